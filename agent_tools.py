@@ -1,55 +1,159 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain.tools import tool
-from bybit_tools import spot_get_market_data, spot_get_open_positions, perp_get_market_data, perp_get_open_positions
+from bybit_tools import (
+    spot_get_market_data, spot_get_open_positions, perp_get_market_data, perp_get_open_positions, safe_float_convert
+)
 from data_processor import add_technical_indicators
+from prompt_encoding import encode_market_data
+from market_data import get_timeframe_data, update_candles
 
-@tool
-def analyze_market_state(symbol: str, interval: int = 15, trading_mode: str = "spot") -> str:
+def fetch_market_frames(symbol: str, interval: int, trading_mode: str, timeframes: list = None, candles=None,
+                        enriched=None):
     """
-    Analyzes the market state for a given symbol and interval.
-    Fetches market data, adds technical indicators, and checks for open positions.
-    Supports both spot and perpetual futures trading modes.
-    Returns a summary string for the LLM.
+    Fetches the candles for the analysis and adds the technical indicators.
+
+    With `timeframes`, the interval and every extra timeframe are derived by
+    resampling one cached 1-minute series instead of fetching each interval.
+    Otherwise `candles` (an up-to-date OHLCV window, see
+    market_data.update_candles) is used instead of fetching the interval,
+    and `enriched` (the same window with the indicators already added, see
+    data_processor.add_indicators_to_frames) instead of computing them.
+
+    Returns:
+        tuple: (DataFrame of the interval, {minutes: DataFrame} of the extra timeframes);
+        the first is empty if no data could be retrieved
     """
-    # 1. Get market data based on trading mode
-    if trading_mode == "spot":
+    higher_timeframes = {}
+    if timeframes:
+        frames = get_timeframe_data(symbol, trading_mode, [interval, *timeframes])
+        market_data = frames.pop(int(interval))
+        higher_timeframes = frames
+    elif enriched is not None:
+        market_data = enriched
+    elif candles is not None:
+        market_data = candles.copy()  # the pandas_ta backend adds the indicators in place
+    elif trading_mode == "spot":
         market_data = spot_get_market_data(symbol, interval, limit=1000)
-    elif trading_mode == "perp":
-        market_data = perp_get_market_data(symbol, interval, limit=1000)
     else:
-        return f"Invalid trading mode: {trading_mode}. Use 'spot' or 'perp'."
+        market_data = perp_get_market_data(symbol, interval, limit=1000)
 
     if market_data.empty:
-        return f"Could not retrieve {trading_mode} market data."
+        return market_data, {}
 
-    # 2. Add technical indicators
-    enriched_data = add_technical_indicators(market_data)
+    enriched_data = market_data if enriched is not None else add_technical_indicators(market_data)
 
     # print the last RSI_14, MACD_12_26_9, BBM_5_2.0_2.0, STOCHRSIk_5_5_3_3, STOCHRSId_5_5_3_3
     print(enriched_data[["RSI_14", "MACD_12_26_9", "BBM_5_2.0_2.0", "STOCHRSIk_5_5_3_3", "STOCHRSId_5_5_3_3"]].tail(5))
 
-    # 3. Format the last few rows for the LLM
-    llm_readable_data = enriched_data.tail(5).to_json(orient="records")
+    higher_timeframes = {
+        minutes: add_technical_indicators(frame) for minutes, frame in higher_timeframes.items() if not frame.empty
+    }
+    return enriched_data, higher_timeframes
 
-    # 4. Check for open positions based on trading mode
+def get_open_position(symbol: str, trading_mode: str):
+    """Position info dict of a symbol in the given trading mode."""
+    if trading_mode == "spot":
+        return spot_get_open_positions(symbol)
+    return perp_get_open_positions(symbol)
+
+def describe_position(symbol: str, trading_mode: str, open_position_info: dict) -> str:
+    """One-line description of the open position for the LLM."""
     if trading_mode == "spot":
-        open_position_info = spot_get_open_positions(symbol)
-        if open_position_info and open_position_info.get('has_position', False):
-            position_info = f"Current spot position for {symbol}: {open_position_info['size']} units (${open_position_info['positionValue']:.2f} value)"
-        else:
-            position_info = f"No open spot positions for {symbol}"
-    elif trading_mode == "perp":
-        open_position_info = perp_get_open_positions(symbol)
         if open_position_info and open_position_info.get('has_position', False):
-            pnl = open_position_info['unrealisedPnl']
-            position_info = f"Current perpetual position for {symbol}: {open_position_info['side']} {open_position_info['size']} units, PnL: ${pnl:.2f}"
-        else:
-            position_info = f"No open perpetual positions for {symbol}"
-    
+            description = f"Current spot position for {symbol}: {open_position_info['size']} units (${open_position_info['positionValue']:.2f} value)"
+            if open_position_info.get('avgPrice'):
+                description += f", entry ${open_position_info['avgPrice']:.4f}, PnL: ${open_position_info['unrealisedPnl']:.2f}"
+            return description
+        return f"No open spot positions for {symbol}"
+    if open_position_info and open_position_info.get('has_position', False):
+        pnl = open_position_info['unrealisedPnl']
+        return f"Current perpetual position for {symbol}: {open_position_info['side']} {open_position_info['size']} units, PnL: ${pnl:.2f}"
+    return f"No open perpetual positions for {symbol}"
+
+def describe_balance(wallet_response: dict) -> str:
+    """One-line USDT balance for position sizing, or "" if the wallet response has none."""
+    if not wallet_response or wallet_response.get('retCode') != 0:
+        return ""
+    for account in wallet_response.get('result', {}).get('list', []):
+        for coin in account.get('coin', []):
+            if coin.get('coin') == "USDT":
+                return f"Account balance: {safe_float_convert(coin.get('walletBalance')):.2f} USDT"
+    return ""
+
+def describe_last_decision(last_decision: dict, now: float = None) -> str:
+    """One-line summary of the previous cycle's decision, or "" on the first cycle."""
+    if not last_decision:
+        return ""
+    minutes = ((now or time.time()) - last_decision.get('at', 0)) / 60
+    outcome = "executed" if last_decision.get('executed') else "not executed"
+    if last_decision.get('action') == "HOLD":
+        outcome = "held"
+    reasoning = (last_decision.get('reasoning') or "")[:160]
+    return f"Previous decision ({minutes:.0f} min ago): {last_decision.get('action')}, {outcome}. Reasoning: {reasoning}"
+
+def render_market_analysis(symbol: str, trading_mode: str, market_data, higher_timeframes: dict,
+                           position_info: str, balance_info: str = "", encoding: str = None,
+                           history_info: str = "") -> dict:
+    """
+    Formats fetched and enriched market data as the analysis text for the LLM.
+
+    Returns:
+        dict: {"text": analysis string, "prompt_report": encoding/token report}
+    """
+    llm_readable_data, prompt_report = encode_market_data(market_data, encoding, rows=5)
+    timeframe_sections = []
+    for minutes, frame in higher_timeframes.items():
+        frame_data, frame_report = encode_market_data(frame, encoding, rows=5)
+        timeframe_sections.append(f"{minutes}m timeframe (last 5 periods):\n{frame_data}\n")
+        prompt_report["estimated_tokens"] += frame_report["estimated_tokens"]
+        prompt_report["baseline_estimated_tokens"] += frame_report["baseline_estimated_tokens"]
+
     print(position_info)
 
-    # 5. Construct the final output for the LLM
     analysis = f"Market Analysis for {symbol} ({trading_mode.upper()} mode):\n"
     analysis += f"Recent Data (last 5 periods):\n{llm_readable_data}\n"
+    analysis += "".join(timeframe_sections)
     analysis += position_info
+    if balance_info:
+        analysis += f"\n{balance_info}"
+    if history_info:
+        analysis += f"\n{history_info}"
+
+    return {"text": analysis, "prompt_report": prompt_report}
+
+def build_market_analysis(symbol: str, interval: int = 15, trading_mode: str = "spot", encoding: str = None,
+                          timeframes: list = None) -> dict:
+    """
+    Builds the market analysis text for the LLM.
+
+    The position lookup runs in a helper thread while the candles are
+    fetched and the indicators computed.
+
+    Returns:
+        dict: {"text": analysis string, "prompt_report": encoding/token report (empty on errors)}
+    """
+    if trading_mode not in ("spot", "perp"):
+        return {"text": f"Invalid trading mode: {trading_mode}. Use 'spot' or 'perp'.", "prompt_report": {}}
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        position_future = executor.submit(get_open_position, symbol, trading_mode)
+        market_data, higher_timeframes = fetch_market_frames(symbol, interval, trading_mode, timeframes)
+        open_position_info = position_future.result()
+
+    if market_data.empty:
+        return {"text": f"Could not retrieve {trading_mode} market data.", "prompt_report": {}}
+
+    position_info = describe_position(symbol, trading_mode, open_position_info)
+    return render_market_analysis(symbol, trading_mode, market_data, higher_timeframes, position_info, encoding=encoding)
 
-    return analysis
+@tool
+def analyze_market_state(symbol: str, interval: int = 15, trading_mode: str = "spot", timeframes: list[int] = None) -> str:
+    """
+    Analyzes the market state for a given symbol and interval.
+    Fetches market data, adds technical indicators, and checks for open positions.
+    Supports both spot and perpetual futures trading modes.
+    Optional timeframes (minutes) add higher-timeframe indicators derived from one 1-minute series.
+    Returns a summary string for the LLM.
+    """
+    return build_market_analysis(symbol, interval, trading_mode, timeframes=timeframes)["text"]
@@ -0,0 +1,410 @@
+"""
+Performance analytics over the history tables: equity curve, drawdown,
+rolling Sharpe/Sortino and per-symbol PnL attribution.
+
+Only the columns the analytics need are loaded, as NumPy arrays, from the
+Parquet archive and the database. They are kept in memory per table and
+filter (ColumnCache, at most COLUMN_CACHE_SIZE of them); later requests
+only fetch the rows added since, so a refresh is one small indexed query:
+- the ids above the last one seen, and the rows within
+  REFRESH_OVERLAP_SECONDS of the newest time loaded, de-duplicated by id,
+  so rows committed out of id order by concurrent writers are picked up;
+- rows changed in place (pnl rewritten by a migration, executions stored
+  again) bump the table's version (database.bump_table_version), and a
+  cache seeing a new version reloads the table.
+
+Results are cached per (metric, range, resolution, parameters) and
+recomputed only when new rows fall inside their range; everything is
+vectorized, so even a recomputation over a year of minute-level balances
+takes a few milliseconds once the columns are cached.
+
+Balances are taken as reported: deposits and withdrawals show up as
+returns.
+"""
+
+import os
+import time
+import datetime
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import select, or_, Float
+from archive import ARCHIVE_DIR, ARCHIVED_TABLES, archive_dataset, archive_filter, history_table, time_value
+
+# Bucket sizes of the equity series (ms)
+RESOLUTIONS = {
+    "1m": 60_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "1h": 3_600_000,
+    "4h": 14_400_000,
+    "1d": 86_400_000,
+}
+
+YEAR_MS = 365 * 86_400_000
+
+# Computed results kept per (metric, range, resolution, parameters)
+ANALYTICS_CACHE_SIZE = 128
+
+# Column caches kept per (table, columns, filters); the least recently used is dropped
+COLUMN_CACHE_SIZE = int(os.environ.get("ANALYTICS_COLUMN_CACHES", "32"))
+
+# A refresh re-reads the rows this close to the newest time loaded (longer than any insert takes to commit)
+REFRESH_OVERLAP_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_OVERLAP_SECONDS", "300"))
+
+# Distinguishes the contents of caches that were reloaded or replaced (part of a result's cache state)
+_generations = itertools.count(1)
+
+
+def _time_ms(values, kind: str):
+    """Time column values as int64 epoch milliseconds."""
+    if kind == "epoch_ms":
+        return np.asarray(values, dtype="int64")
+    return np.asarray(values, dtype="datetime64[ms]").astype("int64")
+
+
+class ColumnCache:
+    """
+    Some columns of one history table (filtered by equality), oldest first.
+
+    The first refresh loads the archive and the database; later ones append
+    the database rows with an id above the last one seen or a time within
+    REFRESH_OVERLAP_SECONDS of the newest, skipping the ids already loaded.
+    A new table version (rows changed in place) reloads everything.
+    Archival doesn't touch the cache: the archived rows were already loaded.
+    """
+
+    def __init__(self, table: str, columns: tuple, where: dict):
+        self.table = table
+        self.names = columns
+        self.where = where
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.time = np.empty(0, dtype="int64")
+        self.ids = np.empty(0, dtype="int64")
+        self.columns = {name: np.empty(0) for name in self.names}
+        self.last_id = None
+        self.version = None  # Of the table when loaded (see database.TableVersion)
+        self.generation = next(_generations)
+        # Bumped when rows arrive out of time order and the arrays are re-sorted
+        self.resorts = 0
+
+    def _append(self, ids, times, columns):
+        if len(self.ids) and len(ids):
+            # The overlap re-reads rows already loaded
+            new = ~np.isin(ids, self.ids[self.ids >= ids.min()])
+            ids, times = ids[new], times[new]
+            columns = {name: values[new] for name, values in columns.items()}
+        if not len(times):
+            return
+        ordered = not len(self.time) or times.min() >= self.time[-1]
+        self.time = np.concatenate([self.time, times])
+        self.ids = np.concatenate([self.ids, ids])
+        for name in self.names:
+            self.columns[name] = np.concatenate([self.columns[name], columns[name]])
+        if not ordered or np.any(np.diff(times) < 0):
+            order = np.argsort(self.time, kind="stable")
+            self.time = self.time[order]
+            self.ids = self.ids[order]
+            for name in self.names:
+                self.columns[name] = self.columns[name][order]
+            self.resorts += 1
+        last_id = int(ids.max())
+        self.last_id = last_id if self.last_id is None else max(self.last_id, last_id)
+
+    def _load_archive(self, archive_dir: str):
+        dataset = archive_dataset(self.table, archive_dir)
+        if dataset is None:
+            return
+        column, kind = ARCHIVED_TABLES[self.table]
+        archived = dataset.to_table(columns=["id", column, *self.names],
+                                    filter=archive_filter(self.table, where=self.where))
+        if archived.num_rows:
+            times = archived.column(column).to_numpy() if kind == "epoch_ms" else \
+                archived.column(column).cast("timestamp[ms]").cast("int64").to_numpy()
+            self._append(archived.column("id").to_numpy(), times,
+                         {name: archived.column(name).to_numpy(zero_copy_only=False) for name in self.names})
+
+    def refresh(self, engine, archive_dir: str = ARCHIVE_DIR):
+        """
+        Loads the rows added since the last refresh.
+
+        Returns:
+            int: Number of new rows
+        """
+        from database import TableVersion
+        column, kind = ARCHIVED_TABLES[self.table]
+        model = history_table(self.table)
+        versions = TableVersion.__table__
+        with self.lock, engine.connect() as connection:
+            version = connection.execute(select(versions.c.version).where(
+                versions.c.table_name == self.table)).scalar() or 0
+            if self.version is not None and version != self.version:
+                self._reset()
+            self.version = version
+            before = len(self.time)
+            last_id = self.last_id
+            if last_id is None:
+                self._load_archive(archive_dir)
+            query = select(model.c.id, model.c[column], *(model.c[name] for name in self.names))
+            for name, value in self.where.items():
+                query = query.where(model.c[name] == value)
+            if last_id is not None and len(self.time):
+                since = datetime.datetime.fromtimestamp(self.time[-1] / 1000 - REFRESH_OVERLAP_SECONDS,
+                                                        tz=datetime.timezone.utc).replace(tzinfo=None)
+                query = query.where(or_(model.c.id > last_id, model.c[column] >= time_value(since, kind)))
+            elif last_id is not None:
+                query = query.where(model.c.id > last_id)
+            rows = connection.execute(query.order_by(model.c[column], model.c.id)).all()
+            if rows:
+                ids, times, *values = zip(*rows)
+                dtypes = ["float64" if isinstance(model.c[name].type, Float) else object for name in self.names]
+                self._append(np.asarray(ids, dtype="int64"), _time_ms(times, kind),
+                             {name: np.asarray(value, dtype=dtype)
+                              for name, value, dtype in zip(self.names, values, dtypes)})
+            elif self.last_id is None:
+                self.last_id = 0
+            return len(self.time) - before
+
+    def window(self, start_ms: int = None, end_ms: int = None):
+        """(time, {column: values}) of the rows in [start_ms, end_ms)."""
+        lo = 0 if start_ms is None else np.searchsorted(self.time, start_ms, side="left")
+        hi = len(self.time) if end_ms is None else np.searchsorted(self.time, end_ms, side="left")
+        return self.time[lo:hi], {name: values[lo:hi] for name, values in self.columns.items()}
+
+
+class AnalyticsCache:
+    """
+    Column caches per (table, columns, filters) and computed results per
+    request, invalidated by new rows; both evict the least recently used.
+    """
+
+    def __init__(self, size: int = ANALYTICS_CACHE_SIZE, column_caches: int = COLUMN_CACHE_SIZE):
+        self.lock = threading.Lock()
+        self.columns = OrderedDict()
+        self.results = OrderedDict()  # key -> ((generation, row count, resorts) it was computed at, result)
+        self.size = size
+        self.column_caches = column_caches
+
+    def column_cache(self, table: str, columns: tuple, where: dict):
+        key = (table, columns, tuple(sorted(where.items())))
+        with self.lock:
+            if key not in self.columns:
+                self.columns[key] = ColumnCache(table, columns, where)
+            self.columns.move_to_end(key)
+            while len(self.columns) > self.column_caches:
+                self.columns.popitem(last=False)
+            return self.columns[key]
+
+    def get(self, key, cache: ColumnCache, start_ms: int, end_ms: int, compute, engine=None,
+            archive_dir: str = ARCHIVE_DIR):
+        """
+        Returns compute(cache) for `key`, reusing the cached result if no new row falls in [start_ms, end_ms).
+        """
+        if engine is None:
+            from database import engine
+        cache.refresh(engine, archive_dir)
+        with cache.lock:
+            state = (cache.generation, len(cache.time), cache.resorts)
+            with self.lock:
+                cached = self.results.get(key)
+            if cached is not None:
+                (generation, count, resorts), result = cached
+                # New rows were appended after `count`, unless a re-sort moved them or the cache was reloaded
+                new = cache.time[count:]
+                if (generation, resorts) == (cache.generation, cache.resorts) and \
+                        not np.any((new >= (start_ms or 0)) & (new < (end_ms or np.inf))):
+                    with self.lock:
+                        self.results.move_to_end(key)
+                    return result
+            result = compute(cache)
+        with self.lock:
+            self.results[key] = (state, result)
+            self.results.move_to_end(key)
+            while len(self.results) > self.size:
+                self.results.popitem(last=False)
+        return result
+
+
+analytics_cache = AnalyticsCache()
+
+
+def window_start(days_back: int, resolution_ms: int, now_ms: int = None):
+    """Start of the last `days_back` days, aligned to the resolution so the range (and its cache key) is stable."""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return (now_ms - days_back * 86_400_000) // resolution_ms * resolution_ms
+
+
+def equity_series(times, balances, resolution_ms: int):
+    """Last balance per bucket: (bucket start times in ms, equity)."""
+    if not len(times):
+        return times, balances.astype("float64")
+    buckets = times // resolution_ms
+    last = np.flatnonzero(np.r_[buckets[1:] != buckets[:-1], True])
+    return buckets[last] * resolution_ms, balances[last].astype("float64")
+
+
+def max_drawdown(times, equity):
+    """Largest peak-to-trough fall of the equity curve, as a fraction of the peak."""
+    if not len(equity):
+        return {"max_drawdown": 0.0, "peak_time": None, "trough_time": None, "recovery_time": None}
+    peaks = np.maximum.accumulate(equity)
+    drawdowns = np.divide(equity, peaks, out=np.ones_like(equity), where=peaks > 0) - 1
+    trough = int(np.argmin(drawdowns))
+    peak = int(np.argmax(equity[:trough + 1]))
+    recovered = np.flatnonzero(equity[trough:] >= equity[peak])
+    return {
+        "max_drawdown": float(-drawdowns[trough]),
+        "peak_time": int(times[peak]),
+        "trough_time": int(times[trough]),
+        "recovery_time": int(times[trough + recovered[0]]) if len(recovered) and drawdowns[trough] < 0 else None,
+    }
+
+
+def period_returns(equity):
+    """Simple returns between consecutive buckets (0 where the previous equity isn't positive)."""
+    previous = equity[:-1]
+    return np.divide(equity[1:] - previous, previous, out=np.zeros(len(previous)), where=previous > 0)
+
+
+def _ratio(mean, deviation, periods_per_year: float):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = mean / deviation * np.sqrt(periods_per_year)
+    return np.where(deviation > 0, ratio, np.nan)
+
+
+def sharpe_sortino(returns, periods_per_year: float):
+    """Annualized Sharpe and Sortino ratios of a return series (zero risk-free rate)."""
+    if len(returns) < 2:
+        return np.nan, np.nan
+    mean = returns.mean()
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    return (float(_ratio(mean, returns.std(ddof=1), periods_per_year)),
+            float(_ratio(mean, downside, periods_per_year)))
+
+
+def rolling_sharpe_sortino(returns, window: int, periods_per_year: float):
+    """Annualized Sharpe and Sortino over each trailing `window` returns (one value per window end)."""
+    if window < 2 or len(returns) < window:
+        return np.empty(0), np.empty(0)
+    sums = np.r_[0.0, np.cumsum(returns)]
+    squares = np.r_[0.0, np.cumsum(returns ** 2)]
+    downside_squares = np.r_[0.0, np.cumsum(np.minimum(returns, 0) ** 2)]
+    mean = (sums[window:] - sums[:-window]) / window
+    variance = np.maximum((squares[window:] - squares[:-window]) / window - mean ** 2, 0) * window / (window - 1)
+    downside = np.sqrt((downside_squares[window:] - downside_squares[:-window]) / window)
+    return _ratio(mean, np.sqrt(variance), periods_per_year), _ratio(mean, downside, periods_per_year)
+
+
+def _balance_cache(coin: str, account_type: str = None):
+    where = {"coin": coin}
+    if account_type:
+        where["account_type"] = account_type
+    return analytics_cache.column_cache("balance_history", ("balance",), where)
+
+
+def equity_curve(days_back: int, resolution: str = "1h", coin: str = "USDT", account_type: str = None,
+                 engine=None, archive_dir: str = ARCHIVE_DIR):
+    """
+    Equity (last balance per bucket) of the last `days_back` days with its max drawdown.
+
+    Returns:
+        dict: {"times": epoch ms array, "equity": array, "drawdown": {...}}
+    """
+    resolution_ms = RESOLUTIONS[resolution]
+    start_ms = window_start(days_back, resolution_ms)
+    cache = _balance_cache(coin, account_type)
+
+    def compute(cache):
+        times, columns = cache.window(start_ms)
+        times, equity = equity_series(times, columns["balance"], resolution_ms)
+        return {
+            "times": times,
+            "equity": equity,
+            "drawdown": max_drawdown(times, equity),
+        }
+
+    key = ("equity", start_ms, resolution, coin, account_type)
+    return analytics_cache.get(key, cache, start_ms, None, compute, engine, archive_dir)
+
+
+def risk_metrics(days_back: int, resolution: str = "1h", window: int = 24, coin: str = "USDT",
+                 account_type: str = None, engine=None, archive_dir: str = ARCHIVE_DIR):
+    """
+    Max drawdown and annualized Sharpe/Sortino of the equity returns, overall and rolling over `window` buckets.
+
+    Ratios are NaN where the deviation is zero; the series are NumPy arrays.
+    """
+    resolution_ms = RESOLUTIONS[resolution]
+    start_ms = window_start(days_back, resolution_ms)
+    periods_per_year = YEAR_MS / resolution_ms
+    cache = _balance_cache(coin, account_type)
+
+    def compute(cache):
+        times, columns = cache.window(start_ms)
+        times, equity = equity_series(times, columns["balance"], resolution_ms)
+        returns = period_returns(equity)
+        sharpe, sortino = sharpe_sortino(returns, periods_per_year)
+        rolling_sharpe, rolling_sortino = rolling_sharpe_sortino(returns, window, periods_per_year)
+        total_return = float(equity[-1] / equity[0] - 1) if len(equity) > 1 and equity[0] > 0 else 0.0
+        return {
+            "periods": len(returns),
+            "total_return": total_return,
+            "sharpe": sharpe,
+            "sortino": sortino,
+            "drawdown": max_drawdown(times, equity),
+            "rolling": {
+                # Returns[i] ends at bucket i + 1, so the first full window ends at bucket `window`
+                "times": times[window:] if len(rolling_sharpe) else times[:0],
+                "sharpe": rolling_sharpe,
+                "sortino": rolling_sortino,
+            },
+        }
+
+    key = ("risk", start_ms, resolution, window, coin, account_type)
+    return analytics_cache.get(key, cache, start_ms, None, compute, engine, archive_dir)
+
+
+def pnl_attribution(days_back: int, category: str = None, engine=None, archive_dir: str = ARCHIVE_DIR):
+    """
+    Realized PnL, fees and trade counts per symbol over the last `days_back` days,
+    with each symbol's share of the total PnL.
+    """
+    # Hourly alignment: the range (and cache key) moves once an hour
+    start_ms = window_start(days_back, RESOLUTIONS["1h"])
+    where = {"category": category} if category else {}
+    cache = analytics_cache.column_cache("bybit_trade_history", ("symbol", "pnl", "exec_fee"), where)
+
+    def compute(cache):
+        _, columns = cache.window(start_ms)
+        if not len(columns["symbol"]):
+            return {"total_pnl": 0.0, "total_fees": 0.0, "symbols": []}
+        symbols, index = np.unique(columns["symbol"].astype(str), return_inverse=True)
+        pnl = np.nan_to_num(columns["pnl"].astype("float64"))
+        fees = np.nan_to_num(columns["exec_fee"].astype("float64"))
+        pnl_by_symbol = np.bincount(index, weights=pnl, minlength=len(symbols))
+        fees_by_symbol = np.bincount(index, weights=fees, minlength=len(symbols))
+        trades = np.bincount(index, minlength=len(symbols))
+        wins = np.bincount(index, weights=pnl > 0, minlength=len(symbols))
+        losses = np.bincount(index, weights=pnl < 0, minlength=len(symbols))
+        total = float(pnl_by_symbol.sum())
+        order = np.argsort(-pnl_by_symbol, kind="stable")
+        return {
+            "total_pnl": total,
+            "total_fees": float(fees_by_symbol.sum()),
+            "symbols": [{
+                "symbol": str(symbols[i]),
+                "pnl": float(pnl_by_symbol[i]),
+                "fees": float(fees_by_symbol[i]),
+                "trades": int(trades[i]),
+                "wins": int(wins[i]),
+                "losses": int(losses[i]),
+                "share": float(pnl_by_symbol[i] / total) if total else None,
+            } for i in order],
+        }
+
+    key = ("attribution", start_ms, category)
+    return analytics_cache.get(key, cache, start_ms, None, compute, engine, archive_dir)
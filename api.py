@@ -1,9 +1,16 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse, Response
 from typing import Optional
 from sqlalchemy import func
 from agent_tools import analyze_market_state
 from bybit_tools import get_bybit_trade_history, store_trade_history_to_db
 from database import init_db, SessionLocal, BybitTradeHistory
+from archive import read_history
+from export import EXPORT_FORMATS, EXPORT_COMPRESSIONS, iter_batches, encode_batches, compress_chunks
+from analytics import RESOLUTIONS, equity_curve, risk_metrics, pnl_attribution
+from metrics import registry
+import time
+import orjson
 import uvicorn
 from datetime import datetime, timedelta
 
@@ -11,6 +18,24 @@ app = FastAPI()
 #init db here
 init_db()
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """Records the latency of every API request, labelled by route path."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The matched route is only known once routing has run inside call_next
+    route = request.scope.get("route")
+    registry.observe("api", route.path if route else request.url.path, time.perf_counter() - start,
+                     request.query_params.get("symbol", ""))
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus-format latency histograms for API requests, exchange calls and DB commits.
+    """
+    return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/analyze/{symbol}")
 def analyze_symbol(symbol: str, interval: int = 15):
     """
@@ -68,6 +93,7 @@ def fetch_and_store_trade_history(
                 "storage_summary": {
                     "stored_count": 0,
                     "updated_count": 0,
+                    "archived_count": 0,
                     "error_count": 0,
                     "total_processed": 0
                 }
@@ -177,6 +203,50 @@ def get_stored_trade_history(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@app.get("/trade-history/export")
+def export_trade_history(
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    compression: str = Query("none", description="Response compression: none, gzip or zstd"),
+    symbol: Optional[str] = Query(None, description="Filter by symbol"),
+    category: Optional[str] = Query(None, description="Filter by category"),
+    days_back: Optional[int] = Query(None, ge=1, description="Only executions of the last N days (default: all)"),
+    include_archive: bool = Query(True, description="Include executions moved to the Parquet archive"),
+):
+    """
+    Stream stored trade history as a file, oldest execution first.
+    
+    Rows are read with a server-side cursor and encoded batch by batch, so
+    memory use doesn't depend on the number of rows exported.
+    
+    Parameters:
+    - format: csv, ndjson or parquet (zstd-compressed columns)
+    - compression: none, gzip or zstd, sent as the Content-Encoding of the response
+    - symbol: Optional symbol filter
+    - category: Optional category filter
+    - days_back: Optional number of days back to export
+    - include_archive: Include archived executions (default: true)
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}. Use one of {', '.join(EXPORT_FORMATS)}.")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown compression: {compression}. Use one of {', '.join(EXPORT_COMPRESSIONS)}.")
+
+    filters = {}
+    if symbol:
+        filters["symbol"] = symbol
+    if category:
+        filters["category"] = category
+    start = datetime.utcnow() - timedelta(days=days_back) if days_back else None
+
+    batches = iter_batches("bybit_trade_history", start=start, where=filters, include_archive=include_archive)
+    chunks = compress_chunks(encode_batches("bybit_trade_history", batches, format), compression)
+    media_type, extension = EXPORT_FORMATS[format]
+    headers = {"Content-Disposition": f'attachment; filename="trade_history.{extension}"'}
+    if compression != "none":
+        headers["Content-Encoding"] = compression
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
 @app.get("/trade-history/pnl-summary")
 def get_pnl_summary(
     symbol: Optional[str] = Query(None, description="Filter by symbol"),
@@ -185,6 +255,7 @@ def get_pnl_summary(
 ):
     """
     Get PnL summary statistics for trade history.
+    Trades older than the retention window are read from the Parquet archive.
     
     Parameters:
     - symbol: Optional symbol filter
@@ -192,24 +263,19 @@ def get_pnl_summary(
     - days_back: Number of days back to analyze (1-730)
     """
     try:
-        db = SessionLocal()
-        
         # Calculate time threshold
         time_threshold = datetime.now() - timedelta(days=days_back)
-        time_threshold_ms = int(time_threshold.timestamp() * 1000)
-        
-        # Build query
-        query = db.query(BybitTradeHistory).filter(
-            BybitTradeHistory.exec_time >= time_threshold_ms
-        )
         
+        filters = {}
         if symbol:
-            query = query.filter(BybitTradeHistory.symbol == symbol)
+            filters["symbol"] = symbol
         if category:
-            query = query.filter(BybitTradeHistory.category == category)
+            filters["category"] = category
         
-        # Get all trades for detailed analysis
-        trades = query.all()
+        # Get all trades for detailed analysis (archive and database)
+        history = read_history("bybit_trade_history", start=datetime.utcfromtimestamp(time_threshold.timestamp()),
+                               where=filters)
+        trades = list(history.astype(object).where(history.notna(), None).itertuples(index=False))
         
         if not trades:
             return {
@@ -250,8 +316,7 @@ def get_pnl_summary(
             symbol_pnl[trade.symbol]["trade_count"] += 1
             symbol_pnl[trade.symbol]["fees"] += trade.exec_fee if trade.exec_fee else 0
         
-        db.close()
-        
+
         return {
             "status": "success",
             "summary": {
@@ -279,5 +344,82 @@ def get_pnl_summary(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def analytics_response(content: dict):
+    """JSON with the NumPy series serialized directly (NaN becomes null)."""
+    return Response(orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+
+@app.get("/analytics/equity-curve")
+def get_equity_curve(
+    days_back: int = Query(30, ge=1, le=730, description="Number of days back"),
+    resolution: str = Query("1h", description="Bucket size: 1m, 5m, 15m, 1h, 4h or 1d"),
+    coin: str = Query("USDT", description="Coin whose balance is the equity"),
+    account_type: Optional[str] = Query(None, description="Filter by account type (e.g. UNIFIED_spot)")
+):
+    """
+    Equity curve from balance history (last balance per bucket) with its max drawdown.
+    Times are epoch milliseconds of the bucket starts.
+    
+    Parameters:
+    - days_back: Number of days back (1-730)
+    - resolution: Bucket size of the curve
+    - coin: Coin whose balance is the equity (default: USDT)
+    - account_type: Optional account type filter
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown resolution: {resolution}. Use one of {', '.join(RESOLUTIONS)}.")
+    try:
+        curve = equity_curve(days_back, resolution, coin, account_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return analytics_response({"status": "success", "resolution": resolution, "days_back": days_back, **curve})
+
+@app.get("/analytics/risk")
+def get_risk_metrics(
+    days_back: int = Query(30, ge=1, le=730, description="Number of days back"),
+    resolution: str = Query("1h", description="Return period: 1m, 5m, 15m, 1h, 4h or 1d"),
+    window: int = Query(24, ge=2, le=10000, description="Rolling window in periods"),
+    coin: str = Query("USDT", description="Coin whose balance is the equity"),
+    account_type: Optional[str] = Query(None, description="Filter by account type (e.g. UNIFIED_spot)")
+):
+    """
+    Max drawdown and annualized Sharpe/Sortino ratios of the equity returns,
+    over the whole range and rolling over `window` periods.
+    
+    Parameters:
+    - days_back: Number of days back (1-730)
+    - resolution: Return period
+    - window: Rolling window in periods (default: 24)
+    - coin: Coin whose balance is the equity (default: USDT)
+    - account_type: Optional account type filter
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown resolution: {resolution}. Use one of {', '.join(RESOLUTIONS)}.")
+    try:
+        metrics = risk_metrics(days_back, resolution, window, coin, account_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return analytics_response({"status": "success", "resolution": resolution, "window": window, "days_back": days_back,
+                               **metrics})
+
+@app.get("/analytics/attribution")
+def get_pnl_attribution(
+    days_back: int = Query(30, ge=1, le=730, description="Number of days back"),
+    category: Optional[str] = Query(None, description="Filter by category")
+):
+    """
+    Realized PnL per symbol (with fees, trade counts and share of the total PnL).
+    
+    Parameters:
+    - days_back: Number of days back (1-730)
+    - category: Optional category filter
+    """
+    try:
+        attribution = pnl_attribution(days_back, category)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return analytics_response({"status": "success", "days_back": days_back, "category": category, **attribution})
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Retention of the history tables: cold rows move to zstd-compressed Parquet.
+
+Off by default: the job runs when ARCHIVE_AFTER_DAYS is set and ARCHIVE_DIR
+is an absolute path (the bot, the API and every node must read the same
+archive). Rows older than ARCHIVE_AFTER_DAYS are written to
+    ARCHIVE_DIR/<table>/date=YYYY-MM-DD/part-<first id>-<last id>.parquet
+and deleted from the database in chunks, one short transaction per chunk.
+A chunk's files are written under a hidden pending name (which readers
+skip) before its delete commits and renamed after; the next run publishes
+or drops the pending files a crash left, depending on whether their rows
+are still in the database, so no row is ever in the archive twice.
+
+read_history() unions the archive with the database for queries that
+reach further back than the retention window.
+
+Usage:
+    ARCHIVE_DIR=/var/lib/gemini-trader/archive python archive.py --days 90
+    python archive.py --days 7 --table balance_history --archive-dir /srv/archive
+"""
+
+import os
+import json
+import argparse
+import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import select, delete, Boolean, DateTime, Float, Integer, JSON
+
+# Days of history kept in the database; 0 (the default) disables the archival job
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+
+# Absolute directory of the Parquet archive, shared by every process that reads history; unset: no archive
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR") or None
+
+# Rows per archive file write and delete transaction
+ARCHIVE_CHUNK_SIZE = 20_000
+
+# table -> (time column, how it stores time: "epoch_ms" or "timestamp")
+ARCHIVED_TABLES = {
+    "trade_history": ("timestamp", "timestamp"),
+    "balance_history": ("timestamp", "timestamp"),
+    "agent_token_usage": ("timestamp", "timestamp"),
+    "bybit_trade_history": ("exec_time", "epoch_ms"),
+}
+
+
+def archive_configured(archive_dir: str = ARCHIVE_DIR):
+    """Whether archive_dir can hold the archive: set, and absolute so every process resolves the same one."""
+    return bool(archive_dir) and os.path.isabs(archive_dir)
+
+
+def history_table(table: str):
+    from database import Base
+    return Base.metadata.tables[table]
+
+
+def _arrow_type(column):
+    # Check subclasses first: BigInteger is an Integer
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    # JSON is stored as its text
+    return pa.string()
+
+
+def arrow_schema(table: str):
+    return pa.schema([(column.name, _arrow_type(column)) for column in history_table(table).columns])
+
+
+def time_value(moment: datetime.datetime, kind: str):
+    """A naive UTC datetime in the time column's representation."""
+    if kind == "epoch_ms":
+        return int(moment.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    return moment
+
+
+def _day(value, kind: str):
+    if kind == "epoch_ms":
+        return datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc).date()
+    return value.date()
+
+
+def archive_dataset(table: str, archive_dir: str = ARCHIVE_DIR):
+    """pyarrow dataset of a table's archive, or None if nothing was archived yet (or there is no archive)."""
+    if not archive_configured(archive_dir):
+        return None
+    table_dir = os.path.join(archive_dir, table)
+    if not os.path.isdir(table_dir):
+        return None
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    # Pending files (".part-...") are skipped like every name starting with "." or "_"
+    return ds.dataset(table_dir, format="parquet", partitioning=partitioning,
+                      schema=arrow_schema(table).append(pa.field("date", pa.string())))
+
+
+def archived_values(table: str, column: str, values, end: datetime.datetime = None, archive_dir: str = None):
+    """
+    The values of `column` among `values` that the archive of `table` holds.
+
+    Args:
+        end: Naive UTC time the rows are older than, to only read the day directories before it
+
+    Returns:
+        set
+    """
+    dataset = archive_dataset(table, archive_dir or ARCHIVE_DIR)
+    values = [value for value in values if value is not None]
+    if dataset is None or not values:
+        return set()
+    condition = ds.field(column).isin(values)
+    if end is not None:
+        condition = condition & (ds.field("date") <= end.date().isoformat())
+    return set(dataset.to_table(columns=[column], filter=condition).column(column).to_pylist())
+
+
+def archive_filter(table: str, start: datetime.datetime = None, end: datetime.datetime = None, where: dict = None):
+    """Dataset filter for a time range and equality filters; the date bounds skip the other day directories."""
+    column, kind = ARCHIVED_TABLES[table]
+    filters = [ds.field(name) == value for name, value in (where or {}).items()]
+    if start is not None:
+        filters += [ds.field("date") >= start.date().isoformat(), ds.field(column) >= time_value(start, kind)]
+    if end is not None:
+        filters += [ds.field("date") <= end.date().isoformat(), ds.field(column) < time_value(end, kind)]
+    condition = None
+    for expression in filters:
+        condition = expression if condition is None else condition & expression
+    return condition
+
+
+def _rows(table: str, rows: list):
+    """Database rows as plain dicts, with JSON columns serialized."""
+    json_columns = [column.name for column in history_table(table).columns if isinstance(column.type, JSON)]
+    rows = [dict(row) for row in rows]
+    for row in rows:
+        for name in json_columns:
+            if row[name] is not None:
+                row[name] = json.dumps(row[name])
+    return rows
+
+
+def pending_path(path: str):
+    """Hidden name a file is written under until the delete of its rows commits."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.pending")
+
+
+def write_day_files(table: str, rows: list, archive_dir: str = ARCHIVE_DIR):
+    """
+    Writes rows (ordered by id) to one pending Parquet file per day.
+
+    Returns:
+        list: Final paths of the files; publish_files() renames the pending files to them
+    """
+    column, kind = ARCHIVED_TABLES[table]
+    schema = arrow_schema(table)
+    by_day = {}
+    for row in rows:
+        # Rows without a time can't be placed in a day; they are archived under the epoch
+        day = _day(row[column], kind) if row[column] is not None else datetime.date(1970, 1, 1)
+        by_day.setdefault(day, []).append(row)
+
+    paths = []
+    for day, day_rows in by_day.items():
+        directory = os.path.join(archive_dir, table, f"date={day.isoformat()}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{day_rows[0]['id']}-{day_rows[-1]['id']}.parquet")
+        pq.write_table(pa.Table.from_pylist(day_rows, schema=schema), pending_path(path), compression="zstd")
+        paths.append(path)
+    return paths
+
+
+def publish_files(paths: list):
+    """Renames the pending files of `paths` into place, once the delete of their rows committed."""
+    for path in paths:
+        os.replace(pending_path(path), path)
+
+
+def recover_pending(table: str, archive_dir: str = ARCHIVE_DIR, engine=None):
+    """
+    Finishes the chunks an interrupted run left as pending files.
+
+    A pending file whose rows are gone from the database was committed and
+    is published; one whose rows are still there was not, and is removed
+    (the rows are archived again).
+
+    Returns:
+        int: Files published
+    """
+    if engine is None:
+        from database import engine
+    column, _ = ARCHIVED_TABLES[table]
+    model = history_table(table)
+    table_dir = os.path.join(archive_dir, table)
+    published = 0
+    for directory, _, names in os.walk(table_dir):
+        for name in names:
+            if not (name.startswith(".part-") and name.endswith(".pending")):
+                continue
+            pending = os.path.join(directory, name)
+            keys = pq.read_table(pending, columns=["id", column]).to_pylist()
+            ids = [key["id"] for key in keys]
+            with engine.connect() as connection:
+                # Same id and time: not a later row that reused the id
+                remaining = {tuple(row) for row in connection.execute(
+                    select(model.c.id, model.c[column]).where(model.c.id.in_(ids))).all()}
+            if remaining & {(key["id"], key[column]) for key in keys}:
+                os.remove(pending)
+            else:
+                os.replace(pending, os.path.join(directory, name[1:-len(".pending")]))
+                published += 1
+    return published
+
+
+def archive_table(table: str, cutoff: datetime.datetime, chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                  archive_dir: str = ARCHIVE_DIR, engine=None):
+    """
+    Moves the rows of a table older than cutoff (naive UTC) to the archive.
+
+    Returns:
+        int: Rows archived
+    """
+    if engine is None:
+        from database import engine
+    column, kind = ARCHIVED_TABLES[table]
+    model = history_table(table)
+    time_column = model.c[column]
+    before = time_value(cutoff, kind)
+    recover_pending(table, archive_dir, engine)
+
+    archived = 0
+    after = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(model).where(time_column < before, model.c.id > after).order_by(model.c.id).limit(chunk_size)
+            ).mappings().all()
+            if not rows:
+                break
+            rows = _rows(table, rows)
+            paths = write_day_files(table, rows, archive_dir)
+            # Deleted in the same transaction that read them, after the files are written
+            connection.execute(delete(model).where(
+                time_column < before, model.c.id > after, model.c.id <= rows[-1]["id"]
+            ))
+        publish_files(paths)
+        archived += len(rows)
+        after = rows[-1]["id"]
+    if archived:
+        print(f"Archived {archived:,} {table} rows older than {cutoff:%Y-%m-%d %H:%M}")
+    return archived
+
+
+def archive_history(days: int = ARCHIVE_AFTER_DAYS, tables=None, archive_dir: str = ARCHIVE_DIR, engine=None):
+    """
+    Archives the rows older than `days` of every archived table.
+
+    Returns:
+        dict: {table: rows archived}
+    """
+    if days <= 0:
+        return {}
+    if not archive_configured(archive_dir):
+        print(f"Not archiving: ARCHIVE_DIR must be an absolute path (got {archive_dir!r})")
+        return {}
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    archived = {}
+    for table in tables or ARCHIVED_TABLES:
+        try:
+            archived[table] = archive_table(table, cutoff, archive_dir=archive_dir, engine=engine)
+        except Exception as e:
+            print(f"Archiving {table} failed: {e}")
+    return archived
+
+
+def read_history(table: str, start: datetime.datetime = None, end: datetime.datetime = None, where: dict = None,
+                 archive_dir: str = ARCHIVE_DIR, engine=None):
+    """
+    Rows of a history table in [start, end) from the archive and the database.
+
+    Only the day directories in the range are read from the archive. JSON
+    columns are returned as their text for both sources.
+
+    Args:
+        table: One of ARCHIVED_TABLES
+        start: Naive UTC start (None: from the beginning)
+        end: Naive UTC end (None: up to now)
+        where: {column: value} equality filters
+
+    Returns:
+        pd.DataFrame: Rows ordered by time, with the table's columns
+    """
+    if engine is None:
+        from database import engine
+    column, kind = ARCHIVED_TABLES[table]
+    model = history_table(table)
+    where = where or {}
+    frames = []
+
+    dataset = archive_dataset(table, archive_dir)
+    if dataset is not None:
+        archived = dataset.to_table(columns=[c.name for c in model.columns],
+                                    filter=archive_filter(table, start, end, where))
+        if archived.num_rows:
+            frames.append(archived.to_pandas())
+
+    query = select(model)
+    for name, value in where.items():
+        query = query.where(model.c[name] == value)
+    if start is not None:
+        query = query.where(model.c[column] >= time_value(start, kind))
+    if end is not None:
+        query = query.where(model.c[column] < time_value(end, kind))
+    with engine.connect() as connection:
+        rows = _rows(table, connection.execute(query).mappings().all())
+    frames.append(pd.DataFrame.from_records(rows, columns=[c.name for c in model.columns]))
+
+    frames = [frame for frame in frames if len(frame)] or frames[-1:]
+    history = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return history.sort_values(column, kind="stable", ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old history rows to Parquet")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"Keep this many days in the database (default: {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--table", action="append", choices=list(ARCHIVED_TABLES),
+                        help="Only archive this table (repeatable)")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Absolute path (default: ARCHIVE_DIR)")
+    args = parser.parse_args()
+    if not archive_configured(args.archive_dir):
+        parser.error("the archive directory must be an absolute path (--archive-dir or ARCHIVE_DIR)")
+
+    archived = archive_history(args.days, args.table, args.archive_dir)
+    print(f"Archived {sum(archived.values()):,} rows to {args.archive_dir}")
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the trading bot's hot paths.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bench_hot_functions --save-baseline
+    python -m benchmarks.bench_hot_functions --compare
+"""
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for complete trading cycles.
+
+Runs run_spot_trading_cycle / run_perp_trading_cycle for growing watchlists
+against a local Bybit stand-in (the HTTP mock server, or the in-process
+SimulatedExchange with --exchange sim) and a stub LLM with configurable latency, and reports cycles/second, p50/p99 cycle latency, CPU
+time, RSS and database rows written per watchlist size.
+
+Usage:
+    python -m benchmarks.bench_cycle_load --mode perp --symbols 1,10,100,500
+    python -m benchmarks.bench_cycle_load --llm-latency-ms 800 --exchange-latency-ms 40 --rounds 2
+    python -m benchmarks.bench_cycle_load --exchange sim --llm-latency-ms 0
+    python -m benchmarks.bench_cycle_load --exchange sim --batch-size 10
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import re
+import logging
+import random
+import argparse
+import resource
+import tempfile
+from contextlib import contextmanager
+
+BENCH_DB_DIR = tempfile.mkdtemp(prefix="gemini-trader-load-")
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{BENCH_DB_DIR}/load.db")
+os.environ.setdefault("GOOGLE_API_KEY", "stub")
+
+from langchain_core.outputs import LLMResult, Generation
+from sqlalchemy import func
+import bybit_tools
+import graph
+import main as bot
+from bybit_mock_server import MockBybitServer, build_kline_list
+from sim_exchange import SimulatedExchange
+from benchmarks.harness import RESULTS_DIR, quiet, environment_info
+from database import SessionLocal, TradeHistory, BalanceHistory, AgentTokenUsage, BybitTradeHistory
+
+COUNTED_TABLES = [TradeHistory, BalanceHistory, AgentTokenUsage, BybitTradeHistory]
+
+
+class StubLLM:
+    """
+    Stand-in for GoogleGenerativeAI that answers after a fixed latency.
+
+    Decisions are derived from a hash of the prompt so runs are reproducible;
+    `entry_ratio` of them are entries (BUY/SELL), the rest HOLD or CLOSE.
+    """
+
+    def __init__(self, latency_ms: float = 100.0, entry_ratio: float = 0.1, model: str = "stub-llm"):
+        self.latency = latency_ms / 1000.0
+        self.entry_ratio = entry_ratio
+        self.model = model
+        self.calls = 0
+
+    def _decision(self, prompt: str):
+        if "JSON array" in prompt:
+            # Batched request: one decision per symbol in the prompt
+            symbols = re.findall(r"Market Analysis for (\S+)", prompt)
+            return [{**self._symbol_decision(f"{symbol}{prompt}"), "symbol": symbol} for symbol in symbols]
+        return self._symbol_decision(prompt)
+
+    def _symbol_decision(self, prompt: str):
+        bucket = int(hashlib.md5(prompt.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        if bucket < self.entry_ratio:
+            action = "BUY" if bucket < self.entry_ratio / 2 else "SELL"
+        elif bucket > 0.97:
+            action = "CLOSE"
+        else:
+            action = "HOLD"
+        return {"action": action, "quantity": 10, "reasoning": "stub decision"}
+
+    def _result(self, prompts):
+        self.calls += len(prompts)
+        generations = [[Generation(text=json.dumps(self._decision(p)))] for p in prompts]
+        prompt_tokens = sum(len(p) // 4 for p in prompts)
+        return LLMResult(generations=generations, llm_output={"token_usage": {
+            "prompt_total_tokens": prompt_tokens,
+            "candidates_total_tokens": 30 * len(prompts),
+            "total_tokens": prompt_tokens + 30 * len(prompts),
+        }})
+
+    def generate(self, prompts, **kwargs):
+        time.sleep(self.latency)
+        return self._result(prompts)
+
+    async def agenerate(self, prompts, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result(prompts)
+
+
+def count_rows():
+    db = SessionLocal()
+    try:
+        return {model.__tablename__: db.query(func.count(model.id)).scalar() for model in COUNTED_TABLES}
+    finally:
+        db.close()
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), falling back to the peak RSS."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def symbols_for(count: int):
+    return [f"SYM{i}USDT" for i in range(count)]
+
+
+@contextmanager
+def mock_exchange(latency_ms: float):
+    """Points the shared pybit session at the HTTP mock server."""
+    with MockBybitServer(latency_ms=latency_ms) as server:
+        bybit_tools.session.endpoint = server.url
+        bybit_tools.session.api_key = bybit_tools.session.api_key or "bench"
+        bybit_tools.session.api_secret = bybit_tools.session.api_secret or "bench"
+        yield None
+
+
+@contextmanager
+def simulated_exchange(max_symbols: int, interval: int):
+    """Swaps in a SimulatedExchange seeded with candles at the cycle interval."""
+    exchange = SimulatedExchange(starting_balance=1_000_000, base_interval=interval, min_order_qty="1")
+    for symbol in symbols_for(max_symbols):
+        exchange.load_klines(symbol, {"result": {"list": build_kline_list(symbol, interval, 1000)}})
+    previous = bybit_tools.session
+    bybit_tools.use_session(exchange)
+    try:
+        yield exchange
+    finally:
+        bybit_tools.use_session(previous)
+
+
+def advance_prices(exchange, symbols, rng):
+    """Moves every simulated price by one random step so TP/SL can trigger between rounds."""
+    for symbol in symbols:
+        exchange.on_tick(symbol, exchange.prices[symbol] * (1 + rng.uniform(-0.002, 0.002)))
+
+
+def run_load(mode: str, symbol_count: int, rounds: int, interval: int, exchange=None, batch_size: int = 1):
+    cycle = bot.run_spot_trading_cycle if mode == "spot" else bot.run_perp_trading_cycle
+    symbols = symbols_for(symbol_count)
+    rng = random.Random(symbol_count)
+
+    rows_before = count_rows()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    latencies = []
+    start = time.perf_counter()
+
+    for _ in range(rounds):
+        if batch_size > 1:
+            # One batched cycle covers the whole watchlist; latencies are per symbol
+            cycle_start = time.perf_counter()
+            with quiet():
+                bot.run_batched_trading_cycle(symbols, interval, mode, batch_size)
+            latencies.extend([(time.perf_counter() - cycle_start) / len(symbols)] * len(symbols))
+        else:
+            # Like main.trading_job: the watchlist's exchange reads at once (mock exchange only)
+            prefetch_start = time.perf_counter()
+            with quiet():
+                snapshots = bot.prefetch_snapshots(symbols, interval, mode)
+            prefetch_seconds = (time.perf_counter() - prefetch_start) / len(symbols)
+            for symbol in symbols:
+                cycle_start = time.perf_counter()
+                with quiet():
+                    cycle(symbol, interval, None, snapshots.get(symbol))
+                latencies.append(time.perf_counter() - cycle_start + prefetch_seconds)
+        with quiet():
+            bot.log_balance_history(mode)
+        if exchange is not None:
+            advance_prices(exchange, symbols, rng)
+
+    wall = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    rows_after = count_rows()
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    return {
+        "symbols": symbol_count,
+        "cycles": len(latencies),
+        "wall_seconds": wall,
+        "cycles_per_second": len(latencies) / wall if wall else 0.0,
+        "p50_cycle_seconds": percentile(latencies, 0.50),
+        "p99_cycle_seconds": percentile(latencies, 0.99),
+        "cpu_seconds": cpu,
+        "cpu_utilization": cpu / wall if wall else 0.0,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": usage_after.ru_maxrss / 1e3,
+        "db_rows_written": {table: rows_after[table] - rows_before[table] for table in rows_after},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end trading cycle load benchmark")
+    parser.add_argument("--mode", choices=["spot", "perp"], default="perp")
+    parser.add_argument("--symbols", default="1,10,100,500", help="Comma-separated watchlist sizes")
+    parser.add_argument("--rounds", type=int, default=1, help="Cycles per symbol at each watchlist size")
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0)
+    parser.add_argument("--exchange", choices=["mock", "sim"], default="mock",
+                        help="HTTP mock server (exercises pybit + network stack) or in-process simulated exchange")
+    parser.add_argument("--exchange-latency-ms", type=float, default=10.0, help="Mock server latency per request")
+    parser.add_argument("--batch-size", type=int, default=1, help="Symbols per batched LLM decision (1: per-symbol cycles)")
+    parser.add_argument("--entry-ratio", type=float, default=0.1, help="Share of decisions that open positions")
+    args = parser.parse_args()
+
+    graph.llm = StubLLM(args.llm_latency_ms, args.entry_ratio)
+    # The bot logs every cycle at INFO; keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.init_db()
+
+    sizes = [int(s) for s in args.symbols.split(",") if s]
+    if args.exchange == "sim":
+        exchange_context = simulated_exchange(max(sizes), args.interval)
+    else:
+        exchange_context = mock_exchange(args.exchange_latency_ms)
+
+    reports = []
+    with exchange_context as exchange:
+        print(f"{'symbols':>8} {'cycles':>7} {'cyc/s':>8} {'p50':>9} {'p99':>9} {'cpu%':>6} {'rss MB':>8} {'rows':>7}")
+        for size in sizes:
+            report = run_load(args.mode, size, args.rounds, args.interval, exchange, args.batch_size)
+            reports.append(report)
+            print(f"{report['symbols']:>8} {report['cycles']:>7} {report['cycles_per_second']:>8.2f} "
+                  f"{report['p50_cycle_seconds'] * 1e3:>7.1f}ms {report['p99_cycle_seconds'] * 1e3:>7.1f}ms "
+                  f"{report['cpu_utilization'] * 100:>5.0f}% {report['rss_mb']:>8.1f} "
+                  f"{sum(report['db_rows_written'].values()):>7}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"cycle_load_{args.mode}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump({"environment": environment_info(), "parameters": vars(args), "reports": reports}, f, indent=2)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the project's hot functions, run against recorded or
+synthesized Bybit fixtures and a throwaway SQLite database.
+
+Usage:
+    python -m benchmarks.bench_hot_functions                    # run and print
+    python -m benchmarks.bench_hot_functions --save-baseline    # store as benchmarks/baseline.json
+    python -m benchmarks.bench_hot_functions --compare          # fail (exit 1) on >10% regressions
+    python -m benchmarks.bench_hot_functions --filter pnl --skip-large
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+# Point the ORM at a scratch database before any project module creates the engine
+BENCH_DB_DIR = tempfile.mkdtemp(prefix="gemini-trader-bench-")
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{BENCH_DB_DIR}/bench.db")
+
+import bybit_tools
+from benchmarks.fixtures import FixtureSession, synthesize_executions
+from benchmarks.harness import (
+    BASELINE_PATH, RESULTS_DIR, measure, quiet, save_results, load_results, compare_results, print_results
+)
+from data_processor import add_technical_indicators
+from database import init_db, SessionLocal, BybitTradeHistory
+
+SYMBOL = "XRPUSDT"
+
+
+def bench_market_data(results: dict):
+    results["spot_get_market_data[1000]"] = measure(lambda: bybit_tools.spot_get_market_data(SYMBOL, 5, 1000))
+    results["perp_get_market_data[1000]"] = measure(lambda: bybit_tools.perp_get_market_data(SYMBOL, 5, 1000))
+
+
+def bench_indicators(results: dict):
+    frame = bybit_tools.perp_get_market_data(SYMBOL, 5, 1000)
+    results["add_technical_indicators[1000]"] = measure(lambda: add_technical_indicators(frame.copy()))
+
+
+def bench_analyze_market_state(results: dict):
+    from agent_tools import analyze_market_state
+
+    for mode in ("spot", "perp"):
+        def run(mode=mode):
+            with quiet():
+                analyze_market_state.invoke({"symbol": SYMBOL, "interval": 5, "trading_mode": mode})
+        results[f"analyze_market_state[{mode}]"] = measure(run)
+
+
+def bench_multi_timeframe(results: dict):
+    from bybit_mock_server import build_kline_list
+    from market_data import resample_ohlcv
+
+    base = bybit_tools.klines_to_dataframe({"retCode": 0, "result": {"list": build_kline_list(SYMBOL, 1, 12_060)}})
+    for minutes in (5, 60):
+        results[f"resample_ohlcv[12060->{minutes}m]"] = measure(lambda minutes=minutes: resample_ohlcv(base, minutes))
+
+
+def bench_indicator_panel(results: dict):
+    from data_processor import compute_indicator_panel
+
+    symbols = [f"SYM{j}USDT" for j in range(500)]
+    frame = bybit_tools.perp_get_market_data(SYMBOL, 5, 200)
+    close = frame["close"].to_numpy()
+    # 500 differently scaled copies of one 200-candle series
+    panel = close[:, None] * (1.0 + np.arange(len(symbols)) / 1000.0)
+    frames = [frame.assign(close=panel[:, j]) for j in range(len(symbols))]
+
+    def loop():
+        for symbol_frame in frames:
+            add_technical_indicators(symbol_frame.copy())
+    results["add_technical_indicators[200x500]"] = measure(loop, repeat=3)
+    results["compute_indicator_panel[200x500]"] = measure(lambda: compute_indicator_panel(panel, symbols))
+
+
+def bench_tp_sl(results: dict):
+    prices = [random.Random(i).uniform(0.1, 100) for i in range(1000)]
+
+    def run():
+        for price in prices:
+            bybit_tools.calculate_perp_tp_sl_prices(price, "Buy", 100.0)
+            bybit_tools.calculate_perp_tp_sl_prices(price, "Sell", 100.0)
+    results["calculate_perp_tp_sl_prices[x2000]"] = measure(run)
+
+
+def bench_trade_pnl(results: dict):
+    executions = synthesize_executions(1000)
+
+    def run():
+        for execution in executions:
+            bybit_tools.calculate_trade_pnl(execution, "linear")
+    results["calculate_trade_pnl[x1000]"] = measure(run)
+
+
+def _clear_trade_history():
+    db = SessionLocal()
+    try:
+        db.query(BybitTradeHistory).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_store_trade_history(results: dict, skip_large: bool):
+    sizes = [1_000] if skip_large else [1_000, 100_000]
+    for size in sizes:
+        executions = synthesize_executions(size)
+
+        def run(executions=executions):
+            with quiet():
+                bybit_tools.store_trade_history_to_db(executions, "linear")
+
+        # Each sample inserts into an empty table; one sample is plenty at 100k rows
+        results[f"store_trade_history_to_db[{size}]"] = measure(
+            run, repeat=3 if size <= 1_000 else 1, number=1, setup=_clear_trade_history, warmup=False
+        )
+    _clear_trade_history()
+
+
+def seed_trade_history(rows: int):
+    """Bulk-inserts `rows` executions spread over the last 30 days across a few symbols."""
+    _clear_trade_history()
+    now_ms = int(time.time() * 1000)
+    symbols = ["XRPUSDT", "BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    db = SessionLocal()
+    try:
+        batch = []
+        for i in range(rows):
+            side = "Buy" if i % 2 == 0 else "Sell"
+            batch.append({
+                "exec_id": f"seed-{i}", "symbol": symbols[i % len(symbols)], "order_id": f"o-{i}",
+                "side": side, "order_type": "Market", "exec_price": 1.0 + (i % 100) / 100,
+                "exec_qty": 10.0, "exec_value": 10.0 + (i % 100) / 10, "exec_fee": 0.01,
+                "fee_currency": "USDT", "is_maker": False, "closed_size": 10.0 if side == "Sell" else 0.0,
+                "exec_time": now_ms - (i * 30 * 24 * 3600 * 1000) // max(rows, 1),
+                "category": "linear", "pnl": ((i % 13) - 6) / 10,
+            })
+            if len(batch) == 10_000:
+                db.bulk_insert_mappings(BybitTradeHistory, batch)
+                batch = []
+        if batch:
+            db.bulk_insert_mappings(BybitTradeHistory, batch)
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_api(results: dict, rows: int):
+    from fastapi.testclient import TestClient
+    import api
+
+    seed_trade_history(rows)
+    client = TestClient(api.app)
+
+    results[f"api /trade-history/list[limit=1000,rows={rows}]"] = measure(
+        lambda: client.get("/trade-history/list", params={"limit": 1000})
+    )
+    results[f"api /trade-history/list[symbol,rows={rows}]"] = measure(
+        lambda: client.get("/trade-history/list", params={"symbol": "XRPUSDT", "limit": 100})
+    )
+    results[f"api /trade-history/pnl-summary[rows={rows}]"] = measure(
+        lambda: client.get("/trade-history/pnl-summary", params={"days_back": 730})
+    )
+    _clear_trade_history()
+
+
+BENCHMARKS = [
+    ("market_data", bench_market_data),
+    ("indicators", bench_indicators),
+    ("analyze_market_state", bench_analyze_market_state),
+    ("multi_timeframe", bench_multi_timeframe),
+    ("indicator_panel", bench_indicator_panel),
+    ("tp_sl", bench_tp_sl),
+    ("trade_pnl", bench_trade_pnl),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini Trader hot-function microbenchmarks")
+    parser.add_argument("--filter", default="", help="Only run benchmark groups whose name contains this")
+    parser.add_argument("--skip-large", action="store_true", help="Skip the 100k-row database benchmark")
+    parser.add_argument("--api-rows", type=int, default=20_000, help="Rows seeded for the API benchmarks")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {BASELINE_PATH}")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, default=None,
+                        help="Compare against a baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before flagging (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    bybit_tools.session = FixtureSession()
+    init_db()
+
+    groups = BENCHMARKS + [
+        ("store_trade_history", lambda results: bench_store_trade_history(results, args.skip_large)),
+        ("api", lambda results: bench_api(results, args.api_rows)),
+    ]
+
+    results = {}
+    for name, bench in groups:
+        if args.filter and args.filter not in name:
+            continue
+        print(f"Running {name}...")
+        bench(results)
+
+    print_results(results)
+    save_results(results, os.path.join(RESULTS_DIR, f"hot_functions_{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    if args.save_baseline:
+        save_results(results, BASELINE_PATH)
+
+    if args.compare:
+        regressions = compare_results(load_results(args.compare), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
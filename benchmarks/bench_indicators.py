@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the numba indicator backend against pandas_ta.
+
+Times a full-window recompute of add_technical_indicators per backend. The
+parity of the two backends is covered by tests/test_indicators.py.
+
+Usage:
+    python -m benchmarks.bench_indicators
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import measure, print_results
+from data_processor import add_technical_indicators
+
+
+def ohlcv(close, start="2025-01-01"):
+    close = np.asarray(close, dtype=float)
+    index = pd.date_range(start, periods=len(close), freq="5min")
+    return pd.DataFrame({
+        "open": close, "high": close * 1.001, "low": close * 0.999, "close": close,
+        "volume": 1.0, "turnover": close,
+    }, index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="numba vs pandas_ta indicator timing")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for rows in (200, 1000):
+        frame = ohlcv(100 * np.exp(np.cumsum(np.random.default_rng(args.seed).normal(0, 0.01, rows))))
+        for backend in ("pandas_ta", "numba"):
+            results[f"add_technical_indicators[{backend},{rows}]"] = measure(
+                lambda backend=backend: add_technical_indicators(frame.copy(), backend=backend)
+            )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
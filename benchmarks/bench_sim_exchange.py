@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tick throughput of the in-process simulated exchange.
+
+Opens perp positions with TP/SL (and spot stop orders) across many symbols,
+then streams a random-walk price feed through on_tick() and reports ticks per
+minute and how many triggers fired.
+
+Usage:
+    python -m benchmarks.bench_sim_exchange --symbols 500 --ticks 2000000
+"""
+
+import time
+import random
+import argparse
+from sim_exchange import SimulatedExchange
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SimulatedExchange tick throughput")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--ticks", type=int, default=1_000_000)
+    parser.add_argument("--volatility", type=float, default=0.0005, help="Per-tick random walk step (fraction)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    exchange = SimulatedExchange(starting_balance=10_000_000)
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    prices = {symbol: 1.0 + rng.random() * 100 for symbol in symbols}
+    ts_ms = 1_760_000_000_000
+
+    for i, symbol in enumerate(symbols):
+        exchange.on_tick(symbol, prices[symbol], ts_ms)
+        price = prices[symbol]
+        if i % 2 == 0:
+            exchange.place_order(category="linear", symbol=symbol, side="Buy", qty="10",
+                                 takeProfit=str(price * 1.01), stopLoss=str(price * 0.99))
+        else:
+            exchange.place_order(category="spot", symbol=symbol, side="Buy", qty="10")
+            exchange.place_order(category="spot", symbol=symbol, side="Sell", qty="10",
+                                 triggerPrice=str(price * 0.99), orderFilter="StopOrder")
+
+    armed = len(exchange.triggers)
+    feed = []
+    for _ in range(args.ticks):
+        symbol = symbols[rng.randrange(len(symbols))]
+        prices[symbol] *= 1 + rng.uniform(-args.volatility, args.volatility)
+        feed.append((symbol, prices[symbol]))
+
+    on_tick = exchange.on_tick
+    start = time.perf_counter()
+    for symbol, price in feed:
+        ts_ms += 10
+        on_tick(symbol, price, ts_ms)
+    elapsed = time.perf_counter() - start
+
+    print(f"symbols:          {args.symbols}")
+    print(f"ticks:            {args.ticks:,}")
+    print(f"elapsed:          {elapsed:.3f}s")
+    print(f"ticks per minute: {args.ticks / elapsed * 60:,.0f}")
+    print(f"per tick:         {elapsed / args.ticks * 1e6:.2f}us")
+    print(f"triggers fired:   {armed - len(exchange.triggers)} of {armed}")
+    print(f"executions:       {len(exchange.executions):,}")
+
+
+if __name__ == "__main__":
+    main()
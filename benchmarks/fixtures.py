@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Bybit response fixtures for benchmarks.
+
+Fixtures are loaded from benchmarks/fixtures/<name>.json when present, so
+pages recorded from the demo API are used as-is. Otherwise a deterministic
+Bybit-shaped payload is synthesized, which keeps benchmarks runnable with no
+credentials or network access.
+
+Usage:
+    python -m benchmarks.fixtures record --symbol XRPUSDT   # capture from the demo API
+    python -m benchmarks.fixtures synthesize                # write synthetic pages to disk
+"""
+
+import os
+import json
+import time
+import argparse
+from bybit_mock_server import build_kline_list, synthetic_price
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Fixed "now" so synthesized pages are identical between runs
+FIXTURE_END_MS = 1_760_000_000_000 // 60_000 * 60_000
+
+
+def _response(result: dict):
+    return {"retCode": 0, "retMsg": "OK", "result": result, "retExtInfo": {}, "time": FIXTURE_END_MS}
+
+
+def synthesize_kline_page(symbol: str = "XRPUSDT", category: str = "linear", interval: int = 5, limit: int = 1000):
+    return _response({
+        "category": category,
+        "symbol": symbol,
+        "list": build_kline_list(symbol, interval, limit, end_ms=FIXTURE_END_MS),
+    })
+
+
+def synthesize_wallet(coins: dict = None):
+    coins = coins or {"USDT": 10000.0, "XRP": 250.0}
+    return _response({"list": [{
+        "accountType": "UNIFIED",
+        "totalEquity": str(sum(coins.values())),
+        "coin": [
+            {"coin": name, "walletBalance": str(balance), "equity": str(balance), "usdValue": str(balance)}
+            for name, balance in coins.items()
+        ],
+    }]})
+
+
+def synthesize_positions(symbol: str = "XRPUSDT", size: float = 100.0):
+    price = synthetic_price(symbol, FIXTURE_END_MS // 60_000)
+    return _response({"category": "linear", "list": [{
+        "symbol": symbol, "side": "Buy" if size else "", "size": str(size), "avgPrice": str(price),
+        "markPrice": str(price * 1.001), "unrealisedPnl": str(size * price * 0.001), "leverage": "10",
+        "positionValue": str(size * price), "positionIdx": 0,
+    }]})
+
+
+def synthesize_executions(count: int = 100, symbol: str = "XRPUSDT", category: str = "linear", start_index: int = 0):
+    """Returns `count` execution records (newest first) alternating opening and closing fills."""
+    executions = []
+    for i in range(start_index, start_index + count):
+        price = synthetic_price(symbol, i)
+        qty = 10.0 + (i % 7)
+        closing = i % 2 == 1
+        executions.append({
+            "symbol": symbol, "orderId": f"order-{i}", "orderLinkId": "", "side": "Sell" if closing else "Buy",
+            "orderType": "Market", "orderPrice": f"{price:.6f}", "orderQty": str(qty), "leavesQty": "0",
+            "execId": f"exec-{symbol}-{i}", "execPrice": f"{price:.6f}", "execQty": str(qty),
+            "execValue": f"{price * qty:.6f}", "execFee": f"{price * qty * 0.00055:.8f}",
+            "execFeeV2": "", "feeCurrency": "USDT", "feeRate": "0.00055", "isMaker": False,
+            "execType": "Trade", "stopOrderType": "UNKNOWN", "createType": "CreateByUser",
+            "tradeIv": "", "markIv": "", "markPrice": f"{price:.6f}", "indexPrice": "", "underlyingPrice": "",
+            "blockTradeId": "", "closedSize": str(qty) if closing else "0", "seq": str(100000 + i),
+            "extraFees": "", "execTime": str(FIXTURE_END_MS - (start_index + count - i) * 60_000),
+        })
+    executions.reverse()
+    return executions
+
+
+def synthesize_execution_page(count: int = 100, symbol: str = "XRPUSDT", category: str = "linear"):
+    return _response({"category": category, "list": synthesize_executions(count, symbol, category), "nextPageCursor": ""})
+
+
+SYNTHESIZERS = {
+    "kline_linear": lambda: synthesize_kline_page(category="linear"),
+    "kline_spot": lambda: synthesize_kline_page(category="spot"),
+    "wallet": synthesize_wallet,
+    "positions": synthesize_positions,
+    "executions": synthesize_execution_page,
+}
+
+
+def load_fixture(name: str):
+    """Returns the recorded fixture `name` if present on disk, otherwise a synthesized one."""
+    path = os.path.join(FIXTURE_DIR, f"{name}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return SYNTHESIZERS[name]()
+
+
+class FixtureSession:
+    """
+    Stand-in for the pybit HTTP session that serves fixtures with no network.
+
+    Assign it to `bybit_tools.session` to benchmark parsing and business logic
+    in isolation from exchange latency.
+    """
+
+    def __init__(self):
+        self.fixtures = {name: load_fixture(name) for name in SYNTHESIZERS}
+        self.order_count = 0
+
+    def get_kline(self, category="linear", limit=200, **kwargs):
+        page = self.fixtures["kline_spot" if category == "spot" else "kline_linear"]
+        if limit >= len(page["result"]["list"]):
+            return page
+        return {**page, "result": {**page["result"], "list": page["result"]["list"][:limit]}}
+
+    def get_wallet_balance(self, **kwargs):
+        return self.fixtures["wallet"]
+
+    def get_positions(self, **kwargs):
+        return self.fixtures["positions"]
+
+    def get_executions(self, **kwargs):
+        return self.fixtures["executions"]
+
+    def get_tickers(self, symbol="XRPUSDT", **kwargs):
+        last_close = self.fixtures["kline_linear"]["result"]["list"][0][4]
+        return _response({"list": [{"symbol": symbol, "lastPrice": last_close}]})
+
+    def get_instruments_info(self, symbol="XRPUSDT", **kwargs):
+        return _response({"list": [{"symbol": symbol, "lotSizeFilter": {"minOrderQty": "0.1", "qtyStep": "0.1"}}]})
+
+    def place_order(self, **kwargs):
+        self.order_count += 1
+        return _response({"orderId": f"fixture-order-{self.order_count}", "orderLinkId": ""})
+
+
+def record_fixtures(symbol: str, interval: int):
+    """Captures live pages from the Bybit demo API into FIXTURE_DIR."""
+    from bybit_tools import session
+
+    pages = {
+        "kline_linear": session.get_kline(category="linear", symbol=symbol, interval=interval, limit=1000),
+        "kline_spot": session.get_kline(category="spot", symbol=symbol, interval=interval, limit=1000),
+        "wallet": session.get_wallet_balance(accountType="UNIFIED"),
+        "positions": session.get_positions(category="linear", symbol=symbol),
+        "executions": session.get_executions(category="linear", symbol=symbol, limit=100),
+    }
+    write_fixtures(pages)
+
+
+def write_fixtures(pages: dict):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name, page in pages.items():
+        path = os.path.join(FIXTURE_DIR, f"{name}.json")
+        with open(path, "w") as f:
+            json.dump(page, f)
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or synthesize Bybit benchmark fixtures")
+    parser.add_argument("command", choices=["record", "synthesize"])
+    parser.add_argument("--symbol", default="XRPUSDT")
+    parser.add_argument("--interval", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_fixtures(args.symbol, args.interval)
+    else:
+        write_fixtures({name: synthesize() for name, synthesize in SYNTHESIZERS.items()})
@@ -0,0 +1,135 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+
+@contextmanager
+def quiet():
+    """Swallows the print() chatter of the code under test so it doesn't distort timings."""
+    with redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(function, repeat: int = 5, number: int = None, min_time: float = 0.2, setup=None, warmup: bool = True):
+    """
+    Times `function` like timeit: `number` calls per sample, `repeat` samples.
+
+    When `number` is None it is chosen so one sample takes at least `min_time`
+    seconds. `setup` (if given) runs before each sample and is not timed.
+
+    Returns:
+        dict: per-call seconds (min, median, mean, max) plus the loop parameters
+    """
+    # Warm-up call so lazy imports and first-call caches don't land in the samples
+    if warmup:
+        if setup:
+            setup()
+        function()
+
+    if number is None:
+        number = 1
+        while True:
+            if setup:
+                setup()
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            if time.perf_counter() - start >= min_time or number >= 1_000_000:
+                break
+            number *= 10
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - start) / number)
+
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def environment_info():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BENCHMARK_DIR
+        ).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": revision,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def save_results(results: dict, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, indent=2, sort_keys=True)
+    print(f"Saved results to {path}")
+
+
+def load_results(path: str):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.10):
+    """
+    Prints a baseline comparison table using median per-call times.
+
+    Returns:
+        list: names of benchmarks slower than the baseline by more than `threshold`
+    """
+    regressions = []
+    print(f"\n{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name in sorted(current):
+        now = current[name]["median"]
+        if name not in baseline:
+            print(f"{name:<45} {'-':>12} {format_seconds(now):>12} {'new':>9}")
+            continue
+        before = baseline[name]["median"]
+        change = (now - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<45} {format_seconds(before):>12} {format_seconds(now):>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def format_seconds(seconds: float):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.3f}s"
+
+
+def print_results(results: dict):
+    print(f"\n{'benchmark':<45} {'median':>12} {'min':>12} {'loops':>10}")
+    for name in sorted(results):
+        r = results[name]
+        print(f"{name:<45} {format_seconds(r['median']):>12} {format_seconds(r['min']):>12} "
+              f"{r['number']:>5}x{r['repeat']}")
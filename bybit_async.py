@@ -0,0 +1,407 @@
+import os
+import time
+import hmac
+import json
+import asyncio
+import hashlib
+import threading
+import httpx
+import pandas as pd
+import bybit_tools
+from pybit.unified_trading import HTTP
+from dotenv import load_dotenv
+from metrics import span
+from market_data import MAX_KLINE_LIMIT, candles_to_fetch, merge_candles
+from bybit_tools import (
+    klines_to_dataframe,
+    safe_float_convert,
+    spot_position_from_response,
+    ledger_entry_price,
+    spot_position_error,
+    perp_position_from_response,
+    perp_position_error,
+)
+
+load_dotenv()
+
+# Same host pybit uses for `HTTP(testnet=False, demo=True)`
+DEMO_BASE_URL = "https://api-demo.bybit.com"
+
+# Fetch the exchange reads of a watchlist cycle concurrently with this client (see snapshots_available)
+ASYNC_SNAPSHOTS = os.environ.get("ASYNC_SNAPSHOTS", "1").lower() not in ("0", "false", "no")
+
+# Endpoints that do not require a signature
+PUBLIC_PATHS = {
+    "/v5/market/kline",
+    "/v5/market/tickers",
+    "/v5/market/instruments-info",
+}
+
+
+class AsyncBybitClient:
+    """
+    Asyncio Bybit v5 REST client built on httpx.
+
+    Uses a single keep-alive connection pool so concurrent reads share warm
+    HTTP/1.1 connections, and signs private requests exactly like pybit
+    (HMAC-SHA256 over timestamp + api_key + recv_window + payload).
+
+    Usage:
+        async with AsyncBybitClient() as client:
+            klines, positions = await asyncio.gather(
+                client.get_kline(category="linear", symbol="XRPUSDT", interval=5, limit=1000),
+                client.get_positions(category="linear", symbol="XRPUSDT"),
+            )
+    """
+
+    def __init__(self, api_key: str = None, api_secret: str = None, base_url: str = None,
+                 recv_window: int = 5000, timeout: float = 30.0, max_connections: int = 20):
+        # Defaults follow the sync session, so both always talk to the same API with the same account
+        session = bybit_tools.session
+        self.api_key = api_key or getattr(session, "api_key", None) or os.environ.get("BYBIT_API_KEY_TESTNET")
+        self.api_secret = api_secret or getattr(session, "api_secret", None) or os.environ.get("BYBIT_API_SECRET_TESTNET")
+        self.base_url = base_url or os.environ.get("BYBIT_BASE_URL") or getattr(session, "endpoint", None) or DEMO_BASE_URL
+        self.recv_window = recv_window
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            http2=False,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30.0,
+            ),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _sign(self, payload: str, timestamp: int):
+        """Returns the Bybit v5 HMAC-SHA256 signature for a request payload."""
+        if self.api_key is None or self.api_secret is None:
+            raise PermissionError("Authenticated endpoints require keys.")
+        param_str = str(timestamp) + self.api_key + str(self.recv_window) + payload
+        return hmac.new(
+            self.api_secret.encode("utf-8"), param_str.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+    def _headers(self, path: str, payload: str):
+        if path in PUBLIC_PATHS:
+            return {}
+        timestamp = int(time.time() * 1000)
+        return {
+            "Content-Type": "application/json",
+            "X-BAPI-API-KEY": self.api_key,
+            "X-BAPI-SIGN": self._sign(payload, timestamp),
+            "X-BAPI-SIGN-TYPE": "2",
+            "X-BAPI-TIMESTAMP": str(timestamp),
+            "X-BAPI-RECV-WINDOW": str(self.recv_window),
+        }
+
+    async def _rate_limit(self):
+        # Same request budget as the sync session (bybit_tools.use_rate_limiter); acquire() may sleep
+        if bybit_tools.rate_limiter is not None:
+            await asyncio.to_thread(bybit_tools.rate_limiter.acquire)
+
+    async def get(self, path: str, **params):
+        """
+        Sends a GET request and returns the decoded Bybit response.
+
+        Parameters are sorted and joined the same way pybit does it so the
+        query string sent is byte-for-byte the string that was signed.
+        """
+        query = "&".join(
+            f"{k}={v}" for k, v in sorted(params.items()) if v is not None
+        )
+        url = f"{path}?{query}" if query else path
+        await self._rate_limit()
+        response = await self.client.get(url, headers=self._headers(path, query))
+        return response.json()
+
+    async def post(self, path: str, **params):
+        """Sends a signed POST request with a JSON body."""
+        body = json.dumps({k: v for k, v in params.items() if v is not None})
+        await self._rate_limit()
+        response = await self.client.post(path, content=body, headers=self._headers(path, body))
+        return response.json()
+
+    # Raw endpoint wrappers (same keyword names as pybit's HTTP session)
+
+    async def get_kline(self, **kwargs):
+        with span("bybit", "get_kline", kwargs.get("symbol")):
+            return await self.get("/v5/market/kline", **kwargs)
+
+    async def get_tickers(self, **kwargs):
+        with span("bybit", "get_tickers", kwargs.get("symbol")):
+            return await self.get("/v5/market/tickers", **kwargs)
+
+    async def get_instruments_info(self, **kwargs):
+        with span("bybit", "get_instruments_info", kwargs.get("symbol")):
+            return await self.get("/v5/market/instruments-info", **kwargs)
+
+    async def get_wallet_balance(self, **kwargs):
+        with span("bybit", "get_wallet_balance", kwargs.get("symbol")):
+            return await self.get("/v5/account/wallet-balance", **kwargs)
+
+    async def get_positions(self, **kwargs):
+        with span("bybit", "get_positions", kwargs.get("symbol")):
+            return await self.get("/v5/position/list", **kwargs)
+
+    async def get_executions(self, **kwargs):
+        with span("bybit", "get_executions", kwargs.get("symbol")):
+            return await self.get("/v5/execution/list", **kwargs)
+
+
+# =============================================================================
+# ASYNC MIRRORS OF THE bybit_tools READ FUNCTIONS
+# =============================================================================
+
+async def spot_get_market_data(client: AsyncBybitClient, symbol: str, interval: str, limit: int = 30):
+    """Fetches market data (OHLCV) for spot trading."""
+    response = await client.get_kline(category="spot", symbol=symbol, interval=interval, limit=limit)
+    return klines_to_dataframe(response)
+
+async def perp_get_market_data(client: AsyncBybitClient, symbol: str, interval: int, limit: int):
+    """Fetches historical OHLCV data for perpetual futures."""
+    response = await client.get_kline(category="linear", symbol=symbol, interval=interval, limit=limit)
+    return klines_to_dataframe(response)
+
+async def spot_get_account_balance(client: AsyncBybitClient, account_type: str):
+    """Retrieves the current wallet balance."""
+    return await client.get_wallet_balance(accountType=account_type)
+
+async def perp_get_account_balance(client: AsyncBybitClient, account_type: str):
+    """Retrieves the current wallet balance for perpetual futures trading."""
+    return await client.get_wallet_balance(accountType=account_type)
+
+async def get_last_price(client: AsyncBybitClient, symbol: str, category: str):
+    """Returns the last traded price from the ticker endpoint (0.0 if unavailable)."""
+    response = await client.get_tickers(category=category, symbol=symbol)
+    if response.get('retCode') == 0 and response.get('result', {}).get('list'):
+        return safe_float_convert(response['result']['list'][0].get('lastPrice'))
+    return 0.0
+
+def live_position_book():
+    """The PositionBook attached in bybit_tools if it can serve reads, else None."""
+    book = bybit_tools.position_book
+    return book if book is not None and book.live() else None
+
+async def _ready(response: dict):
+    """Lets a value at hand (e.g. a position book response) take a slot in asyncio.gather."""
+    return response
+
+async def spot_get_open_positions(client: AsyncBybitClient, symbol: str):
+    """
+    Checks the base currency balance for a spot symbol.
+    The wallet and price lookups are issued concurrently.
+    """
+    try:
+        base_currency = symbol.replace("USDT", "")
+        book = live_position_book()
+        if book:
+            response = book.get_wallet_balance(accountType="UNIFIED", coin=base_currency)
+            current_price = await get_last_price(client, symbol, "spot")
+        else:
+            response, current_price = await asyncio.gather(
+                client.get_wallet_balance(accountType="UNIFIED", coin=base_currency),
+                get_last_price(client, symbol, "spot"),
+            )
+        return spot_position_from_response(response, symbol, current_price, ledger_entry_price(symbol))
+    except Exception as e:
+        print(f"Error getting open spot positions for {symbol}: {e}")
+        return spot_position_error(symbol, e)
+
+async def perp_get_open_positions(client: AsyncBybitClient, symbol: str):
+    """Checks for open perpetual futures positions for a given symbol."""
+    try:
+        book = live_position_book()
+        if book:
+            response = book.get_positions(category="linear", symbol=symbol)
+        else:
+            response = await client.get_positions(category="linear", symbol=symbol)
+        return perp_position_from_response(response, symbol)
+    except Exception as e:
+        print(f"Error getting open positions for {symbol}: {e}")
+        return perp_position_error(symbol, e)
+
+async def get_bybit_trade_history(client: AsyncBybitClient, category: str = "linear", symbol: str = None,
+                                  limit: int = 50, start_time: int = None, end_time: int = None):
+    """Fetch trade execution history from Bybit."""
+    try:
+        return await client.get_executions(
+            category=category, symbol=symbol, limit=limit, startTime=start_time, endTime=end_time
+        )
+    except Exception as e:
+        print(f"Exception while fetching trade history: {e}")
+        return {"retCode": -1, "retMsg": str(e), "result": {"list": []}}
+
+def snapshots_available():
+    """
+    True if the cycle's exchange reads can go through AsyncBybitClient: it
+    talks to the same API as the default pybit session, so not while
+    use_session() routes the bot to a simulated exchange (paper trading).
+    """
+    return ASYNC_SNAPSHOTS and isinstance(bybit_tools.session, HTTP)
+
+async def fetch_symbol_snapshot(client: AsyncBybitClient, symbol: str, interval: int,
+                                trading_mode: str = "perp", limit: int = MAX_KLINE_LIMIT,
+                                candles: pd.DataFrame = None, klines: bool = True):
+    """
+    Fetches klines, position, wallet, ticker (and perp instrument info) for one symbol concurrently.
+
+    Args:
+        client: Shared AsyncBybitClient
+        symbol: Trading symbol (e.g., 'XRPUSDT')
+        interval: Kline interval in minutes
+        trading_mode: 'spot' or 'perp'
+        limit: Number of klines in the window
+        candles: Window of the previous cycle; only the candles since its last one are fetched
+            (see market_data.update_candles)
+        klines: False to skip the klines (e.g. when they come from the 1-minute cache)
+
+    Returns:
+        dict: market_data (up-to-date window, None if it couldn't be fetched or klines=False),
+        position (dict), wallet (raw USDT wallet response), last_price (float),
+        instrument_info (raw response, perp only)
+    """
+    category = "spot" if trading_mode == "spot" else "linear"
+    base_currency = symbol.replace("USDT", "")
+
+    book = live_position_book()
+    if book:
+        position_request = _ready(
+            book.get_wallet_balance(accountType="UNIFIED", coin=base_currency) if trading_mode == "spot"
+            else book.get_positions(category="linear", symbol=symbol)
+        )
+        wallet_request = _ready(book.get_wallet_balance(accountType="UNIFIED", coin="USDT"))
+    else:
+        if trading_mode == "spot":
+            position_request = client.get_wallet_balance(accountType="UNIFIED", coin=base_currency)
+        else:
+            position_request = client.get_positions(category="linear", symbol=symbol)
+        wallet_request = client.get_wallet_balance(accountType="UNIFIED", coin="USDT")
+
+    count = candles_to_fetch(candles, interval, limit)
+    kline_request = client.get_kline(category=category, symbol=symbol, interval=interval, limit=count) \
+        if klines else _ready(None)
+    instrument_request = client.get_instruments_info(category="linear", symbol=symbol) \
+        if trading_mode == "perp" else _ready({})
+
+    kline_response, position_response, wallet, last_price, instrument_info = await asyncio.gather(
+        kline_request,
+        position_request,
+        wallet_request,
+        get_last_price(client, symbol, category),
+        instrument_request,
+        return_exceptions=True,
+    )
+
+    # A failed sub-request degrades to the same empty/error values the sync readers return
+    market_data = None
+    if klines and not isinstance(kline_response, Exception) and kline_response.get('retCode') == 0:
+        market_data = merge_candles(candles, klines_to_dataframe(kline_response), count, limit)
+    if isinstance(last_price, Exception):
+        last_price = 0.0
+    if isinstance(wallet, Exception):
+        wallet = {"retCode": -1, "retMsg": str(wallet)}
+    if isinstance(instrument_info, Exception):
+        instrument_info = {}
+
+    if trading_mode == "spot":
+        if isinstance(position_response, Exception):
+            position = spot_position_error(symbol, position_response)
+        else:
+            position = spot_position_from_response(position_response, symbol, last_price, ledger_entry_price(symbol))
+    else:
+        if isinstance(position_response, Exception):
+            position = perp_position_error(symbol, position_response)
+        else:
+            position = perp_position_from_response(position_response, symbol)
+
+    return {
+        "symbol": symbol,
+        "market_data": market_data,
+        "position": position,
+        "wallet": wallet,
+        "last_price": last_price,
+        "instrument_info": instrument_info,
+    }
+
+async def fetch_watchlist_snapshots(symbols: list, interval: int, trading_mode: str = "perp",
+                                    limit: int = MAX_KLINE_LIMIT, client: AsyncBybitClient = None,
+                                    candles: dict = None, klines: bool = True):
+    """
+    Fetches snapshots for every symbol in a watchlist concurrently over one connection pool.
+
+    Args:
+        candles: {symbol: window of the previous cycle} (see fetch_symbol_snapshot)
+
+    Returns:
+        dict: symbol -> snapshot (see fetch_symbol_snapshot)
+    """
+    owns_client = client is None
+    client = client or AsyncBybitClient()
+    candles = candles or {}
+    try:
+        snapshots = await asyncio.gather(*[
+            fetch_symbol_snapshot(client, symbol, interval, trading_mode, limit, candles.get(symbol), klines)
+            for symbol in symbols
+        ])
+        return {snapshot["symbol"]: snapshot for snapshot in snapshots}
+    finally:
+        if owns_client:
+            await client.close()
+
+
+class SnapshotFetcher:
+    """
+    Runs watchlist snapshots for sync code on one event loop thread with one
+    long-lived client, so the connections (and their TLS sessions) are
+    reused from cycle to cycle instead of opened and closed every time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.client = None
+        self.client_key = None
+
+    def _ensure_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name="bybit-async", daemon=True).start()
+
+    async def _client_for(self):
+        # A new client when use_session() or the keys changed what the defaults point at
+        client = AsyncBybitClient()
+        key = (client.base_url, client.api_key, client.api_secret)
+        if key == self.client_key:
+            await client.close()
+            return self.client
+        if self.client is not None:
+            await self.client.close()
+        self.client, self.client_key = client, key
+        return client
+
+    async def _fetch(self, symbols, interval, trading_mode, candles, klines):
+        client = await self._client_for()
+        return await fetch_watchlist_snapshots(symbols, interval, trading_mode, client=client,
+                                               candles=candles, klines=klines)
+
+    def fetch(self, symbols: list, interval: int, trading_mode: str, candles: dict = None, klines: bool = True):
+        """fetch_watchlist_snapshots() from sync code; blocks until every snapshot is in."""
+        with self.lock:
+            self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch(symbols, interval, trading_mode, candles, klines), self.loop
+        )
+        return future.result()
+
+
+snapshot_fetcher = SnapshotFetcher()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Local Bybit v5 REST stand-in for exercising the clients without network access.
+
+Serves Bybit-shaped responses for the read endpoints used by bybit_tools and
+bybit_async (kline, tickers, instruments-info, wallet-balance, position/list,
+execution/list) plus order/create, with an optional artificial per-request
+latency so concurrency gains can be measured.
+
+Usage:
+    python bybit_mock_server.py --port 8765 --latency-ms 50
+
+    # or in-process
+    with MockBybitServer(latency_ms=50) as server:
+        client = AsyncBybitClient(base_url=server.url, api_key="k", api_secret="s")
+"""
+
+import json
+import time
+import math
+import hmac
+import uuid
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+INTERVAL_MS = 60 * 1000
+
+
+def synthetic_price(symbol: str, index: int):
+    """Deterministic, smooth-ish price path so indicator outputs are reproducible."""
+    seed = sum(ord(c) for c in symbol)
+    base = 0.5 + (seed % 100)
+    return base * (1 + 0.01 * math.sin(index / 7.0) + 0.004 * math.sin(index / 1.7 + seed))
+
+
+def build_kline_list(symbol: str, interval: int, limit: int, end_ms: int = None):
+    """Returns kline rows in Bybit's format (strings, newest first)."""
+    step = int(interval) * INTERVAL_MS if str(interval).isdigit() else INTERVAL_MS
+    end_ms = end_ms or int(time.time() * 1000) // step * step
+    rows = []
+    for i in range(limit):
+        start = end_ms - i * step
+        index = start // step
+        open_ = synthetic_price(symbol, index - 1)
+        close = synthetic_price(symbol, index)
+        high = max(open_, close) * 1.001
+        low = min(open_, close) * 0.999
+        volume = 1000 + (index % 50) * 10
+        rows.append([
+            str(start), f"{open_:.6f}", f"{high:.6f}", f"{low:.6f}", f"{close:.6f}",
+            str(volume), f"{volume * close:.4f}",
+        ])
+    return rows
+
+
+def _kline_end(params: dict):
+    """Start of the newest candle at or before the request's `end` (ms), if given."""
+    if "end" not in params:
+        return None
+    interval = params.get("interval", "1")
+    step = int(interval) * INTERVAL_MS if str(interval).isdigit() else INTERVAL_MS
+    return int(params["end"]) // step * step
+
+
+class MockBybitState:
+    """Mutable account state shared by all request handler threads."""
+
+    def __init__(self, api_secret: str = None):
+        self.api_secret = api_secret
+        self.lock = threading.Lock()
+        self.positions = {}  # symbol -> position dict (Bybit shape)
+        self.executions = []  # newest first
+        self.coins = {"USDT": 10000.0}
+
+    def wallet(self, coin: str = None):
+        with self.lock:
+            coins = [
+                {"coin": name, "walletBalance": str(balance), "equity": str(balance)}
+                for name, balance in self.coins.items()
+                if coin is None or name == coin
+            ]
+        return {"list": [{"accountType": "UNIFIED", "coin": coins}]}
+
+    def position(self, symbol: str):
+        with self.lock:
+            position = self.positions.get(symbol)
+        if position is None:
+            position = {
+                "symbol": symbol, "side": "", "size": "0", "avgPrice": "0", "markPrice": "0",
+                "unrealisedPnl": "0", "leverage": "10", "positionValue": "0",
+            }
+        return {"category": "linear", "list": [position]}
+
+    def place_order(self, params: dict):
+        symbol = params.get("symbol")
+        side = params.get("side")
+        qty = float(params.get("qty", 0))
+        price = synthetic_price(symbol, int(time.time() * 1000) // INTERVAL_MS)
+        order_id = str(uuid.uuid4())
+        with self.lock:
+            if params.get("category") == "linear":
+                if params.get("reduceOnly"):
+                    self.positions.pop(symbol, None)
+                else:
+                    self.positions[symbol] = {
+                        "symbol": symbol, "side": side, "size": str(qty), "avgPrice": str(price),
+                        "markPrice": str(price), "unrealisedPnl": "0", "leverage": "10",
+                        "positionValue": str(qty * price),
+                    }
+            elif params.get("orderFilter") != "StopOrder":
+                base = symbol.replace("USDT", "")
+                sign = 1 if side == "Buy" else -1
+                self.coins[base] = self.coins.get(base, 0.0) + sign * qty
+                self.coins["USDT"] = self.coins.get("USDT", 0.0) - sign * qty * price
+            self.executions.insert(0, {
+                "symbol": symbol, "orderId": order_id, "orderLinkId": "", "side": side,
+                "orderType": "Market", "orderPrice": str(price), "orderQty": str(qty), "leavesQty": "0",
+                "execId": str(uuid.uuid4()), "execPrice": str(price), "execQty": str(qty),
+                "execValue": str(qty * price), "execFee": str(qty * price * 0.001), "feeRate": "0.001",
+                "feeCurrency": "USDT", "isMaker": False, "execType": "Trade", "stopOrderType": "",
+                "closedSize": str(qty) if params.get("reduceOnly") else "0",
+                "execTime": str(int(time.time() * 1000)), "seq": str(len(self.executions) + 1),
+            })
+        return {"orderId": order_id, "orderLinkId": ""}
+
+
+class MockBybitHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, result: dict):
+        self._send({"retCode": 0, "retMsg": "OK", "result": result, "time": int(time.time() * 1000)})
+
+    def _authorized(self, payload: str):
+        """Checks the signature headers; verifies the HMAC when the server knows the secret."""
+        state = self.server.state
+        api_key = self.headers.get("X-BAPI-API-KEY")
+        signature = self.headers.get("X-BAPI-SIGN")
+        if not api_key or not signature:
+            return False
+        if state.api_secret is None:
+            return True
+        param_str = (self.headers.get("X-BAPI-TIMESTAMP", "") + api_key
+                     + self.headers.get("X-BAPI-RECV-WINDOW", "") + payload)
+        expected = hmac.new(state.api_secret.encode("utf-8"), param_str.encode("utf-8"), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def _delay(self):
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000.0)
+
+    def do_GET(self):
+        self._delay()
+        parsed = urlparse(self.path)
+        params = dict(parse_qsl(parsed.query))
+        path = parsed.path
+        state = self.server.state
+
+        if path == "/v5/market/kline":
+            self._ok({
+                "category": params.get("category"), "symbol": params.get("symbol"),
+                "list": build_kline_list(params.get("symbol", "XRPUSDT"), params.get("interval", "1"),
+                                         int(params.get("limit", 200)), _kline_end(params)),
+            })
+        elif path == "/v5/market/tickers":
+            symbol = params.get("symbol", "XRPUSDT")
+            price = synthetic_price(symbol, int(time.time() * 1000) // INTERVAL_MS)
+            self._ok({"category": params.get("category"), "list": [{"symbol": symbol, "lastPrice": f"{price:.6f}"}]})
+        elif path == "/v5/market/instruments-info":
+            self._ok({"category": params.get("category"), "list": [{
+                "symbol": params.get("symbol"),
+                "lotSizeFilter": {"minOrderQty": "0.1", "qtyStep": "0.1"},
+                "priceFilter": {"tickSize": "0.0001"},
+            }]})
+        elif not self._authorized(parsed.query):
+            self._send({"retCode": 10003, "retMsg": "Invalid api key or signature", "result": {}})
+        elif path == "/v5/account/wallet-balance":
+            self._ok(state.wallet(params.get("coin")))
+        elif path == "/v5/position/list":
+            self._ok(state.position(params.get("symbol")))
+        elif path == "/v5/execution/list":
+            limit = int(params.get("limit", 50))
+            with state.lock:
+                executions = [e for e in state.executions
+                              if not params.get("symbol") or e["symbol"] == params["symbol"]][:limit]
+            self._ok({"category": params.get("category"), "list": executions, "nextPageCursor": ""})
+        else:
+            self._send({"retCode": 10001, "retMsg": f"Unknown path {path}", "result": {}})
+
+    def do_POST(self):
+        self._delay()
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        if not self._authorized(body):
+            self._send({"retCode": 10003, "retMsg": "Invalid api key or signature", "result": {}})
+            return
+        if urlparse(self.path).path == "/v5/order/create":
+            self._ok(self.server.state.place_order(json.loads(body or "{}")))
+        else:
+            self._send({"retCode": 10001, "retMsg": f"Unknown path {self.path}", "result": {}})
+
+
+class MockBybitServer:
+    """Runs the mock API on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, api_secret: str = None):
+        self.httpd = ThreadingHTTPServer((host, port), MockBybitHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency_ms = latency_ms
+        self.httpd.state = MockBybitState(api_secret)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Bybit v5 mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial delay added to every request")
+    parser.add_argument("--api-secret", default=None, help="Verify request signatures with this secret")
+    args = parser.parse_args()
+
+    server = MockBybitServer(args.host, args.port, args.latency_ms, args.api_secret)
+    print(f"Mock Bybit API listening on {server.url} (latency {args.latency_ms}ms)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
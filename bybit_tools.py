@@ -1,9 +1,12 @@
 
 import os
 import math
+from functools import wraps
 from dotenv import load_dotenv
 from pybit.unified_trading import HTTP
 import pandas as pd
+from metrics import instrument_methods
+from risk_watchdog import spot_exit_levels
 
 load_dotenv()
 
@@ -15,15 +18,109 @@ session = HTTP(
     timeout=30,
 )
 
-def spot_get_market_data(symbol: str, interval: str, limit: int = 30):
-    """Fetches market data (OHLCV) for spot trading."""
-    response = session.get_kline(
-        category="spot",
-        symbol=symbol,
-        interval=interval,
-        limit=limit
-    )
+# Exchange endpoints used by this module (timed on whichever session is active)
+EXCHANGE_METHODS = [
+    "get_kline",
+    "get_tickers",
+    "get_instruments_info",
+    "get_wallet_balance",
+    "get_positions",
+    "get_executions",
+    "place_order",
+]
+instrument_methods(session, EXCHANGE_METHODS, "bybit")
+
+def use_session(new_session):
+    """
+    Routes every call in this module through `new_session` instead of the demo API.
+
+    Any object with the pybit HTTP method names works, e.g. a
+    sim_exchange.SimulatedExchange for paper trading and load tests.
+
+    Returns:
+        The (instrumented) session now in use
+    """
+    global session
+    session = instrument_methods(new_session, EXCHANGE_METHODS, "bybit")
+    if rate_limiter is not None:
+        rate_limit_methods(session, EXCHANGE_METHODS, rate_limiter)
+    return session
+
+# Request budget shared with other processes (e.g. supervisor.SharedTokenBucket), or None
+rate_limiter = None
+
+def rate_limit_methods(obj, method_names, limiter):
+    """Replaces the given bound methods on an instance with wrappers that take a token from `limiter` first."""
+    for method_name in method_names:
+        method = getattr(obj, method_name, None)
+        if method is None or getattr(method, "_rate_limited", False):
+            continue
+
+        def make_wrapper(method=method):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                limiter.acquire()
+                return method(*args, **kwargs)
+            wrapper._rate_limited = True
+            return wrapper
+
+        setattr(obj, method_name, make_wrapper())
+    return obj
+
+def use_rate_limiter(limiter):
+    """
+    Takes a token from `limiter` before every exchange call, so several
+    worker processes stay within one request budget (see supervisor.py).
 
+    Applies to the session in use and to any later use_session() one.
+    """
+    global rate_limiter
+    rate_limiter = limiter
+    rate_limit_methods(session, EXCHANGE_METHODS, limiter)
+    return limiter
+
+# Live position_book.PositionBook (private WebSocket streams), or None to read positions over REST
+position_book = None
+
+def use_position_book(book):
+    """
+    Serves position and spot balance reads from a PositionBook kept current
+    by the private WebSocket streams instead of polling REST.
+
+    Pass None to go back to REST.
+    """
+    global position_book
+    position_book = book
+    return book
+
+# risk_watchdog.SpotRiskWatchdog guarding spot buys between cycles, or None
+spot_watchdog = None
+
+def use_spot_watchdog(watchdog):
+    """Arms `watchdog` with the stop/target levels of every spot buy from now on (None to stop)."""
+    global spot_watchdog
+    spot_watchdog = watchdog
+    return watchdog
+
+def position_source():
+    """The position book while it is connected and in sync, otherwise the REST session."""
+    if position_book is not None and position_book.live():
+        return position_book
+    return session
+
+def klines_to_dataframe(response: dict):
+    """
+    Converts a Bybit kline response into an OHLCV DataFrame.
+
+    Shared by the spot/perp market data readers and the async client so that
+    every transport parses candles identically.
+
+    Args:
+        response: Raw response from the Bybit kline endpoint
+
+    Returns:
+        pd.DataFrame: OHLCV data indexed by timestamp (oldest first), or an empty DataFrame
+    """
     if response['retCode'] == 0 and 'list' in response['result']:
         data = response['result']['list']
         df = pd.DataFrame(data, columns=["timestamp", "open", "high", "low", "close", "volume", "turnover"])
@@ -37,10 +134,20 @@ def spot_get_market_data(symbol: str, interval: str, limit: int = 30):
         for col in numeric_columns:
             df[col] = df[col].apply(lambda x: safe_float_convert(x))
         
-        # Bybit returns data in ascending order (oldest first), so we reverse it
+        # Bybit returns data in descending order (newest first), so we reverse it
         return df.iloc[::-1]
     return pd.DataFrame()
 
+def spot_get_market_data(symbol: str, interval: str, limit: int = 30):
+    """Fetches market data (OHLCV) for spot trading."""
+    response = session.get_kline(
+        category="spot",
+        symbol=symbol,
+        interval=interval,
+        limit=limit
+    )
+    return klines_to_dataframe(response)
+
 def spot_get_account_balance(account_type: str):
     """Retrieves the current balance to calculate position sizes."""
     response = session.get_wallet_balance(accountType=account_type)
@@ -51,9 +158,12 @@ def spot_place_market_order(symbol: str, side: str, qty: float):
     if side.lower() == "buy":
         # Get the current market price to calculate stop loss
         market_data = spot_get_market_data(symbol, 1, 1)  # Get latest price
-        if not market_data.empty:
-            current_price = float(market_data.iloc[0]['close'])
-            stop_loss_price = round(current_price * 0.9925, 4)  # 0.75% below entry price
+        if market_data.empty:
+            # Never open a position we cannot protect
+            print(f"No price available for {symbol}, not placing BUY order")
+            return {"retCode": -1, "retMsg": f"No price available for {symbol} to set a stop loss"}
+        current_price = float(market_data.iloc[0]['close'])
+        stop_loss_price, take_profit_price = spot_exit_levels(current_price)  # SPOT_STOP_LOSS_PCT (0.75%) below entry price
             
         print(f"Placing BUY order for {symbol} at {current_price}")
         
@@ -70,6 +180,10 @@ def spot_place_market_order(symbol: str, side: str, qty: float):
         
         # If market order is successful, place a separate stop loss order
         if response.get('retCode') == 0:
+            # The local watchdog exits within a tick, even if the stop order below fails
+            if spot_watchdog is not None:
+                spot_watchdog.arm(symbol, qty, current_price, stop_loss_price, take_profit_price)
+
             print(f"Placing stop loss order at {stop_loss_price}")
             try:
                 # Place a conditional sell order that triggers when price falls to stop_loss_price
@@ -99,6 +213,97 @@ def spot_place_market_order(symbol: str, side: str, qty: float):
         )
         return response
 
+def spot_position_from_response(response: dict, symbol: str, current_price: float, entry_price: float = None):
+    """
+    Builds the spot position info dict from a wallet balance response.
+
+    Args:
+        response: Raw response from the Bybit wallet balance endpoint (filtered by base coin)
+        symbol: Trading symbol (e.g., 'XRPUSDT')
+        current_price: Latest market price used to value the position
+        entry_price: Average entry price of the open lots (ledger.entry_price), None if unknown
+
+    Returns:
+        dict: Position information in the same shape as perp positions
+    """
+    base_currency = symbol.replace("USDT", "")
+    position_info = {
+        'symbol': symbol,
+        'side': 'None',
+        'size': 0.0,
+        'avgPrice': 0.0,  # Entry price from the PnL ledger, 0.0 if it has no lots
+        'markPrice': current_price,
+        'unrealisedPnl': 0.0,
+        'leverage': '1',  # Spot has no leverage
+        'positionValue': 0.0,
+        'has_position': False,
+        'trading_mode': 'spot'
+    }
+    
+    if response['retCode'] == 0 and 'list' in response['result']:
+        if len(response['result']['list']) > 0:
+            coin_info = response['result']['list'][0]['coin']
+            if len(coin_info) > 0:
+                wallet_balance = coin_info[0].get('walletBalance', '0')
+                # Handle empty strings and convert to float safely
+                if wallet_balance and wallet_balance.strip():
+                    balance = safe_float_convert(wallet_balance)
+                    # Disregard balances under 1 as open positions
+                    if balance >= 1.0:
+                        position_info.update({
+                            'side': 'Buy',  # Spot positions are always long
+                            'size': balance,
+                            'positionValue': balance * current_price,
+                            'has_position': True
+                        })
+                        print(f"Open SPOT position found: {balance} {base_currency} (${balance * current_price:.2f} value)")
+                        if entry_price:
+                            position_info.update({
+                                'avgPrice': entry_price,
+                                'unrealisedPnl': (current_price - entry_price) * balance
+                            })
+                            print(f"Current Price: {current_price}, Entry Price: {entry_price:.6f}, "
+                                  f"Unrealised PnL: {position_info['unrealisedPnl']:.4f}")
+                        else:
+                            print(f"Current Price: {current_price} (no entry price in the PnL ledger)")
+                    else:
+                        print(f"No significant SPOT position for {symbol} (balance: {balance})")
+                else:
+                    print(f"No SPOT position for {symbol}")
+            else:
+                print(f"No coin info found for {base_currency}")
+        else:
+            print(f"No balance data found for {base_currency}")
+    else:
+        print(f"Error getting balance for {base_currency}: {response.get('retMsg', 'Unknown error')}")
+    
+    return position_info
+
+def ledger_entry_price(symbol: str):
+    """Entry price of the spot lots in the PnL ledger, None if unknown or the lookup fails."""
+    try:
+        from ledger import entry_price
+        return entry_price(symbol, "spot")
+    except Exception as e:
+        print(f"Error reading the entry price of {symbol} from the PnL ledger: {e}")
+        return None
+
+def spot_position_error(symbol: str, error: Exception):
+    """Returns the spot position info dict used when the position lookup fails."""
+    return {
+        'symbol': symbol,
+        'side': 'Error',
+        'size': 0.0,
+        'avgPrice': 0.0,
+        'markPrice': 0.0,
+        'unrealisedPnl': 0.0,
+        'leverage': '1',
+        'positionValue': 0.0,
+        'has_position': False,
+        'trading_mode': 'spot',
+        'error': str(error)
+    }
+
 def spot_get_open_positions(symbol: str):
     """
     Checks the balance of the base currency for a given spot symbol.
@@ -108,7 +313,7 @@ def spot_get_open_positions(symbol: str):
     """
     try:
         base_currency = symbol.replace("USDT", "")
-        response = session.get_wallet_balance(
+        response = position_source().get_wallet_balance(
             accountType="UNIFIED",
             coin=base_currency
         )
@@ -119,65 +324,11 @@ def spot_get_open_positions(symbol: str):
         if not market_data.empty:
             current_price = safe_float_convert(market_data.iloc[0]['close'])
         
-        position_info = {
-            'symbol': symbol,
-            'side': 'None',
-            'size': 0.0,
-            'avgPrice': 0.0,  # We don't track entry price for spot, would need separate tracking
-            'markPrice': current_price,
-            'unrealisedPnl': 0.0,  # Cannot calculate without entry price
-            'leverage': '1',  # Spot has no leverage
-            'positionValue': 0.0,
-            'has_position': False,
-            'trading_mode': 'spot'
-        }
-        
-        if response['retCode'] == 0 and 'list' in response['result']:
-            if len(response['result']['list']) > 0:
-                coin_info = response['result']['list'][0]['coin']
-                if len(coin_info) > 0:
-                    wallet_balance = coin_info[0].get('walletBalance', '0')
-                    # Handle empty strings and convert to float safely
-                    if wallet_balance and wallet_balance.strip():
-                        balance = safe_float_convert(wallet_balance)
-                        # Disregard balances under 1 as open positions
-                        if balance >= 1.0:
-                            position_info.update({
-                                'side': 'Buy',  # Spot positions are always long
-                                'size': balance,
-                                'positionValue': balance * current_price,
-                                'has_position': True
-                            })
-                            print(f"Open SPOT position found: {balance} {base_currency} (${balance * current_price:.2f} value)")
-                            print(f"Current Price: {current_price} (PnL calculation requires entry price tracking)")
-                        else:
-                            print(f"No significant SPOT position for {symbol} (balance: {balance})")
-                    else:
-                        print(f"No SPOT position for {symbol}")
-                else:
-                    print(f"No coin info found for {base_currency}")
-            else:
-                print(f"No balance data found for {base_currency}")
-        else:
-            print(f"Error getting balance for {base_currency}: {response.get('retMsg', 'Unknown error')}")
-        
-        return position_info
+        return spot_position_from_response(response, symbol, current_price, ledger_entry_price(symbol))
         
     except Exception as e:
         print(f"Error getting open spot positions for {symbol}: {e}")
-        return {
-            'symbol': symbol,
-            'side': 'Error',
-            'size': 0.0,
-            'avgPrice': 0.0,
-            'markPrice': 0.0,
-            'unrealisedPnl': 0.0,
-            'leverage': '1',
-            'positionValue': 0.0,
-            'has_position': False,
-            'trading_mode': 'spot',
-            'error': str(e)
-        }
+        return spot_position_error(symbol, e)
 
 def spot_close_position(symbol: str):
     """Places a market sell order to close the entire position of the base currency."""
@@ -203,11 +354,14 @@ def spot_close_position(symbol: str):
             
             print(f"Original quantity: {qty}, Rounded down quantity: {rounded_qty}")
             
-            return spot_place_market_order(
+            response = spot_place_market_order(
                 symbol=symbol,
                 side="Sell",
                 qty=str(rounded_qty)
             )
+            if response.get('retCode') == 0 and spot_watchdog is not None:
+                spot_watchdog.disarm(symbol)
+            return response
         return {"retCode": -1, "retMsg": "No open position to close."}
     except Exception as e:
         print(f"Error closing position for {symbol}: {e}")
@@ -262,30 +416,15 @@ def perp_get_market_data(symbol: str, interval: int, limit: int):
         interval=interval,
         limit=limit
     )
-
-    if response['retCode'] == 0 and 'list' in response['result']:
-        data = response['result']['list']
-        df = pd.DataFrame(data, columns=["timestamp", "open", "high", "low", "close", "volume", "turnover"])
-        
-        # Convert timestamp to datetime (fix deprecation warning by converting to int first)
-        df['timestamp'] = pd.to_datetime(pd.to_numeric(df['timestamp']), unit='ms')
-        df.set_index('timestamp', inplace=True)
-        
-        # Convert string values to numeric (float) for OHLCV data
-        numeric_columns = ["open", "high", "low", "close", "volume", "turnover"]
-        for col in numeric_columns:
-            df[col] = df[col].apply(lambda x: safe_float_convert(x))
-        
-        # Bybit returns data in ascending order (oldest first), so we reverse it
-        return df.iloc[::-1]
-    return pd.DataFrame()
+    return klines_to_dataframe(response)
 
 def perp_get_account_balance(account_type: str):
     """Retrieves the current balance for perpetual futures trading to calculate position sizes."""
     response = session.get_wallet_balance(accountType=account_type)
     return response
 
-def perp_place_market_order(symbol: str, side: str, qty: float, margin_usd: float = 50.0, leverage: int = 10):
+def perp_place_market_order(symbol: str, side: str, qty: float, margin_usd: float = 50.0, leverage: int = 10,
+                            instrument_info: dict = None):
     """
     Executes a perpetual futures trade with specific risk management.
     Automatically sets stop loss (-$0.50) and take profit ($1.00) based on position size.
@@ -296,10 +435,11 @@ def perp_place_market_order(symbol: str, side: str, qty: float, margin_usd: floa
         qty: Quantity to trade (calculated based on $500 position size with 10x leverage)
         margin_usd: Margin amount in USD (default: $50)
         leverage: Leverage multiplier (default: 10x)
+        instrument_info: Instruments-info response fetched earlier in the cycle (fetched here if None)
     """
     try:
         # Get instrument info to determine proper quantity precision
-        instruments_response = session.get_instruments_info(
+        instruments_response = instrument_info or session.get_instruments_info(
             category="linear",
             symbol=symbol
         )
@@ -417,64 +557,48 @@ def safe_float_convert(value, default=0.0):
     except (ValueError, TypeError):
         return default
 
-def perp_get_open_positions(symbol: str):
+def perp_position_from_response(response: dict, symbol: str):
     """
-    Checks for open perpetual futures positions for a given symbol.
-    Returns position information including size, side, and unrealized PnL.
-    Always returns position info even if no position is open.
+    Builds the perp position info dict from a position list response.
+
+    Args:
+        response: Raw response from the Bybit position list endpoint
+        symbol: Trading symbol (e.g., 'XRPUSDT')
+
+    Returns:
+        dict: Position information, or None if the response was an error
     """
-    try:
-        response = session.get_positions(
-            category="linear",  # linear = perpetual futures
-            symbol=symbol
-        )
+    if response['retCode'] == 0 and 'list' in response['result']:
+        positions = response['result']['list']
         
-        if response['retCode'] == 0 and 'list' in response['result']:
-            positions = response['result']['list']
+        # Check if there are any open positions
+        for position in positions:
+            position_size = safe_float_convert(position.get('size', '0'))
             
-            # Check if there are any open positions
-            for position in positions:
-                position_size = safe_float_convert(position.get('size', '0'))
-                
-                position_info = {
-                    'symbol': position.get('symbol', symbol),
-                    'side': position.get('side', 'None'),
-                    'size': position_size,
-                    'avgPrice': safe_float_convert(position.get('avgPrice', '0')),
-                    'markPrice': safe_float_convert(position.get('markPrice', '0')),
-                    'unrealisedPnl': safe_float_convert(position.get('unrealisedPnl', '0')),
-                    'leverage': position.get('leverage', '0'),
-                    'positionValue': safe_float_convert(position.get('positionValue', '0')),
-                    'has_position': position_size > 0,
-                    'trading_mode': 'perp'
-                }
-                
-                if position_size > 0:
-                    print(f"Open PERP position found: {position_info}")
-                    print(f"Unrealized PnL: ${position_info['unrealisedPnl']:.2f}")
-
-                
-                return position_info
-            
-            # If no position data found, return empty position info
-            return {
-                'symbol': symbol,
-                'side': 'None',
-                'size': 0.0,
-                'avgPrice': 0.0,
-                'markPrice': 0.0,
-                'unrealisedPnl': 0.0,
-                'leverage': '0',
-                'positionValue': 0.0,
-                'has_position': False,
+            position_info = {
+                'symbol': position.get('symbol', symbol),
+                'side': position.get('side', 'None'),
+                'size': position_size,
+                'avgPrice': safe_float_convert(position.get('avgPrice', '0')),
+                'markPrice': safe_float_convert(position.get('markPrice', '0')),
+                'unrealisedPnl': safe_float_convert(position.get('unrealisedPnl', '0')),
+                'leverage': position.get('leverage', '0'),
+                'positionValue': safe_float_convert(position.get('positionValue', '0')),
+                'has_position': position_size > 0,
                 'trading_mode': 'perp'
             }
             
-    except Exception as e:
-        print(f"Error getting open positions for {symbol}: {e}")
+            if position_size > 0:
+                print(f"Open PERP position found: {position_info}")
+                print(f"Unrealized PnL: ${position_info['unrealisedPnl']:.2f}")
+
+            
+            return position_info
+        
+        # If no position data found, return empty position info
         return {
             'symbol': symbol,
-            'side': 'Error',
+            'side': 'None',
             'size': 0.0,
             'avgPrice': 0.0,
             'markPrice': 0.0,
@@ -482,9 +606,42 @@ def perp_get_open_positions(symbol: str):
             'leverage': '0',
             'positionValue': 0.0,
             'has_position': False,
-            'trading_mode': 'perp',
-            'error': str(e)
+            'trading_mode': 'perp'
         }
+    return None
+
+def perp_position_error(symbol: str, error: Exception):
+    """Returns the perp position info dict used when the position lookup fails."""
+    return {
+        'symbol': symbol,
+        'side': 'Error',
+        'size': 0.0,
+        'avgPrice': 0.0,
+        'markPrice': 0.0,
+        'unrealisedPnl': 0.0,
+        'leverage': '0',
+        'positionValue': 0.0,
+        'has_position': False,
+        'trading_mode': 'perp',
+        'error': str(error)
+    }
+
+def perp_get_open_positions(symbol: str):
+    """
+    Checks for open perpetual futures positions for a given symbol.
+    Returns position information including size, side, and unrealized PnL.
+    Always returns position info even if no position is open.
+    """
+    try:
+        response = position_source().get_positions(
+            category="linear",  # linear = perpetual futures
+            symbol=symbol
+        )
+        return perp_position_from_response(response, symbol)
+            
+    except Exception as e:
+        print(f"Error getting open positions for {symbol}: {e}")
+        return perp_position_error(symbol, e)
 
 def perp_close_position(symbol: str):
     """
@@ -529,7 +686,7 @@ def perp_close_position(symbol: str):
         print(f"Error closing position for {symbol}: {e}")
         return {"retCode": -1, "retMsg": str(e)}
 
-def monitor_position_pnl(symbol: str, trading_mode: str):
+def monitor_position_pnl(symbol: str, trading_mode: str, position_info: dict = None):
     """
     Monitor and log the current position and unrealized PnL for a given symbol and trading mode.
     This function should be called every trading cycle to track position performance.
@@ -537,6 +694,7 @@ def monitor_position_pnl(symbol: str, trading_mode: str):
     Args:
         symbol: Trading symbol (e.g., 'XRPUSDT')
         trading_mode: 'spot' or 'perp'
+        position_info: Position already read this cycle (e.g. a prefetched snapshot's), None to look it up
     
     Returns:
         dict: Position information with PnL details
@@ -544,7 +702,9 @@ def monitor_position_pnl(symbol: str, trading_mode: str):
     print(f"\n---MONITORING POSITION PnL ({trading_mode.upper()})---")
     
     try:
-        if trading_mode == 'spot':
+        if position_info is not None:
+            pass
+        elif trading_mode == 'spot':
             position_info = spot_get_open_positions(symbol)
         elif trading_mode == 'perp':
             position_info = perp_get_open_positions(symbol)
@@ -632,7 +792,10 @@ def get_bybit_trade_history(category: str = "linear", symbol: str = None, limit:
 
 def calculate_trade_pnl(execution: dict, category: str = "linear"):
     """
-    Calculate the profit/loss for a single trade execution.
+    Calculate the cash flow of a single trade execution.
+
+    This is not realized PnL: store_trade_history_to_db books that from the
+    lot ledger (ledger.py).
     
     For spot trades:
     - Buy: PnL = -(exec_value + exec_fee) [negative because it's a purchase]
@@ -710,18 +873,43 @@ def store_trade_history_to_db(executions_list: list, category: str = "linear"):
     Returns:
         dict: Summary of stored records
     """
-    from database import SessionLocal, BybitTradeHistory
+    import datetime
+    from database import SessionLocal, BybitTradeHistory, bump_table_version
+    from ledger import apply_execution, execution_order, lock_symbols
+    from archive import archived_values
     
     stored_count = 0
     updated_count = 0
+    archived_count = 0
     error_count = 0
     
     db = SessionLocal()
     
     try:
-        for execution in executions_list:
+        # Executions already moved to the Parquet archive (a fetch reaching past the retention
+        # window) are neither stored nor applied to the ledger again
+        exec_times = [int(execution['execTime']) for execution in executions_list
+                      if str(execution.get('execTime') or '').isdigit()]
+        archived = archived_values(
+            "bybit_trade_history", "exec_id", [execution.get('execId') for execution in executions_list],
+            end=datetime.datetime.fromtimestamp(max(exec_times) / 1000, tz=datetime.timezone.utc).replace(tzinfo=None)
+        ) if exec_times else set()
+        # execIds of this batch: a page boundary can list an execution twice, and the lookup
+        # below doesn't see rows added earlier in the batch (no autoflush)
+        seen = set()
+
+        # Lock the batch's ledger rows up front, in a fixed order (see ledger.lock_symbols)
+        lock_symbols(db, category, [execution.get('symbol') for execution in executions_list if execution.get('symbol')])
+        # The ledger consumes lots in execution order; Bybit lists the newest first
+        for execution in sorted(executions_list, key=execution_order):
             try:
                 exec_id = execution.get('execId')
+                if exec_id in archived:
+                    archived_count += 1
+                    continue
+                if exec_id in seen:
+                    continue
+                seen.add(exec_id)
                 
                 # Check if this execution already exists
                 existing_record = db.query(BybitTradeHistory).filter(
@@ -735,10 +923,7 @@ def store_trade_history_to_db(executions_list: list, category: str = "linear"):
                             setattr(existing_record, key.lower().replace('id', '_id'), value)
                     updated_count += 1
                 else:
-                    # Create new record
-                    # Calculate PnL for this trade
-                    trade_pnl = calculate_trade_pnl(execution, category)
-                    
+                    # Create new record (first, so a malformed execution fails before the ledger changes)
                     trade_record = BybitTradeHistory(
                         exec_id=execution.get('execId'),
                         symbol=execution.get('symbol'),
@@ -770,11 +955,14 @@ def store_trade_history_to_db(executions_list: list, category: str = "linear"):
                         seq=int(execution.get('seq', 0)) if execution.get('seq') else None,
                         extra_fees=execution.get('extraFees'),
                         exec_time=int(execution.get('execTime')) if execution.get('execTime') else None,
-                        category=category,
-                        pnl=trade_pnl
+                        category=category
                     )
                     
-                    db.add(trade_record)
+                    # The ledger change and the row commit together or not at all
+                    with db.begin_nested():
+                        # Realized PnL of this trade from the lot ledger
+                        trade_record.pnl = apply_execution(db, execution, category)
+                        db.add(trade_record)
                     stored_count += 1
                     
             except Exception as e:
@@ -782,12 +970,17 @@ def store_trade_history_to_db(executions_list: list, category: str = "linear"):
                 error_count += 1
                 continue
         
+        if updated_count:
+            # Existing rows changed: cached copies of the table reload (see analytics.py)
+            bump_table_version(db, "bybit_trade_history")
+
         # Commit all changes
         db.commit()
         
         summary = {
             "stored_count": stored_count,
             "updated_count": updated_count,
+            "archived_count": archived_count,
             "error_count": error_count,
             "total_processed": len(executions_list)
         }
@@ -1,10 +1,51 @@
+import os
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 
-def add_technical_indicators(df: pd.DataFrame):
+# "pandas_ta" (default) or "numba": the JIT kernels in indicator_kernels.py,
+# which produce the same columns (see tests/test_indicators.py)
+INDICATOR_BACKEND = os.environ.get("INDICATOR_BACKEND", "pandas_ta")
+INDICATOR_BACKENDS = ("pandas_ta", "numba")
+
+# Indicator parameters used by add_technical_indicators (pandas_ta defaults,
+# StochRSI with lengthRSI=5, lengthStoch=5, smoothK=3, smoothD=3)
+RSI_LENGTH = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BB_LENGTH, BB_LOWER_STD, BB_UPPER_STD, BB_DDOF = 5, 2.0, 2.0, 1
+STOCH_LENGTH, STOCH_RSI_LENGTH, STOCH_K, STOCH_D = 5, 5, 3, 3
+
+# Output columns, named the way pandas_ta names them
+_BB = f"_{BB_LENGTH}_{BB_LOWER_STD}_{BB_UPPER_STD}"
+_MACD = f"_{MACD_FAST}_{MACD_SLOW}_{MACD_SIGNAL}"
+_STOCH = f"_{STOCH_LENGTH}_{STOCH_RSI_LENGTH}_{STOCH_K}_{STOCH_D}"
+INDICATOR_COLUMNS = [
+    f"RSI_{RSI_LENGTH}",
+    f"MACD{_MACD}", f"MACDh{_MACD}", f"MACDs{_MACD}",
+    f"BBL{_BB}", f"BBM{_BB}", f"BBU{_BB}", f"BBB{_BB}", f"BBP{_BB}",
+    f"STOCHRSIk{_STOCH}", f"STOCHRSId{_STOCH}",
+]
+
+KERNEL_PARAMS = np.array([
+    RSI_LENGTH, MACD_FAST, MACD_SLOW, MACD_SIGNAL,
+    BB_LENGTH, BB_LOWER_STD, BB_UPPER_STD, BB_DDOF,
+    STOCH_LENGTH, STOCH_RSI_LENGTH, STOCH_K, STOCH_D,
+], dtype=np.float64)
+
+def add_technical_indicators(df: pd.DataFrame, backend: str = None):
     """
     Adds technical indicators to the DataFrame.
+
+    Args:
+        df: OHLCV DataFrame, oldest first
+        backend: "pandas_ta" or "numba" (defaults to INDICATOR_BACKEND)
     """
+    backend = backend or INDICATOR_BACKEND
+    if backend == "numba":
+        return _add_technical_indicators_numba(df)
+    if backend != "pandas_ta":
+        raise ValueError(f"Invalid indicator backend: {backend}. Use one of {INDICATOR_BACKENDS}.")
+
     # Calculate RSI
     df.ta.rsi(append=True)
 
@@ -19,3 +60,139 @@ def add_technical_indicators(df: pd.DataFrame):
     df.ta.stochrsi(length=5, rsi_length=5, k=3, d=3, append=True)
 
     return df
+
+def _add_technical_indicators_numba(df: pd.DataFrame):
+    """
+    Numba version of add_technical_indicators.
+
+    Same columns and values; the only difference is a series too short for
+    an indicator, for which pandas_ta adds no column and this adds NaNs.
+    Returns a new DataFrame (one concat is far cheaper than eleven column
+    inserts), so callers must use the return value.
+    """
+    from indicator_kernels import indicators
+
+    close = df["close"].to_numpy(dtype=np.float64)
+    values = np.empty((len(INDICATOR_COLUMNS), close.shape[0]))
+    indicators(close, KERNEL_PARAMS, values)
+    existing = df.columns.intersection(INDICATOR_COLUMNS)
+    if len(existing):
+        df = df.drop(columns=existing)
+    return pd.concat([df, pd.DataFrame(values.T, index=df.index, columns=INDICATOR_COLUMNS)], axis=1)
+
+class IndicatorPanel:
+    """
+    Indicator columns for a whole watchlist, computed in one pass.
+
+    `values` is a (column, symbol, time) float64 block; `view(symbol)`
+    returns that symbol's columns as NumPy views into it (no copy).
+
+    Usage:
+        panel = compute_indicator_panel(close, symbols, high=high, low=low)
+        rsi = panel.view("XRPUSDT")["RSI_14"]
+        df = panel.frame("XRPUSDT", index)
+    """
+
+    def __init__(self, symbols, values, inputs):
+        self.symbols = list(symbols)
+        self.positions = {symbol: j for j, symbol in enumerate(self.symbols)}
+        self.values = values
+        self.inputs = inputs  # {"close": (time, symbol) array, ...}
+
+    def view(self, symbol: str):
+        """Returns {column: 1-D array} for one symbol; indicator columns are contiguous views."""
+        j = self.positions[symbol]
+        columns = {name: values[:, j] for name, values in self.inputs.items()}
+        columns.update({name: self.values[c, j] for c, name in enumerate(INDICATOR_COLUMNS)})
+        return columns
+
+    def frame(self, symbol: str, index=None):
+        """Returns one symbol's columns as a DataFrame (same columns add_technical_indicators adds)."""
+        return pd.DataFrame(self.view(symbol), index=index, copy=False)
+
+def compute_indicator_panel(close, symbols, high=None, low=None):
+    """
+    Computes RSI, MACD, Bollinger Bands and StochRSI for many symbols at once.
+
+    Args:
+        close: (time, symbol) array of aligned close prices; NaN before a symbol's first candle
+        symbols: Symbol of each column
+        high, low: Optional (time, symbol) arrays carried into the per-symbol views
+
+    Returns:
+        IndicatorPanel
+    """
+    from indicator_kernels import indicators_panel
+
+    close = np.asarray(close, dtype=np.float64)
+    if close.ndim != 2 or close.shape[1] != len(symbols):
+        raise ValueError(f"close must be (time, symbol) with {len(symbols)} columns, got {close.shape}")
+    values = np.empty((len(INDICATOR_COLUMNS), close.shape[1], close.shape[0]))
+    indicators_panel(close, KERNEL_PARAMS, values)
+
+    inputs = {"close": close}
+    for name, array in (("high", high), ("low", low)):
+        if array is not None:
+            inputs[name] = np.asarray(array, dtype=np.float64)
+    return IndicatorPanel(symbols, values, inputs)
+
+def add_indicators_to_frames(frames: dict, backend: str = None):
+    """
+    add_technical_indicators for the frames of a whole watchlist.
+
+    With the numba backend, the frames that end on the same candles as the
+    longest one (a shorter history is fine: leading NaNs compute like the
+    trimmed series) go through one compute_indicator_panel pass; the others,
+    and every frame with the pandas_ta backend, are computed one at a time.
+
+    Args:
+        frames: {symbol: OHLCV DataFrame, oldest first}; not modified
+        backend: "pandas_ta" or "numba" (defaults to INDICATOR_BACKEND)
+
+    Returns:
+        dict: {symbol: DataFrame with the indicator columns}
+    """
+    backend = backend or INDICATOR_BACKEND
+    frames = {symbol: frame for symbol, frame in frames.items() if not frame.empty}
+    panel_frames = {}
+    if backend == "numba" and len(frames) > 1:
+        longest = max(frames.values(), key=len).index
+        panel_frames = {symbol: frame for symbol, frame in frames.items()
+                        if longest[-len(frame):].equals(frame.index)}
+    enriched = {}
+    if len(panel_frames) > 1:
+        index, symbols, arrays = stack_frames(panel_frames, columns=("close",))
+        panel = compute_indicator_panel(arrays["close"], symbols)
+        for j, symbol in enumerate(symbols):
+            frame = panel_frames[symbol]
+            values = panel.values[:, j, len(index) - len(frame):]
+            frame = frame.drop(columns=frame.columns.intersection(INDICATOR_COLUMNS))
+            enriched[symbol] = pd.concat(
+                [frame, pd.DataFrame(values.T, index=frame.index, columns=INDICATOR_COLUMNS)], axis=1)
+    for symbol, frame in frames.items():
+        if symbol not in enriched:
+            enriched[symbol] = add_technical_indicators(frame.copy(), backend)
+    return enriched
+
+def stack_frames(frames: dict, columns=("close", "high", "low")):
+    """
+    Aligns per-symbol OHLCV DataFrames into (time, symbol) arrays.
+
+    Args:
+        frames: {symbol: DataFrame indexed by timestamp}
+        columns: Columns to stack
+
+    Returns:
+        tuple: (index, symbols, {column: (time, symbol) array}); missing candles are NaN
+    """
+    symbols = list(frames)
+    index = frames[symbols[0]].index if symbols else pd.DatetimeIndex([])
+    for frame in frames.values():
+        if not frame.index.equals(index):
+            index = index.union(frame.index)
+    arrays = {}
+    for column in columns:
+        arrays[column] = np.column_stack([
+            frames[symbol][column].reindex(index).to_numpy(dtype=np.float64) for symbol in symbols
+        ]) if symbols else np.empty((0, 0))
+    return index, symbols, arrays
@@ -1,9 +1,11 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, Boolean, Text, BigInteger
+import time
+from sqlalchemy import event, create_engine, update, Column, Index, Integer, String, Float, DateTime, JSON, Boolean, Text, BigInteger
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
 import datetime
+from metrics import registry, current_symbol
 
 load_dotenv()
 
@@ -13,12 +15,31 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# --- Commit latency instrumentation ---
+
+@event.listens_for(SessionLocal, "before_commit")
+def _start_commit_timer(session):
+    session.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_commit_latency(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        registry.observe("db", "commit", time.perf_counter() - started, current_symbol.get())
+
 # --- ORM Models ---
 
+# The history tables are range partitioned by month on Postgres (see partitioning.py).
+# Their composite indexes lead with the columns the queries filter on, then the time
+# column they range over and sort by.
+
 class TradeHistory(Base):
     __tablename__ = "trade_history"
+    __table_args__ = (
+        Index("ix_trade_history_symbol_timestamp", "symbol", "timestamp"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     symbol = Column(String)
     action = Column(String)
     quantity = Column(Float)
@@ -29,11 +50,17 @@ class TradeHistory(Base):
 
 class BybitTradeHistory(Base):
     __tablename__ = "bybit_trade_history"
+    __table_args__ = (
+        # Unique indexes of a partitioned table must include the partition column
+        Index("uq_bybit_trade_history_exec_id_exec_time", "exec_id", "exec_time", unique=True),
+        Index("ix_bybit_trade_history_symbol_exec_time", "symbol", "exec_time"),
+        Index("ix_bybit_trade_history_category_exec_time", "category", "exec_time"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     
     # Bybit execution details
-    exec_id = Column(String, unique=True, index=True)  # Unique execution ID from Bybit
-    symbol = Column(String, index=True)
+    exec_id = Column(String)  # Unique execution ID from Bybit
+    symbol = Column(String)
     order_id = Column(String, index=True)
     order_link_id = Column(String)
     side = Column(String)  # Buy/Sell
@@ -77,15 +104,76 @@ class BybitTradeHistory(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)  # When we inserted this record
     
     # Category for the trade (linear, spot, option, etc.)
-    category = Column(String, index=True)
+    category = Column(String)
     
     # Calculated PnL for the trade
-    pnl = Column(Float)  # Profit/Loss calculated based on side and execution details
+    pnl = Column(Float)  # Realized PnL of the execution, net of its fee (see ledger.py)
+
+# Realized PnL ledger (see ledger.py): the open lots and running totals per symbol,
+# updated as each execution is stored so no history has to be replayed.
+
+class PositionLot(Base):
+    __tablename__ = "position_lots"
+    __table_args__ = (
+        # Oldest lot first when a closing execution consumes lots
+        Index("ix_position_lots_category_symbol_id", "category", "symbol", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    category = Column(String)
+    symbol = Column(String)
+    side = Column(String)  # Buy (long) or Sell (short)
+    qty = Column(Float)  # Quantity still open
+    price = Column(Float)  # Entry price
+    exec_id = Column(String)  # Execution that opened the lot
+    exec_time = Column(BigInteger)
+
+class SymbolPnl(Base):
+    __tablename__ = "symbol_pnl"
+    category = Column(String, primary_key=True)
+    symbol = Column(String, primary_key=True)
+    position_qty = Column(Float, default=0.0)  # Signed open quantity of the lots: long > 0, short < 0
+    cost = Column(Float, default=0.0)  # Entry value of the open lots (sum of qty * price)
+    realized_pnl = Column(Float, default=0.0)  # Net of fees
+    fees = Column(Float, default=0.0)  # In the quote currency
+    last_exec_time = Column(BigInteger)
+    last_exec_id = Column(String)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+# Coordination mode (see leases.py): which node trades which symbol. Times are
+# seconds since the epoch on the database's clock, so node clocks don't matter.
+
+class SymbolLease(Base):
+    __tablename__ = "symbol_leases"
+    trading_mode = Column(String, primary_key=True)  # spot or perp
+    symbol = Column(String, primary_key=True)
+    owner = Column(String)  # Node id of the holder, None when released
+    epoch = Column(Integer, default=0)  # Incremented on every claim: fences the orders of a previous holder
+    expires_at = Column(Float, default=0.0)  # Free to claim after this unless renewed
+    claimed_at = Column(Float)
+    last_order_at = Column(Float)  # Last order placed under the lease
+
+class ClusterNode(Base):
+    __tablename__ = "cluster_nodes"
+    trading_mode = Column(String, primary_key=True)
+    node_id = Column(String, primary_key=True)  # host:pid
+    started_at = Column(Float)
+    expires_at = Column(Float)  # Counted as alive until then, renewed by its heartbeat
+
+# Writers that change history rows in place (rather than insert them) bump the table's
+# version, so in-memory copies of the table (see analytics.ColumnCache) reload it.
+
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, default=0)
 
 class BalanceHistory(Base):
     __tablename__ = "balance_history"
+    __table_args__ = (
+        Index("ix_balance_history_account_type_coin_timestamp", "account_type", "coin", "timestamp"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     account_type = Column(String)
     balance = Column(Float)
     coin = Column(String)
@@ -95,9 +183,75 @@ class AgentTokenUsage(Base):
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     model_name = Column(String)
+    tier = Column(String)  # "triage" or "decision" (see model_router.py)
+    latency_ms = Column(Float)  # Wall time of the model call
     input_tokens = Column(Integer)
     output_tokens = Column(Integer)
     total_tokens = Column(Integer)
+    prompt_encoding = Column(String)  # "json" or "compact" (see prompt_encoding.py)
+    baseline_input_tokens = Column(Integer)  # Estimated input tokens of the same prompt in json encoding
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(String, primary_key=True)  # e.g. "0001_bybit_trade_history_pnl" (see migrations.py)
+    description = Column(String)
+    status = Column(String)  # "running" until every step finished, then "applied"
+    step = Column(Integer, default=0)  # Index of the step in progress
+    last_key = Column(BigInteger)  # Last primary key a chunked backfill committed, to resume after it
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    applied_at = Column(DateTime)
 
 def init_db():
+    from partitioning import ensure_partitions
     Base.metadata.create_all(bind=engine)
+    ensure_partitions(engine)
+
+# --- Writes ---
+
+# Queue of the supervisor's single DB writer in a worker process (see supervisor.py), None to commit directly
+db_writer = None
+
+def use_db_writer(queue):
+    """Routes save_records() through `queue` (a multiprocessing.Queue read by supervisor.run_db_writer)."""
+    global db_writer
+    db_writer = queue
+
+def record_values(record):
+    """Column values of a new ORM record, with the Python-side defaults (e.g. timestamps) applied now."""
+    values = {}
+    for column in record.__table__.columns:
+        value = getattr(record, column.key)
+        if value is None and column.default is not None and column.default.is_callable:
+            value = column.default.arg(None)
+        elif value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        if value is not None:
+            values[column.key] = value
+    return values
+
+def insert_missing(db, table, values: dict):
+    """INSERT of a row unless its primary key exists (waiting for a concurrent insert of the same key)."""
+    dialect = db.get_bind().dialect if hasattr(db, "get_bind") else db.dialect
+    if dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(insert(table).values(**values).on_conflict_do_nothing())
+
+def bump_table_version(db, table_name: str):
+    """Marks rows of a table as changed in place, in the transaction of `db` (a session or connection)."""
+    table = TableVersion.__table__
+    insert_missing(db, table, {"table_name": table_name, "version": 0})
+    db.execute(update(table).where(table.c.table_name == table_name).values(version=table.c.version + 1))
+
+def save_records(*records):
+    """Inserts new ORM records: directly, or through the supervisor's DB writer in a worker process."""
+    if db_writer is not None:
+        db_writer.put([(type(record).__name__, record_values(record)) for record in records])
+        return
+    db = SessionLocal()
+    try:
+        db.add_all(records)
+        db.commit()
+    finally:
+        db.close()
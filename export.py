@@ -0,0 +1,140 @@
+"""
+Streaming exports of the history tables as CSV, NDJSON or Parquet.
+
+Rows are read with a server-side cursor (yield_per) into Arrow record
+batches, encoded one batch at a time and handed out as bytes chunks, so
+memory stays flat however many rows are exported. The archived rows (see
+archive.py) can be streamed first, straight from their Parquet files, so an
+export covers the whole history.
+"""
+
+import zlib
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import zstandard
+from sqlalchemy import select
+from archive import (
+    ARCHIVE_DIR, ARCHIVED_TABLES, arrow_schema, archive_dataset, archive_filter, history_table, time_value, _rows
+)
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+EXPORT_COMPRESSIONS = ("none", "gzip", "zstd")
+
+# Rows fetched from the cursor and encoded per chunk
+EXPORT_BATCH_SIZE = 10_000
+
+
+def iter_batches(table: str, start=None, end=None, where: dict = None, include_archive: bool = False,
+                 batch_size: int = EXPORT_BATCH_SIZE, archive_dir: str = ARCHIVE_DIR, engine=None):
+    """
+    Yields pyarrow RecordBatches with the table's columns (see archive.arrow_schema).
+
+    Args:
+        table: One of archive.ARCHIVED_TABLES
+        start / end: Naive UTC time range [start, end), None for open ends
+        where: {column: value} equality filters
+        include_archive: Stream the matching archived rows before the database rows
+    """
+    if engine is None:
+        from database import engine
+    column, kind = ARCHIVED_TABLES[table]
+    model = history_table(table)
+    schema = arrow_schema(table)
+    where = where or {}
+
+    dataset = archive_dataset(table, archive_dir) if include_archive else None
+    if dataset is not None:
+        batches = dataset.to_batches(columns=schema.names, filter=archive_filter(table, start, end, where),
+                                     batch_size=batch_size)
+        for batch in batches:
+            if batch.num_rows:
+                yield batch
+
+    query = select(model)
+    for name, value in where.items():
+        query = query.where(model.c[name] == value)
+    if start is not None:
+        query = query.where(model.c[column] >= time_value(start, kind))
+    if end is not None:
+        query = query.where(model.c[column] < time_value(end, kind))
+    query = query.order_by(model.c[column], model.c.id)
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for rows in result.mappings().partitions():
+            # JSON columns are exported as their text, like in the archive
+            yield pa.RecordBatch.from_pylist(_rows(table, rows), schema=schema)
+
+
+class _ChunkSink:
+    """File-like target for ParquetWriter that hands the written bytes out as chunks."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def encode_batches(table: str, batches, fmt: str):
+    """Encodes record batches as `fmt`; yields bytes chunks."""
+    schema = arrow_schema(table)
+    if fmt == "ndjson":
+        for batch in batches:
+            yield b"".join(orjson.dumps(row) + b"\n" for row in batch.to_pylist())
+    elif fmt in ("csv", "parquet"):
+        sink = _ChunkSink()
+        if fmt == "csv":
+            writer = pa_csv.CSVWriter(sink, schema)
+        else:
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    else:
+        raise ValueError(f"Unknown export format: {fmt}. Use one of {', '.join(EXPORT_FORMATS)}.")
+
+
+def compress_chunks(chunks, compression: str = "none"):
+    """Compresses a stream of bytes chunks as one gzip or zstd stream (or passes it through)."""
+    if compression == "none":
+        yield from chunks
+        return
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        raise ValueError(f"Unknown compression: {compression}. Use one of {', '.join(EXPORT_COMPRESSIONS)}.")
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
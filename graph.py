@@ -1,76 +1,264 @@
 import os
+import re
 import json
+import time
 from typing import TypedDict
 from langchain_google_genai import GoogleGenerativeAI
-from langchain_core.outputs import LLMResult
-from langgraph.graph import StateGraph, END
-from agent_tools import analyze_market_state
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+import bybit_tools
+import bybit_async
+from agent_tools import (
+    fetch_market_frames, get_open_position, describe_position, describe_balance, describe_last_decision,
+    render_market_analysis
+)
 from bybit_tools import spot_place_market_order, spot_close_position, perp_place_market_order, perp_close_position
 from prompts_debug import system_prompt
-from prompts import spot_system_prompt, perp_system_prompt
-from database import SessionLocal, TradeHistory, AgentTokenUsage
+from prompts import spot_system_prompt, perp_system_prompt, spot_system_prompt_compact, perp_system_prompt_compact, triage_instruction, batch_instruction
+from prompt_encoding import baseline_input_tokens
+from model_router import (
+    DECISION_MODEL, TRIAGE_MODEL, TRIAGE_TIER, DECISION_TIER, BATCH_TIER,
+    triage_enabled, local_triage, parse_triage, model_name, validate_batch_decisions,
+    decision_deadline, generate_with_deadline, hedge_delay, LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES,
+)
+from market_data import update_candles
+from data_processor import add_indicators_to_frames
+from database import save_records, TradeHistory, AgentTokenUsage
+from leases import order_guard, LeaseLost
+from metrics import timed, span, registry, symbol_context
 
 # Graph State
 class GraphState(TypedDict):
     symbol: str
     interval: int
+    timeframes: list  # optional higher timeframes (minutes) derived from the 1-minute series
     market_analysis: str
+    prompt_report: dict  # encoding and estimated tokens of the market data (see prompt_encoding)
     llm_decision: dict
     trade_executed: bool
     error_message: str
     trading_mode: str  # "spot" or "perp"
+    # Filled by the parallel fetch branches that start every cycle
+    market_data: object  # enriched DataFrame of the interval (empty if no data)
+    timeframe_data: dict  # {minutes: enriched DataFrame} of the extra timeframes
+    position: dict  # position info (see bybit_tools.*_get_open_positions)
+    wallet: dict  # raw USDT wallet balance response
+    instrument_info: dict  # raw instruments-info response (perp only)
+    order_result: dict  # orderId/avgPrice of the submitted order, for log_decision
+    snapshot: dict  # exchange reads prefetched with the rest of the watchlist (see prefetch_snapshots)
+    # Carried from the symbol's previous cycle by the checkpointer (see CARRIED_KEYS)
+    candles: object  # raw OHLCV window of the interval, updated with only the new candles each cycle
+    last_decision: dict  # action/quantity/reasoning of the previous cycle, "at" (epoch seconds), "executed"
+    entry_price: float  # spot only: entry of the open position, which the wallet balance doesn't tell
+
+# Keys a cycle takes over from the previous cycle of the same symbol; everything
+# else starts from the state run_*_trading_cycle passes in
+CARRIED_KEYS = ("candles", "last_decision", "entry_price")
+
+# Seconds a prefetched snapshot is used for; later cycles of a long watchlist fetch their own reads
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "30"))
+
+# SQLite file for the graph checkpoints (needs langgraph-checkpoint-sqlite);
+# empty keeps them in memory, so they last as long as the process
+GRAPH_CHECKPOINT_DB = os.environ.get("GRAPH_CHECKPOINT_DB", "")
+
+def make_checkpointer(path: str = GRAPH_CHECKPOINT_DB):
+    """Returns a SqliteSaver for path if the sqlite checkpointer is installed, an InMemorySaver otherwise."""
+    # The candle windows are DataFrames, which msgpack can't encode
+    serde = JsonPlusSerializer(pickle_fallback=True)
+    if path:
+        try:
+            import sqlite3
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            return SqliteSaver(sqlite3.connect(path, check_same_thread=False), serde=serde)
+        except ImportError:
+            print("langgraph-checkpoint-sqlite is not installed; keeping graph checkpoints in memory")
+    return InMemorySaver(serde=serde)
+
+checkpointer = make_checkpointer()
+
+# Initialize the Gemini models: the decision model, and optionally a cheaper triage model
+llm = GoogleGenerativeAI(model=DECISION_MODEL, google_api_key=os.environ.get("GOOGLE_API_KEY"),
+                         timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+triage_llm = None
+if triage_enabled() and TRIAGE_MODEL != "local":
+    triage_llm = GoogleGenerativeAI(model=TRIAGE_MODEL, google_api_key=os.environ.get("GOOGLE_API_KEY"),
+                                    timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+
+def generate(model, prompt: str, tier: str, default_model: str, prompt_report: dict, deadline: float,
+             baseline_tokens_for=None):
+    """
+    Calls one model tier under the cycle deadline and logs its latency and token usage.
+
+    Args:
+        model: LLM client
+        prompt: Prompt to send
+        tier: TRIAGE_TIER, DECISION_TIER or BATCH_TIER
+        default_model: Configured model name (used if the client doesn't expose one)
+        prompt_report: Report of the market data encoding in the prompt
+        deadline: time.monotonic() by which the answer must be in
+        baseline_tokens_for: Optional (system prompt, baseline system prompt) to estimate baseline input tokens
+
+    Returns:
+        str: Response text
+
+    Raises:
+        TimeoutError: If the model didn't answer before the deadline
+    """
+    name = model_name(model, default_model)
+    started = time.perf_counter()
+    with span("llm", tier):
+        llm_result, hedge_won = generate_with_deadline(
+            model, prompt, deadline - time.monotonic(), hedge_delay(registry, tier)
+        )
+    latency_ms = (time.perf_counter() - started) * 1000
+    response_text = llm_result.generations[0][0].text
+    if hedge_won:
+        print(f"[{tier}] {name}: hedged request answered first")
 
-# Initialize the Gemini model
-llm = GoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.environ.get("GOOGLE_API_KEY"))
+    if llm_result.llm_output and 'token_usage' in llm_result.llm_output:
+        token_usage = llm_result.llm_output['token_usage']
+        input_tokens = token_usage.get('prompt_total_tokens', 0)
+        baseline_tokens = None
+        if baseline_tokens_for:
+            baseline_tokens = baseline_input_tokens(prompt, prompt_report, *baseline_tokens_for, input_tokens)
+        print(f"[{tier}] {name}: {latency_ms:.0f}ms, input tokens: {input_tokens} "
+              f"({prompt_report.get('encoding', 'json')} encoding, baseline ~{baseline_tokens})")
+        save_records(AgentTokenUsage(
+            model_name=name,
+            tier=tier,
+            latency_ms=latency_ms,
+            input_tokens=input_tokens,
+            output_tokens=token_usage.get('candidates_total_tokens', 0),
+            total_tokens=token_usage.get('total_tokens', 0),
+            prompt_encoding=prompt_report.get('encoding', 'json'),
+            baseline_input_tokens=baseline_tokens
+        ))
+    return response_text
+
+def triage(prompt: str, prompt_report: dict, deadline: float):
+    """
+    First routing tier. Returns (verdict, reason) where verdict is HOLD or ESCALATE.
+    """
+    if TRIAGE_MODEL == "local":
+        with span("llm", TRIAGE_TIER):
+            return local_triage(prompt_report.get('signals'))
+    response_text = generate(triage_llm, f"{prompt}\n{triage_instruction}", TRIAGE_TIER, TRIAGE_MODEL, prompt_report, deadline)
+    verdict = parse_triage(response_text)
+    return verdict, f"{TRIAGE_MODEL} answered {response_text.strip()[:40]!r}"
 
 # Node Functions
+
+def fresh_snapshot(snapshot: dict):
+    """A prefetched snapshot (see prefetch_snapshots) unless it is older than SNAPSHOT_MAX_AGE, else {}."""
+    if not snapshot or time.monotonic() - snapshot.get('fetched_at', 0.0) > SNAPSHOT_MAX_AGE:
+        return {}
+    return snapshot
+
+# Fetch branches: independent exchange reads that run in parallel at the start of a cycle;
+# each uses the prefetched snapshot when there is one
+@timed("node")
+def fetch_klines(state: GraphState):
+    trading_mode = state.get('trading_mode', 'spot')
+    snapshot = fresh_snapshot(state.get('snapshot'))
+    candles = snapshot.get('market_data')
+    if candles is None and not state.get('timeframes'):
+        # Timeframe data comes from the 1-minute cache, which already fetches only new candles
+        candles = update_candles(state['symbol'], trading_mode, state['interval'], state.get('candles'))
+    market_data, timeframe_data = fetch_market_frames(
+        state['symbol'], state['interval'], trading_mode, state.get('timeframes'), candles=candles,
+        enriched=snapshot.get('enriched')
+    )
+    return {"market_data": market_data, "timeframe_data": timeframe_data, "candles": candles}
+
+@timed("node")
+def fetch_position(state: GraphState):
+    trading_mode = state.get('trading_mode', 'spot')
+    snapshot = fresh_snapshot(state.get('snapshot'))
+    position = snapshot['position'] if 'position' in snapshot else get_open_position(state['symbol'], trading_mode)
+    if trading_mode != 'spot' or not position or position.get('error'):
+        return {"position": position}
+    if not position.get('has_position', False):
+        # Closed since the entry was recorded (stop order, watchdog or by hand)
+        return {"position": position, "entry_price": None}
+    entry_price = state.get('entry_price')
+    if entry_price and not position.get('avgPrice'):
+        position = {**position, 'avgPrice': entry_price,
+                    'unrealisedPnl': (position['markPrice'] - entry_price) * position['size']}
+    return {"position": position}
+
+@timed("node")
+def fetch_wallet(state: GraphState):
+    snapshot = fresh_snapshot(state.get('snapshot'))
+    if 'wallet' in snapshot:
+        return {"wallet": snapshot['wallet']}
+    try:
+        wallet = bybit_tools.position_source().get_wallet_balance(accountType="UNIFIED", coin="USDT")
+    except Exception as e:
+        print(f"Error getting wallet balance: {e}")
+        wallet = {"retCode": -1, "retMsg": str(e)}
+    return {"wallet": wallet}
+
+@timed("node")
+def fetch_instrument_info(state: GraphState):
+    # Only perp orders need the lot size (quantity precision)
+    if state.get('trading_mode', 'spot') != 'perp':
+        return {"instrument_info": {}}
+    snapshot = fresh_snapshot(state.get('snapshot'))
+    if snapshot.get('instrument_info'):
+        return {"instrument_info": snapshot['instrument_info']}
+    try:
+        instrument_info = bybit_tools.session.get_instruments_info(category="linear", symbol=state['symbol'])
+    except Exception as e:
+        print(f"Error getting instrument info for {state['symbol']}: {e}")
+        instrument_info = {}
+    return {"instrument_info": instrument_info}
+
+FETCH_BRANCHES = {
+    "fetch_klines": fetch_klines,
+    "fetch_position": fetch_position,
+    "fetch_wallet": fetch_wallet,
+    "fetch_instrument_info": fetch_instrument_info,
+}
+
+@timed("node")
 def analyze_market(state: GraphState):
     print("---ANALYZING MARKET---")
     symbol = state['symbol']
-    interval = state['interval']
     trading_mode = state.get('trading_mode', 'spot')
-    
-    market_analysis = analyze_market_state.invoke({
-        "symbol": symbol, 
-        "interval": interval,
-        "trading_mode": trading_mode
-    })
-    return {"market_analysis": market_analysis}
+    if trading_mode not in ("spot", "perp"):
+        return {"market_analysis": f"Invalid trading mode: {trading_mode}. Use 'spot' or 'perp'.", "prompt_report": {}}
 
-def make_trade_decision(state: GraphState):
-    print("---MAKING TRADE DECISION---")
-    market_analysis = state['market_analysis']
-    trading_mode = state.get('trading_mode', 'spot')
-    
-    # Select the appropriate prompt based on trading mode
+    market_data = state.get('market_data')
+    if market_data is None or market_data.empty:
+        return {"market_analysis": f"Could not retrieve {trading_mode} market data.", "prompt_report": {}}
+
+    analysis = render_market_analysis(
+        symbol, trading_mode, market_data, state.get('timeframe_data') or {},
+        describe_position(symbol, trading_mode, state.get('position')),
+        describe_balance(state.get('wallet')),
+        history_info=describe_last_decision(state.get('last_decision')),
+    )
+    return {"market_analysis": analysis["text"], "prompt_report": analysis["prompt_report"]}
+
+def select_system_prompts(trading_mode: str, prompt_report: dict):
+    """Returns (system prompt to send, system prompt of the json baseline) for a trading mode."""
+    compact = prompt_report.get('encoding') == 'compact'
     if trading_mode == 'spot':
-        selected_prompt = spot_system_prompt
+        return (spot_system_prompt_compact if compact else spot_system_prompt), spot_system_prompt
     elif trading_mode == 'perp':
-        selected_prompt = perp_system_prompt
-    else:
-        # Fallback to debug prompt for testing
-        selected_prompt = system_prompt
-    
-    prompt = f"{selected_prompt}\n\nHere is the current market analysis:\n{market_analysis}"
-    
-    # Use generate to get token usage
-    llm_result: LLMResult = llm.generate([prompt])
-    response_text = llm_result.generations[0][0].text
-    
-    # Log token usage
-    if llm_result.llm_output and 'token_usage' in llm_result.llm_output:
-        token_usage = llm_result.llm_output['token_usage']
-        db = SessionLocal()
-        db_token_usage = AgentTokenUsage(
-            model_name="gemini-pro",
-            input_tokens=token_usage.get('prompt_total_tokens', 0),
-            output_tokens=token_usage.get('candidates_total_tokens', 0),
-            total_tokens=token_usage.get('total_tokens', 0)
-        )
-        db.add(db_token_usage)
-        db.commit()
-        db.close()
+        return (perp_system_prompt_compact if compact else perp_system_prompt), perp_system_prompt
+    # Fallback to debug prompt for testing
+    return system_prompt, system_prompt
+
+def parse_decision(response_text: str):
+    """
+    Parses a decision JSON object from the model response.
 
+    Returns:
+        dict: {"llm_decision": decision} or {"error_message": ...}
+    """
     # Try to parse JSON directly first
     try:
         decision = json.loads(response_text)
@@ -79,7 +267,6 @@ def make_trade_decision(state: GraphState):
         # Try to extract JSON from the response if it's wrapped in other text
         try:
             # Look for JSON object within the response
-            import re
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
             if json_match:
                 json_str = json_match.group()
@@ -93,7 +280,50 @@ def make_trade_decision(state: GraphState):
             print(f"JSON decode error: {e}")
             return {"error_message": f"Failed to decode LLM response as JSON: {response_text}"}
 
+@timed("node")
+def make_trade_decision(state: GraphState):
+    print("---MAKING TRADE DECISION---")
+    return decide(state, time.monotonic() + decision_deadline(state['interval']))
+
+def decide(state: GraphState, deadline: float, triage_first: bool = True):
+    """
+    Routes one symbol's decision through triage and the decision model.
+
+    Args:
+        state: Analyzed graph state
+        deadline: time.monotonic() by which all model calls must be done
+        triage_first: False if the state was already triaged
+
+    Returns:
+        dict: State update with llm_decision (or error_message)
+    """
+    market_analysis = state['market_analysis']
+    trading_mode = state.get('trading_mode', 'spot')
+    prompt_report = state.get('prompt_report') or {}
+    selected_prompt, baseline_prompt = select_system_prompts(trading_mode, prompt_report)
+    prompt = f"{selected_prompt}\n\nHere is the current market analysis:\n{market_analysis}"
+    
+    # Cheap first tier: quiet candles end here as HOLD, everything that could
+    # place or close an order goes to the decision model
+    try:
+        if triage_first and triage_enabled():
+            verdict, reason = triage(prompt, prompt_report, deadline)
+            print(f"Triage: {verdict} ({reason})")
+            if verdict == "HOLD":
+                return {"llm_decision": {"action": "HOLD", "quantity": 0.0, "reasoning": f"Triage HOLD: {reason}"}}
+        
+        response_text = generate(llm, prompt, DECISION_TIER, DECISION_MODEL, prompt_report, deadline,
+                                 baseline_tokens_for=(selected_prompt, baseline_prompt))
+    except TimeoutError as e:
+        # A stuck model call must not hold up the schedule; skip this candle
+        print(f"⚠️  LLM deadline exceeded: {e}. Holding.")
+        return {"llm_decision": {"action": "HOLD", "quantity": 0.0, "reasoning": f"LLM deadline exceeded: {e}"}}
+
+    return parse_decision(response_text)
+
+@timed("node")
 def log_decision(state: GraphState):
+    # Runs after the order was sent, so the database write never delays it
     print("---LOGGING DECISION---")
     decision = state['llm_decision']
     action = decision.get('action')
@@ -101,25 +331,24 @@ def log_decision(state: GraphState):
     quantity = decision.get('quantity')
     reasoning = decision.get('reasoning')
     trading_mode = state.get('trading_mode', 'spot')
+    order_result = state.get('order_result') or {}
 
     # Log all decisions to the database, including HOLD
-    db = SessionLocal()
-    trade = TradeHistory(
+    save_records(TradeHistory(
         symbol=f"{symbol}_{trading_mode}",  # Include trading mode in symbol
         action=action,
         quantity=quantity,
-        price=0.0,  # No price for HOLD decisions
+        price=float(order_result.get('avgPrice') or 0.0),  # No price for HOLD decisions
         reasoning=f"[{trading_mode.upper()}] {reasoning}",  # Add mode to reasoning
-        order_id=None,  # No order ID for HOLD decisions
+        order_id=order_result.get('orderId'),  # No order ID for HOLD decisions
         llm_decision=decision
-    )
-    db.add(trade)
-    db.commit()
-    db.close()
+    ))
     
     print(f"Logged {action} decision for {symbol} in {trading_mode.upper()} mode")
-    return {"trade_executed": False}  # Will be updated if trade is actually executed
+    return {"last_decision": {"action": action, "quantity": quantity, "reasoning": reasoning,
+                              "at": time.time(), "executed": bool(state.get('trade_executed'))}}
 
+@timed("node")
 def execute_trade(state: GraphState):
     print("---EXECUTING TRADE---")
     decision = state['llm_decision']
@@ -129,6 +358,16 @@ def execute_trade(state: GraphState):
     reasoning = decision.get('reasoning')
     trading_mode = state.get('trading_mode', 'spot')  # Default to spot if not specified
 
+    # Coordination mode: only the holder of the symbol's lease may order, and the check and order run under it
+    try:
+        with order_guard(symbol):
+            return _execute_trade(state, action, symbol, quantity, trading_mode)
+    except LeaseLost as e:
+        print(f"⚠️  LEASE CHECK: {e}. Skipping trade execution.")
+        return {"trade_executed": False, "error_message": str(e)}
+
+
+def _execute_trade(state: GraphState, action: str, symbol: str, quantity, trading_mode: str):
     # Safety check: Prevent opening new positions when one already exists
     if trading_mode == 'perp' and action in ["BUY", "SELL"]:
         from bybit_tools import perp_get_open_positions
@@ -157,63 +396,289 @@ def execute_trade(state: GraphState):
             response = spot_close_position(symbol)
     elif trading_mode == 'perp':
         # Use perpetual futures trading functions
+        instrument_info = state.get('instrument_info') or None
         if action == "BUY":
-            response = perp_place_market_order(symbol, "Buy", quantity, margin_usd=50.0, leverage=10)
+            response = perp_place_market_order(symbol, "Buy", quantity, margin_usd=50.0, leverage=10,
+                                               instrument_info=instrument_info)
         elif action == "SELL":
-            response = perp_place_market_order(symbol, "Sell", quantity, margin_usd=50.0, leverage=10)
+            response = perp_place_market_order(symbol, "Sell", quantity, margin_usd=50.0, leverage=10,
+                                               instrument_info=instrument_info)
         elif action == "CLOSE_LONG" or action == "CLOSE_SHORT" or action == "CLOSE":
             response = perp_close_position(symbol)
     else:
         return {"error_message": f"Invalid trading mode: {trading_mode}"}
 
     if response and response.get('retCode') == 0:
-        # Update the existing database record with execution details
-        db = SessionLocal()
-        # Get the most recent trade record for this symbol
-        trade = db.query(TradeHistory).filter(
-            TradeHistory.symbol == symbol,
-            TradeHistory.action == action
-        ).order_by(TradeHistory.timestamp.desc()).first()
-        
-        if trade:
-            trade.price = float(response['result'].get('avgPrice', 0.0))
-            trade.order_id = response['result'].get('orderId')
-            db.commit()
-        db.close()
-        return {"trade_executed": True}
+        # log_decision records the execution details with the decision
+        update = {"trade_executed": True, "order_result": response['result']}
+        if trading_mode == 'spot':
+            update["entry_price"] = spot_entry_price(state, response['result']) if action == "BUY" else None
+        return update
     elif response:
         return {"error_message": f"Failed to execute {action} order: {response.get('retMsg')}"}
     
     return {"trade_executed": False}
 
 
+def spot_entry_price(state: GraphState, order_result: dict):
+    """Fill price of a spot buy; the order response usually has none, then the last close."""
+    entry_price = float(order_result.get('avgPrice') or 0.0)
+    market_data = state.get('market_data')
+    if not entry_price and market_data is not None and not market_data.empty:
+        entry_price = float(market_data['close'].iloc[-1])
+    return entry_price or None
+
+
 # Conditional Edge Logic
 def should_execute_trade(state: GraphState):
     action = state.get("llm_decision", {}).get("action")
     if action in ["BUY", "SELL", "CLOSE"]:
         return "execute_trade"
     else: # HOLD or no action
-        return END
+        return "log_decision"
+
+def add_market_analysis(graph: StateGraph):
+    """
+    Adds the parallel fetch branches and their analyze_market join to a graph.
+
+    The branches all start at START and run concurrently (LangGraph runs the
+    nodes of one step in parallel); analyze_market waits for all of them.
+    """
+    for name, node in FETCH_BRANCHES.items():
+        graph.add_node(name, node)
+        graph.add_edge(START, name)
+    graph.add_node("analyze_market", analyze_market)
+    graph.add_edge(list(FETCH_BRANCHES), "analyze_market")
 
 # Graph Construction
+#
+#   fetch_klines ─────────┐
+#   fetch_position ───────┤
+#   fetch_wallet ─────────┼─> analyze_market -> make_trade_decision -> [execute_trade] -> log_decision
+#   fetch_instrument_info ┘
 workflow = StateGraph(GraphState)
 
-workflow.add_node("analyze_market", analyze_market)
+add_market_analysis(workflow)
 workflow.add_node("make_trade_decision", make_trade_decision)
-workflow.add_node("log_decision", log_decision)
 workflow.add_node("execute_trade", execute_trade)
+workflow.add_node("log_decision", log_decision)
 
-workflow.set_entry_point("analyze_market")
 workflow.add_edge("analyze_market", "make_trade_decision")
-workflow.add_edge("make_trade_decision", "log_decision")
 workflow.add_conditional_edges(
-    "log_decision",
+    "make_trade_decision",
+    should_execute_trade,
+    {
+        "execute_trade": "execute_trade",
+        "log_decision": "log_decision"
+    }
+)
+workflow.add_edge("execute_trade", "log_decision")
+workflow.add_edge("log_decision", END)
+
+app = workflow.compile(checkpointer=checkpointer)
+
+# Analysis-only graph: the fetch branches and analyze_market, for run_batch
+analysis_workflow = StateGraph(GraphState)
+
+add_market_analysis(analysis_workflow)
+analysis_workflow.add_edge("analyze_market", END)
+
+analysis_app = analysis_workflow.compile()
+
+# Execution-only graph: used to fan out decisions that were made for several
+# symbols in one batched request through the same execution/logging path
+execution_workflow = StateGraph(GraphState)
+
+execution_workflow.add_node("execute_trade", execute_trade)
+execution_workflow.add_node("log_decision", log_decision)
+
+execution_workflow.add_conditional_edges(
+    START,
     should_execute_trade,
     {
         "execute_trade": "execute_trade",
-        END: END
+        "log_decision": "log_decision"
     }
 )
-workflow.add_edge("execute_trade", END)
+execution_workflow.add_edge("execute_trade", "log_decision")
+execution_workflow.add_edge("log_decision", END)
+
+execution_app = execution_workflow.compile(checkpointer=checkpointer)
+
+# Per-symbol state across cycles
+def cycle_config(state: GraphState):
+    """Graph config of a symbol's checkpoint thread (one per trading mode and symbol)."""
+    return {"configurable": {"thread_id": f"{state.get('trading_mode', 'spot')}:{state['symbol']}"}}
+
+def with_carried_state(state: GraphState):
+    """
+    Adds the CARRIED_KEYS of the symbol's previous cycle to the state of a new one.
+
+    Only the latest cycle is ever needed, so its checkpoints are dropped
+    here; the cycle about to run saves the next one.
+    """
+    config = cycle_config(state)
+    values = app.get_state(config).values
+    checkpointer.delete_thread(config["configurable"]["thread_id"])
+    carried = {key: values[key] for key in CARRIED_KEYS if values.get(key) is not None}
+    return {**carried, **state}
+
+def prefetch_snapshots(symbols: list, interval: int, trading_mode: str, timeframes: list = None):
+    """
+    Reads the exchange data of a watchlist cycle for all its symbols at once.
+
+    The requests of every symbol go out concurrently over one connection pool
+    (bybit_async), so the cycle waits about one round trip for them instead
+    of one per symbol; each symbol's fetch branches then use its snapshot. The
+    kline requests only fetch the candles since the window the symbol's
+    previous cycle left (with timeframes, the klines come from the 1-minute
+    cache as before), and the indicators of all the windows are computed
+    together (data_processor.add_indicators_to_frames).
+
+    Returns:
+        dict: {symbol: snapshot}, empty when the async client can't be used or
+        failed (the fetch branches then read on their own)
+    """
+    if len(symbols) < 2 or not bybit_async.snapshots_available():
+        return {}
+    candles = {}
+    if not timeframes:
+        for symbol in symbols:
+            values = app.get_state(cycle_config({"symbol": symbol, "trading_mode": trading_mode})).values
+            if values.get('candles') is not None:
+                candles[symbol] = values['candles']
+    try:
+        with span("bybit", "watchlist_snapshot"):
+            snapshots = bybit_async.snapshot_fetcher.fetch(symbols, interval, trading_mode, candles, klines=not timeframes)
+    except Exception as e:
+        print(f"Prefetching the watchlist failed, fetching per symbol: {e}")
+        return {}
+    frames = {symbol: snapshot['market_data'] for symbol, snapshot in snapshots.items()
+              if snapshot.get('market_data') is not None}
+    for symbol, enriched in add_indicators_to_frames(frames).items():
+        snapshots[symbol]['enriched'] = enriched
+    fetched_at = time.monotonic()
+    for snapshot in snapshots.values():
+        snapshot['fetched_at'] = fetched_at
+    return snapshots
+
+def run_cycle(state: GraphState):
+    """
+    Runs one trading cycle for a symbol on top of what its previous cycle left.
+
+    Returns:
+        dict: Final graph state
+    """
+    # Checkpoint once per cycle, not after every node
+    return app.invoke(with_carried_state(state), cycle_config(state), durability="exit")
+
+# Batched decisions
+def decide_batch(states: list, deadline: float):
+    """
+    Asks the decision model for all symbols of a batch in one request.
+
+    Args:
+        states: Analyzed graph states of the same trading mode
+        deadline: time.monotonic() by which the answer must be in
+
+    Returns:
+        dict: {symbol: decision} for the symbols the answer covered with a valid decision
+    """
+    trading_mode = states[0].get('trading_mode', 'spot')
+    symbols = [state['symbol'] for state in states]
+    reports = [state.get('prompt_report') or {} for state in states]
+    prompt_report = {
+        "encoding": reports[0].get('encoding', 'json'),
+        "estimated_tokens": sum(report.get('estimated_tokens', 0) for report in reports),
+        "baseline_estimated_tokens": sum(report.get('baseline_estimated_tokens', 0) for report in reports),
+    }
+    selected_prompt, baseline_prompt = select_system_prompts(trading_mode, reports[0])
+    analyses = "\n\n".join(state['market_analysis'] for state in states)
+    prompt = (f"{selected_prompt}\n{batch_instruction}\n"
+              f"Here are the current market analyses for {', '.join(symbols)}:\n{analyses}")
+
+    response_text = generate(llm, prompt, BATCH_TIER, DECISION_MODEL, prompt_report, deadline,
+                             baseline_tokens_for=(selected_prompt, baseline_prompt))
+    try:
+        decisions = json.loads(response_text)
+    except json.JSONDecodeError:
+        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        try:
+            decisions = json.loads(json_match.group()) if json_match else None
+        except json.JSONDecodeError:
+            decisions = None
+    return validate_batch_decisions(decisions, symbols, trading_mode)
+
+def run_batch(states: list, batch_size: int):
+    """
+    Runs one trading cycle for several symbols with batched decisions.
+
+    Every symbol is analyzed and triaged on its own; the escalated ones are
+    decided batch_size at a time in one request each, and every decision goes through log_decision /
+    execute_trade. Symbols the batched answer doesn't cover with a valid
+    decision fall back to their own make_trade_decision call.
+
+    Args:
+        states: Initial graph states (same trading mode and interval)
+        batch_size: Maximum number of symbols per decision request
+
+    Returns:
+        list: Final graph state per symbol, in input order
+    """
+    deadline = time.monotonic() + decision_deadline(states[0]['interval'])
+    snapshots = {}
+    if not any(state.get('snapshot') for state in states):
+        snapshots = prefetch_snapshots([state['symbol'] for state in states], states[0]['interval'],
+                                       states[0].get('trading_mode', 'spot'), states[0].get('timeframes'))
+    analyzed = []
+    for state in states:
+        if state['symbol'] in snapshots:
+            state = {**state, "snapshot": snapshots[state['symbol']]}
+        with symbol_context(state['symbol']):
+            analyzed.append(analysis_app.invoke(with_carried_state(state)))
+
+    escalated = []
+    for state in analyzed:
+        if triage_enabled():
+            selected_prompt, _ = select_system_prompts(state.get('trading_mode', 'spot'), state.get('prompt_report') or {})
+            prompt = f"{selected_prompt}\n\nHere is the current market analysis:\n{state['market_analysis']}"
+            try:
+                verdict, reason = triage(prompt, state.get('prompt_report') or {}, deadline)
+            except TimeoutError as e:
+                verdict, reason = "HOLD", f"LLM deadline exceeded: {e}"
+            print(f"Triage {state['symbol']}: {verdict} ({reason})")
+            if verdict == "HOLD":
+                state['llm_decision'] = {"action": "HOLD", "quantity": 0.0, "reasoning": f"Triage HOLD: {reason}"}
+                continue
+        escalated.append(state)
+
+    decisions = {}
+    for start in range(0, len(escalated), batch_size):
+        batch = escalated[start:start + batch_size]
+        if len(batch) < 2:
+            continue
+        print(f"---MAKING BATCHED TRADE DECISION ({len(batch)} symbols)---")
+        try:
+            batch_decisions = decide_batch(batch, deadline)
+        except TimeoutError as e:
+            print(f"⚠️  LLM deadline exceeded: {e}. Holding.")
+            batch_decisions = {state['symbol']: {"action": "HOLD", "quantity": 0.0, "reasoning": f"LLM deadline exceeded: {e}"}
+                               for state in batch}
+        missing = [state['symbol'] for state in batch if state['symbol'] not in batch_decisions]
+        if missing:
+            print(f"Batched answer had no valid decision for {', '.join(missing)}; deciding them one by one")
+        decisions.update(batch_decisions)
 
-app = workflow.compile()
+    escalated_symbols = {state['symbol'] for state in escalated}
+    final_states = []
+    for state in analyzed:
+        with symbol_context(state['symbol']):
+            if state['symbol'] in escalated_symbols:
+                if state['symbol'] in decisions:
+                    decision = dict(decisions[state['symbol']])
+                    decision.pop('symbol', None)
+                    state['llm_decision'] = decision
+                else:
+                    state = {**state, **decide(state, deadline, triage_first=False)}
+            final_states.append(execution_app.invoke(state, cycle_config(state), durability="exit"))
+    return final_states
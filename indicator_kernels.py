@@ -0,0 +1,223 @@
+"""
+Numba kernels for the indicators used by add_technical_indicators.
+
+Each kernel reproduces the pandas_ta 0.4 (non TA-Lib) computation of the
+same indicator, including its seeding and edge cases, so the columns are
+interchangeable:
+
+    RSI       rma (ewm alpha=1/length, adjust=False) of gains and losses
+    MACD      ema seeded with the SMA of the first `length` values
+              (presma), signal ema over the MACD from its first valid value
+    BBANDS    sma middle band, sample standard deviation (ddof=1)
+    STOCHRSI  rolling min/max of the RSI, sma smoothed %K and %D
+
+Series are 1-D float64 arrays; leading NaNs (e.g. a symbol with a shorter
+history in a panel) are skipped so a column computes exactly like the
+trimmed series would. A series shorter than pandas_ta's minimum length for
+an indicator gets all-NaN columns where pandas_ta returns no column. Compiled functions are cached on disk (cache=True)
+so only the first run after a change pays the compile time.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+EPSILON = np.finfo(float).eps
+
+# error_model="numpy": 0/0 yields NaN (as in pandas) instead of raising
+JIT = dict(cache=True, nogil=True, error_model="numpy")
+
+
+@njit(**JIT)
+def first_valid(x):
+    for i in range(x.shape[0]):
+        if not np.isnan(x[i]):
+            return i
+    return x.shape[0]
+
+
+@njit(**JIT)
+def rsi(close, length, out):
+    out[:] = np.nan
+    n = close.shape[0]
+    start = first_valid(close)
+    if n - start < length + 1:
+        return
+    alpha = 1.0 / length
+    change = close[start + 1] - close[start]
+    gain = max(change, 0.0)
+    loss = -min(change, 0.0)
+    out[start + 1] = 100.0 * gain / (gain + loss)
+    for t in range(start + 2, n):
+        change = close[t] - close[t - 1]
+        gain = (1.0 - alpha) * gain + alpha * max(change, 0.0)
+        loss = (1.0 - alpha) * loss + alpha * -min(change, 0.0)
+        out[t] = 100.0 * gain / (gain + loss)
+
+
+@njit(**JIT)
+def ema(x, length, out):
+    """pandas_ta ema with presma=True: SMA seed at the length-th value, then ewm(span=length, adjust=False)."""
+    out[:] = np.nan
+    n = x.shape[0]
+    start = first_valid(x)
+    if n - start < length:
+        return
+    seed = 0.0
+    for i in range(start, start + length):
+        seed += x[i]
+    value = seed / length
+    out[start + length - 1] = value
+    alpha = 2.0 / (length + 1.0)
+    for t in range(start + length, n):
+        value = (1.0 - alpha) * value + alpha * x[t]
+        out[t] = value
+
+
+@njit(**JIT)
+def sma(x, length, out):
+    """Mean of each full window; NaN wherever the window holds a NaN."""
+    out[:] = np.nan
+    weight = 1.0 / length
+    for t in range(length - 1, x.shape[0]):
+        total = 0.0
+        for i in range(t - length + 1, t + 1):
+            total += x[i] * weight
+        out[t] = total
+
+
+@njit(**JIT)
+def stdev(x, length, ddof, out):
+    out[:] = np.nan
+    for t in range(length - 1, x.shape[0]):
+        mean = 0.0
+        for i in range(t - length + 1, t + 1):
+            mean += x[i]
+        mean /= length
+        squares = 0.0
+        for i in range(t - length + 1, t + 1):
+            squares += (x[i] - mean) ** 2
+        out[t] = np.sqrt(squares / (length - ddof))
+
+
+@njit(**JIT)
+def rolling_min_max(x, length, lowest, highest):
+    lowest[:] = np.nan
+    highest[:] = np.nan
+    for t in range(length - 1, x.shape[0]):
+        low = x[t]
+        high = x[t]
+        for i in range(t - length + 1, t):
+            low = min(low, x[i])
+            high = max(high, x[i])
+        # min/max ignore NaN comparisons; a window with a NaN is NaN like pandas' min_periods
+        has_nan = False
+        for i in range(t - length + 1, t + 1):
+            if np.isnan(x[i]):
+                has_nan = True
+        if not has_nan:
+            lowest[t] = low
+            highest[t] = high
+
+
+@njit(**JIT)
+def non_zero_range(x, y, out):
+    """x - y, plus epsilon everywhere if any difference is exactly zero (pandas_ta non_zero_range)."""
+    has_zero = False
+    for t in range(x.shape[0]):
+        out[t] = x[t] - y[t]
+        if out[t] == 0.0:
+            has_zero = True
+    if has_zero:
+        for t in range(x.shape[0]):
+            out[t] += EPSILON
+
+
+@njit(**JIT)
+def macd(close, fast, slow, signal, macd_out, histogram_out, signal_out):
+    n = close.shape[0]
+    if n - first_valid(close) < slow + signal - 1:
+        macd_out[:] = np.nan
+        histogram_out[:] = np.nan
+        signal_out[:] = np.nan
+        return
+    fast_ema = np.empty(n)
+    slow_ema = np.empty(n)
+    ema(close, fast, fast_ema)
+    ema(close, slow, slow_ema)
+    for t in range(n):
+        macd_out[t] = fast_ema[t] - slow_ema[t]
+    ema(macd_out, signal, signal_out)
+    for t in range(n):
+        histogram_out[t] = macd_out[t] - signal_out[t]
+
+
+@njit(**JIT)
+def bbands(close, length, lower_std, upper_std, ddof, lower, mid, upper, bandwidth, percent):
+    n = close.shape[0]
+    deviation = np.empty(n)
+    sma(close, length, mid)
+    stdev(close, length, ddof, deviation)
+    for t in range(n):
+        lower[t] = mid[t] - lower_std * deviation[t]
+        upper[t] = mid[t] + upper_std * deviation[t]
+    band_range = np.empty(n)
+    close_range = np.empty(n)
+    non_zero_range(upper, lower, band_range)
+    non_zero_range(close, lower, close_range)
+    for t in range(n):
+        bandwidth[t] = 100.0 * band_range[t] / mid[t]
+        percent[t] = close_range[t] / band_range[t]
+
+
+@njit(**JIT)
+def stochrsi(close, length, rsi_length, k, d, k_out, d_out):
+    n = close.shape[0]
+    if n - first_valid(close) < length + rsi_length + 2:
+        k_out[:] = np.nan
+        d_out[:] = np.nan
+        return
+    rsi_values = np.empty(n)
+    lowest = np.empty(n)
+    highest = np.empty(n)
+    rsi(close, rsi_length, rsi_values)
+    rolling_min_max(rsi_values, length, lowest, highest)
+    high_low_range = np.empty(n)
+    non_zero_range(highest, lowest, high_low_range)
+    stoch = np.empty(n)
+    for t in range(n):
+        stoch[t] = 100.0 * (rsi_values[t] - lowest[t]) / high_low_range[t]
+    sma(stoch, k, k_out)
+    sma(k_out, d, d_out)
+
+
+@njit(**JIT)
+def indicators(close, params, out):
+    """
+    Computes every indicator column of one series.
+
+    Args:
+        close: 1-D close prices
+        params: float64 array (rsi_length, fast, slow, signal, bb_length, bb_lower_std,
+                bb_upper_std, bb_ddof, stoch_length, stoch_rsi_length, k, d)
+        out: 2-D array (column, time), columns in data_processor.INDICATOR_COLUMNS order
+    """
+    rsi(close, int(params[0]), out[0])
+    macd(close, int(params[1]), int(params[2]), int(params[3]), out[1], out[2], out[3])
+    bbands(close, int(params[4]), params[5], params[6], int(params[7]), out[4], out[5], out[6], out[7], out[8])
+    stochrsi(close, int(params[8]), int(params[9]), int(params[10]), int(params[11]), out[9], out[10])
+
+
+@njit(parallel=True, **JIT)
+def indicators_panel(close, params, out):
+    """
+    Panel version of `indicators`: close is (time, symbol), out is
+    (column, symbol, time) so each symbol's column is contiguous; symbols
+    are computed in parallel.
+    """
+    for j in prange(close.shape[1]):
+        series = np.ascontiguousarray(close[:, j])
+        rsi(series, int(params[0]), out[0, j])
+        macd(series, int(params[1]), int(params[2]), int(params[3]), out[1, j], out[2, j], out[3, j])
+        bbands(series, int(params[4]), params[5], params[6], int(params[7]),
+               out[4, j], out[5, j], out[6, j], out[7, j], out[8, j])
+        stochrsi(series, int(params[8]), int(params[9]), int(params[10]), int(params[11]), out[9, j], out[10, j])
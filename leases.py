@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Coordination mode: a watchlist shared by bot instances on several hosts.
+
+`python main.py spot --symbol A,B,C,... --coordinate` on every host (same
+DATABASE_URL, same watchlist) makes each instance a node that trades only
+the symbols it holds a lease on:
+- every node registers in cluster_nodes and renews its registration and its
+  leases (symbol_leases rows) every LEASE_TTL / 3 seconds;
+- a node holds its fair share, ceil(symbols / live nodes): it claims free or
+  expired leases up to it and releases the ones above it, so symbols are
+  spread again when a node joins, leaves or dies (a dead node's leases
+  expire after LEASE_TTL and are claimed by the others);
+- orders are placed under the lease (order_guard): a conditional UPDATE
+  checks that the lease is still this node's, with the epoch it was claimed
+  with and at least LEASE_ORDER_MARGIN seconds left, and keeps the row
+  locked until the order call returns. A node whose lease lapsed or was
+  taken over can't place an order, and a lease can't change hands while an
+  order is in flight, so the next holder's position check sees it.
+
+Lease rows rather than advisory locks: they work on SQLite too, survive a
+dropped pooled connection, carry the fencing epoch and show who trades
+what. SQLite locks the whole database for a write transaction, so there
+the check commits before the order runs (instead of stalling every other
+writer for the order's duration); the lease then can't change hands only
+for the LEASE_ORDER_MARGIN it had left. Run several hosts on Postgres. All times come from the database's clock. With --workers, each worker
+process is a node of its own.
+
+Usage:
+    python leases.py                        # leases and nodes
+    python leases.py --drill --nodes 3      # failover drill against DATABASE_URL
+"""
+
+import os
+import math
+import time
+import zlib
+import socket
+import argparse
+import threading
+from contextlib import contextmanager, nullcontext
+from sqlalchemy import text, select, insert, update, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds a lease (and a node's registration) lasts without a heartbeat
+LEASE_TTL = float(os.environ.get("LEASE_TTL", "30"))
+
+# An order needs at least this many seconds left on its lease (longer than an order call can take)
+LEASE_ORDER_MARGIN = float(os.environ.get("LEASE_ORDER_MARGIN", "10"))
+
+# Registrations of dead nodes are deleted this many seconds after they expired
+NODE_FORGET_AFTER = 3600
+
+# Node ids are NODE_NAME:pid
+NODE_NAME = os.environ.get("NODE_NAME") or socket.gethostname()
+
+
+class LeaseLost(Exception):
+    """The node doesn't hold the symbol's lease (any more)."""
+
+
+def db_time(connection):
+    """Seconds since the epoch on the database's clock."""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        return float(connection.execute(text("SELECT EXTRACT(EPOCH FROM clock_timestamp())")).scalar())
+    if dialect == "sqlite":
+        return float(connection.execute(text("SELECT (julianday('now') - 2440587.5) * 86400.0")).scalar())
+    return time.time()
+
+
+class SymbolLeases:
+    """
+    The leases of one node: claims its share of the watchlist and renews it from a heartbeat thread.
+
+    Usage:
+        leases = SymbolLeases("spot", ["BTCUSDT", "ETHUSDT", "XRPUSDT"]).start()
+        for symbol in leases.owned():
+            with leases.guard(symbol):  # raises LeaseLost
+                place_order(symbol)
+    """
+
+    def __init__(self, mode: str, symbols: list, node_id: str = None, ttl: float = LEASE_TTL,
+                 order_margin: float = LEASE_ORDER_MARGIN, engine=None):
+        if engine is None:
+            from database import engine
+        self.mode = mode
+        self.symbols = list(symbols)
+        self.node_id = node_id or f"{NODE_NAME}:{os.getpid()}"
+        self.ttl = ttl
+        self.order_margin = min(order_margin, ttl / 2)
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.held = {}  # symbol -> epoch it was claimed with
+        self.valid_until = 0.0  # time.monotonic() until which the held leases are certainly not expired
+        self.stopped = threading.Event()
+        self.thread = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Calls callback(claimed, released) with the symbols of each heartbeat that claimed or released leases."""
+        self.listeners.append(callback)
+
+    def _preference(self, symbol: str):
+        # Rendezvous hashing: nodes prefer different symbols, so their claims rarely collide
+        return zlib.crc32(f"{self.node_id}|{symbol}".encode())
+
+    def _lease(self, symbol: str):
+        from database import SymbolLease
+        return (SymbolLease.trading_mode == self.mode) & (SymbolLease.symbol == symbol)
+
+    def heartbeat(self):
+        """Renews the node and its leases, then claims or releases leases towards its fair share."""
+        from database import SymbolLease, ClusterNode
+        started = time.monotonic()
+        with self.engine.begin() as connection:
+            now = db_time(connection)
+            node = (ClusterNode.trading_mode == self.mode) & (ClusterNode.node_id == self.node_id)
+            if connection.execute(update(ClusterNode).where(node).values(expires_at=now + self.ttl)).rowcount == 0:
+                connection.execute(insert(ClusterNode).values(
+                    trading_mode=self.mode, node_id=self.node_id, started_at=now, expires_at=now + self.ttl))
+                # Registering also forgets the nodes long dead
+                connection.execute(delete(ClusterNode).where(
+                    ClusterNode.trading_mode == self.mode, ClusterNode.expires_at < now - NODE_FORGET_AFTER))
+            # Renewing can't fence anyone: a lease still owned by this node was claimed by no one else
+            connection.execute(update(SymbolLease).where(
+                SymbolLease.trading_mode == self.mode, SymbolLease.owner == self.node_id
+            ).values(expires_at=now + self.ttl))
+            nodes = connection.execute(select(func.count()).select_from(ClusterNode).where(
+                ClusterNode.trading_mode == self.mode, ClusterNode.expires_at > now)).scalar()
+            rows = connection.execute(select(
+                SymbolLease.symbol, SymbolLease.owner, SymbolLease.epoch, SymbolLease.expires_at
+            ).where(SymbolLease.trading_mode == self.mode, SymbolLease.symbol.in_(self.symbols))).all()
+
+        held = {row.symbol: row.epoch for row in rows if row.owner == self.node_id}
+        with self.lock:
+            self.held = dict(held)
+            self.valid_until = started + self.ttl
+
+        existing = {row.symbol for row in rows}
+        for symbol in self.symbols:
+            if symbol not in existing:
+                self._create(symbol)
+        free = [symbol for symbol in self.symbols if symbol not in existing] + [
+            row.symbol for row in rows
+            if row.owner != self.node_id and (row.owner is None or row.expires_at <= now)
+        ]
+
+        share = math.ceil(len(self.symbols) / max(nodes, 1))
+        claimed, released = [], []
+        for symbol in sorted(free, key=self._preference, reverse=True):
+            if len(held) >= share:
+                break
+            epoch = self._claim(symbol)
+            if epoch is not None:
+                held[symbol] = epoch
+                claimed.append(symbol)
+        for symbol in sorted(held, key=self._preference)[:max(0, len(held) - share)]:
+            # Stop ordering on it first; an order in flight keeps the row locked until it returns
+            with self.lock:
+                self.held.pop(symbol, None)
+            self._release(symbol)
+            held.pop(symbol)
+            released.append(symbol)
+
+        with self.lock:
+            self.held = held
+        if claimed or released:
+            print(f"Leases of {self.node_id}: claimed {', '.join(claimed) or '-'}, released "
+                  f"{', '.join(released) or '-'}; holding {len(held)} of {len(self.symbols)} symbols "
+                  f"({nodes} nodes)")
+            for callback in self.listeners:
+                try:
+                    callback(claimed, released)
+                except Exception as e:
+                    print(f"Error in lease listener of {self.node_id}: {e}")
+        return held
+
+    def _create(self, symbol: str):
+        from database import SymbolLease
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(insert(SymbolLease).values(
+                    trading_mode=self.mode, symbol=symbol, owner=None, epoch=0, expires_at=0.0))
+        except IntegrityError:
+            pass  # Created by another node
+
+    def _claim(self, symbol: str):
+        """Claims a free or expired lease (one short transaction); returns its new epoch or None."""
+        from database import SymbolLease
+        with self.engine.begin() as connection:
+            now = db_time(connection)
+            claimed = connection.execute(update(SymbolLease).where(
+                self._lease(symbol), or_(SymbolLease.owner.is_(None), SymbolLease.expires_at <= now)
+            ).values(owner=self.node_id, epoch=SymbolLease.epoch + 1, expires_at=now + self.ttl, claimed_at=now))
+            if claimed.rowcount != 1:
+                return None
+            return connection.execute(select(SymbolLease.epoch).where(self._lease(symbol))).scalar()
+
+    def _release(self, symbol: str):
+        from database import SymbolLease
+        with self.engine.begin() as connection:
+            now = db_time(connection)
+            connection.execute(update(SymbolLease).where(
+                self._lease(symbol), SymbolLease.owner == self.node_id
+            ).values(owner=None, expires_at=now))
+
+    def owned(self):
+        """Symbols of the watchlist this node holds a lease on, in watchlist order."""
+        with self.lock:
+            if time.monotonic() >= self.valid_until:
+                return []
+            return [symbol for symbol in self.symbols if symbol in self.held]
+
+    @contextmanager
+    def guard(self, symbol: str):
+        """
+        Runs the block (an order) under the symbol's lease; raises LeaseLost if the node doesn't hold it.
+
+        The lease row stays locked until the block returns, so it can't be
+        claimed by another node meanwhile (on SQLite: for the order margin
+        the lease had left, see the module docstring).
+        """
+        with self.lock:
+            epoch = self.held.get(symbol)
+        if epoch is None:
+            raise LeaseLost(f"{self.node_id} holds no lease on {self.mode} {symbol}")
+        if self.engine.dialect.name == "sqlite":
+            with self.engine.begin() as connection:
+                self._check(connection, symbol, epoch)
+            yield
+            return
+        with self.engine.begin() as connection:
+            self._check(connection, symbol, epoch)
+            yield
+
+    def _check(self, connection, symbol: str, epoch: int):
+        """Records an order under the lease if it is still this node's, with at least the order margin left."""
+        from database import SymbolLease
+        now = db_time(connection)
+        checked = connection.execute(update(SymbolLease).where(
+            self._lease(symbol), SymbolLease.owner == self.node_id, SymbolLease.epoch == epoch,
+            SymbolLease.expires_at > now + self.order_margin
+        ).values(last_order_at=now))
+        if checked.rowcount != 1:
+            with self.lock:
+                if self.held.get(symbol) == epoch:
+                    self.held.pop(symbol)
+            raise LeaseLost(f"Lease of {self.node_id} on {self.mode} {symbol} (epoch {epoch}) lapsed or was taken over")
+
+    def start(self):
+        """Claims the first share, then keeps heartbeating from a thread."""
+        self.heartbeat()
+        self.thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stopped.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                # The leases lapse (and owned() empties) unless a later heartbeat gets through
+                print(f"Lease heartbeat of {self.node_id} failed: {e}")
+
+    def stop(self):
+        """Releases every lease and deregisters, so the other nodes take over at once."""
+        from database import SymbolLease, ClusterNode
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(10)
+        with self.lock:
+            self.held = {}
+        with self.engine.begin() as connection:
+            now = db_time(connection)
+            connection.execute(update(SymbolLease).where(
+                SymbolLease.trading_mode == self.mode, SymbolLease.owner == self.node_id
+            ).values(owner=None, expires_at=now))
+            connection.execute(delete(ClusterNode).where(
+                ClusterNode.trading_mode == self.mode, ClusterNode.node_id == self.node_id))
+
+
+# Leases of this process in coordination mode, None to trade every symbol unguarded
+symbol_leases = None
+
+def use_symbol_leases(leases: SymbolLeases):
+    """Guards this process' orders with `leases` (see order_guard)."""
+    global symbol_leases
+    symbol_leases = leases
+
+def order_guard(symbol: str):
+    """Context manager placing an order under the symbol's lease in coordination mode; raises LeaseLost."""
+    if symbol_leases is None:
+        return nullcontext()
+    return symbol_leases.guard(symbol)
+
+
+# --- Status and failover drill ---
+
+def show_status(engine, mode: str = None):
+    from database import SymbolLease, ClusterNode
+    with engine.connect() as connection:
+        now = db_time(connection)
+        nodes = select(ClusterNode).order_by(ClusterNode.trading_mode, ClusterNode.node_id)
+        leases = select(SymbolLease).order_by(SymbolLease.trading_mode, SymbolLease.symbol)
+        if mode:
+            nodes = nodes.where(ClusterNode.trading_mode == mode)
+            leases = leases.where(SymbolLease.trading_mode == mode)
+        for node in connection.execute(nodes):
+            state = "alive" if node.expires_at > now else "expired"
+            print(f"node  {node.trading_mode:<5} {node.node_id:<32} {state}, up {now - node.started_at:.0f}s")
+        for lease in connection.execute(leases):
+            if lease.owner is None:
+                holder = "free"
+            elif lease.expires_at > now:
+                holder = f"{lease.owner} for {lease.expires_at - now:.0f}s"
+            else:
+                holder = f"{lease.owner}, expired"
+            print(f"lease {lease.trading_mode:<5} {lease.symbol:<12} epoch {lease.epoch:<5} {holder}")
+
+
+def _drill_node(symbols: list, ttl: float, seconds: float, orders):
+    """A drill node: places fake orders (a short sleep) under its leases and reports them."""
+    leases = SymbolLeases("drill", symbols, ttl=ttl, order_margin=ttl / 4).start()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for symbol in leases.owned():
+            try:
+                with leases.guard(symbol):
+                    started = time.time()
+                    time.sleep(0.02)
+                    orders.put((symbol, leases.node_id, leases.held.get(symbol), started, time.time()))
+            except LeaseLost:
+                pass
+            except Exception as e:
+                print(f"Drill order on {symbol} failed: {e}")
+        time.sleep(0.05)
+    leases.stop()
+
+
+def run_drill(engine, nodes: int, symbols: int, ttl: float, seconds: float):
+    """
+    Starts `nodes` node processes over one watchlist, kills one (no release)
+    halfway, and checks that the others took its symbols over and that no
+    two nodes ever placed orders on a symbol at the same time.
+    """
+    import multiprocessing
+    from database import SymbolLease, ClusterNode
+    with engine.begin() as connection:
+        connection.execute(delete(SymbolLease).where(SymbolLease.trading_mode == "drill"))
+        connection.execute(delete(ClusterNode).where(ClusterNode.trading_mode == "drill"))
+
+    watchlist = [f"DRILL{index}USDT" for index in range(symbols)]
+    context = multiprocessing.get_context("spawn")
+    orders = context.Queue()
+    processes = [context.Process(target=_drill_node, args=(watchlist, ttl, seconds, orders), daemon=True)
+                 for _ in range(nodes)]
+    for process in processes:
+        process.start()
+    time.sleep(seconds / 2)
+    processes[0].kill()
+    killed_at = time.time()
+    print(f"Killed node pid {processes[0].pid}")
+
+    records = []
+    while any(process.is_alive() for process in processes[1:]) or not orders.empty():
+        try:
+            records.append(orders.get(timeout=1))
+        except Exception:
+            pass
+    killed_node = f"{NODE_NAME}:{processes[0].pid}"
+
+    overlaps = 0
+    for symbol in watchlist:
+        placed = sorted((record for record in records if record[0] == symbol), key=lambda record: record[3])
+        for previous, current in zip(placed, placed[1:]):
+            if current[1] != previous[1] and current[3] < previous[4]:
+                overlaps += 1
+                print(f"OVERLAP on {symbol}: {previous} / {current}")
+    taken_over = [record for record in records if record[3] > killed_at and record[1] != killed_node
+                  and any(prior[0] == record[0] and prior[1] == killed_node for prior in records)]
+    failover = min((record[3] - killed_at for record in taken_over), default=None)
+    traded = {record[0] for record in records if record[3] > killed_at}
+    print(f"{len(records)} orders on {symbols} symbols by {nodes} nodes; "
+          f"symbols traded after the kill: {len(traded)}/{symbols}; overlapping orders: {overlaps}")
+    if failover is not None:
+        print(f"First order on a symbol of the killed node {failover:.1f}s after the kill (lease TTL {ttl:.0f}s)")
+    return overlaps == 0 and len(traded) == symbols
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Symbol leases of coordination mode")
+    parser.add_argument("--mode", help="Only this trading mode")
+    parser.add_argument("--drill", action="store_true", help="Run a failover drill (trading mode 'drill')")
+    parser.add_argument("--nodes", type=int, default=3, help="Drill: node processes (default: 3)")
+    parser.add_argument("--symbols", type=int, default=12, help="Drill: watchlist size (default: 12)")
+    parser.add_argument("--ttl", type=float, default=3.0, help="Drill: lease TTL in seconds (default: 3)")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Drill: duration (default: 20)")
+    args = parser.parse_args()
+
+    from database import engine, init_db
+    init_db()
+    if args.drill:
+        raise SystemExit(0 if run_drill(engine, args.nodes, args.symbols, args.ttl, args.seconds) else 1)
+    show_status(engine, args.mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Realized PnL ledger: the open lots and the running realized PnL per symbol.
+
+Executions are applied once, in execution time order, as they are stored
+(bybit_tools.store_trade_history_to_db):
+- one in the direction of the position (or from flat) opens a lot;
+- one against it consumes the open lots oldest first (FIFO) and realizes
+  qty * (exit - entry) on each, the opposite for shorts;
+- a perp execution larger than the position flips it: the rest opens a
+  lot on the other side.
+
+With LEDGER_METHOD=average, opening executions are merged into a single lot
+at the average entry price instead.
+
+An execution updates the symbol's running totals and the lots it opens or
+consumes. A symbol's open lots are loaded once per batch of stored
+executions and every lot is consumed once, so applying an execution is O(1)
+amortized and the ledger never replays history; an execution's PnL is
+known as soon as it is stored.
+
+Several processes may store executions at once (the private stream's
+writer, the API's /trade-history/fetch): a session locks a symbol's
+symbol_pnl row (SELECT ... FOR UPDATE) before loading its state, so the
+other waits for the commit and then reads the updated totals and lots.
+
+Fees are booked as a loss on the execution that pays them. Spot buys pay
+theirs in the base coin, which reduces the quantity received. Spot sells of
+coins the ledger has no lots for (bought before it existed) realize only
+their fee.
+"""
+
+import os
+from collections import deque
+from sqlalchemy import select, delete, and_, or_
+from bybit_tools import safe_float_convert
+
+# "fifo" or "average" (average cost)
+LEDGER_METHOD = os.environ.get("LEDGER_METHOD", "fifo")
+
+# Quantities below this are float residue of closed lots
+QTY_EPSILON = 1e-9
+
+# Executions that don't change the position, only cost their fee
+FEE_ONLY_EXEC_TYPES = ("Funding",)
+
+
+def _symbol_state(db, category: str, symbol: str):
+    """
+    (SymbolPnl row, deque of its open lots oldest first), loaded once per session.
+
+    The row is locked until the session commits, so no other writer applies
+    executions of the symbol in between. Executions stored in the same
+    session reuse the state: new lots are appended and consumed lots popped
+    without flushing or querying again.
+    """
+    from database import SymbolPnl, PositionLot, insert_missing
+    states = db.info.setdefault("ledger", {})
+    state = states.get((category, symbol))
+    if state is None:
+        insert_missing(db, SymbolPnl.__table__, dict(
+            category=category, symbol=symbol, position_qty=0.0, cost=0.0, realized_pnl=0.0, fees=0.0))
+        row = db.get(SymbolPnl, (category, symbol), with_for_update=True, populate_existing=True)
+        lots = db.query(PositionLot).filter(
+            PositionLot.category == category, PositionLot.symbol == symbol
+        ).order_by(PositionLot.id).all()
+        state = states[(category, symbol)] = (row, deque(lots))
+    return state
+
+
+def _close_lots(db, row, lots: deque, qty: float, price: float):
+    """Consumes the oldest lots for `qty`; returns (quantity left unmatched, realized PnL)."""
+    realized = 0.0
+    while qty > QTY_EPSILON and lots:
+        lot = lots[0]
+        matched = min(qty, lot.qty)
+        sign = 1 if lot.side == "Buy" else -1
+        realized += matched * (price - lot.price) * sign
+        row.position_qty -= matched * sign
+        row.cost -= matched * lot.price
+        lot.qty -= matched
+        qty -= matched
+        if lot.qty <= QTY_EPSILON:
+            lots.popleft()
+            # A lot opened in this session was never written
+            if lot in db.new:
+                db.expunge(lot)
+            else:
+                db.delete(lot)
+    if not lots or abs(row.position_qty) <= QTY_EPSILON:
+        row.position_qty, row.cost = 0.0, 0.0
+    return qty, realized
+
+
+def _open_lot(db, row, lots: deque, side: str, qty: float, price: float, exec_id: str, exec_time: int):
+    from database import PositionLot
+    row.position_qty += qty if side == "Buy" else -qty
+    row.cost += qty * price
+    if LEDGER_METHOD == "average" and lots:
+        lot = lots[0]
+        lot.price = (lot.qty * lot.price + qty * price) / (lot.qty + qty)
+        lot.qty += qty
+        return
+    lot = PositionLot(category=row.category, symbol=row.symbol, side=side, qty=qty, price=price,
+                      exec_id=exec_id, exec_time=exec_time)
+    db.add(lot)
+    lots.append(lot)
+
+
+def lock_symbols(db, category: str, symbols):
+    """
+    Loads (and locks) the ledger state of several symbols in name order.
+
+    Call it before applying a batch, so that concurrent writers lock
+    symbols in the same order and never deadlock each other.
+    """
+    category = (category or "linear").lower()
+    for symbol in sorted(set(symbols)):
+        _symbol_state(db, category, symbol)
+
+
+def apply_fill(db, category: str, symbol: str, side: str, qty: float, price: float, fee: float = 0.0,
+               fee_currency: str = None, exec_type: str = None, exec_id: str = None, exec_time: int = None):
+    """
+    Applies one execution to the ledger (in the caller's session, not committed).
+
+    The symbol's row stays locked until the session commits or rolls back
+    (see _symbol_state); a concurrent writer of the same symbol waits for it.
+
+    Returns:
+        float: Realized PnL of the execution, net of its fee
+    """
+    category = (category or "linear").lower()
+    side = "Buy" if (side or "").lower() == "buy" else "Sell"
+    row, lots = _symbol_state(db, category, symbol)
+
+    fee_value = fee
+    if category == "spot" and fee_currency and fee_currency == symbol.replace("USDT", ""):
+        # Fee paid in the base coin
+        fee_value = fee * price
+        if side == "Buy":
+            qty -= fee
+
+    pnl = -fee_value
+    if exec_type not in FEE_ONLY_EXEC_TYPES and qty > QTY_EPSILON:
+        if row.position_qty * (1 if side == "Buy" else -1) < -QTY_EPSILON:
+            qty, realized = _close_lots(db, row, lots, qty, price)
+            pnl += realized
+        # Spot can't go short: a sell never opens a lot
+        if qty > QTY_EPSILON and (category != "spot" or side == "Buy"):
+            _open_lot(db, row, lots, side, qty, price, exec_id, exec_time)
+
+    row.realized_pnl += pnl
+    row.fees += fee_value
+    row.last_exec_time = exec_time
+    row.last_exec_id = exec_id
+    return round(pnl, 6)
+
+
+def apply_execution(db, execution: dict, category: str = "linear"):
+    """apply_fill() for an execution record from the Bybit API."""
+    return apply_fill(
+        db, category, execution.get('symbol'), execution.get('side'),
+        qty=safe_float_convert(execution.get('execQty')),
+        price=safe_float_convert(execution.get('execPrice')),
+        fee=safe_float_convert(execution.get('execFee')),
+        fee_currency=execution.get('feeCurrency'),
+        exec_type=execution.get('execType'),
+        exec_id=execution.get('execId'),
+        exec_time=int(execution.get('execTime')) if execution.get('execTime') else None,
+    )
+
+
+def execution_order(execution: dict):
+    """Sort key applying executions oldest first (a malformed time or seq sorts first instead of raising)."""
+    return safe_float_convert(execution.get('execTime')), safe_float_convert(execution.get('seq'))
+
+
+def entry_price(symbol: str, category: str = "spot"):
+    """
+    Average entry price of the ledger's open lots of a symbol.
+
+    Returns:
+        float or None: None when the ledger has no open lots
+    """
+    from database import SessionLocal, SymbolPnl
+    db = SessionLocal()
+    try:
+        row = db.get(SymbolPnl, (category, symbol))
+        if row is None or abs(row.position_qty or 0.0) <= QTY_EPSILON:
+            return None
+        return row.cost / abs(row.position_qty)
+    finally:
+        db.close()
+
+
+def _apply_row(db, row):
+    return apply_fill(db, row.category, row.symbol, row.side, row.exec_qty or 0.0, row.exec_price or 0.0,
+                      row.exec_fee or 0.0, row.fee_currency, row.exec_type, row.exec_id, row.exec_time)
+
+
+def rebuild_ledger(engine, migration_row: dict, chunk_size: int, archive_dir: str = None):
+    """
+    Builds the ledger from the stored executions, oldest first, and rewrites their pnl.
+
+    Used once, by the migration that introduced the ledger. Archived
+    executions only feed the ledger (their Parquet files keep the PnL they
+    were archived with). Each chunk commits with the migration's progress
+    (the id of its last execution), so an interrupted run resumes after it.
+    """
+    from sqlalchemy.orm import Session
+    from database import BybitTradeHistory, PositionLot, SymbolPnl, bump_table_version
+    from archive import ARCHIVE_DIR, archive_dataset
+    from migrations import record_progress
+
+    table = BybitTradeHistory
+    after_id = migration_row.get("last_key")
+    chunk_size = chunk_size or 10 ** 9
+    replayed = 0
+
+    # Objects stay loaded across the chunk commits: the ledger state is reused
+    with Session(engine, autoflush=False, expire_on_commit=False) as db:
+        if after_id is None:
+            db.execute(delete(PositionLot))
+            db.execute(delete(SymbolPnl))
+            dataset = archive_dataset("bybit_trade_history", archive_dir or ARCHIVE_DIR)
+            if dataset is not None:
+                columns = ["id", "category", "symbol", "side", "exec_qty", "exec_price", "exec_fee",
+                           "fee_currency", "exec_type", "exec_id", "exec_time"]
+                archived = dataset.to_table(columns=columns).sort_by([("exec_time", "ascending"), ("id", "ascending")])
+                for batch in archived.to_batches():
+                    for record in batch.to_pylist():
+                        if record["exec_time"] is not None:
+                            apply_fill(db, record["category"], record["symbol"], record["side"],
+                                       record["exec_qty"] or 0.0, record["exec_price"] or 0.0,
+                                       record["exec_fee"] or 0.0, record["fee_currency"], record["exec_type"],
+                                       record["exec_id"], record["exec_time"])
+                            replayed += 1
+                print(f"Ledger: {replayed:,} archived executions applied")
+            after = None
+        else:
+            after = (db.execute(select(table.exec_time).where(table.id == after_id)).scalar(), after_id)
+
+        while True:
+            query = select(table).where(table.exec_time.is_not(None))
+            if after is not None:
+                query = query.where(or_(
+                    table.exec_time > after[0], and_(table.exec_time == after[0], table.id > after[1])
+                ))
+            rows = db.execute(query.order_by(table.exec_time, table.id).limit(chunk_size)).scalars().all()
+            if not rows:
+                break
+            for row in rows:
+                row.pnl = _apply_row(db, row)
+            after = (rows[-1].exec_time, rows[-1].id)
+            # Progress commits with the chunk's ledger changes
+            record_progress(db.connection(), migration_row["version"], last_key=rows[-1].id)
+            db.commit()
+            replayed += len(rows)
+            print(f"Ledger: {replayed:,} executions applied")
+        # Their pnl was rewritten
+        bump_table_version(db, "bybit_trade_history")
+        db.commit()
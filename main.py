@@ -2,18 +2,24 @@ import schedule
 import time
 import logging
 import argparse
+import os
 import sys
 from dotenv import load_dotenv
-from graph import app, GraphState
-from database import init_db, SessionLocal, BalanceHistory
-from bybit_tools import spot_get_account_balance, perp_get_account_balance, monitor_position_pnl
+from graph import run_cycle, run_batch, prefetch_snapshots, fresh_snapshot, GraphState
+from model_router import DECISION_BATCH_SIZE
+from database import init_db, engine, save_records, BalanceHistory
+from partitioning import ensure_partitions
+from archive import archive_history, archive_configured, ARCHIVE_AFTER_DAYS
+from bybit_tools import (
+    spot_get_account_balance, perp_get_account_balance, monitor_position_pnl, use_session, use_position_book,
+    use_spot_watchdog
+)
+from metrics import span, symbol_context, start_metrics_server
+from profiling import CycleProfiler
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the database
-init_db()
-
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -23,62 +29,100 @@ def parse_arguments():
     parser.add_argument('mode', choices=['spot', 'perp'], 
                        help='Trading mode: spot for spot trading, perp for perpetual futures trading')
     parser.add_argument('--symbol', default='XRPUSDT', 
-                       help='Trading symbol (default: XRPUSDT)')
+                       help='Trading symbol, or comma-separated watchlist (default: XRPUSDT)')
     parser.add_argument('--interval', type=int, default=5, 
                        help='Trading interval in minutes (default: 5)')
+    parser.add_argument('--timeframes', default=os.environ.get('ANALYSIS_TIMEFRAMES', ''),
+                       help='Comma-separated higher timeframes in minutes (e.g. 15,60), resampled from one '
+                            'cached 1-minute series (default: none)')
+    parser.add_argument('--batch-size', type=int, default=DECISION_BATCH_SIZE,
+                       help='Decide up to this many watchlist symbols in one LLM request, 1 to disable (default: 1)')
+    parser.add_argument('--paper', action='store_true',
+                       help='Paper trade against an in-process simulated exchange fed by live public prices')
+    parser.add_argument('--no-private-stream', action='store_true',
+                       default=os.environ.get('PRIVATE_STREAM', '1').lower() in ('0', 'false', 'no'),
+                       help='Poll REST for positions instead of tracking them from the private WebSocket streams')
+    parser.add_argument('--no-watchdog', action='store_true',
+                       default=os.environ.get('SPOT_WATCHDOG', '1').lower() in ('0', 'false', 'no'),
+                       help='Spot only: rely on exchange stop orders alone instead of also exiting on streamed ticks')
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('METRICS_PORT', 9100)),
+                       help='Port for the Prometheus /metrics endpoint, 0 to disable (default: 9100); '
+                            'worker N of the supervisor serves on the port + N + 1')
+    parser.add_argument('--metrics-host', default=os.environ.get('METRICS_HOST', '127.0.0.1'),
+                       help='Interface the /metrics endpoint listens on; 0.0.0.0 to let a remote Prometheus '
+                            'scrape it (default: 127.0.0.1, local only)')
+    parser.add_argument('--workers', default=os.environ.get('WORKERS', '1'),
+                       help='Shard the watchlist across this many worker processes under a supervisor, '
+                            '"auto" for one per CPU core (default: 1, a single process)')
+    parser.add_argument('--coordinate', action='store_true',
+                       default=os.environ.get('COORDINATE', '0').lower() in ('1', 'true', 'yes'),
+                       help='Share the watchlist with the other instances on the same database: trade only the '
+                            'symbols this instance (or worker) holds a lease on (see leases.py)')
     
     args = parser.parse_args()
     return args
 
 def log_balance_history(mode: str):
     logging.info(f"---LOGGING BALANCE HISTORY ({mode.upper()})---")
-    db = SessionLocal()
-    try:
-        # Use appropriate balance function based on trading mode
-        if mode == 'spot':
-            response = spot_get_account_balance("UNIFIED")
-        elif mode == 'perp':
-            response = perp_get_account_balance("UNIFIED")
-        else:
-            logging.error(f"Invalid trading mode for balance logging: {mode}")
-            return
-            
-        if response and response.get('retCode') == 0:
-            balances = response['result']['list']
-            for balance in balances:
-                for coin_balance in balance['coin']:
-                    db_balance = BalanceHistory(
-                        account_type=f"{balance['accountType']}_{mode}",  # Add mode to account type
-                        balance=float(coin_balance['equity']),
-                        coin=coin_balance['coin']
-                    )
-                    db.add(db_balance)
-            db.commit()
-    finally:
-        db.close()
+    # Use appropriate balance function based on trading mode
+    if mode == 'spot':
+        response = spot_get_account_balance("UNIFIED")
+    elif mode == 'perp':
+        response = perp_get_account_balance("UNIFIED")
+    else:
+        logging.error(f"Invalid trading mode for balance logging: {mode}")
+        return
+        
+    if response and response.get('retCode') == 0:
+        balances = response['result']['list']
+        save_records(*(
+            BalanceHistory(
+                account_type=f"{balance['accountType']}_{mode}",  # Add mode to account type
+                balance=float(coin_balance['equity']),
+                coin=coin_balance['coin']
+            )
+            for balance in balances for coin_balance in balance['coin']
+        ))
+
+def log_private_event(topic: str, record: dict):
+    """Logs fills and position changes as the private streams report them."""
+    if topic == "execution":
+        trigger = record.get("stopOrderType")
+        trigger = f" ({trigger})" if trigger and trigger != "UNKNOWN" else ""
+        logging.info(f"Fill {record.get('symbol')}: {record.get('side')} {record.get('execQty')} "
+                     f"@ {record.get('execPrice')}{trigger}")
+    elif topic == "position":
+        logging.info(f"Position {record.get('symbol')}: {record.get('side') or 'flat'} {record.get('size')}")
 
-def run_spot_trading_cycle(symbol: str, interval: int):
+def run_spot_trading_cycle(symbol: str, interval: int, timeframes: list = None, snapshot: dict = None):
     """Run a trading cycle for spot trading."""
+    with symbol_context(symbol), span("cycle", "spot", symbol):
+        _run_spot_trading_cycle(symbol, interval, timeframes, snapshot)
+
+def _run_spot_trading_cycle(symbol: str, interval: int, timeframes: list = None, snapshot: dict = None):
     logging.info("---STARTING SPOT TRADING CYCLE---")
     print(f"Selected Symbol: {symbol}")
     print(f"Selected Interval: {interval} minutes")
     print("Mode: SPOT TRADING")
     
     # Monitor current position PnL before making decisions
-    monitor_position_pnl(symbol, "spot")
+    monitor_position_pnl(symbol, "spot", fresh_snapshot(snapshot).get('position'))
     
     initial_state: GraphState = {
         "symbol": symbol,
         "interval": interval,
+        "timeframes": timeframes or [],
         "market_analysis": "",
+        "prompt_report": {},
         "llm_decision": {},
         "trade_executed": False,
         "error_message": "",
-        "trading_mode": "spot"  # Add trading mode to state
+        "trading_mode": "spot",  # Add trading mode to state
+        "snapshot": snapshot or {}
     }
     
     # Invoke the graph
-    final_state = app.invoke(initial_state)
+    final_state = run_cycle(initial_state)
     
     logging.info(f"---COMPLETED SPOT TRADING CYCLE---")
     logging.info(f"Final State: {final_state.get('llm_decision')}")
@@ -86,28 +130,35 @@ def run_spot_trading_cycle(symbol: str, interval: int):
     if final_state.get("error_message"):
         logging.error(f"Error in spot trading cycle: {final_state['error_message']}")
 
-def run_perp_trading_cycle(symbol: str, interval: int):
+def run_perp_trading_cycle(symbol: str, interval: int, timeframes: list = None, snapshot: dict = None):
     """Run a trading cycle for perpetual futures trading."""
+    with symbol_context(symbol), span("cycle", "perp", symbol):
+        _run_perp_trading_cycle(symbol, interval, timeframes, snapshot)
+
+def _run_perp_trading_cycle(symbol: str, interval: int, timeframes: list = None, snapshot: dict = None):
     logging.info("---STARTING PERPETUAL FUTURES TRADING CYCLE---")
     print(f"Selected Symbol: {symbol}")
     print(f"Selected Interval: {interval} minutes")
     print("Mode: PERPETUAL FUTURES TRADING")
     
     # Monitor current position PnL before making decisions
-    monitor_position_pnl(symbol, "perp")
+    monitor_position_pnl(symbol, "perp", fresh_snapshot(snapshot).get('position'))
     
     initial_state: GraphState = {
         "symbol": symbol,
         "interval": interval,
+        "timeframes": timeframes or [],
         "market_analysis": "",
+        "prompt_report": {},
         "llm_decision": {},
         "trade_executed": False,
         "error_message": "",
-        "trading_mode": "perp"  # Add trading mode to state
+        "trading_mode": "perp",  # Add trading mode to state
+        "snapshot": snapshot or {}
     }
     
     # Invoke the graph
-    final_state = app.invoke(initial_state)
+    final_state = run_cycle(initial_state)
     
     logging.info(f"---COMPLETED PERPETUAL FUTURES TRADING CYCLE---")
     logging.info(f"Final State: {final_state.get('llm_decision')}")
@@ -115,36 +166,257 @@ def run_perp_trading_cycle(symbol: str, interval: int):
     if final_state.get("error_message"):
         logging.error(f"Error in perpetual futures trading cycle: {final_state['error_message']}")
 
-def main():
-    """Main function to run the trading bot based on command line arguments."""
-    args = parse_arguments()
-    
-    logging.info(f"Starting Gemini Trader in {args.mode.upper()} mode")
-    logging.info(f"Symbol: {args.symbol}, Interval: {args.interval} minutes")
-    
+def run_batched_trading_cycle(symbols: list, interval: int, mode: str, batch_size: int, timeframes: list = None):
+    """Run one trading cycle for a watchlist, deciding up to batch_size symbols per LLM request."""
+    with span("cycle", f"{mode}_batch"):
+        logging.info(f"---STARTING BATCHED {mode.upper()} TRADING CYCLE ({len(symbols)} symbols)---")
+        snapshots = prefetch_snapshots(symbols, interval, mode, timeframes)
+        for symbol in symbols:
+            with symbol_context(symbol):
+                monitor_position_pnl(symbol, mode, snapshots.get(symbol, {}).get('position'))
+
+        states = [{
+            "symbol": symbol,
+            "interval": interval,
+            "timeframes": timeframes or [],
+            "market_analysis": "",
+            "prompt_report": {},
+            "llm_decision": {},
+            "trade_executed": False,
+            "error_message": "",
+            "trading_mode": mode,
+            "snapshot": snapshots.get(symbol, {})
+        } for symbol in symbols]
+        final_states = run_batch(states, batch_size)
+
+        logging.info(f"---COMPLETED BATCHED {mode.upper()} TRADING CYCLE---")
+        for final_state in final_states:
+            logging.info(f"Final State {final_state['symbol']}: {final_state.get('llm_decision')}")
+            if final_state.get("error_message"):
+                logging.error(f"Error in {mode} trading cycle for {final_state['symbol']}: {final_state['error_message']}")
+
+def worker_count(workers: str, symbols: list):
+    """Number of worker processes for --workers ("auto": one per CPU core), at most one per symbol."""
+    count = (os.cpu_count() or 1) if workers == "auto" else int(workers)
+    return max(1, min(count, len(symbols)))
+
+def connect_exchange(args, symbols: list, private_stream: bool = True, price_board=None):
+    """
+    Sets up paper trading, the private position streams and the spot watchdog.
+
+    Args:
+        private_stream: Track positions from the private WebSocket streams (unless --no-private-stream)
+        price_board: supervisor.SharedPriceBoard feeding the spot watchdog instead of its own ticker stream
+    """
+    if args.paper:
+        from sim_exchange import start_paper_trading
+        exchange, _price_feed = start_paper_trading(symbols, args.mode)
+        use_session(exchange)
+        logging.info("Paper trading: orders are filled by the simulated exchange, no orders reach Bybit")
+    elif private_stream and not args.no_private_stream:
+        from position_book import start_private_stream
+        try:
+            book = start_private_stream()
+            book.add_listener(log_private_event)
+            use_position_book(book)
+            logging.info("Tracking positions and executions from the private WebSocket streams")
+        except Exception as e:
+            logging.warning(f"Private stream unavailable, polling REST for positions: {e}")
+
+    if args.mode == 'spot' and not args.no_watchdog:
+        from risk_watchdog import SpotRiskWatchdog, start_tick_stream
+        watchdog = SpotRiskWatchdog().start()
+        try:
+            if price_board is not None and not args.paper:
+                price_board.watch(symbols, watchdog.on_tick)
+            else:
+                start_tick_stream(symbols, watchdog)
+            use_spot_watchdog(watchdog)
+            logging.info("Spot watchdog: stop/target exits fire on streamed ticks")
+            if not args.coordinate:
+                # Positions held before this process started; in coordination mode, once their lease is claimed
+                watchdog.arm_open_positions(symbols)
+        except Exception as e:
+            logging.warning(f"Ticker stream unavailable, spot exits rely on exchange stop orders: {e}")
+
+def trading_job(args, symbols: list, timeframes: list, report=None, leases=None):
+    """
+    Returns the function running one trading cycle of `symbols` (profiled on demand).
+
+    Args:
+        report: Called with {symbol: seconds} after each cycle (supervisor workers)
+        leases: leases.SymbolLeases in coordination mode; each cycle trades only the symbols it holds
+    """
+    # On-demand profiling: SIGUSR1 / SIGUSR2, PROFILE_CYCLES or flag files in PROFILE_DIR
+    profiler = CycleProfiler()
+    profiler.install_signal_handlers()
+
     # Choose the appropriate trading function based on mode
     if args.mode == 'spot':
-        trading_function = lambda: run_spot_trading_cycle(args.symbol, args.interval)
+        symbol_cycle = run_spot_trading_cycle
     elif args.mode == 'perp':
-        trading_function = lambda: run_perp_trading_cycle(args.symbol, args.interval)
+        symbol_cycle = run_perp_trading_cycle
     else:
         logging.error(f"Invalid trading mode: {args.mode}")
         sys.exit(1)
-    
+
+    def cycle_function():
+        cycle_seconds = {}
+        active = symbols if leases is None else leases.owned()
+        if leases is not None:
+            logging.info(f"Holding leases on {len(active)} of {len(symbols)} symbols: {', '.join(active) or '-'}")
+        if len(active) > 1 and args.batch_size > 1:
+            started = time.perf_counter()
+            run_batched_trading_cycle(active, args.interval, args.mode, args.batch_size, timeframes)
+            # A batch is decided together; its time is split evenly
+            cycle_seconds = dict.fromkeys(active, (time.perf_counter() - started) / len(active))
+        else:
+            # Every symbol's exchange reads at once; each cycle then only waits for its model call
+            snapshots = prefetch_snapshots(active, args.interval, args.mode, timeframes)
+            for symbol in active:
+                started = time.perf_counter()
+                symbol_cycle(symbol, args.interval, timeframes, snapshots.get(symbol))
+                cycle_seconds[symbol] = time.perf_counter() - started
+        if report is not None:
+            report(cycle_seconds)
+
+    return lambda: profiler.run_cycle("-".join(symbols), args.mode, cycle_function)
+
+def schedule_balances(args):
+    """Schedules balance logging every minute; returns the balance logging function."""
     balance_function = lambda: log_balance_history(args.mode)
+    schedule.every(1).minutes.do(balance_function)
+    return balance_function
+
+def schedule_housekeeping():
+    """Schedules the history partition and archive jobs."""
+    # Keep next months' history partitions ready (Postgres; no-op on SQLite)
+    schedule.every().day.do(ensure_partitions, engine)
+    if ARCHIVE_AFTER_DAYS > 0 and archive_configured():
+        # Move history older than ARCHIVE_AFTER_DAYS to the Parquet archive
+        schedule.every().day.at("00:30").do(archive_history)
+    elif ARCHIVE_AFTER_DAYS > 0:
+        logging.warning("ARCHIVE_AFTER_DAYS is set but ARCHIVE_DIR is not an absolute path: not archiving")
+
+def run_scheduler(tick=None, stop=None):
+    """
+    Runs the scheduled jobs, calling tick() every second.
+
+    Args:
+        stop: Event ending the loop once set (between jobs, never during a cycle); None runs forever
+    """
+    while stop is None or not stop.is_set():
+        schedule.run_pending()
+        if tick is not None:
+            tick()
+        if stop is not None:
+            stop.wait(1)
+        else:
+            time.sleep(1)
+
+def start_leases(args, symbols: list):
+    """Coordination mode: claims this process' share of the watchlist and guards its orders with it."""
+    import bybit_tools
+    from leases import SymbolLeases, use_symbol_leases
+    leases = SymbolLeases(args.mode, symbols)
+    watchdog = bybit_tools.spot_watchdog
+    if watchdog is not None:
+        # Watch the open positions of the symbols this node takes over, stop watching those it hands over
+        def watch_leased_positions(claimed: list, released: list):
+            for symbol in released:
+                watchdog.disarm(symbol)
+            watchdog.arm_open_positions(claimed)
+        leases.add_listener(watch_leased_positions)
+    leases.start()
+    use_symbol_leases(leases)
+    logging.info(f"Coordination mode: node {leases.node_id} holds leases on {', '.join(leases.owned()) or 'no symbols yet'}")
+    return leases
+
+def run_worker(index: int, symbols: list, args, timeframes: list, services):
+    """
+    Entry point of a supervisor worker process (see supervisor.py): trades
+    its shard of the watchlist (in coordination mode, the symbols it holds
+    leases on), with the supervisor's request budget, DB writer and price board.
+    """
+    from database import use_db_writer
+    from bybit_tools import use_rate_limiter
+    # The supervisor already set up the schema; workers only write rows
+    use_db_writer(services.db_queue)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port + index + 1, args.metrics_host)
+
+    # Positions are polled over the shared request budget; the supervisor stores the executions
+    connect_exchange(args, symbols, private_stream=False, price_board=services.prices)
+    use_rate_limiter(services.rate_limiter)
+    leases = start_leases(args, symbols) if args.coordinate else None
+
+    trading_function = trading_job(args, symbols, timeframes,
+                                   report=lambda cycle_seconds: services.report(index, cycle_seconds),
+                                   leases=leases)
+    schedule.every(1).minutes.do(trading_function)
+    trading_function()
+    if args.paper:
+        # Every worker trades its own simulated account
+        schedule_balances(args)()
+    try:
+        # Until the supervisor stops or reshards this worker
+        run_scheduler(stop=services.stop_event(index))
+    finally:
+        if leases is not None:
+            leases.stop()
+
+def main():
+    """Main function to run the trading bot based on command line arguments."""
+    args = parse_arguments()
+    
+    logging.info(f"Starting Gemini Trader in {args.mode.upper()} mode")
+    logging.info(f"Symbol: {args.symbol}, Interval: {args.interval} minutes")
+
+    # Initialize the database: once, before any supervisor worker starts, so the
+    # workers never race each other's table and partition DDL
+    init_db()
+    symbols = [symbol.strip() for symbol in args.symbol.split(",") if symbol.strip()]
+    timeframes = [int(minutes) for minutes in args.timeframes.split(",") if minutes.strip()]
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, args.metrics_host)
+        logging.info(f"Serving Prometheus metrics on {args.metrics_host}:{args.metrics_port}/metrics")
+
+    workers = worker_count(args.workers, symbols)
+    if workers > 1:
+        from supervisor import Supervisor
+        logging.info(f"Supervisor: {len(symbols)} symbols across {workers} worker processes")
+        # Coordinating workers share the whole watchlist through leases instead of fixed shards
+        supervisor = Supervisor(args, symbols, timeframes, workers, run_worker, shard=not args.coordinate).start()
+        schedule_housekeeping()
+        if not args.paper:
+            schedule_balances(args)()
+        try:
+            run_scheduler(supervisor.check)
+        finally:
+            supervisor.stop()
+        return
+
+    connect_exchange(args, symbols)
+    leases = start_leases(args, symbols) if args.coordinate else None
+    trading_function = trading_job(args, symbols, timeframes, leases=leases)
     
     # Schedule the trading cycle and balance logging
     schedule.every(1).minutes.do(trading_function)
-    schedule.every(1).minutes.do(balance_function)
+    balance_function = schedule_balances(args)
+    schedule_housekeeping()
 
     # Main loop to run the scheduler
     # Run once immediately
     trading_function()
     balance_function()
     
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    try:
+        run_scheduler()
+    finally:
+        if leases is not None:
+            # Hand the symbols over now instead of after LEASE_TTL
+            leases.stop()
 
 # Main loop to run the scheduler
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+import pandas as pd
+import bybit_tools
+from bybit_tools import klines_to_dataframe
+
+# All timeframes are derived from this one series (minutes)
+BASE_INTERVAL = 1
+
+# Bybit returns at most this many candles per kline request
+MAX_KLINE_LIMIT = 1000
+
+# Candles computed per derived timeframe; enough for the 26/9 MACD and the
+# 14-period RSI to settle. The base series is backfilled once to cover
+# TIMEFRAME_BARS of the largest timeframe, then only new candles are fetched.
+TIMEFRAME_BARS = int(os.environ.get("TIMEFRAME_BARS", "200"))
+
+MINUTE_MS = 60_000
+
+OHLCV_AGGREGATION = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+    "turnover": "sum",
+}
+
+
+def resample_ohlcv(df: pd.DataFrame, minutes: int):
+    """
+    Aggregates 1-minute candles into `minutes` candles.
+
+    Bars are aligned the way Bybit aligns them: to multiples of the interval
+    since the Unix epoch (UTC), labelled by their start and closed on the
+    left. A leading bar the base series only partly covers is dropped; the
+    last bar may still be in progress, like the exchange's latest candle.
+
+    Args:
+        df: OHLCV DataFrame indexed by timestamp, oldest first (see klines_to_dataframe)
+        minutes: Target interval in minutes
+
+    Returns:
+        pd.DataFrame: Resampled OHLCV DataFrame, oldest first
+    """
+    if minutes == BASE_INTERVAL or df.empty:
+        return df
+    resampled = df.resample(f"{minutes}min", origin="epoch", label="left", closed="left").agg(OHLCV_AGGREGATION)
+    resampled = resampled.dropna(subset=["open"])
+    if len(resampled) and resampled.index[0] < df.index[0]:
+        resampled = resampled.iloc[1:]
+    return resampled
+
+
+class BaseSeriesCache:
+    """
+    Per-symbol cache of 1-minute candles.
+
+    The first request for a symbol backfills as many pages as needed; after
+    that each refresh fetches a single page with the candles since the last
+    cached one (the last cached candle is re-fetched because it may have
+    still been in progress). Falls back to a full refetch after a gap longer
+    than one page.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}  # (category, symbol) -> DataFrame of 1-minute candles, oldest first
+
+    def _fetch(self, category: str, symbol: str, limit: int, end_ms: int = None):
+        params = {"category": category, "symbol": symbol, "interval": BASE_INTERVAL, "limit": limit}
+        if end_ms is not None:
+            params["end"] = end_ms
+        return klines_to_dataframe(bybit_tools.session.get_kline(**params))
+
+    def _backfill(self, category: str, symbol: str, df: pd.DataFrame, minutes: int):
+        """Prepends older pages until df holds `minutes` candles or the exchange has no older ones."""
+        while len(df) < minutes:
+            oldest_ms = int(df.index[0].timestamp() * 1000)
+            page = self._fetch(category, symbol, min(MAX_KLINE_LIMIT, minutes - len(df)), oldest_ms - 1)
+            page = page[page.index < df.index[0]] if not page.empty else page
+            if page.empty:
+                break
+            df = pd.concat([page, df])
+        return df
+
+    def get(self, category: str, symbol: str, minutes: int):
+        """
+        Returns the latest `minutes` 1-minute candles of a symbol, refreshing the cache.
+
+        Args:
+            category: 'spot' or 'linear'
+            symbol: Trading symbol
+            minutes: Number of 1-minute candles needed
+
+        Returns:
+            pd.DataFrame: OHLCV data indexed by timestamp (oldest first), or an empty DataFrame
+        """
+        key = (category, symbol)
+        with self.lock:
+            cached = self.series.get(key)
+            if cached is not None and len(cached):
+                last_ms = int(cached.index[-1].timestamp() * 1000)
+                missing = (int(time.time() * 1000) - last_ms) // MINUTE_MS + 1
+                if missing < MAX_KLINE_LIMIT:
+                    page = self._fetch(category, symbol, int(missing) + 1)
+                    if not page.empty:
+                        cached = pd.concat([cached[cached.index < page.index[0]], page])
+                else:
+                    cached = None
+
+            if cached is None or not len(cached):
+                cached = self._fetch(category, symbol, min(MAX_KLINE_LIMIT, minutes))
+                if cached.empty:
+                    return cached
+
+            cached = self._backfill(category, symbol, cached, minutes)
+            cached = cached.iloc[-max(minutes, MAX_KLINE_LIMIT):]
+            self.series[key] = cached
+            return cached.iloc[-minutes:]
+
+
+base_series_cache = BaseSeriesCache()
+
+
+def get_timeframe_data(symbol: str, trading_mode: str, timeframes, bars: int = TIMEFRAME_BARS):
+    """
+    Derives OHLCV data for several timeframes from the cached 1-minute series.
+
+    Args:
+        symbol: Trading symbol
+        trading_mode: 'spot' or 'perp'
+        timeframes: Intervals in minutes, e.g. [5, 15, 60]
+        bars: Candles wanted per timeframe
+
+    Returns:
+        dict: {minutes: OHLCV DataFrame} (empty DataFrames if no data was available)
+    """
+    category = "spot" if trading_mode == "spot" else "linear"
+    timeframes = sorted({int(minutes) for minutes in timeframes})
+    if not timeframes or timeframes[0] < BASE_INTERVAL:
+        raise ValueError(f"Invalid timeframes: {timeframes}. Use positive minute intervals.")
+    # One extra bar of the largest timeframe covers a partly cached leading bar
+    base = base_series_cache.get(category, symbol, (bars + 1) * timeframes[-1])
+    return {minutes: resample_ohlcv(base, minutes).iloc[-bars:] for minutes in timeframes}
+
+
+def update_candles(symbol: str, trading_mode: str, interval: int, candles: pd.DataFrame = None,
+                   limit: int = MAX_KLINE_LIMIT):
+    """
+    Brings a window of `interval` candles up to date.
+
+    With the window of a previous cycle only the candles since its last one
+    are fetched (the last one is re-fetched because it may have still been in
+    progress); without one, or after a gap longer than one page, the whole
+    window is fetched.
+
+    Args:
+        symbol: Trading symbol
+        trading_mode: 'spot' or 'perp'
+        interval: Candle interval in minutes
+        candles: Previous OHLCV window (see klines_to_dataframe), or None
+        limit: Candles kept in the window
+
+    Returns:
+        pd.DataFrame: The latest `limit` candles, oldest first (empty if no data was available)
+    """
+    get_market_data = bybit_tools.spot_get_market_data if trading_mode == "spot" else bybit_tools.perp_get_market_data
+    count = candles_to_fetch(candles, interval, limit)
+    return merge_candles(candles, get_market_data(symbol, interval, count), count, limit)
+
+
+def candles_to_fetch(candles: pd.DataFrame, interval: int, limit: int = MAX_KLINE_LIMIT):
+    """
+    Number of candles to request to bring `candles` up to date: the ones since
+    its last candle (inclusive), or the whole window without one or after a gap.
+    """
+    if candles is not None and len(candles):
+        last_ms = int(candles.index[-1].timestamp() * 1000)
+        missing = (int(time.time() * 1000) - last_ms) // (int(interval) * MINUTE_MS) + 1
+        if missing < limit:
+            return int(missing) + 1
+    return limit
+
+
+def merge_candles(candles: pd.DataFrame, page: pd.DataFrame, count: int, limit: int = MAX_KLINE_LIMIT):
+    """Window of the latest `limit` candles from the previous one and `page`, the `count` candles fetched for it."""
+    if candles is None or not len(candles) or count >= limit:
+        return page
+    if page.empty:
+        return candles
+    return pd.concat([candles[candles.index < page.index[0]], page]).iloc[-limit:]
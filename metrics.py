@@ -0,0 +1,219 @@
+import time
+import bisect
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Symbol of the trading cycle currently running; used when a span has no explicit symbol
+current_symbol = contextvars.ContextVar("current_symbol", default="")
+
+# Histogram bucket upper bounds in seconds (Prometheus cumulative buckets)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Number of most recent samples kept per series for quantile estimation
+RESERVOIR_SIZE = 2048
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus a bounded window of recent samples for p50/p95/p99."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.samples.append(seconds)
+
+    def quantile(self, q: float):
+        """Returns the q-quantile of the recent samples (nearest-rank), or 0.0 if empty."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+        return ordered[index]
+
+
+class MetricsRegistry:
+    """Thread-safe store of latency histograms keyed by (kind, name, symbol)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, kind: str, name: str, seconds: float, symbol: str = ""):
+        key = (kind, name, symbol or "")
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def quantile(self, kind: str, name: str, q: float, symbol: str = ""):
+        with self.lock:
+            histogram = self.histograms.get((kind, name, symbol or ""))
+            return histogram.quantile(q) if histogram else 0.0
+
+    def pooled_quantile(self, kind: str, name: str, q: float):
+        """Returns (q-quantile, sample count) over the recent samples of all symbols of a series."""
+        with self.lock:
+            samples = sorted(
+                sample for (k, n, _), histogram in self.histograms.items() if k == kind and n == name
+                for sample in histogram.samples
+            )
+        if not samples:
+            return 0.0, 0
+        index = min(len(samples) - 1, max(0, int(round(q * len(samples))) - 1))
+        return samples[index], len(samples)
+
+    def summary(self):
+        """Returns {(kind, name, symbol): {count, sum, p50, p95, p99}} for logging and debugging."""
+        with self.lock:
+            return {
+                key: {
+                    "count": h.count,
+                    "sum": h.total,
+                    **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES},
+                }
+                for key, h in self.histograms.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render_prometheus(self, prefix: str = "gemini_trader"):
+        """Renders all series in the Prometheus text exposition format (version 0.0.4)."""
+        metric = f"{prefix}_span_duration_seconds"
+        quantile_metric = f"{prefix}_span_duration_quantile_seconds"
+        lines = [
+            f"# HELP {metric} Latency of instrumented spans (graph nodes, exchange calls, DB commits).",
+            f"# TYPE {metric} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {quantile_metric} Recent-window latency quantiles of instrumented spans.",
+            f"# TYPE {quantile_metric} gauge",
+        ]
+        with self.lock:
+            for (kind, name, symbol), h in sorted(self.histograms.items()):
+                labels = f'kind="{kind}",name="{name}",symbol="{symbol}"'
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum{{{labels}}} {h.total}")
+                lines.append(f"{metric}_count{{{labels}}} {h.count}")
+                for q in QUANTILES:
+                    quantile_lines.append(f'{quantile_metric}{{{labels},quantile="{q}"}} {h.quantile(q)}')
+        return "\n".join(lines + quantile_lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def span(kind: str, name: str, symbol: str = None):
+    """
+    Times the enclosed block and records it in the global registry.
+
+    Args:
+        kind: Span family, e.g. 'node', 'bybit', 'db', 'cycle', 'api'
+        name: Span name within the family, e.g. 'analyze_market' or 'get_kline'
+        symbol: Trading symbol; defaults to the symbol of the running cycle
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(kind, name, time.perf_counter() - start, symbol or current_symbol.get())
+
+
+def timed(kind: str, name: str = None):
+    """Decorator form of span(); the symbol is taken from a `symbol` kwarg or a graph state dict."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            symbol = kwargs.get("symbol")
+            if symbol is None and args and isinstance(args[0], dict):
+                symbol = args[0].get("symbol")
+            with span(kind, span_name, symbol):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def symbol_context(symbol: str):
+    """Sets the default symbol label for spans recorded inside the block."""
+    token = current_symbol.set(symbol)
+    try:
+        yield
+    finally:
+        current_symbol.reset(token)
+
+
+def instrument_methods(obj, method_names, kind: str):
+    """
+    Replaces the given bound methods on an instance with timed wrappers.
+
+    Used to time every exchange endpoint call on the shared pybit session
+    without touching each call site.
+    """
+    for method_name in method_names:
+        method = getattr(obj, method_name, None)
+        if method is None or getattr(method, "_instrumented", False):
+            continue
+
+        def make_wrapper(method=method, method_name=method_name):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                with span(kind, method_name, kwargs.get("symbol")):
+                    return method(*args, **kwargs)
+            wrapper._instrumented = True
+            return wrapper
+
+        setattr(obj, method_name, make_wrapper())
+    return obj
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Serves /metrics from a daemon thread (for the bot process, which has no web server).
+
+    Local only by default; the series name the traded symbols, so exposing
+    them to a network (host="0.0.0.0") is an explicit choice.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
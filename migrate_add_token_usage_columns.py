@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add prompt encoding and model routing columns to agent_token_usage table.
+Run this script to update existing database schema.
+
+Kept for existing deployments; the migration itself is
+0002_agent_token_usage_routing in migrations.py.
+"""
+
+from migrations import migrate
+
+def migrate_add_token_usage_columns():
+    """Add prompt_encoding, baseline_input_tokens, tier and latency_ms columns to agent_token_usage."""
+    return migrate(target="0002_agent_token_usage_routing")
+
+if __name__ == "__main__":
+    print("Starting database migration to add token usage columns...")
+    success = migrate_add_token_usage_columns()
+
+    if success:
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        print("Please check the error messages above and try again.")
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations and chunked backfills.
+
+Every migration is a list of steps applied in order; the schema_migrations
+table records which migrations are applied and, while one is running, the
+step and the last primary key its backfill committed. An interrupted run
+resumes where it stopped.
+
+Backfills are set-based UPDATEs (the per-row logic is a SQL CASE, nothing
+is fetched into Python) run in keyset-chunked batches, one short
+transaction per chunk, so the bot keeps writing while a backfill runs.
+
+Usage:
+    python migrations.py                   # apply everything pending
+    python migrations.py --status
+    python migrations.py --chunk-size 0    # each backfill as one UPDATE
+    python migrations.py --check           # verify the partitioned tables (Postgres, after 0003)
+"""
+
+import time
+import argparse
+import datetime
+from sqlalchemy import inspect, text, select, update
+from dotenv import load_dotenv
+from partitioning import (
+    PARTITIONED_TABLES, PARTITION_MONTHS_AHEAD, is_partitioned, create_month_partitions, column_month,
+    month_start, add_months, partition_name
+)
+
+load_dotenv()
+
+# Rows per backfill transaction
+BACKFILL_CHUNK_SIZE = 5000
+
+# Postgres: give up on a schema change instead of queueing the live writer behind it
+DDL_LOCK_TIMEOUT = "5s"
+
+
+class AddColumns:
+    """Adds the missing nullable columns {name: SQL type} to a table (metadata-only on Postgres)."""
+
+    def __init__(self, table: str, columns: dict):
+        self.table = table
+        self.columns = columns
+
+    def describe(self):
+        return f"add {', '.join(self.columns)} to {self.table}"
+
+    def run(self, engine, migration_row, chunk_size):
+        existing = {column["name"] for column in inspect(engine).get_columns(self.table)}
+        with engine.begin() as connection:
+            if engine.dialect.name == "postgresql":
+                connection.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+            for name, column_type in self.columns.items():
+                if name in existing:
+                    print(f"Column '{name}' already exists in {self.table} table.")
+                    continue
+                print(f"Adding '{name}' column to {self.table} table...")
+                connection.execute(text(f"ALTER TABLE {self.table} ADD COLUMN {name} {column_type}"))
+
+
+class Backfill:
+    """
+    UPDATE table SET `assignments` WHERE `where`, in keyset-chunked batches.
+
+    `where` must exclude rows that were already backfilled (e.g. "pnl IS
+    NULL") so a rerun after an interruption never redoes committed work.
+    """
+
+    def __init__(self, table: str, assignments: str, where: str, key: str = "id"):
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+        self.key = key
+
+    def describe(self):
+        return f"backfill {self.table} where {self.where}"
+
+    def run(self, engine, migration_row, chunk_size):
+        from database import bump_table_version
+        statement = f"UPDATE {self.table} SET {self.assignments} WHERE ({self.where})"
+        if not chunk_size:
+            with engine.begin() as connection:
+                updated = connection.execute(text(statement)).rowcount
+                bump_table_version(connection, self.table)
+            print(f"{self.table}: {updated:,} rows updated")
+            return
+
+        chunk = text(f"{statement} AND {self.key} > :after AND {self.key} <= :upto")
+        run_in_chunks(engine, self.table, self.key, chunk, migration_row, chunk_size, "rows updated")
+        with engine.begin() as connection:
+            bump_table_version(connection, self.table)
+
+
+def run_in_chunks(engine, table: str, key: str, statement, migration_row: dict, chunk_size: int, done: str):
+    """
+    Runs `statement` (with :after/:upto bounds of `key`) over the table in keyset chunks.
+
+    Each chunk commits with the migration's progress, so a rerun resumes
+    after the last committed chunk.
+    """
+    next_bound = text(f"SELECT {key} FROM {table} WHERE {key} > :after ORDER BY {key} LIMIT 1 OFFSET :offset")
+    with engine.connect() as connection:
+        max_key = connection.execute(text(f"SELECT MAX({key}) FROM {table}")).scalar()
+    if max_key is None:
+        print(f"{table}: no rows")
+        return
+
+    after = migration_row.get("last_key") or 0
+    rows = 0
+    started = last_report = time.monotonic()
+    while after < max_key:
+        with engine.begin() as connection:
+            upto = connection.execute(next_bound, {"after": after, "offset": chunk_size - 1}).scalar()
+            if upto is None or upto > max_key:
+                # Rows inserted since the start are handled by the live writer already
+                upto = max_key
+            rows += connection.execute(statement, {"after": after, "upto": upto}).rowcount
+            # Progress commits with the chunk, so a resumed run starts right after it
+            record_progress(connection, migration_row["version"], last_key=upto)
+        after = upto
+        if time.monotonic() - last_report >= 1 or after >= max_key:
+            last_report = time.monotonic()
+            rate = rows / max(last_report - started, 1e-9)
+            print(f"{table}: {rows:,} {done}, {key} {after:,}/{max_key:,} ({after / max_key:.0%}), {rate:,.0f} rows/s")
+
+
+class CreateIndexes:
+    """Creates the indexes the models declare on the tables that are missing in the database."""
+
+    def __init__(self, tables: list):
+        self.tables = tables
+
+    def describe(self):
+        return f"create the model indexes of {', '.join(self.tables)}"
+
+    def run(self, engine, migration_row, chunk_size):
+        from database import Base
+        for table in self.tables:
+            existing = {index["name"] for index in inspect(engine).get_indexes(table)}
+            for index in Base.metadata.tables[table].indexes:
+                if index.name in existing:
+                    continue
+                print(f"Creating index {index.name}...")
+                with engine.begin() as connection:
+                    index.create(connection, checkfirst=True)
+
+
+class DropIndexes:
+    """Drops indexes that newer composite indexes made redundant."""
+
+    def __init__(self, names: list):
+        self.names = names
+
+    def describe(self):
+        return f"drop {', '.join(self.names)}"
+
+    def run(self, engine, migration_row, chunk_size):
+        with engine.begin() as connection:
+            for name in self.names:
+                connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+class PartitionByMonth:
+    """
+    Postgres: rebuilds a table as a monthly range-partitioned table (see partitioning.py).
+
+    The partitioned copy is filled in keyset chunks while a trigger mirrors
+    every write to the old table into it; the swap then only takes a short
+    exclusive lock to rename the two tables. The old table stays as
+    <table>_unpartitioned until it is dropped by hand.
+
+    The primary key becomes (id, partition column) and the id sequence moves
+    to the new table. Rows without a partition value are stored with the
+    time they were inserted (or in the default partition).
+
+    SQLite has no partitioning; the step does nothing there.
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+
+    def describe(self):
+        return f"partition {self.table} by month of {PARTITIONED_TABLES[self.table][0]}"
+
+    def run(self, engine, migration_row, chunk_size):
+        if engine.dialect.name != "postgresql":
+            print(f"{engine.dialect.name} has no table partitioning; {self.table} stays a single table")
+            return
+        from database import Base
+        table = self.table
+        staging = f"{table}_partitioned"
+        column, kind = PARTITIONED_TABLES[table]
+        with engine.connect() as connection:
+            if is_partitioned(connection, table):
+                print(f"{table} is already partitioned")
+                return
+
+        columns = [c["name"] for c in inspect(engine).get_columns(table)]
+        if kind == "epoch_ms":
+            fallback = "CAST(EXTRACT(EPOCH FROM {row}created_at) * 1000 AS BIGINT)" if "created_at" in columns else "0"
+        else:
+            fallback = "TIMESTAMP '1970-01-01'"
+
+        def values(row: str = ""):
+            return ", ".join(
+                f"COALESCE({row}{name}, {fallback.format(row=row)})" if name == column else f"{row}{name}"
+                for name in columns
+            )
+
+        column_list = ", ".join(columns)
+        upsert = ", ".join(f"{name} = EXCLUDED.{name}" for name in columns if name not in ("id", column))
+        with engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+            # Index names are unique per schema: move the old ones out of the way
+            old_indexes = connection.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname NOT LIKE '%\\_unpartitioned'"
+            ), {"table": table}).scalars().all()
+            for name in old_indexes:
+                connection.execute(text(f"ALTER INDEX {name} RENAME TO {(name + '_unpartitioned')[-63:]}"))
+
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS, "
+                f"CONSTRAINT {table}_pkey PRIMARY KEY (id, {column})) PARTITION BY RANGE ({column})"
+            ))
+            for index in Base.metadata.tables[table].indexes:
+                unique = "UNIQUE " if index.unique else ""
+                connection.execute(text(f"CREATE {unique}INDEX IF NOT EXISTS {index.name} ON {staging} "
+                                        f"({', '.join(c.name for c in index.columns)})"))
+
+            first = column_month(connection.execute(text(f"SELECT MIN({column}) FROM {table}")).scalar(), kind)
+            current = month_start(datetime.datetime.utcnow())
+            create_month_partitions(connection, table, min(first or current, current),
+                                    add_months(current, PARTITION_MONTHS_AHEAD), parent=staging)
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {staging} DEFAULT"))
+
+            # Mirror writes made during the copy
+            connection.execute(text(f"""
+                CREATE OR REPLACE FUNCTION {table}_mirror() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        DELETE FROM {staging} WHERE id = OLD.id;
+                        RETURN OLD;
+                    END IF;
+                    INSERT INTO {staging} ({column_list}) VALUES ({values("NEW.")})
+                    ON CONFLICT (id, {column}) DO UPDATE SET {upsert};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            """))
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_mirror ON {table}"))
+            connection.execute(text(f"CREATE TRIGGER {table}_mirror AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                                    f"FOR EACH ROW EXECUTE FUNCTION {table}_mirror()"))
+
+        # FOR SHARE: a row deleted or updated while its chunk copies waits for the chunk to commit, so the
+        # trigger then removes or updates the copy (without it, a stale copy of a deleted row could survive)
+        copy = text(f"INSERT INTO {staging} ({column_list}) SELECT {values()} FROM {table} "
+                    f"WHERE id > :after AND id <= :upto FOR SHARE ON CONFLICT DO NOTHING")
+        run_in_chunks(engine, table, "id", copy, migration_row, chunk_size or BACKFILL_CHUNK_SIZE, "rows copied")
+
+        with engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+            connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+            # No write can land in between: a copy that lost rows is not swapped in
+            old_rows = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            new_rows = connection.execute(text(f"SELECT COUNT(*) FROM {staging}")).scalar()
+            if old_rows != new_rows:
+                raise RuntimeError(f"{staging} has {new_rows:,} rows, {table} {old_rows:,}: not swapping them")
+            sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+            connection.execute(text(f"DROP TRIGGER {table}_mirror ON {table}"))
+            connection.execute(text(f"DROP FUNCTION {table}_mirror()"))
+            connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+            connection.execute(text(f"ALTER TABLE {staging} RENAME TO {table}"))
+            if sequence:
+                connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+        print(f"{table} is partitioned; the old table is kept as {table}_unpartitioned")
+
+
+class RebuildLedger:
+    """Builds the realized PnL ledger from the stored executions and rewrites their pnl (see ledger.py)."""
+
+    def describe(self):
+        return "build the PnL ledger from bybit_trade_history"
+
+    def run(self, engine, migration_row, chunk_size):
+        from ledger import rebuild_ledger
+        rebuild_ledger(engine, migration_row, chunk_size)
+
+
+class Migration:
+    def __init__(self, version: str, description: str, steps: list):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+# Per-execution cash flow, the same rules as bybit_tools.calculate_trade_pnl (0004 replaces it with realized PnL)
+TRADE_PNL_SQL = """ROUND(CAST(CASE
+    WHEN LOWER(category) IN ('linear', 'inverse') THEN
+        CASE
+            WHEN COALESCE(closed_size, 0) > 0 AND LOWER(side) = 'sell'
+                THEN COALESCE(exec_value, 0) - COALESCE(exec_fee, 0)
+            WHEN COALESCE(closed_size, 0) > 0 THEN -(COALESCE(exec_value, 0) + COALESCE(exec_fee, 0))
+            ELSE -COALESCE(exec_fee, 0)
+        END
+    WHEN LOWER(side) = 'buy' THEN -(COALESCE(exec_value, 0) + COALESCE(exec_fee, 0))
+    ELSE COALESCE(exec_value, 0) - COALESCE(exec_fee, 0)
+END AS NUMERIC), 6)"""
+
+MIGRATIONS = [
+    Migration("0001_bybit_trade_history_pnl", "PnL column of bybit_trade_history", [
+        AddColumns("bybit_trade_history", {"pnl": "FLOAT"}),
+        Backfill("bybit_trade_history", f"pnl = {TRADE_PNL_SQL}", "pnl IS NULL"),
+    ]),
+    Migration("0002_agent_token_usage_routing", "Prompt encoding and model routing columns of agent_token_usage", [
+        AddColumns("agent_token_usage", {
+            "prompt_encoding": "VARCHAR",
+            "baseline_input_tokens": "INTEGER",
+            "tier": "VARCHAR",
+            "latency_ms": "FLOAT",
+        }),
+        # Rows logged before this migration were all json-encoded decision calls
+        Backfill("agent_token_usage", "prompt_encoding = 'json', baseline_input_tokens = input_tokens",
+                 "prompt_encoding IS NULL"),
+        # They were logged as "gemini-pro" although the model was gemini-2.0-flash
+        Backfill("agent_token_usage",
+                 "tier = 'decision', "
+                 "model_name = CASE WHEN model_name = 'gemini-pro' THEN 'gemini-2.0-flash' ELSE model_name END",
+                 "tier IS NULL"),
+    ]),
+    Migration("0003_history_partitions", "Monthly partitions and query-aligned indexes of the history tables", [
+        PartitionByMonth("bybit_trade_history"),
+        PartitionByMonth("trade_history"),
+        PartitionByMonth("balance_history"),
+        CreateIndexes(list(PARTITIONED_TABLES)),
+        # Prefixes of the composite indexes; exec_id is unique together with exec_time now
+        DropIndexes(["ix_bybit_trade_history_symbol", "ix_bybit_trade_history_category",
+                     "ix_bybit_trade_history_exec_id"]),
+    ]),
+    Migration("0004_pnl_ledger", "Lot-based realized PnL of bybit_trade_history", [
+        # The tables are created from the models; pnl was cash flow until now
+        RebuildLedger(),
+    ]),
+]
+
+
+def record_progress(connection, version: str, **values):
+    from database import SchemaMigration
+    connection.execute(update(SchemaMigration.__table__)
+                       .where(SchemaMigration.__table__.c.version == version).values(**values))
+
+
+def migration_rows(engine):
+    """Returns {version: schema_migrations row as dict}."""
+    from database import SchemaMigration
+    with engine.connect() as connection:
+        rows = connection.execute(select(SchemaMigration.__table__)).mappings().all()
+    return {row["version"]: dict(row) for row in rows}
+
+
+def migrate(target: str = None, chunk_size: int = BACKFILL_CHUNK_SIZE, engine=None):
+    """
+    Applies the pending migrations in order, up to and including `target`.
+
+    Tables that don't exist yet are created from the current models, so a
+    new database just gets its migrations recorded.
+
+    Returns:
+        bool: True if every migration up to the target is applied
+    """
+    from database import Base, SchemaMigration
+    if engine is None:
+        from database import engine
+
+    if target is not None and target not in {migration.version for migration in MIGRATIONS}:
+        print(f"Unknown migration: {target}")
+        return False
+
+    Base.metadata.create_all(bind=engine)
+    table = SchemaMigration.__table__
+    try:
+        for migration in MIGRATIONS:
+            row = migration_rows(engine).get(migration.version)
+            if row is None or row["status"] != "applied":
+                if row is None:
+                    with engine.begin() as connection:
+                        connection.execute(table.insert().values(
+                            version=migration.version, description=migration.description, status="running", step=0
+                        ))
+                    row = migration_rows(engine)[migration.version]
+                else:
+                    print(f"Resuming {migration.version} at step {row['step'] + 1}")
+
+                print(f"Applying {migration.version}: {migration.description}")
+                started = time.monotonic()
+                for index in range(row["step"], len(migration.steps)):
+                    step = migration.steps[index]
+                    print(f"  [{index + 1}/{len(migration.steps)}] {step.describe()}")
+                    step.run(engine, row, chunk_size)
+                    row = {**row, "step": index + 1, "last_key": None}
+                    with engine.begin() as connection:
+                        record_progress(connection, migration.version, step=index + 1, last_key=None)
+                with engine.begin() as connection:
+                    record_progress(connection, migration.version, status="applied",
+                                    applied_at=datetime.datetime.utcnow())
+                print(f"Applied {migration.version} in {time.monotonic() - started:.1f}s")
+            if migration.version == target:
+                break
+        return True
+
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        print("Run it again to resume from the last committed chunk.")
+        return False
+
+
+def print_status(engine=None):
+    if engine is None:
+        from database import engine
+    from database import Base
+    Base.metadata.create_all(bind=engine)
+    rows = migration_rows(engine)
+    for migration in MIGRATIONS:
+        row = rows.get(migration.version)
+        if row is None:
+            state = "pending"
+        elif row["status"] == "applied":
+            state = f"applied {row['applied_at']:%Y-%m-%d %H:%M:%S}"
+        else:
+            state = f"interrupted at step {row['step'] + 1}, {row['last_key'] or 0} keys done"
+        print(f"{migration.version:<36} {state:<32} {migration.description}")
+
+
+def check_partitions(engine=None, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    Verifies the tables migration 0003 partitioned (Postgres).
+
+    Checks per table: it is partitioned, has a partition for every month
+    from its oldest row through `months_ahead` months from now, nothing in
+    its default partition, its model indexes and its id sequence; and while
+    <table>_unpartitioned is kept, that every old row was copied unchanged.
+    Run it before the bot writes again: rows it updated or deleted since
+    the swap count as changed or missing.
+
+    Returns:
+        list: Descriptions of the problems found (empty if none)
+    """
+    if engine is None:
+        from database import engine
+    from database import Base
+    if engine.dialect.name != "postgresql":
+        print(f"{engine.dialect.name} has no table partitioning; nothing to check")
+        return []
+
+    problems = []
+    current = month_start(datetime.datetime.utcnow())
+    for table, (column, kind) in PARTITIONED_TABLES.items():
+        with engine.connect() as connection:
+            if not is_partitioned(connection, table):
+                problems.append(f"{table} is not partitioned")
+                continue
+            partitions = set(connection.execute(text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table"
+            ), {"table": table}).scalars())
+            rows = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            first = column_month(connection.execute(text(f"SELECT MIN({column}) FROM {table}")).scalar(), kind)
+            month = min(first or current, current)
+            while month <= add_months(current, months_ahead):
+                if partition_name(table, month) not in partitions:
+                    problems.append(f"{table} has no partition for {month:%Y-%m}")
+                month = add_months(month, 1)
+            default_rows = 0
+            if f"{table}_default" in partitions:
+                default_rows = connection.execute(text(f"SELECT COUNT(*) FROM {table}_default")).scalar()
+                if default_rows:
+                    problems.append(f"{table}_default holds {default_rows:,} rows outside the monthly partitions")
+            if not connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar():
+                problems.append(f"{table}.id has no sequence")
+            indexes = {index["name"] for index in inspect(connection).get_indexes(table)}
+            for index in Base.metadata.tables[table].indexes:
+                if index.name not in indexes:
+                    problems.append(f"{table} lacks index {index.name}")
+
+            summary = f"{table}: {rows:,} rows in {len(partitions)} partitions ({default_rows:,} in the default)"
+            old = f"{table}_unpartitioned"
+            if inspect(connection).has_table(old):
+                columns = [c["name"] for c in inspect(connection).get_columns(old) if c["name"] != column]
+                old_rows = connection.execute(text(f"SELECT COUNT(*) FROM {old}")).scalar()
+                missing = connection.execute(text(
+                    f"SELECT COUNT(*) FROM {old} o WHERE NOT EXISTS (SELECT 1 FROM {table} n WHERE n.id = o.id)"
+                )).scalar()
+                # As text: json columns have no equality operator
+                differ = " OR ".join(f"CAST(o.{name} AS TEXT) IS DISTINCT FROM CAST(n.{name} AS TEXT)" for name in columns)
+                changed = connection.execute(text(
+                    f"SELECT COUNT(*) FROM {old} o JOIN {table} n ON n.id = o.id WHERE {differ}"
+                )).scalar()
+                summary += f"; {old_rows:,} in {old}, {missing:,} of them missing, {changed:,} changed"
+                if missing:
+                    problems.append(f"{missing:,} rows of {old} are missing from {table}")
+                if changed:
+                    problems.append(f"{changed:,} rows of {old} differ in {table}")
+            print(summary)
+    for problem in problems:
+        print(f"Problem: {problem}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--target", help="Stop after this migration version")
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE,
+                        help=f"Rows per backfill transaction, 0 for one UPDATE per backfill (default: {BACKFILL_CHUNK_SIZE})")
+    parser.add_argument("--status", action="store_true", help="List the migrations and their state")
+    parser.add_argument("--check", action="store_true",
+                        help="Verify the partitioned history tables against their old copies (Postgres; "
+                             "before the bot writes again)")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+    elif args.check:
+        raise SystemExit(1 if check_partitions() else 0)
+    elif migrate(args.target, args.chunk_size):
+        print("\n✅ Migrations completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        print("Please check the error messages above and try again.")
@@ -0,0 +1,235 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+
+# Model that makes every decision that can place or close an order
+DECISION_MODEL = os.environ.get("DECISION_MODEL", "gemini-2.0-flash")
+
+# First tier, off by default ("none": every cycle goes straight to
+# DECISION_MODEL, as before the tiers existed). Opt in with
+# TRIAGE_MODEL=local to triage with the rule stub below (no API call; quiet
+# candles are held without asking DECISION_MODEL), or with the name of a
+# (cheaper) Gemini model asked to answer HOLD or ESCALATE.
+TRIAGE_MODEL = os.environ.get("TRIAGE_MODEL", "none")
+
+# Model calls of one cycle must finish within this fraction of the candle
+# interval, and never later than LLM_DEADLINE_MAX_SECONDS (the scheduler
+# ticks every minute). Past the deadline the cycle falls back to HOLD.
+LLM_DEADLINE_FRACTION = float(os.environ.get("LLM_DEADLINE_FRACTION", "0.5"))
+LLM_DEADLINE_MAX_SECONDS = float(os.environ.get("LLM_DEADLINE_MAX_SECONDS", "45"))
+
+# Request timeout and retries of the Gemini clients: a call abandoned at the
+# deadline still occupies a worker thread until the client itself gives up
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", str(LLM_DEADLINE_MAX_SECONDS)))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+
+# Threads running model calls of clients without native async support (abandoned calls included)
+LLM_CALL_THREADS = int(os.environ.get("LLM_CALL_THREADS", "32"))
+
+# Hedged requests: if the first request hasn't answered after the p95 latency
+# of the tier, send a second one and take whichever answers first. Until
+# LLM_HEDGE_MIN_SAMPLES calls were observed LLM_HEDGE_DELAY_SECONDS is used.
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_DELAY_SECONDS", "5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Batched decisions: up to this many escalated symbols share one decision
+# request (1 disables batching)
+DECISION_BATCH_SIZE = int(os.environ.get("DECISION_BATCH_SIZE", "1"))
+
+TRIAGE_TIER = "triage"
+DECISION_TIER = "decision"
+BATCH_TIER = "decision_batch"
+
+# Actions a decision may carry per trading mode (see prompts.py)
+VALID_ACTIONS = {
+    "spot": {"BUY", "CLOSE", "HOLD"},
+    "perp": {"BUY", "SELL", "CLOSE", "CLOSE_LONG", "CLOSE_SHORT", "HOLD"},
+}
+
+# Every entry and exit rule in prompts.py requires at least one of these.
+# If none holds on the latest candle, no rule can fire and the cycle is a HOLD.
+CANDIDATE_SIGNALS = (
+    "rsi_lt35",
+    "rsi_gt65",
+    "touch_lower_bb",
+    "touch_upper_bb",
+    "k_cross_up_d",
+    "k_cross_down_d",
+)
+
+
+def triage_enabled():
+    return TRIAGE_MODEL not in ("", "none")
+
+
+def local_triage(signals: dict):
+    """
+    Rule-based triage on the signal features of prompt_encoding.signal_features.
+
+    Returns:
+        tuple: ("HOLD" or "ESCALATE", reason)
+    """
+    if not signals:
+        return "ESCALATE", "no signal features available"
+    candidates = [name for name in CANDIDATE_SIGNALS if signals.get(name)]
+    if candidates:
+        return "ESCALATE", f"candidate signals: {', '.join(candidates)}"
+    return "HOLD", "no entry or exit condition can be met on the latest candle"
+
+
+def parse_triage(response_text: str):
+    """
+    Reads a triage model answer. Anything but a clear HOLD escalates, including
+    an answer that names an order action.
+    """
+    answer = response_text.strip().upper()
+    if answer.startswith("HOLD") and "ESCALATE" not in answer:
+        return "HOLD"
+    return "ESCALATE"
+
+
+def validate_batch_decisions(decisions, symbols, trading_mode: str):
+    """
+    Matches a batched answer to the requested symbols.
+
+    Args:
+        decisions: Parsed JSON answer (expected: list of decision objects with a "symbol" key)
+        symbols: Symbols that were in the batch
+        trading_mode: 'spot' or 'perp'
+
+    Returns:
+        dict: {symbol: decision} for every well-formed decision; symbols that are
+        missing, duplicated or invalid are left out so they can be retried alone
+    """
+    if not isinstance(decisions, list):
+        return {}
+    valid_actions = VALID_ACTIONS.get(trading_mode, set())
+    seen = {}
+    duplicates = set()
+    for decision in decisions:
+        if not isinstance(decision, dict):
+            continue
+        symbol = decision.get("symbol")
+        if symbol not in symbols:
+            continue
+        if decision.get("action") not in valid_actions:
+            continue
+        try:
+            float(decision.get("quantity", 0.0))
+        except (TypeError, ValueError):
+            continue
+        if symbol in seen:
+            duplicates.add(symbol)
+        seen[symbol] = decision
+    return {symbol: decision for symbol, decision in seen.items() if symbol not in duplicates}
+
+
+def model_name(model, default: str):
+    """Name of the model behind an LLM client (falls back to the configured name)."""
+    return getattr(model, "model", None) or default
+
+
+def decision_deadline(interval: int):
+    """Seconds the model calls of a cycle on this candle interval (minutes) may take."""
+    return min(interval * 60 * LLM_DEADLINE_FRACTION, LLM_DEADLINE_MAX_SECONDS)
+
+
+async def _generate_hedged(model, prompt: str, timeout: float, hedge_delay: float = None):
+    """Returns (LLMResult, True if the hedged request won)."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    first = asyncio.ensure_future(model.agenerate([prompt]))
+    tasks = {first}
+    hedge = None
+    error = None
+    try:
+        while tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            wait = remaining
+            if hedge_delay is not None and hedge is None:
+                wait = min(remaining, max(0.0, hedge_delay - (timeout - remaining)))
+            done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None:
+                    return task.result(), task is hedge
+                error = task.exception()
+            # Send the hedge once the delay has passed, or right away if the first request failed
+            if hedge_delay is not None and hedge is None and (error is not None or not done) and loop.time() < deadline:
+                hedge = asyncio.ensure_future(model.agenerate([prompt]))
+                tasks.add(hedge)
+        if error is not None and not tasks:
+            raise error
+        raise TimeoutError(f"no response within {timeout:.1f}s")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _CallLoop:
+    """
+    Event loop thread that every deadline-bound model call runs on.
+
+    Clients without native async support (like GoogleGenerativeAI, which
+    only implements _generate) run agenerate in the loop's executor. A call
+    past its deadline is abandoned there: nothing waits for its thread, so
+    the caller returns at the deadline however long the request hangs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+
+    def submit(self, coroutine):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                    max_workers=LLM_CALL_THREADS, thread_name_prefix="llm-call"))
+                threading.Thread(target=self.loop.run_forever, name="llm-calls", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+call_loop = _CallLoop()
+
+
+def generate_with_deadline(model, prompt: str, timeout: float, hedge_delay: float = None):
+    """
+    Calls model.agenerate under a deadline, optionally hedged.
+
+    The call runs on the shared call loop (see _CallLoop), so graph nodes can
+    stay synchronous and are never held past the deadline by a stuck request.
+
+    Args:
+        model: LLM client with agenerate
+        prompt: Prompt to send
+        timeout: Seconds to wait for an answer
+        hedge_delay: Seconds after which a second identical request is sent (None: no hedging)
+
+    Returns:
+        tuple: (LLMResult of the first request that answered, True if it was the hedged request)
+
+    Raises:
+        TimeoutError: If no request answered within the timeout
+    """
+    future = call_loop.submit(_generate_hedged(model, prompt, timeout, hedge_delay))
+    try:
+        # The coroutine gives up at the deadline itself; the margin covers scheduling only
+        return future.result(max(0.0, timeout) + 1.0)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"no response within {timeout:.1f}s")
+
+
+def hedge_delay(registry, tier: str):
+    """p95 latency of a tier's recent calls, or the configured delay until enough calls were seen."""
+    if not LLM_HEDGE:
+        return None
+    p95, samples = registry.pooled_quantile("llm", tier, 0.95)
+    if samples < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DELAY_SECONDS
+    return p95
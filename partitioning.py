@@ -0,0 +1,107 @@
+"""
+Monthly range partitions of the history tables (Postgres).
+
+The tables are converted by migration 0003 (see migrations.PartitionByMonth);
+after that, ensure_partitions() creates the partitions of the coming months
+ahead of time. It runs at startup (init_db) and daily from the bot, so rows
+never land in the catch-all default partition. Queries with a time range on
+the partition column only scan the partitions of that range.
+
+SQLite has no partitioning: the tables stay single tables and every
+function here is a no-op; the composite (filter, time) indexes declared on
+the models keep the time-window queries fast there.
+"""
+
+import os
+import datetime
+from sqlalchemy import text
+
+# table -> (partition column, how it stores time: "epoch_ms" or "timestamp")
+PARTITIONED_TABLES = {
+    "bybit_trade_history": ("exec_time", "epoch_ms"),
+    "trade_history": ("timestamp", "timestamp"),
+    "balance_history": ("timestamp", "timestamp"),
+}
+
+# Monthly partitions kept ready after the current month
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "2"))
+
+
+def month_start(moment: datetime.datetime):
+    return datetime.datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime.datetime, months: int):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return datetime.datetime(month.year + years, month_index + 1, 1)
+
+
+def partition_name(table: str, month: datetime.datetime):
+    return f"{table}_y{month:%Y}m{month:%m}"
+
+
+def partition_bound(month: datetime.datetime, kind: str):
+    """SQL literal of a month start in the partition column's representation (UTC)."""
+    if kind == "epoch_ms":
+        return str(int(month.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000))
+    return f"'{month:%Y-%m-%d %H:%M:%S}'"
+
+
+def column_month(value, kind: str):
+    """Month of a partition column value (None stays None)."""
+    if value is None:
+        return None
+    if kind == "epoch_ms":
+        value = datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc).replace(tzinfo=None)
+    return month_start(value)
+
+
+def is_partitioned(connection, table: str):
+    return bool(connection.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = :table AND pg_table_is_visible(c.oid)
+        )
+    """), {"table": table}).scalar())
+
+
+def create_month_partitions(connection, table: str, first: datetime.datetime, last: datetime.datetime,
+                            parent: str = None):
+    """
+    Creates the missing monthly partitions of `table` from month `first` through `last`.
+
+    `parent` is the partitioned table to attach them to if it doesn't have
+    the table's final name yet (while migrating).
+    """
+    column, kind = PARTITIONED_TABLES[table]
+    month = month_start(first)
+    while month <= last:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {parent or table} "
+            f"FOR VALUES FROM ({partition_bound(month, kind)}) TO ({partition_bound(add_months(month, 1), kind)})"
+        ))
+        month = add_months(month, 1)
+
+
+def ensure_partitions(engine, months_ahead: int = PARTITION_MONTHS_AHEAD, now: datetime.datetime = None):
+    """
+    Creates the partitions from the current month through `months_ahead` months later.
+
+    Returns:
+        list: Partitioned tables that were checked (empty on SQLite or before migration 0003)
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+    current = month_start(now or datetime.datetime.utcnow())
+    checked = []
+    for table in PARTITIONED_TABLES:
+        try:
+            with engine.begin() as connection:
+                if not is_partitioned(connection, table):
+                    continue
+                create_month_partitions(connection, table, current, add_months(current, months_ahead))
+            checked.append(table)
+        except Exception as e:
+            # E.g. the default partition already holds rows of that month
+            print(f"Could not create partitions of {table}: {e}")
+    return checked
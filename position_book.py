@@ -0,0 +1,291 @@
+import os
+import time
+import queue
+import threading
+from bybit_tools import store_trade_history_to_db
+
+# Private stream topics the book subscribes to
+PRIVATE_TOPICS = ("position", "execution", "order", "wallet")
+
+# Order statuses after which an order no longer rests on the book
+TERMINAL_ORDER_STATUSES = {"Filled", "Cancelled", "Rejected", "Deactivated", "PartiallyFilledCanceled"}
+
+# Seconds between REST re-sync attempts while the book is out of sync
+RESYNC_INTERVAL = float(os.environ.get("POSITION_BOOK_RESYNC_SECONDS", "5"))
+
+# Backoff of storing an execution batch again after a database error, doubling up to the maximum
+EXECUTION_RETRY_SECONDS = 1.0
+MAX_EXECUTION_RETRY_SECONDS = 60.0
+
+
+def _ok(result: dict):
+    return {"retCode": 0, "retMsg": "OK", "result": result, "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+
+class PositionBook:
+    """
+    In-memory position, wallet and order state kept current by Bybit's
+    private WebSocket streams.
+
+    Seeded with one REST snapshot, then updated as position, wallet, order
+    and execution events arrive, so a TP/SL fill is reflected within
+    milliseconds instead of on the next cycle's poll. Exposes the pybit
+    get_positions / get_wallet_balance methods with Bybit-shaped responses,
+    so bybit_tools reads from it exactly like from the REST session (see
+    bybit_tools.position_source). Executions are written to
+    bybit_trade_history by a background thread as they arrive; a batch the
+    database rejects is stored again with backoff, since the stream never
+    resends it.
+
+    If the stream disconnects the book stops answering (live() is False and
+    readers fall back to REST); after the reconnect it re-syncs from a fresh
+    REST snapshot, because events sent while disconnected are not replayed.
+    A failed re-sync is retried at most every RESYNC_INTERVAL seconds.
+
+    Usage:
+        book = start_private_stream()
+        bybit_tools.use_position_book(book)
+        book.add_listener(lambda topic, record: print(topic, record))
+    """
+
+    def __init__(self, rest_session=None, store_executions: bool = True):
+        self.lock = threading.RLock()
+        self.rest_session = rest_session  # None: the session bybit_tools is currently using
+        self.positions = {}  # symbol -> latest linear position record
+        self.wallets = {}    # accountType -> {coin: coin record}
+        self.orders = {}     # orderId -> latest record of a resting order
+        self.listeners = []
+        self.websocket = None
+        self.synced = False
+        self.syncing = False
+        self.last_sync = 0.0  # time.monotonic() of the last snapshot attempt
+        self.pending = None  # messages received while a snapshot is loading
+        self.executions = queue.Queue() if store_executions else None
+        self.writer = None
+
+    # =========================================================================
+    # STREAM
+    # =========================================================================
+
+    def attach(self, websocket):
+        """Subscribes the book to the private topics of a pybit WebSocket(channel_type="private")."""
+        self.websocket = websocket
+        websocket.position_stream(self.handle_message)
+        websocket.execution_stream(self.handle_message)
+        websocket.order_stream(self.handle_message)
+        websocket.wallet_stream(self.handle_message)
+
+    def start_writer(self):
+        """Starts the thread that stores streamed executions in bybit_trade_history."""
+        if self.executions is not None and self.writer is None:
+            self.writer = threading.Thread(target=self._write_executions, daemon=True)
+            self.writer.start()
+
+    def add_listener(self, callback):
+        """Calls callback(topic, record) for every streamed record, after the book applied it."""
+        self.listeners.append(callback)
+
+    def handle_message(self, message: dict):
+        """WebSocket callback for every private topic."""
+        topic = message.get("topic", "").split(".")[0]
+        records = message.get("data") or []
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(message)
+            else:
+                self._apply(topic, records)
+
+        if topic == "execution" and self.executions is not None:
+            for record in records:
+                self.executions.put(record)
+
+        for callback in self.listeners:
+            for record in records:
+                try:
+                    callback(topic, record)
+                except Exception as e:
+                    print(f"Error in position book listener for {topic}: {e}")
+
+    def _apply(self, topic: str, records: list):
+        if topic == "position":
+            for record in records:
+                if record.get("category", "linear") == "linear":
+                    self._apply_position(record)
+        elif topic == "wallet":
+            self._apply_wallet(records)
+        elif topic == "order":
+            for record in records:
+                if record.get("orderStatus") in TERMINAL_ORDER_STATUSES:
+                    self.orders.pop(record.get("orderId"), None)
+                else:
+                    self.orders[record.get("orderId")] = record
+
+    def _apply_position(self, record: dict):
+        symbol = record.get("symbol")
+        current = self.positions.get(symbol)
+        # Snapshot and stream can overlap; never let an older update win
+        if current is not None and int(record.get("seq") or 0) < int(current.get("seq") or 0):
+            return
+        if not record.get("avgPrice") and record.get("entryPrice"):
+            record = {**record, "avgPrice": record["entryPrice"]}
+        self.positions[symbol] = record
+
+    def _apply_wallet(self, accounts: list):
+        # Every wallet update carries the account's whole coin list: a coin missing from it is gone
+        for account in accounts:
+            self.wallets[account.get("accountType", "UNIFIED")] = {
+                coin.get("coin"): coin for coin in account.get("coin", [])
+            }
+
+    def _write_executions(self):
+        failed = []  # executions of batches the database rejected, stored again first
+        backoff = EXECUTION_RETRY_SECONDS
+        while True:
+            retrying = bool(failed)
+            if retrying:
+                time.sleep(backoff)
+                batch = failed
+            else:
+                batch = [self.executions.get()]
+            while True:
+                try:
+                    batch.append(self.executions.get_nowait())
+                except queue.Empty:
+                    break
+            by_category = {}
+            for execution in batch:
+                by_category.setdefault(execution.get("category", "linear"), []).append(execution)
+            failed = []
+            for category, executions in by_category.items():
+                # Storing is idempotent per execId, so a retried batch never duplicates rows or fills
+                if "error" in store_trade_history_to_db(executions, category):
+                    failed.extend(executions)
+            if failed:
+                if retrying:
+                    backoff = min(backoff * 2, MAX_EXECUTION_RETRY_SECONDS)
+                print(f"Storing {len(failed)} streamed executions failed, retrying in {backoff:.0f}s")
+            else:
+                backoff = EXECUTION_RETRY_SECONDS
+
+    # =========================================================================
+    # SNAPSHOT
+    # =========================================================================
+
+    def sync(self):
+        """
+        Loads positions and the UNIFIED wallet from REST.
+
+        Events that arrive while the snapshot loads are held back and applied
+        on top of it, so none are lost.
+
+        Returns:
+            bool: True if both snapshots loaded
+        """
+        import bybit_tools
+
+        with self.lock:
+            if self.syncing:
+                return False
+            self.syncing = True
+            self.synced = False
+            self.last_sync = time.monotonic()
+            self.pending = []
+        loaded = False
+        try:
+            rest = self.rest_session or bybit_tools.session
+            positions = rest.get_positions(category="linear", settleCoin="USDT")
+            wallet = rest.get_wallet_balance(accountType="UNIFIED")
+            loaded = positions.get("retCode") == 0 and wallet.get("retCode") == 0
+            if not loaded:
+                print(f"Position book snapshot failed: {positions.get('retMsg')} / {wallet.get('retMsg')}")
+        except Exception as e:
+            print(f"Position book snapshot failed: {e}")
+        finally:
+            with self.lock:
+                if loaded:
+                    self.positions = {}
+                    self.wallets = {}
+                    for record in positions["result"].get("list", []):
+                        self._apply_position(record)
+                    self._apply_wallet(wallet["result"].get("list", []))
+                for message in self.pending:
+                    self._apply(message.get("topic", "").split(".")[0], message.get("data") or [])
+                self.pending = None
+                self.synced = loaded
+                self.syncing = False
+        return loaded
+
+    def live(self):
+        """
+        True if reads can be served from the book.
+
+        A dropped connection marks the book out of sync; the first check
+        after the reconnect re-syncs it from REST, and a failed re-sync is
+        retried after RESYNC_INTERVAL (reads use REST meanwhile).
+        """
+        if self.websocket is not None and not self.websocket.is_connected():
+            self.synced = False
+            return False
+        if not self.synced:
+            if time.monotonic() - self.last_sync < RESYNC_INTERVAL:
+                return False
+            return self.sync()
+        return True
+
+    def stop(self):
+        if self.websocket is not None:
+            self.websocket.exit()
+            self.websocket = None
+        self.synced = False
+
+    # =========================================================================
+    # PYBIT-SHAPED READERS
+    # =========================================================================
+
+    def get_positions(self, category: str = "linear", symbol: str = None, **kwargs):
+        with self.lock:
+            if symbol:
+                rows = [dict(self.positions[symbol])] if symbol in self.positions else []
+            else:
+                rows = [dict(record) for record in self.positions.values()]
+        return _ok({"category": category, "list": rows})
+
+    def get_wallet_balance(self, accountType: str = "UNIFIED", coin: str = None, **kwargs):
+        with self.lock:
+            coins = self.wallets.get(accountType, {})
+            names = coin.split(",") if coin else list(coins)
+            rows = [dict(coins[name]) for name in names if name in coins]
+        return _ok({"list": [{"accountType": accountType, "coin": rows}]})
+
+    def get_open_orders(self, category: str = None, symbol: str = None, **kwargs):
+        """Resting orders seen on the order stream since the book started."""
+        with self.lock:
+            rows = [
+                dict(order) for order in self.orders.values()
+                if (not category or order.get("category") == category) and (not symbol or order.get("symbol") == symbol)
+            ]
+        return _ok({"category": category, "list": rows, "nextPageCursor": ""})
+
+
+def start_private_stream(api_key: str = None, api_secret: str = None):
+    """
+    Connects a PositionBook to the private WebSocket of the demo account the
+    REST session trades on and loads its first snapshot.
+
+    Returns:
+        PositionBook
+    """
+    from pybit.unified_trading import WebSocket
+
+    book = PositionBook()
+    websocket = WebSocket(
+        testnet=False,
+        demo=True,
+        channel_type="private",
+        api_key=api_key or os.environ.get("BYBIT_API_KEY_TESTNET"),
+        api_secret=api_secret or os.environ.get("BYBIT_API_SECRET_TESTNET"),
+    )
+    book.attach(websocket)
+    book.sync()
+    book.start_writer()
+    return book
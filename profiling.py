@@ -0,0 +1,128 @@
+import os
+import time
+import signal
+import pstats
+import cProfile
+import logging
+import tracemalloc
+
+# Where profiles and tracemalloc snapshots are written
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+# Admin flag file: write a cycle count into it (e.g. `echo 3 > profiles/profile.request`)
+# and the bot profiles that many upcoming cycles, then deletes the file
+PROFILE_REQUEST_FILE = "profile.request"
+SNAPSHOT_REQUEST_FILE = "snapshot.request"
+
+
+class CycleProfiler:
+    """
+    Runtime switch for profiling trading cycles of the long-running bot.
+
+    Profiling is requested without restarting the process, through any of:
+    - PROFILE_CYCLES env var: profile the first N cycles after startup
+    - SIGUSR1: profile the next PROFILE_CYCLES_ON_SIGNAL cycles (default: 3)
+    - SIGUSR2: take a tracemalloc snapshot after the next cycle
+    - flag files profile.request / snapshot.request in PROFILE_DIR
+
+    Each profiled cycle is dumped as `<symbol>_<mode>_cycle<id>_<timestamp>.prof`
+    (open with `python -m pstats` or snakeviz). Snapshots are dumped as
+    `.tracemalloc` files and the top allocation growth since the previous
+    snapshot is logged, which is how DataFrame/langchain object growth across
+    the endless scheduler loop shows up.
+    """
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.cycle_id = 0
+        self.pending_cycles = int(os.environ.get("PROFILE_CYCLES", 0))
+        self.cycles_on_signal = int(os.environ.get("PROFILE_CYCLES_ON_SIGNAL", 3))
+        self.snapshot_requested = False
+        self.last_snapshot = None
+
+        if os.environ.get("TRACEMALLOC", "").lower() in ("1", "true", "yes"):
+            tracemalloc.start(int(os.environ.get("TRACEMALLOC_FRAMES", 10)))
+
+    def install_signal_handlers(self):
+        """Registers SIGUSR1 (profile next cycles) and SIGUSR2 (memory snapshot), where supported."""
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.request_profile(self.cycles_on_signal))
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.request_snapshot())
+
+    def request_profile(self, cycles: int):
+        self.pending_cycles += cycles
+
+    def request_snapshot(self):
+        self.snapshot_requested = True
+
+    def _consume_flag_files(self):
+        profile_flag = os.path.join(self.output_dir, PROFILE_REQUEST_FILE)
+        if os.path.exists(profile_flag):
+            try:
+                with open(profile_flag) as f:
+                    content = f.read().strip()
+                self.request_profile(int(content) if content else self.cycles_on_signal)
+            except ValueError:
+                logging.warning(f"Ignoring invalid profile request in {profile_flag}")
+            os.remove(profile_flag)
+
+        snapshot_flag = os.path.join(self.output_dir, SNAPSHOT_REQUEST_FILE)
+        if os.path.exists(snapshot_flag):
+            self.request_snapshot()
+            os.remove(snapshot_flag)
+
+    def _output_path(self, symbol: str, mode: str, extension: str):
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_dir, f"{symbol}_{mode}_cycle{self.cycle_id}_{timestamp}.{extension}")
+
+    def run_cycle(self, symbol: str, mode: str, cycle_function):
+        """Runs one trading cycle, profiling it and/or snapshotting memory if requested."""
+        self.cycle_id += 1
+        self._consume_flag_files()
+
+        if self.pending_cycles <= 0:
+            result = cycle_function()
+        else:
+            self.pending_cycles -= 1
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                result = cycle_function()
+            finally:
+                profiler.disable()
+                path = self._output_path(symbol, mode, "prof")
+                profiler.dump_stats(path)
+                logging.info(f"Profiled cycle {self.cycle_id} for {symbol} -> {path} "
+                             f"({self.pending_cycles} profiled cycles remaining)")
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+        if self.snapshot_requested:
+            self.snapshot_requested = False
+            self.take_snapshot(symbol, mode)
+
+        return result
+
+    def take_snapshot(self, symbol: str, mode: str):
+        """Dumps a tracemalloc snapshot and logs the largest growth since the previous one."""
+        if not tracemalloc.is_tracing():
+            # The first request only starts tracing; growth is visible from the next snapshot on
+            tracemalloc.start(int(os.environ.get("TRACEMALLOC_FRAMES", 10)))
+            logging.info("tracemalloc started; request another snapshot to see allocation growth")
+            return None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        path = self._output_path(symbol, mode, "tracemalloc")
+        snapshot.dump(path)
+        current, peak = tracemalloc.get_traced_memory()
+        logging.info(f"tracemalloc snapshot -> {path} (current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB)")
+
+        if self.last_snapshot is not None:
+            for stat in snapshot.compare_to(self.last_snapshot, "lineno")[:10]:
+                logging.info(f"   {stat}")
+        self.last_snapshot = snapshot
+        return path
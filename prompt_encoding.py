@@ -0,0 +1,185 @@
+import os
+import re
+import math
+import pandas as pd
+
+# "json" sends the raw indicator rows (original behaviour); "compact" sends
+# precomputed signal features plus a rounded columnar window
+DEFAULT_ENCODING = os.environ.get("PROMPT_ENCODING", "json")
+
+# Indicator columns produced by add_technical_indicators -> short names used in
+# compact prompts. high/low, the BB middle band and the MACD/signal lines are
+# left out: the band touches and momentum they feed are already in the signals.
+COMPACT_COLUMNS = {
+    "close": "close",
+    "BBL_5_2.0_2.0": "bbl",
+    "BBU_5_2.0_2.0": "bbu",
+    "RSI_14": "rsi",
+    "MACDh_12_26_9": "macd_h",
+    "STOCHRSIk_5_5_3_3": "k",
+    "STOCHRSId_5_5_3_3": "d",
+}
+
+# Oscillators bounded 0-100 only need one decimal
+ONE_DECIMAL_COLUMNS = {"rsi", "k", "d"}
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str):
+    """
+    Rough tokenizer-free token estimate.
+
+    Counts short letter runs, 1-3 digit groups and punctuation separately,
+    which tracks subword tokenizers on number-heavy prompts far better than a
+    characters/4 rule. Only used to compare encodings; billed counts come from
+    the model's token_usage.
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def _round(value, column: str):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if column in ONE_DECIMAL_COLUMNS:
+        return round(float(value), 1)
+    return float(f"{float(value):.5g}")
+
+
+def _value(row, column: str):
+    value = row.get(column)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+def signal_features(df: pd.DataFrame):
+    """
+    Boolean entry/exit conditions the prompts reason about, computed on the latest candle.
+
+    Returns:
+        dict: rsi/k/d values plus band touch, RSI zone and %K/%D cross flags
+    """
+    if len(df) == 0:
+        return {}
+    last = df.iloc[-1]
+    prev = df.iloc[-2] if len(df) > 1 else last
+
+    rsi = _value(last, "RSI_14")
+    k, d = _value(last, "STOCHRSIk_5_5_3_3"), _value(last, "STOCHRSId_5_5_3_3")
+    prev_k, prev_d = _value(prev, "STOCHRSIk_5_5_3_3"), _value(prev, "STOCHRSId_5_5_3_3")
+    lower, upper = _value(last, "BBL_5_2.0_2.0"), _value(last, "BBU_5_2.0_2.0")
+    macd_h, prev_macd_h = _value(last, "MACDh_12_26_9"), _value(prev, "MACDh_12_26_9")
+    crosses_known = None not in (k, d, prev_k, prev_d)
+
+    return {
+        "rsi": _round(rsi, "rsi"),
+        "rsi_lt30": rsi is not None and rsi < 30,
+        "rsi_lt35": rsi is not None and rsi < 35,
+        "rsi_gt65": rsi is not None and rsi > 65,
+        "rsi_gt70": rsi is not None and rsi > 70,
+        "touch_lower_bb": lower is not None and float(last["low"]) <= lower,
+        "close_below_lower_bb": lower is not None and float(last["close"]) < lower,
+        "touch_upper_bb": upper is not None and float(last["high"]) >= upper,
+        "close_above_upper_bb": upper is not None and float(last["close"]) > upper,
+        "k": _round(k, "k"),
+        "d": _round(d, "d"),
+        "k_lt20": k is not None and k < 20,
+        "k_gt80": k is not None and k > 80,
+        "k_cross_up_d": crosses_known and prev_k <= prev_d and k > d,
+        "k_cross_down_d": crosses_known and prev_k >= prev_d and k < d,
+        "macd_h_rising": None not in (macd_h, prev_macd_h) and macd_h > prev_macd_h,
+    }
+
+
+def encode_json(df: pd.DataFrame, rows: int = 5):
+    """Original encoding: every column of the last rows as JSON records."""
+    return df.tail(rows).to_json(orient="records")
+
+
+def _format(value):
+    return "na" if value is None else f"{value:g}"
+
+
+def encode_compact(df: pd.DataFrame, rows: int = 5, features: dict = None):
+    """
+    Latest rsi/k/d, the names of the signals that are true, and a rounded
+    columnar window of the key columns, e.g.
+
+        rsi=28.4 k=12.1 d=9.7
+        true=rsi_lt30,rsi_lt35,touch_lower_bb,k_lt20,k_cross_up_d
+        last5 close=0.5012,...;bbl=...;rsi=...
+    """
+    features = signal_features(df) if features is None else features
+    window = df.tail(rows)
+    columns = [
+        f"{name}=" + ",".join(_format(_round(value, name)) for value in window[source].tolist())
+        for source, name in COMPACT_COLUMNS.items() if source in window.columns
+    ]
+    values = " ".join(f"{name}={_format(features.get(name))}" for name in ("rsi", "k", "d"))
+    flags = ",".join(name for name, value in features.items() if value is True) or "none"
+    return f"{values}\ntrue={flags}\nlast{len(window)} {';'.join(columns)}"
+
+
+def encode_market_data(df: pd.DataFrame, encoding: str = None, rows: int = 5):
+    """
+    Encodes the enriched candles for the LLM and reports the token cost.
+
+    Args:
+        df: DataFrame returned by add_technical_indicators
+        encoding: 'json' or 'compact' (default: PROMPT_ENCODING env var, else 'json')
+        rows: Number of most recent candles to include
+
+    Returns:
+        tuple: (encoded text, report dict with the estimated tokens of this and the json encoding
+                and the latest signal features)
+    """
+    encoding = encoding or DEFAULT_ENCODING
+    baseline_text = encode_json(df, rows)
+    features = signal_features(df)
+    if encoding == "compact":
+        text = encode_compact(df, rows, features)
+    elif encoding == "json":
+        text = baseline_text
+    else:
+        raise ValueError(f"Invalid prompt encoding: {encoding}. Use 'json' or 'compact'.")
+
+    report = {
+        "encoding": encoding,
+        "estimated_tokens": estimate_tokens(text),
+        "baseline_estimated_tokens": estimate_tokens(baseline_text),
+        "signals": features,
+    }
+    return text, report
+
+
+def baseline_input_tokens(prompt: str, report: dict, system_prompt: str, baseline_system_prompt: str,
+                          input_tokens: int = 0):
+    """
+    Estimates what a decision prompt would have cost with the baseline encoding.
+
+    The baseline swaps the compact system prompt and market data back for the
+    full ones. Estimates are additive, so only the swapped parts are
+    re-counted. When the model reported the real input token count, the
+    estimate is calibrated by the real/estimated ratio of the prompt actually
+    sent, so the two numbers logged side by side are comparable.
+
+    Args:
+        prompt: Full prompt that was sent
+        report: Report returned by encode_market_data for the market data in the prompt
+        system_prompt: System prompt that was sent
+        baseline_system_prompt: System prompt the json encoding uses
+        input_tokens: Input tokens reported by the model (0 if unknown)
+
+    Returns:
+        int: Estimated baseline input tokens
+    """
+    estimated_prompt = estimate_tokens(prompt)
+    estimated_baseline = (
+        estimated_prompt
+        - estimate_tokens(system_prompt) + estimate_tokens(baseline_system_prompt)
+        - report.get("estimated_tokens", 0) + report.get("baseline_estimated_tokens", 0)
+    )
+    if input_tokens and estimated_prompt:
+        return int(round(estimated_baseline * input_tokens / estimated_prompt))
+    return estimated_baseline
@@ -0,0 +1,192 @@
+import os
+import time
+import queue
+import threading
+from metrics import registry
+from leases import order_guard, LeaseLost
+from trigger_index import TriggerIndex, RISES_TO, FALLS_TO
+
+# Stop loss below the entry of a spot buy (the exchange-side stop order uses the same level)
+SPOT_STOP_LOSS_PCT = float(os.environ.get("SPOT_STOP_LOSS_PCT", "0.0075"))
+
+# Take profit above the entry of a spot buy; 0 leaves exits above the entry to the model
+SPOT_TAKE_PROFIT_PCT = float(os.environ.get("SPOT_TAKE_PROFIT_PCT", "0"))
+
+# Exit orders tried per triggered position before the watchdog gives up on it
+MAX_EXIT_ATTEMPTS = 3
+
+
+def spot_exit_levels(entry_price: float):
+    """Returns (stop_price, target_price or None) for a spot buy at entry_price."""
+    stop_price = round(entry_price * (1 - SPOT_STOP_LOSS_PCT), 4)
+    target_price = round(entry_price * (1 + SPOT_TAKE_PROFIT_PCT), 4) if SPOT_TAKE_PROFIT_PCT > 0 else None
+    return stop_price, target_price
+
+
+class SpotRiskWatchdog:
+    """
+    In-process stop loss / take profit for spot positions.
+
+    Every spot buy arms a stop (and optional target) level in a TriggerIndex
+    shared by all symbols; on_tick() is called for every streamed price, so a
+    tick that crosses nothing costs O(1) however many positions are armed.
+    A crossed level queues a market exit for the worker thread (the tick
+    thread never waits on an order) and disarms the other level of the
+    position.
+
+    Positions this process didn't open (held before a restart, or taken
+    over from another worker or node) are armed by arm_open_positions()
+    from their balance and the PnL ledger's entry price.
+
+    The exchange-side stop order placed by spot_place_market_order stays as
+    a backstop for when this process is down; whichever fires second finds
+    no balance left to sell.
+
+    Usage:
+        watchdog = SpotRiskWatchdog()
+        watchdog.start()
+        watchdog.arm("XRPUSDT", qty=100, entry_price=0.5123)
+        watchdog.on_tick("XRPUSDT", 0.5081)  # below the stop: exit queued
+    """
+
+    def __init__(self, exit_position=None):
+        self.lock = threading.Lock()
+        self.index = TriggerIndex()
+        self.positions = {}  # symbol -> {"qty", "entry_price", "stop_price", "target_price", "attempts"}
+        self.exit_position = exit_position  # callable(symbol) -> order response; default bybit_tools.spot_close_position
+        self.exits = queue.Queue()
+        self.worker = None
+        self.last_exits = {}  # symbol -> details of the latest exit, for logging and debugging
+
+    def arm(self, symbol: str, qty: float, entry_price: float, stop_price: float = None, target_price: float = None):
+        """Tracks a spot position; replaces any levels already armed for the symbol."""
+        if stop_price is None and target_price is None:
+            stop_price, target_price = spot_exit_levels(entry_price)
+        with self.lock:
+            self.index.cancel_symbol(symbol)
+            position = {"qty": float(qty), "entry_price": entry_price, "stop_price": stop_price,
+                        "target_price": target_price, "attempts": 0}
+            self._arm_levels(symbol, position)
+            self.positions[symbol] = position
+        print(f"Watchdog armed for {symbol}: entry {entry_price}, stop {stop_price}, target {target_price}")
+
+    def arm_open_positions(self, symbols: list):
+        """
+        Arms the spot positions that already exist, e.g. on start or when a symbol's lease is claimed.
+
+        The size is the coin balance (position book or REST) and the entry
+        the ledger's (ledger.entry_price); a symbol without a balance or
+        without ledger lots is left unarmed, and armed symbols keep their levels.
+
+        Returns:
+            list: The symbols armed
+        """
+        from bybit_tools import spot_get_open_positions
+        armed = []
+        for symbol in symbols:
+            with self.lock:
+                if symbol in self.positions:
+                    continue
+            position = spot_get_open_positions(symbol)
+            if not position.get("has_position"):
+                continue
+            if not position.get("avgPrice"):
+                print(f"Watchdog not armed for {symbol}: {position['size']} held, no entry price in the PnL ledger")
+                continue
+            self.arm(symbol, position["size"], position["avgPrice"])
+            armed.append(symbol)
+        return armed
+
+    def _arm_levels(self, symbol: str, position: dict):
+        if position["stop_price"]:
+            self.index.add(symbol, position["stop_price"], FALLS_TO, "stop_loss")
+        if position["target_price"]:
+            self.index.add(symbol, position["target_price"], RISES_TO, "take_profit")
+
+    def disarm(self, symbol: str):
+        """Stops tracking a symbol (e.g. after the position was closed by the model)."""
+        with self.lock:
+            self.index.cancel_symbol(symbol)
+            return self.positions.pop(symbol, None) is not None
+
+    def armed(self):
+        """Returns {symbol: position} of the tracked positions."""
+        with self.lock:
+            return {symbol: dict(position) for symbol, position in self.positions.items()}
+
+    def on_tick(self, symbol: str, price: float):
+        """Checks one streamed price; queues an exit if it crossed the symbol's stop or target."""
+        with self.lock:
+            fired = self.index.on_price(symbol, price)
+            if not fired:
+                return
+            self.index.cancel_symbol(symbol)
+            position = self.positions.pop(symbol, None)
+        if position is not None:
+            self.exits.put((symbol, fired[0][1], price, position, time.perf_counter()))
+
+    def start(self):
+        """Starts the exit worker thread."""
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run_exits, daemon=True)
+            self.worker.start()
+        return self
+
+    def _run_exits(self):
+        while True:
+            symbol, reason, price, position, ticked_at = self.exits.get()
+            try:
+                self._exit(symbol, reason, price, position, ticked_at)
+            except Exception as e:
+                print(f"Watchdog error while closing {symbol}: {e}")
+
+    def _exit(self, symbol: str, reason: str, price: float, position: dict, ticked_at: float):
+        exit_position = self.exit_position
+        if exit_position is None:
+            from bybit_tools import spot_close_position as exit_position
+
+        print(f"Watchdog {reason} for {symbol} at {price} (entry {position['entry_price']}): closing position")
+        try:
+            # Coordination mode: the exit is an order like any other, placed under the symbol's lease
+            with order_guard(symbol):
+                response = exit_position(symbol)
+        except LeaseLost as e:
+            print(f"Watchdog left {symbol} to its exchange stop order and the lease holder: {e}")
+            return
+        seconds = time.perf_counter() - ticked_at
+        registry.observe("watchdog", reason, seconds, symbol)
+        self.last_exits[symbol] = {"reason": reason, "price": price, "seconds": seconds, "response": response}
+
+        if response.get("retCode") == 0 or response.get("retMsg") == "No open position to close.":
+            print(f"Watchdog closed {symbol} {seconds * 1000:.0f}ms after the {reason} tick")
+            return
+        position["attempts"] += 1
+        if position["attempts"] >= MAX_EXIT_ATTEMPTS:
+            print(f"Watchdog gave up closing {symbol} after {position['attempts']} attempts: {response.get('retMsg')}")
+            return
+        # Re-arm so the next tick beyond the level retries the exit
+        print(f"Watchdog exit for {symbol} failed ({response.get('retMsg')}), retrying on the next tick")
+        with self.lock:
+            if symbol not in self.positions:
+                self._arm_levels(symbol, position)
+                self.positions[symbol] = position
+
+
+def start_tick_stream(symbols: list, watchdog: SpotRiskWatchdog):
+    """
+    Feeds the watchdog from Bybit's public spot ticker WebSocket.
+
+    Returns:
+        The pybit WebSocket
+    """
+    from pybit.unified_trading import WebSocket
+
+    def handle_ticker(message):
+        data = message.get("data", {})
+        last_price = data.get("lastPrice")
+        if last_price:
+            watchdog.on_tick(data.get("symbol"), float(last_price))
+
+    websocket = WebSocket(testnet=False, channel_type="spot")
+    websocket.ticker_stream(symbol=symbols, callback=handle_ticker)
+    return websocket
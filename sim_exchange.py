@@ -0,0 +1,417 @@
+import bisect
+import time
+import itertools
+import threading
+from trigger_index import TriggerIndex, RISES_TO, FALLS_TO
+
+MINUTE_MS = 60_000
+
+
+def _ok(result: dict):
+    return {"retCode": 0, "retMsg": "OK", "result": result, "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+
+def _error(code: int, message: str):
+    return {"retCode": code, "retMsg": message, "result": {}, "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+
+class SimulatedExchange:
+    """
+    In-process Bybit stand-in for paper trading and load tests.
+
+    Implements the subset of the pybit HTTP session used by bybit_tools
+    (get_kline, get_tickers, get_instruments_info, get_wallet_balance,
+    get_positions, get_executions, place_order) with Bybit-shaped responses,
+    so it can replace `bybit_tools.session` without touching any caller.
+
+    State is held in memory: one UNIFIED wallet, linear positions in one-way
+    mode, spot balances, and armed conditional orders. Market orders fill at
+    the last price. Prices arrive through on_tick()/replay_*(); every tick
+    updates the current candle and checks TP/SL and spot stop orders through
+    a TriggerIndex, so a tick that triggers nothing is O(1).
+
+    Usage:
+        exchange = SimulatedExchange(starting_balance=10000)
+        exchange.load_klines("XRPUSDT", live_session.get_kline(category="linear", symbol="XRPUSDT", interval=1, limit=1000))
+        bybit_tools.use_session(exchange)
+        exchange.on_tick("XRPUSDT", 0.5123)
+    """
+
+    def __init__(self, starting_balance: float = 10000.0, spot_fee_rate: float = 0.001,
+                 linear_fee_rate: float = 0.00055, base_interval: int = 1, min_order_qty: str = "0.1"):
+        self.lock = threading.RLock()
+        self.spot_fee_rate = spot_fee_rate
+        self.linear_fee_rate = linear_fee_rate
+        self.bar_ms = base_interval * MINUTE_MS
+        self.min_order_qty = min_order_qty
+
+        self.prices = {}      # symbol -> last price
+        self.last_tick_ms = {}  # symbol -> timestamp of the last tick
+        self.bars = {}        # symbol -> [[start_ms, open, high, low, close, volume], ...] oldest first
+        self.coins = {"USDT": float(starting_balance)}
+        self.positions = {}   # symbol -> {"side", "size", "avg_price", "take_profit", "stop_loss", "trigger_ids"}
+        self.executions = []  # oldest first
+        self.triggers = TriggerIndex()
+        self.order_ids = itertools.count(1)
+        self.exec_ids = itertools.count(1)
+
+    # =========================================================================
+    # PRICE FEED
+    # =========================================================================
+
+    def on_tick(self, symbol: str, price: float, ts_ms: int = None, volume: float = 0.0):
+        """Applies one trade/ticker price: updates the candle and fires crossed triggers."""
+        if ts_ms is None:
+            ts_ms = int(time.time() * 1000)
+        with self.lock:
+            self.prices[symbol] = price
+            self.last_tick_ms[symbol] = ts_ms
+
+            start = ts_ms - ts_ms % self.bar_ms
+            bars = self.bars.get(symbol)
+            if bars is None:
+                bars = self.bars[symbol] = []
+            if bars and bars[-1][0] == start:
+                bar = bars[-1]
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += volume
+            else:
+                bars.append([start, price, price, price, price, volume])
+
+            for trigger_id, order in self.triggers.on_price(symbol, price):
+                self._fill_triggered(order, price, ts_ms)
+
+    def replay_prices(self, symbol: str, prices, start_ms: int = None, step_ms: int = 1000):
+        """Feeds a sequence of prices as ticks `step_ms` apart."""
+        ts_ms = start_ms if start_ms is not None else int(time.time() * 1000)
+        for price in prices:
+            self.on_tick(symbol, price, ts_ms)
+            ts_ms += step_ms
+
+    def replay_klines(self, symbol: str, response: dict):
+        """
+        Replays a Bybit kline response bar by bar as open/low/high/close ticks.
+
+        Bullish bars visit the low first and bearish bars the high first, the
+        pessimistic ordering commonly used when only OHLC data is available.
+        """
+        rows = sorted(response["result"]["list"], key=lambda row: int(row[0]))
+        for row in rows:
+            start, open_, high, low, close = int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])
+            volume = float(row[5]) / 4
+            path = (open_, low, high, close) if close >= open_ else (open_, high, low, close)
+            step = self.bar_ms // 4
+            for i, price in enumerate(path):
+                self.on_tick(symbol, price, start + i * step, volume)
+
+    def load_klines(self, symbol: str, response: dict):
+        """Seeds candle history (at the base interval) without firing triggers."""
+        rows = sorted(response["result"]["list"], key=lambda row: int(row[0]))
+        with self.lock:
+            self.bars[symbol] = [
+                [int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5])]
+                for row in rows
+            ]
+            if rows:
+                self.prices[symbol] = float(rows[-1][4])
+                self.last_tick_ms[symbol] = int(rows[-1][0])
+
+    # =========================================================================
+    # MARKET DATA ENDPOINTS
+    # =========================================================================
+
+    def get_kline(self, category: str = "linear", symbol: str = None, interval=1, limit: int = 200,
+                  end: int = None, **kwargs):
+        interval_ms = int(interval) * MINUTE_MS if str(interval).isdigit() else self.bar_ms
+        factor = max(1, interval_ms // self.bar_ms)
+        with self.lock:
+            bars = self.bars.get(symbol, [])
+            if end is not None:
+                bars = bars[:bisect.bisect_right(bars, [int(end), float("inf")])]
+            bars = bars[-(limit + 1) * factor:]
+            aggregated = []
+            for start, open_, high, low, close, volume in bars:
+                bucket = start - start % interval_ms
+                if aggregated and aggregated[-1][0] == bucket:
+                    current = aggregated[-1]
+                    current[2] = max(current[2], high)
+                    current[3] = min(current[3], low)
+                    current[4] = close
+                    current[5] += volume
+                else:
+                    aggregated.append([bucket, open_, high, low, close, volume])
+        rows = [
+            [str(start), str(open_), str(high), str(low), str(close), str(volume), str(volume * close)]
+            for start, open_, high, low, close, volume in reversed(aggregated[-limit:])
+        ]
+        return _ok({"category": category, "symbol": symbol, "list": rows})
+
+    def get_tickers(self, category: str = "linear", symbol: str = None, **kwargs):
+        with self.lock:
+            symbols = [symbol] if symbol else list(self.prices)
+            tickers = [{"symbol": s, "lastPrice": str(self.prices[s])} for s in symbols if s in self.prices]
+        return _ok({"category": category, "list": tickers})
+
+    def get_instruments_info(self, category: str = "linear", symbol: str = None, **kwargs):
+        return _ok({"category": category, "list": [{
+            "symbol": symbol,
+            "status": "Trading",
+            "lotSizeFilter": {"minOrderQty": self.min_order_qty, "qtyStep": self.min_order_qty},
+        }]})
+
+    # =========================================================================
+    # ACCOUNT ENDPOINTS
+    # =========================================================================
+
+    def get_wallet_balance(self, accountType: str = "UNIFIED", coin: str = None, **kwargs):
+        with self.lock:
+            names = coin.split(",") if coin else list(self.coins)
+            coins = [
+                {"coin": name, "walletBalance": str(self.coins[name]), "equity": str(self._equity(name)),
+                 "usdValue": str(self._equity(name) * self._usd_price(name))}
+                for name in names if name in self.coins
+            ]
+            total = sum(self._equity(name) * self._usd_price(name) for name in self.coins)
+        return _ok({"list": [{"accountType": accountType, "totalEquity": str(total), "coin": coins}]})
+
+    def _usd_price(self, coin: str):
+        return 1.0 if coin == "USDT" else self.prices.get(f"{coin}USDT", 0.0)
+
+    def _equity(self, coin: str):
+        equity = self.coins.get(coin, 0.0)
+        if coin == "USDT":
+            equity += sum(self._unrealised(symbol, position) for symbol, position in self.positions.items())
+        return equity
+
+    def _unrealised(self, symbol: str, position: dict):
+        mark = self.prices.get(symbol, position["avg_price"])
+        direction = 1 if position["side"] == "Buy" else -1
+        return (mark - position["avg_price"]) * position["size"] * direction
+
+    def get_positions(self, category: str = "linear", symbol: str = None, **kwargs):
+        with self.lock:
+            symbols = [symbol] if symbol else list(self.positions)
+            rows = []
+            for s in symbols:
+                position = self.positions.get(s)
+                if position is None:
+                    rows.append({"symbol": s, "side": "", "size": "0", "avgPrice": "0", "markPrice": str(self.prices.get(s, 0)),
+                                 "unrealisedPnl": "0", "leverage": "10", "positionValue": "0", "positionIdx": 0,
+                                 "takeProfit": "", "stopLoss": ""})
+                    continue
+                rows.append({
+                    "symbol": s, "side": position["side"], "size": str(position["size"]),
+                    "avgPrice": str(position["avg_price"]), "markPrice": str(self.prices.get(s, position["avg_price"])),
+                    "unrealisedPnl": str(self._unrealised(s, position)), "leverage": "10",
+                    "positionValue": str(position["size"] * position["avg_price"]), "positionIdx": 0,
+                    "takeProfit": str(position["take_profit"] or ""), "stopLoss": str(position["stop_loss"] or ""),
+                })
+        return _ok({"category": category, "list": rows})
+
+    def get_executions(self, category: str = "linear", symbol: str = None, limit: int = 50,
+                       startTime: int = None, endTime: int = None, **kwargs):
+        with self.lock:
+            selected = []
+            for execution in reversed(self.executions):
+                exec_time = int(execution["execTime"])
+                if endTime and exec_time > int(endTime):
+                    continue
+                if startTime and exec_time < int(startTime):
+                    break
+                if execution["category"] != category or (symbol and execution["symbol"] != symbol):
+                    continue
+                selected.append({k: v for k, v in execution.items() if k != "category"})
+                if len(selected) >= int(limit):
+                    break
+        return _ok({"category": category, "list": selected, "nextPageCursor": ""})
+
+    # =========================================================================
+    # TRADING
+    # =========================================================================
+
+    def place_order(self, category: str = "linear", symbol: str = None, side: str = None, orderType: str = "Market",
+                    qty=None, triggerPrice=None, orderFilter: str = None, takeProfit=None, stopLoss=None,
+                    reduceOnly: bool = False, **kwargs):
+        with self.lock:
+            price = self.prices.get(symbol)
+            if price is None:
+                return _error(10001, f"No price available for {symbol}")
+            try:
+                qty = float(qty)
+            except (TypeError, ValueError):
+                return _error(10001, f"Invalid qty: {qty}")
+            if qty <= 0:
+                return _error(10001, "Order quantity must be positive")
+
+            order_id = f"sim-{next(self.order_ids)}"
+            ts_ms = self.last_tick_ms.get(symbol, int(time.time() * 1000))
+
+            if orderType != "Market":
+                return _error(10001, "SimulatedExchange only supports market orders")
+
+            if category == "spot" and orderFilter == "StopOrder":
+                level = float(triggerPrice)
+                direction = FALLS_TO if level <= price else RISES_TO
+                self.triggers.add(symbol, level, direction, {
+                    "category": "spot", "symbol": symbol, "side": side, "qty": qty,
+                    "order_id": order_id, "stop_order_type": "Stop",
+                })
+                return _ok({"orderId": order_id, "orderLinkId": ""})
+
+            if category == "spot":
+                error = self._fill_spot(symbol, side, qty, price, ts_ms, order_id)
+            elif category == "linear":
+                if reduceOnly and not self._reduces(symbol, side):
+                    return _error(110017, "Reduce-only order would not reduce the current position")
+                error = self._fill_linear(symbol, side, qty, price, ts_ms, order_id, reduce_only=reduceOnly)
+                if error is None and not reduceOnly and (takeProfit or stopLoss):
+                    self._set_trading_stop(symbol, takeProfit, stopLoss)
+            else:
+                return _error(10001, f"Unsupported category: {category}")
+
+            if error:
+                return error
+            return _ok({"orderId": order_id, "orderLinkId": ""})
+
+    def _reduces(self, symbol: str, side: str):
+        position = self.positions.get(symbol)
+        return position is not None and position["side"] != side
+
+    def _set_trading_stop(self, symbol: str, take_profit, stop_loss):
+        """(Re)arms full-position TP/SL triggers for a linear position."""
+        position = self.positions.get(symbol)
+        if position is None:
+            return
+        for trigger_id in position["trigger_ids"]:
+            self.triggers.cancel(trigger_id)
+        position["trigger_ids"] = []
+        is_long = position["side"] == "Buy"
+        for level, kind in ((take_profit, "TakeProfit"), (stop_loss, "StopLoss")):
+            if not level:
+                continue
+            level = float(level)
+            direction = RISES_TO if (kind == "TakeProfit") == is_long else FALLS_TO
+            position["trigger_ids"].append(self.triggers.add(symbol, level, direction, {
+                "category": "linear", "symbol": symbol, "stop_order_type": kind,
+            }))
+        position["take_profit"] = float(take_profit) if take_profit else None
+        position["stop_loss"] = float(stop_loss) if stop_loss else None
+
+    def _fill_triggered(self, order: dict, price: float, ts_ms: int):
+        order_id = f"sim-{next(self.order_ids)}"
+        if order["category"] == "linear":
+            position = self.positions.get(order["symbol"])
+            if position is None:
+                return
+            close_side = "Sell" if position["side"] == "Buy" else "Buy"
+            self._fill_linear(order["symbol"], close_side, position["size"], price, ts_ms, order_id,
+                              reduce_only=True, stop_order_type=order["stop_order_type"])
+        else:
+            self._fill_spot(order["symbol"], order["side"], order["qty"], price, ts_ms, order["order_id"],
+                            stop_order_type=order["stop_order_type"])
+
+    def _fill_spot(self, symbol: str, side: str, qty: float, price: float, ts_ms: int, order_id: str,
+                   stop_order_type: str = ""):
+        base = symbol[:-4] if symbol.endswith("USDT") else symbol
+        value = qty * price
+        fee = value * self.spot_fee_rate
+        if side == "Buy":
+            if self.coins.get("USDT", 0.0) < value + fee:
+                return _error(170131, "Insufficient balance.")
+            self.coins["USDT"] -= value + fee
+            self.coins[base] = self.coins.get(base, 0.0) + qty
+        else:
+            if self.coins.get(base, 0.0) + 1e-12 < qty:
+                return _error(170131, "Insufficient balance.")
+            self.coins[base] -= qty
+            self.coins["USDT"] = self.coins.get("USDT", 0.0) + value - fee
+        self._record_execution("spot", symbol, side, qty, price, fee, 0.0, ts_ms, order_id, stop_order_type)
+        return None
+
+    def _fill_linear(self, symbol: str, side: str, qty: float, price: float, ts_ms: int, order_id: str,
+                     reduce_only: bool = False, stop_order_type: str = ""):
+        position = self.positions.get(symbol)
+        fee = qty * price * self.linear_fee_rate
+        closed = 0.0
+        realized = 0.0
+
+        if position is not None and position["side"] != side:
+            closed = min(qty, position["size"])
+            direction = 1 if position["side"] == "Buy" else -1
+            realized = (price - position["avg_price"]) * closed * direction
+            position["size"] -= closed
+            if position["size"] <= 1e-12:
+                for trigger_id in position["trigger_ids"]:
+                    self.triggers.cancel(trigger_id)
+                del self.positions[symbol]
+                position = None
+            remainder = 0.0 if reduce_only else qty - closed
+        else:
+            remainder = qty
+
+        if remainder > 1e-12:
+            if position is None:
+                self.positions[symbol] = {
+                    "side": side, "size": remainder, "avg_price": price,
+                    "take_profit": None, "stop_loss": None, "trigger_ids": [],
+                }
+            else:
+                total = position["size"] + remainder
+                position["avg_price"] = (position["avg_price"] * position["size"] + price * remainder) / total
+                position["size"] = total
+
+        self.coins["USDT"] = self.coins.get("USDT", 0.0) + realized - fee
+        self._record_execution("linear", symbol, side, qty, price, fee, closed, ts_ms, order_id, stop_order_type)
+        return None
+
+    def _record_execution(self, category: str, symbol: str, side: str, qty: float, price: float, fee: float,
+                          closed_size: float, ts_ms: int, order_id: str, stop_order_type: str):
+        exec_number = next(self.exec_ids)
+        self.executions.append({
+            "category": category,
+            "symbol": symbol, "orderId": order_id, "orderLinkId": "", "side": side, "orderType": "Market",
+            "orderPrice": str(price), "orderQty": str(qty), "leavesQty": "0",
+            "execId": f"sim-exec-{exec_number}", "execPrice": str(price), "execQty": str(qty),
+            "execValue": str(qty * price), "execFee": str(fee), "execFeeV2": "", "feeCurrency": "USDT",
+            "feeRate": str(self.spot_fee_rate if category == "spot" else self.linear_fee_rate),
+            "isMaker": False, "execType": "Trade", "stopOrderType": stop_order_type or "UNKNOWN",
+            "createType": "CreateByStopLoss" if stop_order_type == "StopLoss" else
+                          "CreateByTakeProfit" if stop_order_type == "TakeProfit" else "CreateByUser",
+            "tradeIv": "", "markIv": "", "markPrice": str(price), "indexPrice": "", "underlyingPrice": "",
+            "blockTradeId": "", "closedSize": str(closed_size), "seq": str(exec_number), "extraFees": "",
+            "execTime": str(ts_ms),
+        })
+
+
+def start_paper_trading(symbols: list, trading_mode: str, starting_balance: float = 10000.0):
+    """
+    Builds a SimulatedExchange fed by Bybit's public market data.
+
+    Seeds each symbol with the last 1000 one-minute candles from the public
+    REST API and streams live prices from the public ticker WebSocket, so the
+    bot trades against real prices without ever sending an order.
+
+    Returns:
+        tuple: (exchange, websocket)
+    """
+    from pybit.unified_trading import HTTP, WebSocket
+
+    category = "spot" if trading_mode == "spot" else "linear"
+    exchange = SimulatedExchange(starting_balance=starting_balance)
+    public = HTTP(testnet=False)
+    for symbol in symbols:
+        exchange.load_klines(symbol, public.get_kline(category=category, symbol=symbol, interval=1, limit=1000))
+
+    def handle_ticker(message):
+        data = message.get("data", {})
+        last_price = data.get("lastPrice")
+        if last_price:
+            exchange.on_tick(data.get("symbol"), float(last_price), int(message.get("ts", time.time() * 1000)))
+
+    websocket = WebSocket(testnet=False, channel_type=category)
+    websocket.ticker_stream(symbol=symbols, callback=handle_ticker)
+    return exchange, websocket
@@ -0,0 +1,429 @@
+"""
+Supervisor mode: a watchlist sharded across worker processes.
+
+`python main.py spot --symbol A,B,C,... --workers N` (or `--workers auto`,
+one per CPU core) starts this supervisor, which spawns N workers; each runs
+the normal trading schedule for its shard of the symbols, so the pandas and
+indicator work of different shards runs on different cores.
+
+The services every worker would otherwise duplicate live once:
+- request budget: SharedTokenBucket, a token bucket in shared memory that
+  every worker's exchange calls take from (bybit_tools.use_rate_limiter);
+- database writes: the workers send their rows over a queue and one writer
+  thread here inserts them (database.use_db_writer). Executions are stored
+  here too, from the one private stream, so the PnL ledger has one writer;
+- market data: one public ticker stream writes the latest prices into a
+  SharedPriceBoard, which the spot watchdogs of the workers read.
+
+Balance logging and the partition/archive jobs also run here only.
+
+Workers report how long each symbol's cycle took. A worker that exits or
+stops reporting is restarted (with backoff) on the same shard, and the
+shards are periodically rebalanced from those timings when that lowers the
+busiest worker's load enough to justify restarting the workers it moves
+symbols between. A worker is stopped by asking it to exit between cycles, so
+no order is cut off between being sent and being logged; it is killed only
+if it has not finished its cycle after WORKER_DRAIN_SECONDS. The schema is
+set up by main() once, before any worker starts. With --coordinate every
+worker gets the whole watchlist and the workers (of this and other hosts)
+divide it through leases instead.
+"""
+
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# Exchange requests per second shared by all workers (Bybit limits per account and IP)
+BYBIT_REQUESTS_PER_SECOND = float(os.environ.get("BYBIT_REQUESTS_PER_SECOND", "20"))
+
+# A worker that reported no cycle for this long is restarted
+WORKER_STALL_SECONDS = int(os.environ.get("WORKER_STALL_SECONDS", "600"))
+
+# Seconds a stopping worker gets to finish its cycle and exit before it is killed
+WORKER_DRAIN_SECONDS = int(os.environ.get("WORKER_DRAIN_SECONDS", "180"))
+
+# Seconds between rebalancing checks, and the minimum relative drop of the busiest worker's load to rebalance
+REBALANCE_INTERVAL = int(os.environ.get("REBALANCE_INTERVAL", "1800"))
+REBALANCE_GAIN = 0.2
+
+# Restart backoff doubles per consecutive crash up to this many seconds
+MAX_RESTART_BACKOFF = 60
+
+# A worker up this long is considered healthy again (its backoff resets)
+STABLE_AFTER = 600
+
+# Weight of the latest cycle time in a symbol's moving average
+COST_SMOOTHING = 0.3
+
+# Rows the DB writer inserts per transaction at most
+DB_WRITER_BATCH = 500
+
+
+def shard_symbols(symbols: list, workers: int, costs: dict = None):
+    """
+    Splits symbols into `workers` shards of about equal total cost
+    (longest first onto the least loaded shard; unknown costs count as the mean).
+
+    Returns:
+        list: One list of symbols per worker, each in watchlist order
+    """
+    costs = costs or {}
+    default = sum(costs.values()) / len(costs) if costs else 1.0
+    loads = [0.0] * workers
+    assigned = [[] for _ in range(workers)]
+    for symbol in sorted(symbols, key=lambda symbol: -costs.get(symbol, default)):
+        index = loads.index(min(loads))
+        assigned[index].append(symbol)
+        loads[index] += costs.get(symbol, default)
+    order = {symbol: position for position, symbol in enumerate(symbols)}
+    return [sorted(shard, key=order.get) for shard in assigned]
+
+
+class SharedTokenBucket:
+    """
+    A token bucket shared by processes: its state lives in shared memory and
+    a process lock guards the refill-and-take, so every worker draws from
+    one request budget.
+    """
+
+    def __init__(self, rate: float = BYBIT_REQUESTS_PER_SECOND, burst: float = None, context=None):
+        """`context` is the multiprocessing context the worker processes are started with."""
+        context = context or multiprocessing.get_context()
+        self.rate = rate
+        self.burst = burst or rate
+        # [tokens, last refill]; time.monotonic() is the same clock in every process of the host
+        self.state = context.RawArray("d", [self.burst, time.monotonic()])
+        self.lock = context.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Blocks until `tokens` are available and takes them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                available = min(self.burst, self.state[0] + (now - self.state[1]) * self.rate)
+                self.state[1] = now
+                if available >= tokens:
+                    self.state[0] = available - tokens
+                    return
+                self.state[0] = available
+                wait = (tokens - available) / self.rate
+            time.sleep(wait)
+
+
+class SharedPriceBoard:
+    """
+    Latest price per symbol in shared memory: one writer (the supervisor's
+    ticker stream), read by any number of worker processes.
+
+    Each symbol's row is (sequence, price, time); the writer makes the
+    sequence odd while it updates the row, so readers retry instead of
+    reading a half-written one.
+    """
+
+    def __init__(self, symbols: list, name: str = None):
+        self.symbols = list(symbols)
+        self.index = {symbol: position for position, symbol in enumerate(self.symbols)}
+        size = max(len(self.symbols), 1) * 3 * 8
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Spawned workers share the supervisor's resource tracker; only the supervisor unlinks the block
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.rows = np.ndarray((max(len(self.symbols), 1), 3), dtype=np.float64, buffer=self.memory.buf)
+        if self.owner:
+            self.rows[:] = 0.0
+
+    def __reduce__(self):
+        # Worker processes attach to the same block by name
+        return SharedPriceBoard, (self.symbols, self.memory.name)
+
+    def on_tick(self, symbol: str, price: float):
+        """Publishes a price (the interface of risk_watchdog.start_tick_stream's consumer)."""
+        position = self.index.get(symbol)
+        if position is None:
+            return
+        row = self.rows[position]
+        sequence = row[0]
+        row[0] = sequence + 1
+        row[1] = price
+        row[2] = time.time()
+        row[0] = sequence + 2
+
+    def read(self, symbol: str):
+        """(sequence, price, time) of a symbol; sequence 0 means no price yet."""
+        row = self.rows[self.index[symbol]]
+        while True:
+            sequence = row[0]
+            if sequence % 2:
+                continue
+            price, at = row[1], row[2]
+            if row[0] == sequence:
+                return int(sequence), float(price), float(at)
+
+    def watch(self, symbols: list, callback, interval: float = 0.05):
+        """Calls callback(symbol, price) from a daemon thread for every new price of the symbols."""
+        def run():
+            seen = {symbol: 0 for symbol in symbols}
+            while True:
+                for symbol in symbols:
+                    sequence, price, _ = self.read(symbol)
+                    if sequence != seen[symbol]:
+                        seen[symbol] = sequence
+                        try:
+                            callback(symbol, price)
+                        except Exception as e:
+                            print(f"Price board callback failed for {symbol}: {e}")
+                time.sleep(interval)
+
+        symbols = [symbol for symbol in symbols if symbol in self.index]
+        thread = threading.Thread(target=run, name="price-board", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        del self.rows
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class WorkerServices:
+    """What a worker process gets from the supervisor (pickled into it at spawn)."""
+
+    def __init__(self, rate_limiter: SharedTokenBucket, db_queue, status_queue, prices: SharedPriceBoard = None,
+                 stop_events: list = None):
+        self.rate_limiter = rate_limiter
+        self.db_queue = db_queue
+        self.status_queue = status_queue
+        self.prices = prices
+        self.stop_events = stop_events or []
+
+    def stop_event(self, index: int):
+        """Event set when the supervisor wants worker `index` to exit after its current cycle."""
+        return self.stop_events[index]
+
+    def report(self, index: int, cycle_seconds: dict):
+        """Sends {symbol: seconds} of the last cycle to the supervisor (also its liveness signal)."""
+        self.status_queue.put((index, cycle_seconds))
+
+
+def run_db_writer(db_queue):
+    """Inserts the rows workers send through database.save_records(), in batches, until it reads None."""
+    from database import Base, SessionLocal
+    models = {mapper.class_.__name__: mapper.class_ for mapper in Base.registry.mappers}
+    running = True
+    while running:
+        batch = [db_queue.get()]
+        while len(batch) < DB_WRITER_BATCH:
+            try:
+                batch.append(db_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            running = False
+            batch = [records for records in batch if records is not None]
+        if not batch:
+            continue
+        db = SessionLocal()
+        try:
+            for records in batch:
+                db.add_all(models[model](**values) for model, values in records)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"DB writer failed to insert {len(batch)} batches: {e}")
+        finally:
+            db.close()
+
+
+class _Worker:
+    def __init__(self, symbols: list):
+        self.symbols = symbols
+        self.process = None
+        self.started_at = 0.0
+        self.last_report = 0.0
+        self.restarts = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """Spawns the workers with their shards and shared services, restarts them and rebalances the shards."""
+
+    def __init__(self, args, symbols: list, timeframes: list, workers: int, target, shard: bool = True):
+        """
+        Args:
+            args: Parsed main.py arguments, passed on to the workers
+            symbols: Watchlist
+            timeframes: Higher timeframes (minutes)
+            workers: Number of worker processes
+            target: Worker entry point, target(index, symbols, args, timeframes, services)
+            shard: Split the watchlist between the workers; False gives every worker all of it
+                (coordination mode: the workers divide it through leases, see leases.py)
+        """
+        self.args = args
+        self.symbols = symbols
+        self.timeframes = timeframes
+        self.target = target
+        # spawn: the parent runs WebSocket and writer threads that a fork would copy mid-state
+        self.context = multiprocessing.get_context("spawn")
+        self.costs = {}
+        self.shard = shard
+        if shard:
+            self.workers = [_Worker(part) for part in shard_symbols(symbols, workers)]
+        else:
+            self.workers = [_Worker(list(symbols)) for _ in range(workers)]
+        self.last_rebalance = time.monotonic()
+        self.services = None
+        self.writer = None
+        self.streams = []
+
+    def start(self):
+        from bybit_tools import use_rate_limiter
+        rate_limiter = SharedTokenBucket(context=self.context)
+        # This process' own calls (snapshots, balances) draw from the same budget
+        use_rate_limiter(rate_limiter)
+        db_queue = self.context.Queue()
+        status_queue = self.context.Queue()
+        self.writer = threading.Thread(target=run_db_writer, args=(db_queue,), name="db-writer", daemon=True)
+        self.writer.start()
+
+        prices = None
+        if self.args.mode == "spot" and not self.args.no_watchdog and not self.args.paper:
+            from risk_watchdog import start_tick_stream
+            prices = SharedPriceBoard(self.symbols)
+            try:
+                self.streams.append(start_tick_stream(self.symbols, prices))
+            except Exception as e:
+                print(f"Ticker stream unavailable, spot exits rely on exchange stop orders: {e}")
+        if not self.args.no_private_stream and not self.args.paper:
+            # Executions are stored (and the PnL ledger updated) by this process only
+            from position_book import start_private_stream
+            try:
+                self.streams.append(start_private_stream())
+            except Exception as e:
+                print(f"Private stream unavailable, executions are not stored: {e}")
+
+        stop_events = [self.context.Event() for _ in self.workers]
+        self.services = WorkerServices(rate_limiter, db_queue, status_queue, prices, stop_events)
+        for index in range(len(self.workers)):
+            self._spawn(index)
+        return self
+
+    def _spawn(self, index: int):
+        worker = self.workers[index]
+        self.services.stop_event(index).clear()
+        worker.process = self.context.Process(
+            target=self.target, args=(index, worker.symbols, self.args, self.timeframes, self.services),
+            name=f"worker-{index}", daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = worker.last_report = time.monotonic()
+        print(f"Worker {index} (pid {worker.process.pid}) trading {', '.join(worker.symbols)}")
+
+    def _stop_workers(self, indexes: list):
+        """Asks the workers to exit after their current cycle; kills those still running after WORKER_DRAIN_SECONDS."""
+        indexes = [index for index in indexes
+                   if self.workers[index].process is not None and self.workers[index].process.is_alive()]
+        for index in indexes:
+            self.services.stop_event(index).set()
+        deadline = time.monotonic() + WORKER_DRAIN_SECONDS
+        for index in indexes:
+            process = self.workers[index].process
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"Worker {index} did not finish its cycle within {WORKER_DRAIN_SECONDS}s, killing it")
+                process.terminate()
+                process.join(10)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+    def _drain_status(self):
+        while True:
+            try:
+                index, cycle_seconds = self.services.status_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.workers[index].last_report = time.monotonic()
+            for symbol, seconds in cycle_seconds.items():
+                previous = self.costs.get(symbol)
+                self.costs[symbol] = seconds if previous is None else \
+                    (1 - COST_SMOOTHING) * previous + COST_SMOOTHING * seconds
+
+    def check(self):
+        """Restarts exited or stalled workers and rebalances when due; call it periodically."""
+        self._drain_status()
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if worker.process is not None and worker.process.is_alive():
+                if now - worker.last_report > WORKER_STALL_SECONDS:
+                    print(f"Worker {index} reported no cycle for {now - worker.last_report:.0f}s, restarting it")
+                    self._stop_workers([index])
+                else:
+                    if now - worker.started_at > STABLE_AFTER:
+                        worker.restarts = 0
+                    continue
+            if worker.process is not None:
+                backoff = min(MAX_RESTART_BACKOFF, 2 ** worker.restarts)
+                print(f"Worker {index} exited with code {worker.process.exitcode}, restarting in {backoff}s")
+                worker.process = None
+                worker.restart_at = now + backoff
+                worker.restarts += 1
+            if now >= worker.restart_at:
+                self._spawn(index)
+        if now - self.last_rebalance >= REBALANCE_INTERVAL:
+            self.rebalance()
+
+    def _load(self, symbols: list):
+        default = sum(self.costs.values()) / len(self.costs) if self.costs else 1.0
+        return sum(self.costs.get(symbol, default) for symbol in symbols)
+
+    def rebalance(self):
+        """
+        Reassigns the shards by measured cycle time if that lowers the busiest
+        worker's load by REBALANCE_GAIN; restarts only the workers whose shard changes.
+
+        Returns:
+            bool: True if the shards changed
+        """
+        self.last_rebalance = time.monotonic()
+        if not self.shard or not self.costs:
+            return False
+        shards = shard_symbols(self.symbols, len(self.workers), self.costs)
+        current = max(self._load(worker.symbols) for worker in self.workers)
+        proposed = max(self._load(shard) for shard in shards)
+        if proposed > current * (1 - REBALANCE_GAIN):
+            return False
+
+        print(f"Rebalancing shards: busiest worker {current:.1f}s -> {proposed:.1f}s per cycle")
+        # Each new shard goes to the worker already holding most of its symbols
+        unassigned = list(range(len(self.workers)))
+        moved = {}
+        for shard in sorted(shards, key=len, reverse=True):
+            index = max(unassigned, key=lambda index: len(set(shard) & set(self.workers[index].symbols)))
+            unassigned.remove(index)
+            if set(shard) != set(self.workers[index].symbols):
+                moved[index] = shard
+        # Every worker giving up a symbol exits before any worker picks it up
+        self._stop_workers(list(moved))
+        for index, shard in moved.items():
+            worker = self.workers[index]
+            worker.symbols = shard
+            worker.process = None
+            worker.restart_at = 0.0
+            self._spawn(index)
+        return True
+
+    def stop(self):
+        if self.services is not None:
+            self._stop_workers(list(range(len(self.workers))))
+        if self.services is not None:
+            self.services.db_queue.put(None)
+            self.writer.join(30)
+            if self.services.prices is not None:
+                self.services.prices.close()
@@ -0,0 +1,19 @@
+"""
+Test setup: a throwaway database and dummy API keys, set before the bot's
+modules (which connect at import time) are imported.
+
+TEST_DATABASE_URL runs the database tests against another database, e.g. a
+local Postgres: TEST_DATABASE_URL=postgresql://postgres@localhost/test pytest
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Never the DATABASE_URL of .env: the tests write and truncate tables
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or \
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='gemini-trader-tests-'), 'test.db')}"
+os.environ.setdefault("GOOGLE_API_KEY", "test")
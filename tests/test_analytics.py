@@ -0,0 +1,116 @@
+"""The analytics column caches: incremental refreshes, rows changed in place, eviction."""
+
+import uuid
+import pytest
+from sqlalchemy import update
+import analytics
+from analytics import AnalyticsCache, ColumnCache
+from database import init_db, engine, SessionLocal, BybitTradeHistory, bump_table_version
+
+
+@pytest.fixture(autouse=True, scope="module")
+def schema():
+    init_db()
+
+
+@pytest.fixture
+def symbol():
+    # A fresh symbol per test: the tests share the database
+    return f"T{uuid.uuid4().hex[:8].upper()}USDT"
+
+
+@pytest.fixture
+def first_id():
+    # Explicit ids, far above the ones the sequence hands out to the other tests
+    return 1_000_000_000 + uuid.uuid4().int % 100_000_000 * 10
+
+
+def store(symbol, exec_time, pnl, id=None):
+    db = SessionLocal()
+    try:
+        row = BybitTradeHistory(id=id, exec_id=uuid.uuid4().hex, symbol=symbol, category="linear",
+                                exec_time=exec_time, pnl=pnl)
+        db.add(row)
+        db.commit()
+        return row.id
+    finally:
+        db.close()
+
+
+def column_cache(symbol):
+    return ColumnCache("bybit_trade_history", ("pnl",), {"symbol": symbol})
+
+
+def test_refresh_appends_new_rows_in_time_order(symbol, tmp_path):
+    cache = column_cache(symbol)
+    store(symbol, 2_000, 2.0)
+    assert cache.refresh(engine, str(tmp_path)) == 1
+    store(symbol, 1_000, 1.0)
+    assert cache.refresh(engine, str(tmp_path)) == 1
+    assert cache.time.tolist() == [1_000, 2_000]
+    assert cache.columns["pnl"].tolist() == [1.0, 2.0]
+    assert cache.refresh(engine, str(tmp_path)) == 0
+
+
+def test_rows_committed_out_of_id_order_are_picked_up(symbol, first_id, tmp_path):
+    cache = column_cache(symbol)
+    first = store(symbol, 1_000, 1.0, id=first_id)
+    # A concurrent writer took the next id but commits after a later one
+    store(symbol, 3_000, 3.0, id=first + 2)
+    cache.refresh(engine, str(tmp_path))
+    store(symbol, 2_000, 2.0, id=first + 1)
+    assert cache.refresh(engine, str(tmp_path)) == 1
+    assert cache.columns["pnl"].tolist() == [1.0, 2.0, 3.0]
+    assert sorted(cache.ids.tolist()) == [first, first + 1, first + 2]
+
+
+def test_overlap_covers_refresh_overlap_seconds(symbol, first_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "REFRESH_OVERLAP_SECONDS", 60)
+    cache = column_cache(symbol)
+    first = store(symbol, 1_000_000, 1.0, id=first_id)
+    store(symbol, 1_000_000 + 61_000, 2.0, id=first + 3)
+    cache.refresh(engine, str(tmp_path))
+    store(symbol, 1_000_000 + 500, 3.0, id=first + 1)
+    store(symbol, 1_000_000 + 61_000 - 60_000, 4.0, id=first + 2)
+    # Only the row within the overlap of the newest time is picked up
+    assert cache.refresh(engine, str(tmp_path)) == 1
+    assert cache.columns["pnl"].tolist() == [1.0, 4.0, 2.0]
+
+
+def test_rows_changed_in_place_reload_the_cache(symbol, tmp_path):
+    cache = column_cache(symbol)
+    id = store(symbol, 1_000, 1.0)
+    cache.refresh(engine, str(tmp_path))
+    generation = cache.generation
+    with engine.begin() as connection:
+        connection.execute(update(BybitTradeHistory).where(BybitTradeHistory.id == id).values(pnl=5.0))
+        bump_table_version(connection, "bybit_trade_history")
+    cache.refresh(engine, str(tmp_path))
+    assert cache.columns["pnl"].tolist() == [5.0]
+    assert cache.generation != generation
+
+
+def test_reloaded_cache_invalidates_results(symbol, tmp_path):
+    results = AnalyticsCache()
+    cache = results.column_cache("bybit_trade_history", ("pnl",), {"symbol": symbol})
+    id = store(symbol, 1_000, 1.0)
+
+    def total(key):
+        return results.get(key, cache, None, None, lambda cache: float(cache.columns["pnl"].sum()),
+                           engine=engine, archive_dir=str(tmp_path))
+
+    assert total("total") == 1.0
+    with engine.begin() as connection:
+        connection.execute(update(BybitTradeHistory).where(BybitTradeHistory.id == id).values(pnl=5.0))
+        bump_table_version(connection, "bybit_trade_history")
+    assert total("total") == 5.0
+
+
+def test_column_caches_evict_the_least_recently_used():
+    results = AnalyticsCache(column_caches=2)
+    first = results.column_cache("bybit_trade_history", ("pnl",), {"symbol": "AUSDT"})
+    results.column_cache("bybit_trade_history", ("pnl",), {"symbol": "BUSDT"})
+    assert results.column_cache("bybit_trade_history", ("pnl",), {"symbol": "AUSDT"}) is first
+    results.column_cache("bybit_trade_history", ("pnl",), {"symbol": "CUSDT"})
+    assert [key[2] for key in results.columns] == [(("symbol", "AUSDT"),), (("symbol", "CUSDT"),)]
+    assert results.column_cache("bybit_trade_history", ("pnl",), {"symbol": "AUSDT"}) is first
@@ -0,0 +1,105 @@
+"""Archival of the history tables to Parquet: interrupted runs and executions fetched again."""
+
+import os
+import time
+import uuid
+import datetime
+import pytest
+from sqlalchemy import select
+import archive
+from archive import archive_table, read_history, pending_path, write_day_files, _rows, history_table
+from bybit_tools import store_trade_history_to_db
+from database import init_db, engine, SessionLocal, BybitTradeHistory, SymbolPnl
+
+# Executions of 2001, archived with a cutoff in 2002
+OLD = int(datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+CUTOFF = datetime.datetime(2002, 1, 1)
+
+
+@pytest.fixture(autouse=True, scope="module")
+def schema():
+    init_db()
+
+
+@pytest.fixture
+def symbol():
+    # A fresh symbol per test: the tests share the database
+    return f"T{uuid.uuid4().hex[:8].upper()}USDT"
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    return str(tmp_path)
+
+
+def execution(symbol, exec_id, side, qty, price, exec_time):
+    return {"execId": exec_id, "symbol": symbol, "side": side, "execQty": str(qty), "execPrice": str(price),
+            "execValue": str(qty * price), "execFee": "0", "execType": "Trade", "execTime": str(exec_time)}
+
+
+def ledger_totals(symbol):
+    db = SessionLocal()
+    try:
+        row = db.get(SymbolPnl, ("linear", symbol))
+        return row.position_qty, row.cost
+    finally:
+        db.close()
+
+
+def test_archive_dir_must_be_absolute():
+    assert not archive.archive_configured(None)
+    assert not archive.archive_configured("archive")
+    assert archive.archive_history(90, archive_dir="archive") == {}
+    assert archive.archive_dataset("bybit_trade_history", "archive") is None
+
+
+def test_refetching_archived_executions_skips_them(symbol, archive_dir):
+    executions = [
+        execution(symbol, f"{symbol}-1", "Buy", 5, 1.0, OLD),
+        execution(symbol, f"{symbol}-2", "Sell", 5, 2.0, OLD + 60_000),
+        execution(symbol, f"{symbol}-3", "Buy", 5, 3.0, int(time.time() * 1000)),
+    ]
+    assert store_trade_history_to_db(executions)["stored_count"] == 3
+    assert ledger_totals(symbol) == (5.0, 15.0)
+    assert archive_table("bybit_trade_history", CUTOFF, archive_dir=archive_dir) >= 2
+
+    summary = store_trade_history_to_db(executions[:2])
+    assert (summary["stored_count"], summary["archived_count"]) == (0, 2)
+    assert ledger_totals(symbol) == (5.0, 15.0)
+    history = read_history("bybit_trade_history", where={"symbol": symbol}, archive_dir=archive_dir)
+    assert history["exec_id"].tolist() == [f"{symbol}-1", f"{symbol}-2", f"{symbol}-3"]
+
+
+def interrupted_chunk(symbol, archive_dir, commit: bool):
+    """Writes the pending files of a chunk of `symbol`'s rows, deleting them from the database if `commit`."""
+    model = history_table("bybit_trade_history")
+    with engine.begin() as connection:
+        rows = connection.execute(select(model).where(model.c.symbol == symbol).order_by(model.c.id)).mappings().all()
+        paths = write_day_files("bybit_trade_history", _rows("bybit_trade_history", rows), archive_dir)
+        if commit:
+            connection.execute(model.delete().where(model.c.symbol == symbol))
+    return paths
+
+
+@pytest.mark.parametrize("committed", [False, True])
+def test_resume_after_an_interrupted_chunk(symbol, archive_dir, committed):
+    store_trade_history_to_db([execution(symbol, f"{symbol}-{index}", "Buy", 1, 1.0, OLD + index * 3_600_000)
+                               for index in range(3)])
+    paths = interrupted_chunk(symbol, archive_dir, commit=committed)
+    assert all(os.path.exists(pending_path(path)) for path in paths)
+    # Readers skip the pending files
+    history = read_history("bybit_trade_history", where={"symbol": symbol}, archive_dir=archive_dir)
+    assert len(history) == (0 if committed else 3)
+
+    # The next run publishes a committed chunk and re-archives the rows of one that wasn't
+    archive_table("bybit_trade_history", CUTOFF, archive_dir=archive_dir)
+    assert not any(os.path.exists(pending_path(path)) for path in paths)
+    assert all(os.path.exists(path) for path in paths)
+    history = read_history("bybit_trade_history", where={"symbol": symbol}, archive_dir=archive_dir)
+    assert history["exec_id"].tolist() == [f"{symbol}-{index}" for index in range(3)]
+    db = SessionLocal()
+    try:
+        assert db.query(BybitTradeHistory).filter(BybitTradeHistory.symbol == symbol).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,173 @@
+"""AsyncBybitClient, the snapshot fetch and its use by the cycle, against the local mock API."""
+
+import asyncio
+import pandas as pd
+import pytest
+import bybit_tools
+from bybit_async import AsyncBybitClient, fetch_symbol_snapshot, fetch_watchlist_snapshots
+from bybit_mock_server import MockBybitServer, build_kline_list
+
+API_KEY = "test-key"
+API_SECRET = "test-secret"
+
+
+@pytest.fixture
+def server():
+    # The server checks the HMAC of every private request with the secret
+    with MockBybitServer(api_secret=API_SECRET) as server:
+        yield server
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def with_client(server, call, api_secret=API_SECRET):
+    async with AsyncBybitClient(base_url=server.url, api_key=API_KEY, api_secret=api_secret) as client:
+        return await call(client)
+
+
+def test_signed_get_is_accepted(server):
+    response = run(with_client(server, lambda client: client.get_wallet_balance(accountType="UNIFIED", coin="USDT")))
+    assert response["retCode"] == 0
+    assert response["result"]["list"][0]["coin"][0]["coin"] == "USDT"
+
+
+def test_wrong_secret_is_rejected(server):
+    response = run(with_client(server, lambda client: client.get_positions(category="linear", symbol="XRPUSDT"),
+                               api_secret="wrong"))
+    assert response["retCode"] == 10003
+
+
+def test_signed_post_places_order(server):
+    response = run(with_client(server, lambda client: client.post(
+        "/v5/order/create", category="linear", symbol="XRPUSDT", side="Buy", orderType="Market", qty="10")))
+    assert response["retCode"] == 0
+    assert server.state.positions["XRPUSDT"]["size"] == "10.0"
+
+
+def test_private_request_without_keys_raises(server):
+    async def call(client):
+        client.api_key = client.api_secret = None
+        return await client.get_positions(category="linear", symbol="XRPUSDT")
+
+    with pytest.raises(PermissionError):
+        run(with_client(server, call))
+
+
+def test_klines_parse_oldest_first(server):
+    response = run(with_client(server, lambda client: client.get_kline(
+        category="linear", symbol="XRPUSDT", interval=60, limit=50)))
+    frame = bybit_tools.klines_to_dataframe(response)
+    assert len(frame) == 50
+    assert frame.index.is_monotonic_increasing
+    assert list(frame.columns) == ["open", "high", "low", "close", "volume", "turnover"]
+    assert all(dtype == float for dtype in frame.dtypes)
+    newest = build_kline_list("XRPUSDT", 60, 1)[0]
+    assert frame["close"].iloc[-1] == pytest.approx(float(newest[4]))
+
+
+def test_klines_error_response_parses_empty():
+    assert bybit_tools.klines_to_dataframe({"retCode": 10001, "retMsg": "error", "result": {}}).empty
+
+
+def test_perp_snapshot(server):
+    server.state.place_order({"category": "linear", "symbol": "XRPUSDT", "side": "Sell", "qty": "5"})
+    snapshot = run(with_client(server, lambda client: fetch_symbol_snapshot(client, "XRPUSDT", 60, "perp", limit=100)))
+    assert len(snapshot["market_data"]) == 100
+    assert snapshot["position"]["has_position"] and snapshot["position"]["side"] == "Sell"
+    assert snapshot["position"]["size"] == 5.0
+    assert snapshot["wallet"]["retCode"] == 0
+    assert snapshot["last_price"] > 0
+    assert snapshot["instrument_info"]["result"]["list"][0]["lotSizeFilter"]["qtyStep"] == "0.1"
+
+
+def test_spot_snapshot(server):
+    server.state.coins["XRP"] = 12.5
+    snapshot = run(with_client(server, lambda client: fetch_symbol_snapshot(client, "XRPUSDT", 60, "spot", limit=10)))
+    assert snapshot["position"]["has_position"]
+    assert snapshot["position"]["size"] == 12.5
+    assert snapshot["position"]["positionValue"] == pytest.approx(12.5 * snapshot["last_price"])
+    assert snapshot["instrument_info"] == {}
+
+
+def test_snapshot_fetches_only_new_candles(server):
+    full = run(with_client(server, lambda client: client.get_kline(
+        category="linear", symbol="XRPUSDT", interval=60, limit=200)))
+    window = bybit_tools.klines_to_dataframe(full)
+    requested = []
+
+    async def call(client):
+        get_kline = client.get_kline
+
+        async def counting_get_kline(**kwargs):
+            requested.append(kwargs["limit"])
+            return await get_kline(**kwargs)
+        client.get_kline = counting_get_kline
+        return await fetch_symbol_snapshot(client, "XRPUSDT", 60, "perp", limit=200, candles=window.iloc[:-3])
+
+    snapshot = run(with_client(server, call))
+    assert requested[0] < 10
+    pd.testing.assert_frame_equal(snapshot["market_data"], window)
+
+
+def test_snapshot_degrades_on_failed_requests():
+    # Nothing listens on the port: every request fails
+    async def call():
+        async with AsyncBybitClient(base_url="http://127.0.0.1:9", api_key=API_KEY, api_secret=API_SECRET) as client:
+            return await fetch_symbol_snapshot(client, "XRPUSDT", 60, "perp", limit=10)
+
+    snapshot = run(call())
+    assert snapshot["market_data"] is None
+    assert snapshot["position"]["side"] == "Error"
+    assert snapshot["wallet"]["retCode"] == -1
+    assert snapshot["last_price"] == 0.0
+
+
+def test_requests_take_tokens_from_the_rate_limiter(server, monkeypatch):
+    class CountingLimiter:
+        acquired = 0
+
+        def acquire(self, tokens: float = 1.0):
+            self.acquired += 1
+
+    limiter = CountingLimiter()
+    monkeypatch.setattr(bybit_tools, "rate_limiter", limiter)
+    snapshots = run(fetch_watchlist_snapshots(
+        ["XRPUSDT", "BTCUSDT"], 60, "perp", limit=10,
+        client=AsyncBybitClient(base_url=server.url, api_key=API_KEY, api_secret=API_SECRET)))
+    assert set(snapshots) == {"XRPUSDT", "BTCUSDT"}
+    # klines, position, wallet, ticker and instrument info per symbol
+    assert limiter.acquired == 10
+
+
+def test_cycle_uses_prefetched_snapshots(server, monkeypatch):
+    import graph
+    monkeypatch.setenv("BYBIT_BASE_URL", server.url)
+    monkeypatch.setenv("BYBIT_API_KEY_TESTNET", API_KEY)
+    monkeypatch.setenv("BYBIT_API_SECRET_TESTNET", API_SECRET)
+    server.state.place_order({"category": "linear", "symbol": "BTCUSDT", "side": "Buy", "qty": "2"})
+
+    snapshots = graph.prefetch_snapshots(["XRPUSDT", "BTCUSDT"], 60, "perp")
+    assert set(snapshots) == {"XRPUSDT", "BTCUSDT"}
+
+    def no_reads(*args, **kwargs):
+        raise AssertionError("the fetch branches read the exchange despite the snapshot")
+    monkeypatch.setattr(graph, "get_open_position", no_reads)
+    monkeypatch.setattr(graph, "update_candles", no_reads)
+
+    state = {"symbol": "BTCUSDT", "interval": 60, "trading_mode": "perp", "snapshot": snapshots["BTCUSDT"]}
+    assert graph.fetch_position(state)["position"]["size"] == 2.0
+    assert graph.fetch_wallet(state)["wallet"]["retCode"] == 0
+    assert graph.fetch_instrument_info(state)["instrument_info"]["retCode"] == 0
+    klines = graph.fetch_klines(state)
+    assert len(klines["market_data"]) == 1000 and klines["candles"] is snapshots["BTCUSDT"]["market_data"]
+    # The indicators were computed for the whole watchlist at prefetch
+    assert klines["market_data"] is snapshots["BTCUSDT"]["enriched"]
+    assert "RSI_14" in klines["market_data"]
+
+
+def test_no_prefetch_on_a_simulated_exchange(monkeypatch):
+    import graph
+    monkeypatch.setattr(bybit_tools, "session", object())
+    assert graph.prefetch_snapshots(["XRPUSDT", "BTCUSDT"], 60, "perp") == {}
@@ -0,0 +1,151 @@
+"""Streaming exports: each format and compression decoded back, the filters, archived rows first."""
+
+import io
+import gzip
+import uuid
+import datetime
+import orjson
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import pytest
+import zstandard
+from sqlalchemy import select
+from archive import archive_table, arrow_schema, history_table
+from database import init_db, engine, SessionLocal, BybitTradeHistory, TradeHistory
+from export import iter_batches, encode_batches, compress_chunks
+
+DAY = 86_400_000
+# Executions of 2001, archived with a cutoff in 2002
+OLD = int(datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+CUTOFF = datetime.datetime(2002, 1, 1)
+# The columns compared with the source rows, none of them null
+COLUMNS = ("id", "exec_id", "symbol", "side", "exec_price", "exec_qty", "is_maker", "exec_time")
+
+
+@pytest.fixture(autouse=True, scope="module")
+def schema():
+    init_db()
+
+
+@pytest.fixture
+def symbol():
+    # A fresh symbol per test: the tests share the database
+    return f"T{uuid.uuid4().hex[:8].upper()}USDT"
+
+
+def store(symbol, exec_times):
+    db = SessionLocal()
+    try:
+        for index, exec_time in enumerate(exec_times):
+            db.add(BybitTradeHistory(exec_id=f"{symbol}-{index}", symbol=symbol, category="linear",
+                                     side="Buy" if index % 2 else "Sell", exec_price=100.0 + index,
+                                     exec_qty=0.5 * (index + 1), is_maker=bool(index % 2), exec_time=exec_time))
+        db.commit()
+    finally:
+        db.close()
+
+
+def source_rows(symbol):
+    model = history_table("bybit_trade_history")
+    with engine.connect() as connection:
+        rows = connection.execute(select(model).where(model.c.symbol == symbol)
+                                  .order_by(model.c.exec_time, model.c.id)).mappings().all()
+    return [{name: row[name] for name in COLUMNS} for row in rows]
+
+
+def export(table, fmt, compression="none", **kwargs):
+    batches = iter_batches(table, engine=engine, **kwargs)
+    return b"".join(compress_chunks(encode_batches(table, batches, fmt), compression))
+
+
+def decode(table, data, fmt, compression="none"):
+    """The exported rows as dicts."""
+    if compression == "gzip":
+        data = gzip.decompress(data)
+    elif compression == "zstd":
+        # A streamed frame doesn't record its size, so it is read back as a stream too
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if fmt == "ndjson":
+        return [orjson.loads(line) for line in data.splitlines()]
+    if fmt == "csv":
+        schema = arrow_schema(table)
+        options = pa_csv.ConvertOptions(column_types=schema, strings_can_be_null=True)
+        return pa_csv.read_csv(io.BytesIO(data), convert_options=options).to_pylist()
+    return pq.read_table(io.BytesIO(data)).to_pylist()
+
+
+def exported(data, fmt, compression="none"):
+    return [{name: row[name] for name in COLUMNS} for row in decode("bybit_trade_history", data, fmt, compression)]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+@pytest.mark.parametrize("fmt", ["csv", "ndjson", "parquet"])
+def test_round_trip(symbol, fmt, compression):
+    store(symbol, [OLD + index * DAY for index in range(5)])
+    # Batches of two rows: the output is encoded and compressed across several chunks
+    data = export("bybit_trade_history", fmt, compression, where={"symbol": symbol}, batch_size=2)
+    assert exported(data, fmt, compression) == source_rows(symbol)
+
+
+def test_every_column_survives_parquet(symbol):
+    store(symbol, [OLD])
+    data = export("bybit_trade_history", "parquet", where={"symbol": symbol})
+    table = pq.read_table(io.BytesIO(data))
+    assert table.schema == arrow_schema("bybit_trade_history")
+    db = SessionLocal()
+    try:
+        row = db.query(BybitTradeHistory).filter(BybitTradeHistory.symbol == symbol).one()
+        columns = BybitTradeHistory.__table__.columns
+        assert table.to_pylist() == [{column.name: getattr(row, column.name) for column in columns}]
+    finally:
+        db.close()
+
+
+def test_time_and_where_filters(symbol):
+    store(symbol, [OLD + index * DAY for index in range(5)])
+    store(f"{symbol}X", [OLD + DAY])
+    start = datetime.datetime(2001, 1, 2)
+    end = datetime.datetime(2001, 1, 4)
+    data = export("bybit_trade_history", "ndjson", where={"symbol": symbol, "category": "linear"}, start=start, end=end)
+    # [start, end): the second and third executions
+    assert exported(data, "ndjson") == source_rows(symbol)[1:3]
+    assert export("bybit_trade_history", "ndjson", where={"symbol": symbol, "category": "spot"}) == b""
+
+
+def test_archived_rows_come_before_the_database_rows(symbol, tmp_path):
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000)
+    store(symbol, [OLD, OLD + DAY, now])
+    rows = source_rows(symbol)
+    archive_table("bybit_trade_history", CUTOFF, archive_dir=str(tmp_path))
+    assert source_rows(symbol) == rows[2:]
+
+    for fmt in ("csv", "ndjson", "parquet"):
+        data = export("bybit_trade_history", fmt, where={"symbol": symbol}, include_archive=True,
+                      archive_dir=str(tmp_path))
+        assert exported(data, fmt) == rows
+    data = export("bybit_trade_history", "ndjson", where={"symbol": symbol}, archive_dir=str(tmp_path))
+    assert exported(data, "ndjson") == rows[2:]
+    # The time range applies to the archived rows too
+    data = export("bybit_trade_history", "ndjson", where={"symbol": symbol}, include_archive=True,
+                  archive_dir=str(tmp_path), start=datetime.datetime(2001, 1, 2))
+    assert exported(data, "ndjson") == rows[1:]
+
+
+def test_json_columns_are_exported_as_text(symbol):
+    decision = {"action": "BUY", "confidence": 0.8}
+    db = SessionLocal()
+    try:
+        db.add(TradeHistory(symbol=symbol, action="BUY", quantity=1.0, price=100.0, llm_decision=decision))
+        db.commit()
+    finally:
+        db.close()
+    for fmt in ("csv", "ndjson", "parquet"):
+        rows = decode("trade_history", export("trade_history", fmt, where={"symbol": symbol}), fmt)
+        assert [orjson.loads(row["llm_decision"]) for row in rows] == [decision]
+
+
+def test_unknown_format_or_compression():
+    with pytest.raises(ValueError):
+        list(encode_batches("bybit_trade_history", [], "xml"))
+    with pytest.raises(ValueError):
+        list(compress_chunks([b""], "brotli"))
@@ -0,0 +1,138 @@
+"""
+The numba indicator backend against pandas_ta, column by column, and the
+indicators of a watchlist computed together.
+
+The parity cases cover the edge cases of the pandas_ta computations: flat
+stretches that hit the non_zero_range epsilon, constant series, series too
+short for an indicator and leading gaps in a panel.
+"""
+
+import functools
+import numpy as np
+import pandas as pd
+import pytest
+from bybit_mock_server import build_kline_list
+from bybit_tools import klines_to_dataframe
+from data_processor import (
+    INDICATOR_COLUMNS, add_technical_indicators, add_indicators_to_frames, compute_indicator_panel, stack_frames
+)
+
+# Allowed relative error per value
+TOLERANCE = 1e-9
+
+
+def ohlcv(close, start="2025-01-01"):
+    close = np.asarray(close, dtype=float)
+    index = pd.date_range(start, periods=len(close), freq="5min")
+    return pd.DataFrame({
+        "open": close, "high": close * 1.001, "low": close * 0.999, "close": close,
+        "volume": 1.0, "turnover": close,
+    }, index=index)
+
+
+def parity_cases(seed: int = 7):
+    rng = np.random.default_rng(seed)
+    walk = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 1000)))
+    flat = walk.copy()
+    flat[100:140] = flat[100]  # zero band width and zero RSI range
+    steps = np.round(walk, 0)  # coarse ticks: repeated closes everywhere
+    cases = {
+        "mock_klines[1000]": klines_to_dataframe(
+            {"retCode": 0, "result": {"list": build_kline_list("XRPUSDT", 5, 1000)}}
+        ),
+        "random_walk[1000]": ohlcv(walk),
+        "flat_stretch[1000]": ohlcv(flat),
+        "integer_ticks[1000]": ohlcv(steps),
+        "constant[100]": ohlcv(np.full(100, 2.5)),
+        "uptrend[200]": ohlcv(np.linspace(1, 2, 200)),
+    }
+    for length in (3, 5, 10, 11, 12, 14, 15, 20, 30, 33, 34):  # around the minimum lengths
+        cases[f"short[{length}]"] = ohlcv(walk[:length])
+    return cases
+
+
+CASES = parity_cases()
+
+
+@functools.lru_cache(maxsize=None)
+def expected(name):
+    return add_technical_indicators(CASES[name].copy(), backend="pandas_ta")
+
+
+def assert_column_matches(want, got, column):
+    """pandas_ta's column `want` (None when it adds none) against numba's `got`."""
+    if want is None:
+        # pandas_ta adds no column when the series is too short
+        assert np.isnan(got).all(), f"{column}: pandas_ta has no column but numba has values"
+        return
+    want = want.to_numpy()
+    nan_mismatch = np.isnan(want) != np.isnan(got)
+    assert not nan_mismatch.any(), \
+        f"{column}: NaN (warm-up) rows differ at {np.flatnonzero(nan_mismatch)[:5].tolist()}"
+    valid = ~np.isnan(want)
+    error = np.abs(want[valid] - got[valid]) / np.maximum(1.0, np.abs(want[valid]))
+    assert not error.size or error.max() <= TOLERANCE, f"{column}: max relative error {error.max():.3g}"
+
+
+@pytest.mark.parametrize("column", INDICATOR_COLUMNS)
+@pytest.mark.parametrize("name", list(CASES))
+def test_numba_matches_pandas_ta(name, column):
+    actual = add_technical_indicators(CASES[name].copy(), backend="numba")
+    assert list(actual.columns[-len(INDICATOR_COLUMNS):]) == INDICATOR_COLUMNS
+    assert_column_matches(expected(name).get(column), actual[column].to_numpy(), column)
+
+
+@pytest.mark.parametrize("column", INDICATOR_COLUMNS)
+def test_warm_up_rows_are_nan(column):
+    want = expected("random_walk[1000]")[column].to_numpy()
+    got = add_technical_indicators(CASES["random_walk[1000]"].copy(), backend="numba")[column].to_numpy()
+    warm_up = np.flatnonzero(~np.isnan(want))[0]
+    assert warm_up > 0 and np.isnan(got[:warm_up]).all() and not np.isnan(got[warm_up:]).any()
+
+
+@pytest.mark.parametrize("column", INDICATOR_COLUMNS)
+def test_panel_matches_pandas_ta(column):
+    # Symbols with different history lengths: leading NaNs in the panel
+    index = CASES["random_walk[1000]"].index
+    frames = {}
+    for i, (name, frame) in enumerate(CASES.items()):
+        frame = frame.iloc[i * 37 % len(frame):]
+        frames[name] = frame.set_axis(index[-len(frame):])
+    index, symbols, arrays = stack_frames(frames)
+    panel = compute_indicator_panel(arrays["close"], symbols)
+    for name, frame in frames.items():
+        want = add_technical_indicators(frame.copy(), backend="pandas_ta").get(column)
+        got = panel.frame(name, index).reindex(frame.index)[column].to_numpy()
+        assert_column_matches(want, got, f"{name} {column}")
+
+
+@pytest.fixture
+def watchlist():
+    rng = np.random.default_rng(7)
+    walk = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 300)))
+    full = ohlcv(walk)
+    return {
+        "AUSDT": full,
+        "BUSDT": ohlcv(walk * 2).iloc[120:],  # shorter history, same last candle
+        "CUSDT": ohlcv(walk[:20]).set_axis(full.index[-20:]),  # too short for MACD and StochRSI
+        "DUSDT": ohlcv(walk[:200]),  # ends earlier: computed on its own
+        "EUSDT": ohlcv([]),
+    }
+
+
+@pytest.mark.parametrize("backend", ["numba", "pandas_ta"])
+def test_watchlist_matches_one_symbol_at_a_time(watchlist, backend):
+    before = {symbol: frame.copy() for symbol, frame in watchlist.items()}
+    enriched = add_indicators_to_frames(watchlist, backend=backend)
+    assert set(enriched) == {"AUSDT", "BUSDT", "CUSDT", "DUSDT"}
+    for symbol, frame in enriched.items():
+        pd.testing.assert_frame_equal(frame, add_technical_indicators(before[symbol].copy(), backend=backend))
+        pd.testing.assert_frame_equal(watchlist[symbol], before[symbol])
+
+
+def test_recomputes_indicator_columns_already_present(watchlist):
+    stale = {symbol: watchlist[symbol].assign(**{column: 0.0 for column in INDICATOR_COLUMNS})
+             for symbol in ("AUSDT", "BUSDT")}
+    enriched = add_indicators_to_frames(stale, backend="numba")
+    expected = add_technical_indicators(watchlist["BUSDT"].copy(), backend="numba")
+    pd.testing.assert_frame_equal(enriched["BUSDT"], expected)
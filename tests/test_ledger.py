@@ -0,0 +1,130 @@
+"""The realized PnL ledger, including two writers storing executions of one symbol at once."""
+
+import os
+import uuid
+import threading
+import pytest
+from database import init_db, SessionLocal, SymbolPnl, BybitTradeHistory
+from bybit_tools import store_trade_history_to_db
+from ledger import apply_fill, lock_symbols
+
+POSTGRES = os.environ["DATABASE_URL"].startswith("postgresql")
+
+
+@pytest.fixture(autouse=True, scope="module")
+def schema():
+    init_db()
+
+
+@pytest.fixture
+def symbol():
+    # A fresh symbol per test: the tests share the database
+    return f"T{uuid.uuid4().hex[:8].upper()}USDT"
+
+
+def totals(symbol, category="linear"):
+    db = SessionLocal()
+    try:
+        row = db.get(SymbolPnl, (category, symbol))
+        return row.position_qty, row.cost, round(row.realized_pnl, 6)
+    finally:
+        db.close()
+
+
+def fill(symbol, side, qty, price, exec_id):
+    db = SessionLocal()
+    try:
+        pnl = apply_fill(db, "linear", symbol, side, qty, price, exec_id=exec_id, exec_time=1)
+        db.commit()
+        return pnl
+    finally:
+        db.close()
+
+
+def test_fifo_realizes_against_the_oldest_lots(symbol):
+    fill(symbol, "Buy", 1.0, 100.0, "1")
+    fill(symbol, "Buy", 1.0, 110.0, "2")
+    assert fill(symbol, "Sell", 1.5, 120.0, "3") == pytest.approx(20.0 + 5.0)
+    assert totals(symbol) == (pytest.approx(0.5), pytest.approx(55.0), 25.0)
+
+
+@pytest.mark.skipif(not POSTGRES, reason="row locks need Postgres (TEST_DATABASE_URL)")
+def test_concurrent_writers_do_not_overwrite_each_other(symbol):
+    fill(symbol, "Buy", 2.0, 100.0, "open")
+    first_locked = threading.Event()
+    release = threading.Event()
+    results = {}
+
+    def first_writer():
+        db = SessionLocal()
+        try:
+            lock_symbols(db, "linear", [symbol])
+            first_locked.set()
+            results["first"] = apply_fill(db, "linear", symbol, "Sell", 1.0, 110.0, exec_id="a", exec_time=2)
+            # Hold the lock while the second writer tries to read the symbol
+            release.wait(5)
+            db.commit()
+        finally:
+            db.close()
+
+    def second_writer():
+        first_locked.wait(5)
+        results["second"] = fill(symbol, "Sell", 1.0, 120.0, "b")
+
+    threads = [threading.Thread(target=first_writer), threading.Thread(target=second_writer)]
+    for thread in threads:
+        thread.start()
+    threads[1].join(0.5)
+    # The second writer waits for the first one's lock
+    assert threads[1].is_alive()
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert results == {"first": 10.0, "second": 20.0}
+    assert totals(symbol) == (0.0, 0.0, 30.0)
+
+
+@pytest.mark.skipif(not POSTGRES, reason="row locks need Postgres (TEST_DATABASE_URL)")
+def test_concurrent_first_fills_of_a_new_symbol(symbol):
+    barrier = threading.Barrier(4)
+
+    def writer(index):
+        barrier.wait()
+        fill(symbol, "Buy", 1.0, 100.0 + index, f"buy-{index}")
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert totals(symbol) == (4.0, pytest.approx(406.0), 0.0)
+
+
+def execution(symbol, exec_id, side, qty, price, exec_time, **fields):
+    return {"execId": exec_id, "symbol": symbol, "side": side, "execQty": str(qty), "execPrice": str(price),
+            "execValue": str(qty * price), "execFee": "0", "execType": "Trade", "execTime": str(exec_time), **fields}
+
+
+def test_malformed_execution_leaves_the_ledger_untouched(symbol):
+    summary = store_trade_history_to_db([
+        execution(symbol, f"{symbol}-1", "Buy", 1.0, 100.0, 1_000),
+        execution(symbol, f"{symbol}-2", "Buy", 1.0, 110.0, 2_000, seq="not a number"),
+        execution(symbol, f"{symbol}-3", "Buy", 1.0, 120.0, "later"),
+    ])
+    assert (summary["stored_count"], summary["error_count"]) == (1, 2)
+    assert totals(symbol) == (1.0, 100.0, 0.0)
+
+
+def test_execution_listed_twice_in_a_batch_is_applied_once(symbol):
+    fills = [execution(symbol, f"{symbol}-1", "Buy", 1.0, 100.0, 1_000),
+             execution(symbol, f"{symbol}-2", "Sell", 1.0, 110.0, 2_000)]
+    # Two pages that overlap on one execution
+    summary = store_trade_history_to_db(fills + fills[1:])
+    assert "error" not in summary and summary["stored_count"] == 2
+    assert totals(symbol) == (0.0, 0.0, 10.0)
+    db = SessionLocal()
+    try:
+        assert db.query(BybitTradeHistory).filter(BybitTradeHistory.symbol == symbol).count() == 2
+    finally:
+        db.close()
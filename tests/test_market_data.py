@@ -0,0 +1,90 @@
+"""Derived timeframes (resample_ohlcv) and the incremental candle window (merge_candles)."""
+
+import pandas as pd
+import pytest
+from market_data import resample_ohlcv, merge_candles
+
+
+def minute_candles(start: str, minutes: list):
+    """1-minute candles at `minutes` after `start`; candle i has open i, high i + 0.5, low i - 0.5, close i + 0.25."""
+    index = pd.Timestamp(start) + pd.to_timedelta(minutes, unit="min")
+    values = [float(i) for i in range(len(minutes))]
+    return pd.DataFrame({
+        "open": values,
+        "high": [v + 0.5 for v in values],
+        "low": [v - 0.5 for v in values],
+        "close": [v + 0.25 for v in values],
+        "volume": 1.0,
+        "turnover": values,
+    }, index=index)
+
+
+def bar(start, open_, high, low, close, volume, turnover):
+    return pd.Timestamp(start), [open_, high, low, close, volume, turnover]
+
+
+def assert_bars(frame, expected):
+    assert list(frame.index) == [start for start, _ in expected]
+    assert frame[["open", "high", "low", "close", "volume", "turnover"]].values.tolist() == \
+        [values for _, values in expected]
+
+
+def test_15m_bars_drop_the_partial_leading_bar():
+    # 00:07 .. 00:37: the 00:00 bar is only partly covered, the 00:30 one still in progress
+    candles = minute_candles("2025-01-01 00:07", list(range(31)))
+    assert_bars(resample_ohlcv(candles, 15), [
+        # Candles 8 (00:15) .. 22 (00:29)
+        bar("2025-01-01 00:15", 8.0, 22.5, 7.5, 22.25, 15.0, float(sum(range(8, 23)))),
+        # Candles 23 (00:30) .. 30 (00:37)
+        bar("2025-01-01 00:30", 23.0, 30.5, 22.5, 30.25, 8.0, float(sum(range(23, 31)))),
+    ])
+
+
+def test_bars_align_to_the_epoch_not_the_first_candle():
+    candles = minute_candles("2025-01-01 00:15", list(range(15)))
+    assert_bars(resample_ohlcv(candles, 15), [bar("2025-01-01 00:15", 0.0, 14.5, -0.5, 14.25, 15.0, 105.0)])
+    # An hour bar that starts at 10:30 belongs to 10:00 and is partial
+    candles = minute_candles("2025-01-01 10:30", list(range(100)))
+    assert list(resample_ohlcv(candles, 60).index) == [pd.Timestamp("2025-01-01 11:00"), pd.Timestamp("2025-01-01 12:00")]
+
+
+def test_gap_in_the_base_series():
+    # 00:00 .. 00:19, nothing from 00:20 to 00:49, then 00:50 .. 01:04
+    candles = minute_candles("2025-01-01 00:00", list(range(20)) + list(range(50, 65)))
+    assert_bars(resample_ohlcv(candles, 15), [
+        bar("2025-01-01 00:00", 0.0, 14.5, -0.5, 14.25, 15.0, float(sum(range(0, 15)))),
+        bar("2025-01-01 00:15", 15.0, 19.5, 14.5, 19.25, 5.0, float(sum(range(15, 20)))),
+        # No 00:30 bar: no candle fell in it; 00:45 holds candles 20 (00:50) .. 29 (00:59)
+        bar("2025-01-01 00:45", 20.0, 29.5, 19.5, 29.25, 10.0, float(sum(range(20, 30)))),
+        bar("2025-01-01 01:00", 30.0, 34.5, 29.5, 34.25, 5.0, float(sum(range(30, 35)))),
+    ])
+    assert_bars(resample_ohlcv(candles, 60), [
+        bar("2025-01-01 00:00", 0.0, 29.5, -0.5, 29.25, 30.0, float(sum(range(0, 30)))),
+        bar("2025-01-01 01:00", 30.0, 34.5, 29.5, 34.25, 5.0, float(sum(range(30, 35)))),
+    ])
+
+
+def test_base_interval_is_returned_as_is():
+    candles = minute_candles("2025-01-01 00:07", list(range(5)))
+    assert resample_ohlcv(candles, 1) is candles
+
+
+def test_merge_replaces_the_refetched_candle_and_keeps_the_window():
+    window = minute_candles("2025-01-01 00:00", list(range(10)))
+    # The last cached candle (00:09) was still in progress: it comes back with the two new ones
+    page = minute_candles("2025-01-01 00:09", list(range(3))) + 100.0
+    merged = merge_candles(window, page, count=3, limit=10)
+    assert list(merged.index) == list(pd.date_range("2025-01-01 00:02", periods=10, freq="1min"))
+    assert merged["open"].tolist() == [2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 100.0, 101.0, 102.0]
+
+
+@pytest.mark.parametrize("window, page_minutes, count, expected", [
+    (None, [0, 1], 2, "page"),  # no previous window
+    ("window", [0, 1], 10, "page"),  # a full page replaces the window (gap longer than a page)
+    ("window", [], 2, "window"),  # nothing fetched
+])
+def test_merge_without_an_incremental_page(window, page_minutes, count, expected):
+    candles = {"window": minute_candles("2025-01-01 00:00", list(range(10))), None: None}[window]
+    page = minute_candles("2025-01-01 00:20", page_minutes)
+    merged = merge_candles(candles, page, count=count, limit=10)
+    assert merged is (page if expected == "page" else candles)
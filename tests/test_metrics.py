@@ -0,0 +1,26 @@
+"""The Prometheus endpoint and the span registry."""
+
+import urllib.request
+import pytest
+from metrics import registry, span, start_metrics_server
+
+
+@pytest.fixture
+def server():
+    server = start_metrics_server(0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_listens_on_localhost_only_by_default(server):
+    assert server.server_address[0] == "127.0.0.1"
+
+
+def test_serves_recorded_spans(server):
+    with span("bybit", "get_kline", "XRPUSDT"):
+        pass
+    port = server.server_address[1]
+    body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+    assert 'kind="bybit"' in body and 'symbol="XRPUSDT"' in body
+    assert registry.quantile("bybit", "get_kline", 0.5, "XRPUSDT") >= 0.0
@@ -0,0 +1,267 @@
+"""
+Migration 0003 (monthly partitions) on Postgres while the bot keeps writing,
+and the keyset-chunked backfills with their resume after an interruption.
+
+The partitioning test runs in a database of its own on the server of
+TEST_DATABASE_URL: the legacy single tables are seeded with months of
+history, then converted while a writer thread inserts, updates and deletes
+rows, and the result is compared with the old tables
+(migrations.check_partitions) and with what the writer did.
+"""
+
+import os
+import uuid
+import random
+import datetime
+import threading
+import pytest
+from sqlalchemy import create_engine, text, insert, update, delete
+from sqlalchemy.engine import make_url
+from database import Base, BybitTradeHistory, TradeHistory, BalanceHistory
+from migrations import migrate, migration_rows, check_partitions
+from partitioning import partition_name, month_start, add_months, is_partitioned, PARTITION_MONTHS_AHEAD
+
+POSTGRES = os.environ["DATABASE_URL"].startswith("postgresql")
+
+SEEDED_MONTHS = 4
+SEEDED_ROWS = 3000
+CHUNK_SIZE = 100
+
+
+@pytest.fixture
+def engine():
+    url = make_url(os.environ["DATABASE_URL"])
+    name = f"migration_test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(text(f"CREATE DATABASE {name}"))
+    engine = create_engine(url.set(database=name), pool_size=10)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as connection:
+            connection.execute(text(f"DROP DATABASE {name}"))
+        admin.dispose()
+
+
+def epoch_ms(moment: datetime.datetime):
+    return int(moment.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def seed(engine):
+    """The legacy single tables (as before 0003) with SEEDED_MONTHS months of rows."""
+    Base.metadata.create_all(bind=engine)
+    now = datetime.datetime.utcnow()
+    first = add_months(month_start(now), -SEEDED_MONTHS)
+    span = (now - first).total_seconds()
+    rng = random.Random(7)
+    moments = sorted(first + datetime.timedelta(seconds=rng.uniform(0, span)) for _ in range(SEEDED_ROWS))
+    with engine.begin() as connection:
+        connection.execute(insert(BybitTradeHistory), [
+            {"exec_id": f"seed-{index}", "symbol": rng.choice(["BTCUSDT", "XRPUSDT"]), "side": "Buy",
+             "category": "linear", "exec_qty": 1.0, "exec_price": 100.0 + index, "pnl": 0.0,
+             # A few executions without a time: stored under their insert time
+             "exec_time": None if index % 500 == 0 else epoch_ms(moment), "created_at": moment}
+            for index, moment in enumerate(moments)
+        ])
+        connection.execute(insert(TradeHistory), [
+            {"timestamp": moment, "symbol": "XRPUSDT", "action": "BUY", "quantity": 1.0,
+             "llm_decision": {"action": "BUY", "index": index}}
+            for index, moment in enumerate(moments)
+        ])
+        connection.execute(insert(BalanceHistory), [
+            {"timestamp": moment, "account_type": "UNIFIED_spot", "coin": "USDT", "balance": float(index)}
+            for index, moment in enumerate(moments)
+        ])
+    return first
+
+
+class Writes:
+    """What the writers did."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inserted = {"bybit_trade_history": 0, "trade_history": 0, "balance_history": 0}
+        self.updated = {}  # id -> pnl
+        self.deleted = set()  # id
+
+
+class Writer(threading.Thread):
+    """
+    The live bot: inserts new rows into every history table, and until the
+    swap also updates and deletes old executions of the chunk being copied
+    (so that check_partitions can compare the old table with the new one
+    exactly afterwards).
+    """
+
+    def __init__(self, engine, writes, stopping, seed: int):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.writes = writes
+        self.stopping = stopping
+        self.rng = random.Random(seed)
+        self.error = None
+
+    def run(self):
+        count = 0
+        try:
+            while not self.stopping.is_set():
+                now = datetime.datetime.utcnow()
+                with self.engine.begin() as connection:
+                    # The swap waits for this transaction, or is already done
+                    connection.execute(text("LOCK TABLE bybit_trade_history IN ROW EXCLUSIVE MODE"))
+                    swapped = is_partitioned(connection, "bybit_trade_history")
+                    connection.execute(insert(BybitTradeHistory).values(
+                        exec_id=f"live-{self.name}-{count}", symbol="XRPUSDT", side="Sell", category="linear",
+                        exec_qty=1.0, exec_price=1.0, pnl=0.0, exec_time=epoch_ms(now), created_at=now))
+                    connection.execute(insert(TradeHistory).values(
+                        timestamp=now, symbol="XRPUSDT", action="SELL", llm_decision={"live": count}))
+                    connection.execute(insert(BalanceHistory).values(
+                        timestamp=now, account_type="UNIFIED_spot", coin="USDT", balance=1.0))
+                    copied = connection.execute(text(
+                        "SELECT last_key FROM schema_migrations WHERE version = '0003_history_partitions'"
+                    )).scalar() or 0
+                    row_id = min(copied + self.rng.randint(1, CHUNK_SIZE), SEEDED_ROWS)
+                    # Recorded while the row lock is held, so in the order the writes commit
+                    if not swapped and count % 3 == 2:
+                        if connection.execute(delete(BybitTradeHistory).where(
+                                BybitTradeHistory.id == row_id)).rowcount:
+                            with self.writes.lock:
+                                self.writes.deleted.add(row_id)
+                                self.writes.updated.pop(row_id, None)
+                    elif not swapped:
+                        if connection.execute(update(BybitTradeHistory).where(
+                                BybitTradeHistory.id == row_id).values(pnl=float(count))).rowcount:
+                            with self.writes.lock:
+                                self.writes.updated[row_id] = float(count)
+                with self.writes.lock:
+                    for table in self.writes.inserted:
+                        self.writes.inserted[table] += 1
+                count += 1
+        except Exception as e:
+            self.error = e
+
+
+@pytest.mark.skipif(not POSTGRES, reason="partitioning needs Postgres (TEST_DATABASE_URL)")
+def test_partitioning_under_concurrent_writes(engine):
+    first = seed(engine)
+    writes, stopping = Writes(), threading.Event()
+    writers = [Writer(engine, writes, stopping, seed) for seed in range(4)]
+    for writer in writers:
+        writer.start()
+    try:
+        assert migrate("0003_history_partitions", chunk_size=CHUNK_SIZE, engine=engine)
+        # Writes keep going to the partitioned tables after the swap
+        written = writes.inserted["bybit_trade_history"]
+        while writes.inserted["bybit_trade_history"] < written + 20 and all(w.is_alive() for w in writers):
+            stopping.wait(0.01)
+    finally:
+        stopping.set()
+        for writer in writers:
+            writer.join(10)
+    assert [writer.error for writer in writers] == [None] * len(writers)
+    assert writes.updated and writes.deleted
+
+    # Rows copied unchanged, the partitions of every month, no rows in the default partition
+    assert check_partitions(engine) == []
+    with engine.connect() as connection:
+        for table, inserted in writes.inserted.items():
+            rows = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            removed = len(writes.deleted) if table == "bybit_trade_history" else 0
+            assert rows == SEEDED_ROWS + inserted - removed, table
+            current = month_start(datetime.datetime.utcnow())
+            month = first
+            while month <= add_months(current, PARTITION_MONTHS_AHEAD):
+                assert connection.execute(text("SELECT to_regclass(:name)"),
+                                          {"name": partition_name(table, month)}).scalar() is not None
+                month = add_months(month, 1)
+
+        pnl = dict(connection.execute(text(f"SELECT id, pnl FROM bybit_trade_history WHERE id <= {SEEDED_ROWS}")).all())
+        assert not writes.deleted & set(pnl)
+        assert all(pnl[row_id] == value for row_id, value in writes.updated.items())
+        assert connection.execute(text(
+            "SELECT COUNT(*) FROM bybit_trade_history WHERE exec_time IS NULL")).scalar() == 0
+
+    # New rows get ids from the sequence the partitioned table now owns
+    with engine.begin() as connection:
+        before = connection.execute(text("SELECT MAX(id) FROM bybit_trade_history")).scalar()
+        connection.execute(insert(BybitTradeHistory).values(exec_id="after", exec_time=epoch_ms(datetime.datetime.utcnow())))
+        assert connection.execute(text("SELECT id FROM bybit_trade_history WHERE exec_id = 'after'")).scalar() > before
+
+
+# Keyset-chunked backfills and their resume, on a SQLite database of their own
+
+
+@pytest.fixture
+def backfill_engine(tmp_path, monkeypatch):
+    import migrations
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE backfill_rows (id INTEGER PRIMARY KEY, value INTEGER, "
+                                "doubled INTEGER, touched INTEGER DEFAULT 0)"))
+        # Sparse ids: the chunks are bounded by keys that exist, not by id arithmetic
+        connection.execute(text("INSERT INTO backfill_rows (id, value) VALUES (:id, :value)"),
+                           [{"id": row_id, "value": row_id * 10} for row_id in range(1, 300, 3)])
+    # Doesn't skip backfilled rows, so a chunk run twice would show up in `touched`
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        migrations.Migration("9001_backfill_test", "Backfill test", [
+            migrations.Backfill("backfill_rows", "doubled = value * 2, touched = touched + 1", "value >= 0"),
+        ]),
+    ])
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def backfilled(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT id, value, doubled, touched FROM backfill_rows ORDER BY id")).all()
+
+
+def test_backfill_runs_in_keyset_chunks(backfill_engine, monkeypatch):
+    import migrations
+    bounds = []
+    record_progress = migrations.record_progress
+
+    def recording(connection, version, **values):
+        bounds.append(values.get("last_key"))
+        record_progress(connection, version, **values)
+    monkeypatch.setattr(migrations, "record_progress", recording)
+
+    assert migrate(chunk_size=7, engine=backfill_engine)
+    rows = backfilled(backfill_engine)
+    assert all(doubled == value * 2 and touched == 1 for _, value, doubled, touched in rows)
+    ids = [row_id for row_id, *_ in rows]
+    # Every 7th id, then the last one; then the step and the migration are recorded done
+    chunks = ids[6::7] + ([ids[-1]] if len(ids) % 7 else [])
+    assert bounds[:len(chunks)] == chunks and bounds[len(chunks):] == [None, None]
+
+
+def test_interrupted_backfill_resumes_after_the_last_committed_chunk(backfill_engine, monkeypatch):
+    import migrations
+    record_progress = migrations.record_progress
+    chunks = []
+
+    def crash_in_the_third_chunk(connection, version, **values):
+        if values.get("last_key") is not None:
+            chunks.append(values["last_key"])
+            if len(chunks) == 3:
+                raise RuntimeError("killed")
+        record_progress(connection, version, **values)
+    monkeypatch.setattr(migrations, "record_progress", crash_in_the_third_chunk)
+    assert not migrate(chunk_size=10, engine=backfill_engine)
+
+    committed = chunks[1]
+    row = migration_rows(backfill_engine)["9001_backfill_test"]
+    assert (row["status"], row["step"], row["last_key"]) == ("running", 0, committed)
+    # The third chunk rolled back with its progress
+    assert [row_id for row_id, _, _, touched in backfilled(backfill_engine) if touched] == \
+        [row_id for row_id, *_ in backfilled(backfill_engine) if row_id <= committed]
+
+    monkeypatch.setattr(migrations, "record_progress", record_progress)
+    assert migrate(chunk_size=10, engine=backfill_engine)
+    # Resumed after the second chunk: every row updated exactly once
+    assert all(doubled == value * 2 and touched == 1 for _, value, doubled, touched in backfilled(backfill_engine))
+    assert migration_rows(backfill_engine)["9001_backfill_test"]["status"] == "applied"
@@ -0,0 +1,80 @@
+"""generate_with_deadline against clients with and without native async support."""
+
+import os
+import sys
+import time
+import threading
+import subprocess
+import pytest
+from langchain_core.language_models.llms import LLM
+from model_router import generate_with_deadline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SyncLLM(LLM):
+    """Implements only _call, like GoogleGenerativeAI: agenerate runs it in an executor thread."""
+
+    delay: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "sync-test"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        call = self.calls
+        time.sleep(self.delay if call == 1 else 0.0)
+        return f"answer {call}"
+
+
+def test_answer_within_deadline():
+    result, hedge_won = generate_with_deadline(SyncLLM(delay=0.05), "prompt", 2.0)
+    assert result.generations[0][0].text == "answer 1"
+    assert not hedge_won
+
+
+def test_stuck_sync_call_returns_at_the_deadline():
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        generate_with_deadline(SyncLLM(delay=4.0), "prompt", 1.0)
+    assert time.monotonic() - started < 1.5
+
+
+def test_stuck_sync_call_returns_at_the_deadline_inside_a_running_loop():
+    import asyncio
+
+    async def node():
+        # A graph node invoked from async code still calls synchronously
+        return generate_with_deadline(SyncLLM(delay=4.0), "prompt", 1.0)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(node())
+    assert time.monotonic() - started < 1.5
+
+
+def test_hedge_answers_when_the_first_request_hangs():
+    started = time.monotonic()
+    result, hedge_won = generate_with_deadline(SyncLLM(delay=4.0), "prompt", 2.0, hedge_delay=0.2)
+    assert hedge_won and result.generations[0][0].text == "answer 2"
+    assert time.monotonic() - started < 1.5
+
+
+def test_abandoned_calls_leave_threads_for_later_calls():
+    for _ in range(3):
+        with pytest.raises(TimeoutError):
+            generate_with_deadline(SyncLLM(delay=3.0), "prompt", 0.2)
+    started = time.monotonic()
+    result, _ = generate_with_deadline(SyncLLM(), "prompt", 1.0)
+    assert result.generations[0][0].text == "answer 1"
+    assert time.monotonic() - started < 0.5
+    assert any(thread.name.startswith("llm-call") for thread in threading.enumerate())
+
+
+def test_triage_is_opt_in():
+    env = {name: value for name, value in os.environ.items() if name != "TRIAGE_MODEL"}
+    check = "import model_router; print(model_router.TRIAGE_MODEL, model_router.triage_enabled())"
+    assert subprocess.run([sys.executable, "-c", check], env=env, capture_output=True, text=True,
+                          cwd=ROOT, check=True).stdout.split() == ["none", "False"]
@@ -0,0 +1,67 @@
+"""PositionBook: wallet snapshots, re-sync pacing and storing streamed executions."""
+
+import time
+import pytest
+import position_book
+from position_book import PositionBook
+
+
+def wallet_message(*coins):
+    return {"topic": "wallet", "data": [{"accountType": "UNIFIED", "coin": [
+        {"coin": coin, "walletBalance": str(balance), "equity": str(balance)} for coin, balance in coins
+    ]}]}
+
+
+def test_wallet_update_replaces_the_coins():
+    book = PositionBook(store_executions=False)
+    book.handle_message(wallet_message(("USDT", 100), ("XRP", 50)))
+    book.handle_message(wallet_message(("USDT", 160)))
+    coins = book.get_wallet_balance()["result"]["list"][0]["coin"]
+    assert [(coin["coin"], coin["walletBalance"]) for coin in coins] == [("USDT", "160")]
+    assert book.get_wallet_balance(coin="XRP")["result"]["list"][0]["coin"] == []
+
+
+class FailingRest:
+    calls = 0
+
+    def get_positions(self, **kwargs):
+        self.calls += 1
+        raise ConnectionError("REST unavailable")
+
+    def get_wallet_balance(self, **kwargs):
+        raise ConnectionError("REST unavailable")
+
+
+def test_failed_resync_is_retried_after_the_interval(monkeypatch):
+    monkeypatch.setattr(position_book, "RESYNC_INTERVAL", 0.3)
+    rest = FailingRest()
+    book = PositionBook(rest_session=rest, store_executions=False)
+    assert not book.live()
+    for _ in range(20):
+        assert not book.live()
+    assert rest.calls == 1
+    time.sleep(0.35)
+    assert not book.live()
+    assert rest.calls == 2
+
+
+def test_rejected_execution_batch_is_stored_again(monkeypatch):
+    monkeypatch.setattr(position_book, "EXECUTION_RETRY_SECONDS", 0.05)
+    attempts = []
+
+    def store(executions, category):
+        attempts.append([execution["execId"] for execution in executions])
+        if len(attempts) == 1:
+            return {"stored_count": 0, "error": "database is locked"}
+        return {"stored_count": len(executions)}
+
+    monkeypatch.setattr(position_book, "store_trade_history_to_db", store)
+    book = PositionBook()
+    book.start_writer()
+    book.handle_message({"topic": "execution", "data": [
+        {"execId": "1", "category": "linear"}, {"execId": "2", "category": "linear"}]})
+    deadline = time.monotonic() + 5
+    while len(attempts) < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert attempts[0] == attempts[1] == ["1", "2"]
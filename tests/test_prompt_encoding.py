@@ -0,0 +1,123 @@
+"""The compact prompt encoding: signal features, the encoded fields and its token cost against the JSON baseline."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from bybit_mock_server import build_kline_list
+from bybit_tools import klines_to_dataframe
+from data_processor import add_technical_indicators
+from prompt_encoding import (
+    baseline_input_tokens, encode_compact, encode_json, encode_market_data, estimate_tokens, signal_features
+)
+
+
+def candles(rows):
+    """Indicator rows, oldest first, with the columns of add_technical_indicators the encoding reads."""
+    columns = ["open", "high", "low", "close", "volume", "BBL_5_2.0_2.0", "BBM_5_2.0_2.0", "BBU_5_2.0_2.0",
+               "RSI_14", "MACD_12_26_9", "MACDh_12_26_9", "MACDs_12_26_9", "STOCHRSIk_5_5_3_3", "STOCHRSId_5_5_3_3"]
+    index = pd.date_range("2025-01-01", periods=len(rows), freq="5min")
+    return pd.DataFrame(rows, columns=columns, index=index)
+
+
+# A close below the lower band, RSI oversold, %K crossing up through %D, MACD histogram rising
+OVERSOLD = candles([
+    [0.52, 0.53, 0.51, 0.515, 1000.0, 0.505, 0.52, 0.535, 38.25, -0.001, -0.0004, -0.0006, 5.0, 8.0],
+    [0.515, 0.516, 0.498, 0.50123456, 1500.0, 0.502, 0.515, 0.528, 28.44, -0.0015, -0.0002, -0.0013, 15.06, 9.71],
+])
+
+
+@pytest.fixture(scope="module")
+def market_data():
+    klines = {"retCode": 0, "result": {"list": build_kline_list("XRPUSDT", 5, 200)}}
+    return add_technical_indicators(klines_to_dataframe(klines))
+
+
+def test_signal_features():
+    assert signal_features(OVERSOLD) == {
+        "rsi": 28.4,
+        "rsi_lt30": True,
+        "rsi_lt35": True,
+        "rsi_gt65": False,
+        "rsi_gt70": False,
+        "touch_lower_bb": True,
+        "close_below_lower_bb": True,
+        "touch_upper_bb": False,
+        "close_above_upper_bb": False,
+        "k": 15.1,
+        "d": 9.7,
+        "k_lt20": True,
+        "k_gt80": False,
+        "k_cross_up_d": True,
+        "k_cross_down_d": False,
+        "macd_h_rising": True,
+    }
+
+
+def test_missing_indicators_are_not_signals():
+    df = OVERSOLD.tail(1).copy()
+    df[["RSI_14", "STOCHRSIk_5_5_3_3", "BBL_5_2.0_2.0"]] = np.nan
+    features = signal_features(df)
+    assert (features["rsi"], features["k"], features["d"]) == (None, None, 9.7)
+    # A single candle has no previous one to cross or rise from
+    assert not any(value for name, value in features.items() if name not in ("d", "touch_upper_bb"))
+    assert signal_features(OVERSOLD.iloc[:0]) == {}
+
+
+def test_encode_compact_fields():
+    values, flags, window = encode_compact(OVERSOLD).split("\n")
+    assert values == "rsi=28.4 k=15.1 d=9.7"
+    assert flags == ("true=rsi_lt30,rsi_lt35,touch_lower_bb,close_below_lower_bb,k_lt20,k_cross_up_d,"
+                     "macd_h_rising")
+    # The key columns only, closes to 5 significant digits, oscillators to one decimal
+    assert window == ("last2 close=0.515,0.50123;bbl=0.505,0.502;bbu=0.535,0.528;rsi=38.2,28.4;"
+                      "macd_h=-0.0004,-0.0002;k=5,15.1;d=8,9.7")
+
+
+def test_encode_compact_without_signals():
+    df = OVERSOLD.copy()
+    df["RSI_14"] = [50.0, np.nan]
+    df["STOCHRSIk_5_5_3_3"] = [50.0, 50.0]
+    df["STOCHRSId_5_5_3_3"] = [50.0, 50.0]
+    df["low"] = df["close"] = df["high"] = [0.52, 0.52]
+    df["MACDh_12_26_9"] = [0.0, 0.0]
+    values, flags, window = encode_compact(df, rows=1).split("\n")
+    assert values == "rsi=na k=50 d=50"
+    assert flags == "true=none"
+    assert window.startswith("last1 close=0.52;") and "rsi=na;" in window
+
+
+@pytest.mark.parametrize("rows", [5, 20])
+def test_compact_encoding_costs_fewer_tokens(market_data, rows):
+    text, report = encode_market_data(market_data, "compact", rows)
+    assert text == encode_compact(market_data, rows)
+    assert report["encoding"] == "compact"
+    assert report["estimated_tokens"] == estimate_tokens(text)
+    assert report["baseline_estimated_tokens"] == estimate_tokens(encode_json(market_data, rows))
+    assert report["estimated_tokens"] < report["baseline_estimated_tokens"] / 2
+    assert report["signals"] == signal_features(market_data)
+
+
+def test_json_encoding_is_the_baseline(market_data):
+    text, report = encode_market_data(market_data, "json")
+    assert text == encode_json(market_data)
+    assert report["estimated_tokens"] == report["baseline_estimated_tokens"]
+    with pytest.raises(ValueError):
+        encode_market_data(market_data, "yaml")
+
+
+def test_estimate_tokens():
+    # rsi = 28 . 4 | 123 456 7 | , | Close
+    assert estimate_tokens("rsi=28.4") == 5
+    assert estimate_tokens("1234567") == 3
+    assert estimate_tokens(" , ") == 1
+    assert estimate_tokens("ClosePrice") == 2
+    assert estimate_tokens("") == 0
+
+
+def test_baseline_input_tokens():
+    report = {"estimated_tokens": 10, "baseline_estimated_tokens": 40}
+    prompt = "system " + "a " * 20
+    # 21 estimated, the system prompt 1 -> 3 and the market data 10 -> 40
+    assert baseline_input_tokens(prompt, report, "system", "system prompt text") == 21 + 2 + 30
+    # Calibrated by the real/estimated ratio of the prompt that was sent
+    assert baseline_input_tokens(prompt, report, "system", "system prompt text", input_tokens=42) == 106
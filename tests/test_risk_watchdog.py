@@ -0,0 +1,38 @@
+"""Arming the spot watchdog from positions this process didn't open."""
+
+import bybit_tools
+from risk_watchdog import SpotRiskWatchdog, spot_exit_levels
+
+
+def spot_position(size, entry):
+    return {"has_position": size >= 1.0, "size": size, "avgPrice": entry or 0.0}
+
+
+def test_arms_held_positions_from_the_ledger_entry(monkeypatch):
+    positions = {"XRPUSDT": spot_position(120.0, 0.5), "BTCUSDT": spot_position(0.0, None),
+                 "SOLUSDT": spot_position(30.0, None)}
+    monkeypatch.setattr(bybit_tools, "spot_get_open_positions", positions.get)
+    watchdog = SpotRiskWatchdog()
+
+    assert watchdog.arm_open_positions(list(positions)) == ["XRPUSDT"]
+    armed = watchdog.armed()
+    assert set(armed) == {"XRPUSDT"}
+    assert armed["XRPUSDT"]["qty"] == 120.0
+    assert (armed["XRPUSDT"]["stop_price"], armed["XRPUSDT"]["target_price"]) == spot_exit_levels(0.5)
+
+
+def test_armed_levels_are_kept(monkeypatch):
+    monkeypatch.setattr(bybit_tools, "spot_get_open_positions", lambda symbol: spot_position(10.0, 0.5))
+    watchdog = SpotRiskWatchdog()
+    watchdog.arm("XRPUSDT", 10.0, 0.6, stop_price=0.55)
+    assert watchdog.arm_open_positions(["XRPUSDT"]) == []
+    assert watchdog.armed()["XRPUSDT"]["stop_price"] == 0.55
+
+
+def test_armed_position_exits_on_a_tick_below_the_stop(monkeypatch):
+    monkeypatch.setattr(bybit_tools, "spot_get_open_positions", lambda symbol: spot_position(10.0, 1.0))
+    watchdog = SpotRiskWatchdog()
+    watchdog.arm_open_positions(["XRPUSDT"])
+    watchdog.on_tick("XRPUSDT", 0.9)
+    symbol, reason, price, position, _ = watchdog.exits.get_nowait()
+    assert (symbol, reason, price, position["qty"]) == ("XRPUSDT", "stop_loss", 0.9, 10.0)
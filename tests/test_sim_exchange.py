@@ -0,0 +1,102 @@
+"""SimulatedExchange: market fills, and the TP/SL and spot stop orders its trigger index fires."""
+
+import pytest
+from sim_exchange import SimulatedExchange
+
+START_MS = 1_700_000_000_000
+
+
+@pytest.fixture
+def exchange():
+    exchange = SimulatedExchange(starting_balance=10_000.0, spot_fee_rate=0.0, linear_fee_rate=0.0)
+    exchange.on_tick("XRPUSDT", 1.0, START_MS)
+    return exchange
+
+
+def tick(exchange, price, seconds=1):
+    exchange.on_tick("XRPUSDT", price, START_MS + seconds * 1000)
+
+
+def position(exchange):
+    return exchange.get_positions(category="linear", symbol="XRPUSDT")["result"]["list"][0]
+
+
+def executions(exchange):
+    return list(reversed(exchange.get_executions(category="linear", symbol="XRPUSDT")["result"]["list"]))
+
+
+def test_market_order_fills_at_the_last_price(exchange):
+    assert exchange.place_order(category="linear", symbol="XRPUSDT", side="Buy", qty="100")["retCode"] == 0
+    tick(exchange, 1.1)
+    assert (position(exchange)["side"], position(exchange)["size"]) == ("Buy", "100.0")
+    assert float(position(exchange)["unrealisedPnl"]) == pytest.approx(10.0)
+    assert executions(exchange)[0]["execPrice"] == "1.0"
+
+
+def test_take_profit_closes_a_long(exchange):
+    exchange.place_order(category="linear", symbol="XRPUSDT", side="Buy", qty="100", takeProfit="1.2", stopLoss="0.9")
+    tick(exchange, 1.19)
+    assert position(exchange)["size"] == "100.0"
+    tick(exchange, 1.25, seconds=2)
+    assert position(exchange)["size"] == "0"
+    fill = executions(exchange)[-1]
+    assert (fill["side"], fill["execPrice"], fill["closedSize"]) == ("Sell", "1.25", "100.0")
+    assert (fill["stopOrderType"], fill["createType"]) == ("TakeProfit", "CreateByTakeProfit")
+    assert exchange.coins["USDT"] == pytest.approx(10_000.0 + 25.0)
+    # The stop loss of the closed position was cancelled with it
+    tick(exchange, 0.5, seconds=3)
+    assert len(executions(exchange)) == 2 and len(exchange.triggers) == 0
+
+
+def test_stop_loss_closes_a_short(exchange):
+    exchange.place_order(category="linear", symbol="XRPUSDT", side="Sell", qty="50", takeProfit="0.8", stopLoss="1.1")
+    tick(exchange, 1.1)
+    assert position(exchange)["size"] == "0"
+    fill = executions(exchange)[-1]
+    assert (fill["side"], fill["stopOrderType"], fill["createType"]) == ("Buy", "StopLoss", "CreateByStopLoss")
+    assert exchange.coins["USDT"] == pytest.approx(10_000.0 - 5.0)
+
+
+def test_new_levels_replace_the_armed_ones(exchange):
+    exchange.place_order(category="linear", symbol="XRPUSDT", side="Buy", qty="10", takeProfit="1.2", stopLoss="0.9")
+    exchange.place_order(category="linear", symbol="XRPUSDT", side="Buy", qty="10", takeProfit="1.5", stopLoss="0.8")
+    assert (position(exchange)["takeProfit"], position(exchange)["stopLoss"]) == ("1.5", "0.8")
+    tick(exchange, 1.3)
+    tick(exchange, 0.85, seconds=2)
+    assert position(exchange)["size"] == "20.0"
+    tick(exchange, 0.8, seconds=3)
+    assert position(exchange)["size"] == "0"
+
+
+def test_manual_close_disarms_the_triggers(exchange):
+    exchange.place_order(category="linear", symbol="XRPUSDT", side="Buy", qty="10", stopLoss="0.9")
+    exchange.place_order(category="linear", symbol="XRPUSDT", side="Sell", qty="10", reduceOnly=True)
+    tick(exchange, 0.5)
+    assert position(exchange)["size"] == "0" and len(executions(exchange)) == 2
+
+
+def test_reduce_only_without_a_position_is_rejected(exchange):
+    assert exchange.place_order(category="linear", symbol="XRPUSDT", side="Sell", qty="10",
+                                reduceOnly=True)["retCode"] == 110017
+
+
+def test_spot_stop_order_sells_when_the_price_falls(exchange):
+    exchange.place_order(category="spot", symbol="XRPUSDT", side="Buy", qty="100")
+    assert exchange.coins["XRP"] == 100.0
+    exchange.place_order(category="spot", symbol="XRPUSDT", side="Sell", qty="100", orderFilter="StopOrder",
+                         triggerPrice="0.9")
+    tick(exchange, 0.95)
+    assert exchange.coins["XRP"] == 100.0
+    tick(exchange, 0.89, seconds=2)
+    assert exchange.coins["XRP"] == 0.0
+    assert exchange.coins["USDT"] == pytest.approx(10_000.0 - 100.0 + 89.0)
+    fill = exchange.get_executions(category="spot", symbol="XRPUSDT")["result"]["list"][0]
+    assert (fill["side"], fill["stopOrderType"]) == ("Sell", "Stop")
+
+
+def test_ticks_build_candles(exchange):
+    for seconds, price in ((10, 1.2), (20, 0.9), (30, 1.05), (60, 1.1)):
+        tick(exchange, price, seconds)
+    bars = exchange.get_kline(category="linear", symbol="XRPUSDT", interval=1, limit=10)["result"]["list"]
+    # Newest first: the 1-minute bar of the first ticks, then the one the last tick opened
+    assert [row[1:5] for row in reversed(bars)] == [["1.0", "1.2", "0.9", "1.05"], ["1.1", "1.1", "1.1", "1.1"]]
@@ -0,0 +1,109 @@
+"""Stopping supervisor workers: drained between cycles, killed only after the grace time."""
+
+import os
+import time
+import threading
+import types
+import pytest
+import bybit_tools
+import supervisor
+from supervisor import Supervisor
+
+
+def cycling_worker(index, symbols, args, timeframes, services):
+    """Runs one-second 'cycles', logging their start and end, until asked to stop."""
+    stop = services.stop_event(index)
+    with open(os.path.join(args.log_dir, f"{os.getpid()}.log"), "a") as log:
+        while args.ignore_stop or not stop.is_set():
+            log.write("start\n")
+            log.flush()
+            time.sleep(1)
+            log.write("end\n")
+            log.flush()
+            services.report(index, dict.fromkeys(symbols, 1.0))
+
+
+@pytest.fixture
+def run_supervisor(tmp_path, monkeypatch):
+    # Keep this process' exchange session off the supervisor's request budget
+    monkeypatch.setattr(bybit_tools, "use_rate_limiter", lambda limiter: limiter)
+    supervisors = []
+
+    def run(symbols, workers, ignore_stop=False):
+        args = types.SimpleNamespace(mode="perp", paper=True, no_watchdog=True, no_private_stream=True,
+                                     log_dir=str(tmp_path), ignore_stop=ignore_stop)
+        supervisors.append(Supervisor(args, symbols, [], workers, cycling_worker).start())
+        return supervisors[-1]
+
+    yield run
+    for started in supervisors:
+        started.stop()
+
+
+def logged_cycles(tmp_path, pid):
+    path = tmp_path / f"{pid}.log"
+    return path.read_text().split() if path.exists() else []
+
+
+def wait_for_cycles(tmp_path, started, timeout=30):
+    """Waits until every worker has finished a cycle."""
+    deadline = time.monotonic() + timeout
+    while any("end" not in logged_cycles(tmp_path, worker.process.pid) for worker in started.workers):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_stopped_worker_finishes_its_cycle(run_supervisor, tmp_path):
+    started = run_supervisor(["XRPUSDT"], 1)
+    wait_for_cycles(tmp_path, started)
+    process = started.workers[0].process
+    started.stop()
+    assert process.exitcode == 0
+    assert logged_cycles(tmp_path, process.pid)[-1] == "end"
+
+
+def test_worker_ignoring_the_stop_is_killed_after_the_grace_time(run_supervisor, tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "WORKER_DRAIN_SECONDS", 1)
+    started = run_supervisor(["XRPUSDT"], 1, ignore_stop=True)
+    wait_for_cycles(tmp_path, started)
+    process = started.workers[0].process
+    stopping = time.monotonic()
+    started.stop()
+    assert process.exitcode != 0
+    assert time.monotonic() - stopping < 5
+
+
+def test_rebalance_drains_the_workers_it_reshards(run_supervisor, tmp_path):
+    started = run_supervisor(["A", "B", "C", "D"], 2)
+    assert [worker.symbols for worker in started.workers] == [["A", "C"], ["B", "D"]]
+    wait_for_cycles(tmp_path, started)
+    previous = [worker.process for worker in started.workers]
+    started.costs = {"A": 10.0, "B": 1.0, "C": 10.0, "D": 1.0}
+    assert started.rebalance()
+    assert sorted(worker.symbols for worker in started.workers) == [["A", "B"], ["C", "D"]]
+    for process in previous:
+        assert process.exitcode == 0
+        assert logged_cycles(tmp_path, process.pid)[-1] == "end"
+    assert all(worker.process.is_alive() for worker in started.workers)
+
+
+def test_run_scheduler_returns_between_jobs():
+    import schedule
+    from main import run_scheduler
+    runs = []
+
+    def job():
+        runs.append("start")
+        time.sleep(0.5)
+        runs.append("end")
+
+    stop = threading.Event()
+    schedule.every().second.do(job)
+    timer = threading.Timer(1.2, stop.set)
+    timer.start()
+    try:
+        run_scheduler(stop=stop)
+    finally:
+        schedule.clear()
+        timer.cancel()
+    assert runs and runs[-1] == "end"
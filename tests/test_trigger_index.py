@@ -0,0 +1,72 @@
+"""TriggerIndex: trigger order, lazy cancellation and its stale accounting."""
+
+import pytest
+from trigger_index import TriggerIndex, RISES_TO, FALLS_TO
+
+
+def heap_entries(index):
+    return sum(len(heap) for heaps in (index.rising, index.falling) for heap in heaps.values())
+
+
+def test_fires_crossed_levels_nearest_first():
+    index = TriggerIndex()
+    far = index.add("XRPUSDT", 1.2, RISES_TO, "far")
+    near = index.add("XRPUSDT", 1.1, RISES_TO, "near")
+    index.add("XRPUSDT", 1.3, RISES_TO, "not crossed")
+    index.add("XRPUSDT", 0.9, FALLS_TO, "below")
+    assert index.on_price("XRPUSDT", 1.0) == []
+    assert index.on_price("XRPUSDT", 1.25) == [(near, "near"), (far, "far")]
+    # Fired triggers don't fire again
+    assert index.on_price("XRPUSDT", 1.25) == []
+    assert set(index.triggers().values()) == {"not crossed", "below"}
+
+
+def test_falling_levels_and_symbols_are_independent():
+    index = TriggerIndex()
+    high = index.add("XRPUSDT", 0.95, FALLS_TO, "high")
+    low = index.add("XRPUSDT", 0.9, FALLS_TO, "low")
+    index.add("BTCUSDT", 0.95, FALLS_TO, "other symbol")
+    assert index.on_price("XRPUSDT", 0.95) == [(high, "high")]
+    assert index.on_price("XRPUSDT", 0.5) == [(low, "low")]
+    assert list(index.triggers("BTCUSDT").values()) == ["other symbol"]
+
+
+def test_invalid_direction():
+    with pytest.raises(ValueError):
+        TriggerIndex().add("XRPUSDT", 1.0, "sideways")
+
+
+def test_cancelled_triggers_never_fire():
+    index = TriggerIndex()
+    cancelled = index.add("XRPUSDT", 1.1, RISES_TO, "cancelled")
+    kept = index.add("XRPUSDT", 1.2, RISES_TO, "kept")
+    index.add("XRPUSDT", 0.9, FALLS_TO, {"kind": "stop"})
+    assert index.cancel(cancelled) and not index.cancel(cancelled)
+    assert index.cancel_symbol("XRPUSDT", lambda payload: isinstance(payload, dict)) == 1
+    assert index.stale == 2
+    assert index.on_price("XRPUSDT", 2.0) == [(kept, "kept")]
+    assert index.on_price("XRPUSDT", 0.1) == []
+    assert not index.cancel(kept)
+
+
+def test_popped_cancelled_entries_leave_the_stale_count():
+    index = TriggerIndex()
+    for _ in range(10):
+        index.cancel(index.add("XRPUSDT", 1.1, RISES_TO))
+        index.cancel(index.add("XRPUSDT", 0.9, FALLS_TO))
+    assert index.stale == heap_entries(index) == 20
+    index.on_price("XRPUSDT", 1.1)
+    index.on_price("XRPUSDT", 0.9)
+    assert index.stale == heap_entries(index) == 0
+    assert len(index) == 0
+
+
+def test_compaction_drops_cancelled_entries():
+    index = TriggerIndex()
+    live = [index.add("XRPUSDT", 2.0 + i, RISES_TO) for i in range(5)]
+    for i in range(1030):
+        index.cancel(index.add("XRPUSDT", 1.0 + i / 10_000, FALLS_TO))
+    # Rebuilt once the cancelled entries outnumbered the live ones by 1024
+    assert index.stale == heap_entries(index) - len(live)
+    assert heap_entries(index) < 1030
+    assert [trigger_id for trigger_id, _ in index.on_price("XRPUSDT", 10.0)] == live
@@ -0,0 +1,102 @@
+import heapq
+import itertools
+
+# Trigger directions
+RISES_TO = "rises_to"  # fires once price >= level (short stop loss, long take profit)
+FALLS_TO = "falls_to"  # fires once price <= level (long stop loss, short take profit)
+
+
+class TriggerIndex:
+    """
+    Per-symbol price trigger index.
+
+    Triggers are kept in two heaps per symbol: a min-heap of levels that fire
+    when the price rises to them and a max-heap of levels that fire when it
+    falls to them. Checking a tick only looks at the two heap tops, so a tick
+    that fires nothing costs O(1) regardless of how many triggers are armed;
+    each fired trigger costs O(log n). Cancellation is lazy.
+
+    Usage:
+        index = TriggerIndex()
+        trigger_id = index.add("XRPUSDT", 0.49, FALLS_TO, {"kind": "stop_loss"})
+        for trigger_id, payload in index.on_price("XRPUSDT", 0.48):
+            ...
+    """
+
+    def __init__(self):
+        self.rising = {}   # symbol -> heap of (level, trigger_id)
+        self.falling = {}  # symbol -> heap of (-level, trigger_id)
+        self.payloads = {}  # trigger_id -> (symbol, payload); absent once fired or cancelled
+        self.ids = itertools.count(1)
+        self.stale = 0  # cancelled entries still sitting in the heaps
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def add(self, symbol: str, level: float, direction: str, payload=None):
+        """Arms a trigger and returns its id."""
+        trigger_id = next(self.ids)
+        if direction == RISES_TO:
+            heapq.heappush(self.rising.setdefault(symbol, []), (level, trigger_id))
+        elif direction == FALLS_TO:
+            heapq.heappush(self.falling.setdefault(symbol, []), (-level, trigger_id))
+        else:
+            raise ValueError(f"Invalid trigger direction: {direction}")
+        self.payloads[trigger_id] = (symbol, payload)
+        return trigger_id
+
+    def cancel(self, trigger_id: int):
+        """Disarms a trigger; returns False if it already fired or was cancelled."""
+        if self.payloads.pop(trigger_id, None) is None:
+            return False
+        self._mark_stale(1)
+        return True
+
+    def cancel_symbol(self, symbol: str, predicate=None):
+        """Disarms all triggers of a symbol (optionally only those whose payload matches)."""
+        cancelled = [
+            trigger_id for trigger_id, (trigger_symbol, payload) in self.payloads.items()
+            if trigger_symbol == symbol and (predicate is None or predicate(payload))
+        ]
+        for trigger_id in cancelled:
+            del self.payloads[trigger_id]
+        self._mark_stale(len(cancelled))
+        return len(cancelled)
+
+    def _mark_stale(self, count: int):
+        # Rebuild the heaps once cancelled entries outnumber live ones, so a
+        # long-running process that keeps re-arming stops doesn't grow unbounded
+        self.stale += count
+        if self.stale > len(self.payloads) + 1024:
+            for heaps in (self.rising, self.falling):
+                for symbol, heap in heaps.items():
+                    heap[:] = [item for item in heap if item[1] in self.payloads]
+                    heapq.heapify(heap)
+            self.stale = 0
+
+    def triggers(self, symbol: str = None):
+        """Returns {trigger_id: payload} of armed triggers, optionally for one symbol."""
+        return {
+            trigger_id: payload for trigger_id, (trigger_symbol, payload) in self.payloads.items()
+            if symbol is None or trigger_symbol == symbol
+        }
+
+    def on_price(self, symbol: str, price: float):
+        """Pops and returns [(trigger_id, payload)] for every trigger crossed by this price."""
+        fired = []
+        rising = self.rising.get(symbol)
+        while rising and rising[0][0] <= price:
+            self._pop(rising, fired)
+        falling = self.falling.get(symbol)
+        while falling and -falling[0][0] >= price:
+            self._pop(falling, fired)
+        return fired
+
+    def _pop(self, heap: list, fired: list):
+        _, trigger_id = heapq.heappop(heap)
+        entry = self.payloads.pop(trigger_id, None)
+        if entry is None:
+            # A cancelled entry leaves the heaps
+            self.stale -= 1
+        else:
+            fired.append((trigger_id, entry[1]))